@@ -0,0 +1,207 @@
+"""
+AI Aggregates - Agrégats compacts pour les outils IA (statistiques, retards)
+
+Les outils get_statistics et predict_delays ne transmettent au modèle que
+des compteurs, des sommes et quelques lignes (top-N, référencées #1..#N
+dans le prompt plutôt que par UUID) :
+
+1. Fonctions SQL `ai_company_statistics` / `ai_projects_at_risk` : une
+   requête groupée, un seul objet JSON renvoyé par PostgREST
+2. Repli (fonctions non déployées, plus redemandées par le processus, ou
+   en échec) : lecture paginée des seules colonnes utiles puis agrégation
+   en Python, même format de sortie
+"""
+
+import heapq
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from supabase_helpers import SqlFunction, paged
+
+logger = logging.getLogger(__name__)
+
+# Statuts des projets suivis par la prédiction de retards
+ACTIVE_PROJECT_STATUSES = ("ACTIVE", "IN_PROGRESS")
+
+# Nombre de projets détaillés transmis au modèle
+TOP_PROJECTS = 10
+
+# Échéance proche (jours)
+DUE_SOON_DAYS = 14
+
+
+def _to_date(value: Any) -> Optional[date]:
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value if not isinstance(value, datetime) else value.date()
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def summarize_quotes(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compteurs et montants des devis"""
+    total, accepted, pending = 0, 0, 0
+    amount = accepted_amount = Decimal("0")
+    for q in rows:
+        value = Decimal(str(q.get("amount") or 0))
+        total += 1
+        amount += value
+        if q.get("status") == "ACCEPTED":
+            accepted += 1
+            accepted_amount += value
+        elif q.get("status") == "SENT":
+            pending += 1
+    return {
+        "total": total,
+        "amount": float(amount),
+        "accepted": accepted,
+        "accepted_amount": float(accepted_amount),
+        "pending": pending,
+    }
+
+
+def summarize_projects(
+    rows: Iterable[Dict[str, Any]],
+    today: Optional[date] = None,
+    top: int = TOP_PROJECTS
+) -> Dict[str, Any]:
+    """Compteurs d'échéances des projets en cours + top-N des échéances les plus proches"""
+    today = today or date.today()
+    active = overdue = due_soon = no_end_date = 0
+    dated: List[tuple] = []
+    undated: List[Dict[str, Any]] = []
+    for p in rows:
+        active += 1
+        end = _to_date(p.get("end_date"))
+        if end is None:
+            no_end_date += 1
+            if len(undated) < top:
+                undated.append(p)
+            continue
+        days_left = (end - today).days
+        if days_left < 0:
+            overdue += 1
+        elif days_left <= DUE_SOON_DAYS:
+            due_soon += 1
+        dated.append((days_left, p))
+
+    nearest = heapq.nsmallest(top, dated, key=lambda item: item[0])
+    projects = [
+        {
+            "id": p.get("id"), "name": p.get("name"), "status": p.get("status"),
+            "priority": p.get("priority"), "end_date": str(p.get("end_date"))[:10], "days_left": days_left,
+        }
+        for days_left, p in nearest
+    ]
+    projects += [
+        {"id": p.get("id"), "name": p.get("name"), "status": p.get("status"),
+         "priority": p.get("priority"), "end_date": None, "days_left": None}
+        for p in undated[:top - len(projects)]
+    ]
+    return {
+        "active": active,
+        "overdue": overdue,
+        "due_soon": due_soon,
+        "no_end_date": no_end_date,
+        "projects": projects,
+    }
+
+
+def format_projects_prompt(summary: Dict[str, Any]) -> str:
+    """Résumé texte compact des projets pour le prompt de prédiction (projets notés #1..#N)"""
+    lines = [
+        f"{summary['active']} projets en cours, {summary['overdue']} en retard, "
+        f"{summary['due_soon']} à échéance sous {DUE_SOON_DAYS} j, {summary['no_end_date']} sans échéance."
+    ]
+    for i, p in enumerate(summary["projects"], 1):
+        deadline = "sans échéance" if p["days_left"] is None else f"J{p['days_left']:+d}"
+        lines.append(f"#{i} {p['name']} | {p['status']} | {p['priority'] or 'N/A'} | {deadline}")
+    return "\n".join(lines)
+
+
+def resolve_project_refs(predictions: List[Dict[str, Any]], summary: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Remplace les références #n renvoyées par le modèle par l'id et le nom du projet"""
+    projects = summary.get("projects") or []
+    for prediction in predictions:
+        ref = str(prediction.get("project_id") or prediction.get("project") or "").lstrip("#").strip()
+        if ref.isdigit() and 1 <= int(ref) <= len(projects):
+            project = projects[int(ref) - 1]
+            prediction["project_id"] = project["id"]
+            prediction["project_name"] = project["name"]
+    return predictions
+
+
+class AIAggregates:
+    """Agrégats d'une entreprise pour les outils IA (requêtes synchrones, à lancer via asyncio.to_thread)"""
+
+    def __init__(self, supabase_client):
+        self.supabase = supabase_client
+        self._statistics_rpc = SqlFunction("ai_company_statistics")
+        self._at_risk_rpc = SqlFunction("ai_projects_at_risk")
+
+    def company_statistics(self, company_id: str, date_from: datetime) -> Dict[str, Any]:
+        """Devis / clients / recherches terrain depuis date_from"""
+        stats = self._statistics_rpc.value(self.supabase, {
+            "p_company_id": company_id,
+            "p_date_from": date_from.isoformat(),
+        })
+        if stats is not None:
+            return {**stats, "source": "sql"}
+
+        since = date_from.isoformat()
+        quotes = summarize_quotes(paged(
+            lambda: self.supabase.table("quotes").select("amount, status")
+            .eq("company_id", company_id)
+            .gte("created_at", since)
+            .order("id")
+        ))
+        clients = self.supabase.table("clients").select("id", count="exact") \
+            .eq("company_id", company_id) \
+            .limit(1) \
+            .execute()
+        searches_total = searches_processed = 0
+        for s in paged(
+            lambda: self.supabase.table("searches").select("status")
+            .eq("company_id", company_id)
+            .gte("created_at", since)
+            .order("id")
+        ):
+            searches_total += 1
+            searches_processed += s.get("status") == "PROCESSED"
+        return {
+            "quotes": quotes,
+            "clients": {"total": getattr(clients, "count", None) or len(clients.data or [])},
+            "searches": {"total": searches_total, "processed": searches_processed},
+            "source": "python",
+        }
+
+    def projects_at_risk(
+        self,
+        company_id: str,
+        statuses: Sequence[str] = ACTIVE_PROJECT_STATUSES,
+        today: Optional[date] = None
+    ) -> Dict[str, Any]:
+        """Échéances des projets en cours (compteurs + projets les plus urgents)"""
+        today = today or date.today()
+        summary = self._at_risk_rpc.value(self.supabase, {
+            "p_company_id": company_id,
+            "p_statuses": list(statuses),
+            "p_today": today.isoformat(),
+            "p_due_soon_days": DUE_SOON_DAYS,
+            "p_top": TOP_PROJECTS,
+        })
+        if summary is not None:
+            return {**summary, "source": "sql"}
+
+        summary = summarize_projects(paged(
+            lambda: self.supabase.table("projects").select("id, name, status, priority, end_date")
+            .eq("company_id", company_id)
+            .in_("status", list(statuses))
+            .order("id")
+        ), today)
+        return {**summary, "source": "python"}
@@ -0,0 +1,274 @@
+"""
+AI Cache - Cache des réponses IA (universal_query, analyse rapport, amélioration texte)
+
+- LRU borné en mémoire avec TTL : les entrées expirées ou les moins
+  récemment utilisées sont évincées, la mémoire du worker reste bornée
+- clé normalisée : namespace + entreprise + rôle + requête normalisée
+  + empreinte de l'historique de conversation
+- backend partagé optionnel (SQLite local, AI_CACHE_SQLITE_PATH) pour que
+  tous les workers uvicorn profitent des réponses des autres ; depuis la
+  boucle asyncio, aget()/aset() l'interrogent via asyncio.to_thread (verrou
+  SQLite jusqu'à 5 s) et un hit n'écrit last_access qu'une fois par minute
+- compteurs hits / misses / évictions par namespace pour get_stats()
+"""
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Nombre de messages d'historique pris en compte (identique à universal_query)
+HISTORY_WINDOW = 10
+
+# Précision de last_access (éviction LRU du backend partagé) : un hit n'écrit pas à chaque lecture
+TOUCH_INTERVAL = 60
+
+
+def normalize_query(query: str) -> str:
+    """Minuscules, forme Unicode NFC et espaces compactés ("Devis  Dupont ?" == "devis dupont ?")"""
+    return " ".join(unicodedata.normalize("NFC", query or "").lower().split())
+
+
+def history_digest(history: Optional[List[Dict]]) -> str:
+    """Empreinte des derniers messages de la conversation ("" si pas d'historique)"""
+    if not history:
+        return ""
+    window = [
+        {"role": m.get("role"), "content": m.get("content")}
+        for m in history[-HISTORY_WINDOW:]
+        if isinstance(m, dict)
+    ]
+    return hashlib.sha256(json.dumps(window, ensure_ascii=False, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def make_cache_key(namespace: str, *parts: Any) -> str:
+    raw = json.dumps([namespace, *parts], ensure_ascii=False, default=str)
+    return f"{namespace}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+class LRUTTLCache:
+    """Cache mémoire borné (LRU) avec expiration (TTL), thread-safe"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (time.time() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCacheBackend:
+    """
+    Cache partagé entre workers dans un fichier SQLite local (mode WAL)
+
+    Éviction LRU sur `last_access` quand le nombre d'entrées dépasse
+    `max_entries` ; les entrées expirées sont purgées au passage.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_last_access ON ai_cache(last_access)")
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, last_access FROM ai_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+                return None
+            if now - row[2] >= TOUCH_INTERVAL:
+                self._conn.execute("UPDATE ai_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, now + (ttl or self.ttl), now)
+            )
+            self._writes += 1
+            # Éviction amortie : contrôle de la taille toutes les 50 écritures
+            if self._writes % 50 == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (now,))
+        overflow = self._conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+
+
+class AICache:
+    """
+    Cache à deux niveaux : LRU mémoire du worker, puis backend partagé optionnel
+
+    Un hit du backend partagé est recopié dans le LRU local. Les appelants
+    asynchrones utilisent aget()/aset() : le LRU local reste lu sur la
+    boucle, le backend partagé est lu et écrit dans un thread.
+    """
+
+    def __init__(self, local: LRUTTLCache, shared: Optional[SQLiteCacheBackend] = None):
+        self.local = local
+        self.shared = shared
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, namespace: str, counter: str):
+        stats = self._counters.setdefault(namespace, {"hits": 0, "shared_hits": 0, "misses": 0, "sets": 0})
+        stats[counter] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            return self._from_shared(key, self._read_shared(key))
+        return self._from_local(key, value)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            return self._from_shared(key, await asyncio.to_thread(self._read_shared, key))
+        return self._from_local(key, value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._count(key.split(":", 1)[0], "sets")
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self._write_shared(key, value, ttl)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._count(key.split(":", 1)[0], "sets")
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            await asyncio.to_thread(self._write_shared, key, value, ttl)
+
+    def _from_local(self, key: str, value: Optional[Any]) -> Optional[Any]:
+        self._count(key.split(":", 1)[0], "misses" if value is None else "hits")
+        return value
+
+    def _from_shared(self, key: str, value: Optional[Any]) -> Optional[Any]:
+        namespace = key.split(":", 1)[0]
+        if value is None:
+            self._count(namespace, "misses")
+            return None
+        self.local.set(key, value)
+        self._count(namespace, "hits")
+        self._count(namespace, "shared_hits")
+        return value
+
+    def _read_shared(self, key: str) -> Optional[Any]:
+        try:
+            return self.shared.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Cache IA partagé indisponible: {e}")
+            return None
+
+    def _write_shared(self, key: str, value: Any, ttl: Optional[float]):
+        try:
+            self.shared.set(key, value, ttl)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Écriture cache IA partagé impossible: {e}")
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        hits = sum(c["hits"] for c in self._counters.values())
+        misses = sum(c["misses"] for c in self._counters.values())
+        return {
+            "backend": "memory+sqlite" if self.shared is not None else "memory",
+            "entries": len(self.local),
+            "max_entries": self.local.max_entries,
+            "ttl_seconds": self.local.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": f"{(hits / max(1, hits + misses)) * 100:.1f}%",
+            "evictions": self.local.evictions + (self.shared.evictions if self.shared is not None else 0),
+            "namespaces": {ns: dict(c) for ns, c in self._counters.items()},
+        }
+
+
+def build_ai_cache() -> AICache:
+    """Cache IA configuré par variables d'environnement"""
+    max_entries = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+    ttl = float(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+    shared = None
+    sqlite_path = os.getenv("AI_CACHE_SQLITE_PATH")
+    if sqlite_path:
+        try:
+            shared = SQLiteCacheBackend(
+                sqlite_path,
+                max_entries=int(os.getenv("AI_CACHE_SHARED_MAX_ENTRIES", str(max_entries * 10))),
+                ttl=ttl
+            )
+            logger.info(f"💾 Cache IA partagé SQLite: {sqlite_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Cache IA partagé SQLite indisponible ({e}) - cache mémoire seul")
+    return AICache(LRUTTLCache(max_entries=max_entries, ttl=ttl), shared)
@@ -0,0 +1,561 @@
+"""
+AI Routes - Endpoints de l'assistant IA (/api/ai/*)
+
+Le module ai_service (OpenAI, index BM25 SciPy) n'est pas importé ici :
+get_ai_service() le charge au premier appel (préchargé en tâche de fond
+par le lifespan), le démarrage du serveur n'en paie pas le coût.
+"""
+
+import json
+import asyncio
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from ai_usage import AIQuotaExceededError
+from server_supabase import (
+    AI_SERVICE_AVAILABLE, ai_usage_meter, get_ai_service, get_user_company, get_user_from_token,
+    logger, supabase_service
+)
+
+router = APIRouter()
+
+
+async def _enforce_ai_quota(ai_service, company_id: str):
+    """Budget journalier et débit IA de l'entreprise => 429 avant tout appel OpenAI"""
+    try:
+        await asyncio.to_thread(ai_service.check_quota, company_id)
+    except AIQuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+class AIQueryModel(BaseModel):
+    """Requête IA universelle"""
+    query: str = Field(..., description="Question ou commande en langage naturel")
+    conversation_history: Optional[List[Dict]] = Field(default=None, description="Historique conversation (optionnel)")
+
+@router.post("/ai/query")
+async def ai_universal_query(data: AIQueryModel, user_data: dict = Depends(get_user_from_token)):
+    """
+    🤖 RECHERCHE UNIVERSELLE IA
+    
+    L'utilisateur pose une question en langage naturel:
+    - "Montre-moi les devis de Dupont à Mennecy"
+    - "Quelles sont les recherches terrain terminées la semaine dernière à St-Fargeau?"
+    - "Statistiques du mois"
+    
+    Architecture 2 étapes:
+    1. Filtrage local Supabase (pas de coût IA)
+    2. IA décide sur 3-10 résultats max
+    
+    Modèle: GPT-4o-mini (95% des requêtes) - ultra économique
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {
+                "success": False,
+                "message": "Service IA non disponible. Contactez l'administrateur."
+            }
+        
+        company_id = await get_user_company(user_data)
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Entreprise non trouvée")
+        
+        ai_service = get_ai_service()
+        await _enforce_ai_quota(ai_service, company_id)
+        result = await ai_service.universal_query(
+            company_id=company_id,
+            user_query=data.query,
+            user_role=user_data.get("role", "TECHNICIEN"),
+            conversation_history=data.conversation_history
+        )
+        
+        return result
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur AI query: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur IA: {str(e)}")
+
+@router.post("/ai/devis")
+async def ai_generate_devis(
+    client_id: str = Query(..., description="ID du client"),
+    description: str = Query(..., description="Description des travaux"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    📝 GÉNÉRATION AUTOMATIQUE DE DEVIS
+    
+    L'IA:
+    1. Cherche des devis similaires dans l'historique
+    2. Copie les lignes de travail pertinentes
+    3. Ajuste quantités et prix selon le contexte
+    4. Propose un devis pré-rempli prêt à valider
+    
+    Exemple:
+    - description: "Réparation fissure + traitement humidité 30m²"
+    - Retour: devis avec lignes, prix, TVA calculée
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {
+                "success": False,
+                "message": "Service IA non disponible"
+            }
+        
+        company_id = await get_user_company(user_data)
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Entreprise non trouvée")
+        
+        # Vérifier que le client appartient à l'entreprise
+        client_check = supabase_service.table("clients").select("id").eq("id", client_id).eq("company_id", company_id).execute()
+        if not client_check.data:
+            raise HTTPException(status_code=404, detail="Client non trouvé dans votre entreprise")
+        
+        ai_service = get_ai_service()
+        await _enforce_ai_quota(ai_service, company_id)
+        result = await ai_service._generate_devis_draft(company_id, client_id, description)
+        
+        return {
+            "success": True,
+            "devis_draft": result,
+            "message": "Brouillon de devis généré. Vérifiez et ajustez avant validation."
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur génération devis IA: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _ai_planning_result(action: str, schedules: List[dict]) -> dict:
+    """Résultat de l'assistant planning pour une action donnée"""
+    if action == "detect_conflicts":
+        # Détecter conflits (même technicien, même jour, heures qui se chevauchent)
+        conflicts = []
+        for i, s1 in enumerate(schedules):
+            for s2 in schedules[i+1:]:
+                if s1.get("user_id") == s2.get("user_id") and s1.get("date") == s2.get("date"):
+                    conflicts.append({
+                        "schedule1": s1,
+                        "schedule2": s2,
+                        "reason": "Même technicien, même jour"
+                    })
+        
+        return {
+            "success": True,
+            "action": action,
+            "conflicts": conflicts,
+            "total_conflicts": len(conflicts)
+        }
+    
+    elif action == "suggest_slots":
+        # Suggérer créneaux libres
+        return {
+            "success": True,
+            "action": action,
+            "message": "Fonctionnalité en développement - bientôt disponible",
+            "current_schedules": len(schedules)
+        }
+    
+    else:
+        return {
+            "success": True,
+            "action": action,
+            "schedules": schedules,
+            "total": len(schedules)
+        }
+
+@router.post("/ai/planning")
+async def ai_planning_assistant(
+    action: str = Query(..., description="suggest_slots | detect_conflicts | optimize"),
+    date_from: Optional[str] = Query(None, description="Date début (ISO)"),
+    date_to: Optional[str] = Query(None, description="Date fin (ISO)"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    📅 ASSISTANT PLANNING INTELLIGENT
+    
+    Actions:
+    - suggest_slots: Propose créneaux optimaux pour techniciens disponibles
+    - detect_conflicts: Détecte conflits dans le planning
+    - optimize: Optimise les déplacements et l'organisation
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {"success": False, "message": "Service IA non disponible"}
+        
+        company_id = await get_user_company(user_data)
+        
+        # Pour l'instant, utiliser la recherche planning standard
+        ai_service = get_ai_service()
+        filters = {}
+        if date_from:
+            filters["date_from"] = date_from
+        if date_to:
+            filters["date_to"] = date_to
+        
+        schedules = await ai_service._search_planning(company_id, filters)
+        return _ai_planning_result(action, schedules)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur planning IA: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/ai/rapport/{search_id}")
+async def ai_analyze_rapport(
+    search_id: str,
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    📊 ANALYSE INTELLIGENTE DE RAPPORT TERRAIN
+    
+    L'IA (GPT-4o pour documents complexes):
+    - Résume immédiatement le rapport
+    - Détecte problèmes et anomalies
+    - Évalue la dangerosité/urgence
+    - Recommande actions à faire
+    - Identifie matériel nécessaire
+    
+    Exemple:
+    - Input: "Fissure mur porteur + humidité 30%"
+    - Output: Analyse détaillée + recommandations + niveau urgence
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {"success": False, "message": "Service IA non disponible"}
+        
+        company_id = await get_user_company(user_data)
+        
+        # Vérifier que la recherche appartient à l'entreprise
+        search_check = supabase_service.table("searches").select("id").eq("id", search_id).eq("company_id", company_id).execute()
+        if not search_check.data:
+            raise HTTPException(status_code=404, detail="Rapport non trouvé dans votre entreprise")
+        
+        ai_service = get_ai_service()
+        await _enforce_ai_quota(ai_service, company_id)
+        analysis = await ai_service._analyze_rapport(company_id, search_id)
+        
+        return {
+            "success": True,
+            "search_id": search_id,
+            "analysis": analysis,
+            "message": "Rapport analysé par IA"
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur analyse rapport IA: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ai/client/{client_id}/insights")
+async def ai_client_insights(
+    client_id: str,
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    👤 INSIGHTS CLIENT INTELLIGENTS
+    
+    Analyse:
+    - Historique achats et comportement
+    - Chiffre d'affaires généré
+    - Fréquence et régularité
+    - Recommandations (relance, offre spéciale, etc.)
+    - Détection client "important" ou "à risque"
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {"success": False, "message": "Service IA non disponible"}
+        
+        company_id = await get_user_company(user_data)
+        
+        ai_service = get_ai_service()
+        client_details = await ai_service._get_client_details(company_id, client_id)
+        
+        if not client_details:
+            raise HTTPException(status_code=404, detail="Client non trouvé")
+        
+        # Analyse basique (à enrichir avec GPT si besoin)
+        total_amount = client_details.get("total_amount", 0)
+        total_quotes = client_details.get("total_quotes", 0)
+        
+        insights = {
+            "client_id": client_id,
+            "total_amount": total_amount,
+            "total_quotes": total_quotes,
+            "average_quote": total_amount / max(1, total_quotes),
+            "status": "VIP" if total_amount > 10000 else "STANDARD" if total_amount > 2000 else "NOUVEAU",
+            "recommendations": []
+        }
+        
+        if total_quotes == 0:
+            insights["recommendations"].append("Premier devis - Bien accueillir ce nouveau client")
+        elif total_amount > 10000:
+            insights["recommendations"].append("Client VIP - Priorité maximale")
+        
+        return {
+            "success": True,
+            "insights": insights,
+            "client_details": client_details
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur insights client: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ai/predictions")
+async def ai_predictions(
+    prediction_type: str = Query("delays", description="delays | payment_defaults | stock_needs"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    🔮 IA PRÉDICTIVE
+    
+    Prédictions basées sur l'historique:
+    - delays: Anticipe les retards de projets
+    - payment_defaults: Prédit défauts de paiement
+    - stock_needs: Anticipe besoins matériels
+    
+    Nécessite quelques mois de données pour précision.
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {"success": False, "message": "Service IA non disponible"}
+        
+        company_id = await get_user_company(user_data)
+        ai_service = get_ai_service()
+        
+        if prediction_type == "delays":
+            await _enforce_ai_quota(ai_service, company_id)
+            predictions = await ai_service._predict_delays(company_id)
+        else:
+            predictions = {
+                "message": f"Prédiction '{prediction_type}' en développement",
+                "available_soon": True
+            }
+        
+        return {
+            "success": True,
+            "prediction_type": prediction_type,
+            "predictions": predictions
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur prédictions IA: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/ai/improve-text")
+async def ai_improve_text(
+    text: str = Query(..., description="Texte à améliorer (rapport technicien)"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    ✨ CORRECTION ORTHOGRAPHIQUE & AMÉLIORATION TEXTE TECHNICIEN
+    
+    Améliore automatiquement les rapports techniciens:
+    - Correction orthographe et grammaire
+    - Réécriture professionnelle
+    - Clarification des phrases
+    - Terminologie BTP appropriée
+    
+    Exemple:
+    Entrée: "jai fé le travail ojourdui sa c bien passé"
+    Sortie: "J'ai effectué les travaux aujourd'hui. L'intervention s'est déroulée sans incident."
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {
+                "success": False,
+                "original": text,
+                "improved": text,
+                "message": "Service IA non disponible. Texte non modifié."
+            }
+        
+        ai_service = get_ai_service()
+        company_id = await get_user_company(user_data)
+        if company_id:
+            await _enforce_ai_quota(ai_service, company_id)
+        
+        # GPT-4o-mini pour correction rapide et économique (réponses identiques en cache)
+        result = await ai_service.improve_text(text, company_id)
+        
+        return {
+            "success": True,
+            "original": text,
+            "improved": result["improved"],
+            "tokens": result["tokens"],
+            "cost_euros": result["tokens"] * 0.15 / 1000000,
+            "cached": result.get("cached", False)
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur amélioration texte IA: {e}")
+        return {
+            "success": False,
+            "original": text,
+            "improved": text,
+            "message": f"Erreur: {str(e)}"
+        }
+
+# ----------------------------------------------------------------------------
+# Variantes streaming (Server-Sent Events) des endpoints IA
+# Événements: token (fragment de texte), function_call / function_result,
+# similar_quotes, progress, done (résultat complet), error
+# ----------------------------------------------------------------------------
+
+def _sse_response(events) -> StreamingResponse:
+    """Sérialise un flux d'événements {"event", "data"} au format text/event-stream"""
+    async def body():
+        async for event in events:
+            payload = json.dumps(event.get("data"), ensure_ascii=False, default=str)
+            yield f"event: {event['event']}\ndata: {payload}\n\n"
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _single_event(event: str, data):
+    yield {"event": event, "data": data}
+
+@router.post("/ai/query/stream")
+async def ai_universal_query_stream(data: AIQueryModel, user_data: dict = Depends(get_user_from_token)):
+    """🤖 Recherche universelle IA en streaming SSE (tokens transmis au fil de l'eau)"""
+    if not AI_SERVICE_AVAILABLE:
+        return _sse_response(_single_event("error", {"success": False, "message": "Service IA non disponible. Contactez l'administrateur."}))
+    
+    company_id = await get_user_company(user_data)
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Entreprise non trouvée")
+    
+    ai_service = get_ai_service()
+    await _enforce_ai_quota(ai_service, company_id)
+    return _sse_response(ai_service.stream_universal_query(
+        company_id=company_id,
+        user_query=data.query,
+        user_role=user_data.get("role", "TECHNICIEN"),
+        conversation_history=data.conversation_history
+    ))
+
+@router.post("/ai/devis/stream")
+async def ai_generate_devis_stream(
+    client_id: str = Query(..., description="ID du client"),
+    description: str = Query(..., description="Description des travaux"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """📝 Génération de devis en streaming SSE (devis similaires puis brouillon JSON)"""
+    if not AI_SERVICE_AVAILABLE:
+        return _sse_response(_single_event("error", {"success": False, "message": "Service IA non disponible"}))
+    
+    company_id = await get_user_company(user_data)
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Entreprise non trouvée")
+    
+    client_check = supabase_service.table("clients").select("id").eq("id", client_id).eq("company_id", company_id).execute()
+    if not client_check.data:
+        raise HTTPException(status_code=404, detail="Client non trouvé dans votre entreprise")
+    
+    ai_service = get_ai_service()
+    await _enforce_ai_quota(ai_service, company_id)
+    return _sse_response(ai_service.stream_devis_draft(company_id, client_id, description))
+
+@router.post("/ai/planning/stream")
+async def ai_planning_assistant_stream(
+    action: str = Query(..., description="suggest_slots | detect_conflicts | optimize"),
+    date_from: Optional[str] = Query(None, description="Date début (ISO)"),
+    date_to: Optional[str] = Query(None, description="Date fin (ISO)"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """📅 Assistant planning en streaming SSE (progression puis résultat)"""
+    if not AI_SERVICE_AVAILABLE:
+        return _sse_response(_single_event("error", {"success": False, "message": "Service IA non disponible"}))
+    
+    company_id = await get_user_company(user_data)
+    filters = {}
+    if date_from:
+        filters["date_from"] = date_from
+    if date_to:
+        filters["date_to"] = date_to
+    
+    async def events():
+        try:
+            yield {"event": "progress", "data": {"step": "loading_schedules"}}
+            schedules = await get_ai_service()._search_planning(company_id, filters)
+            yield {"event": "progress", "data": {"step": "schedules_loaded", "count": len(schedules)}}
+            yield {"event": "done", "data": _ai_planning_result(action, schedules)}
+        except Exception as e:
+            logger.error(f"❌ Erreur planning IA (stream): {e}")
+            yield {"event": "error", "data": {"success": False, "message": str(e)}}
+    
+    return _sse_response(events())
+
+@router.post("/ai/improve-text/stream")
+async def ai_improve_text_stream(
+    text: str = Query(..., description="Texte à améliorer (rapport technicien)"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """✨ Amélioration de texte technicien en streaming SSE"""
+    if not AI_SERVICE_AVAILABLE:
+        return _sse_response(_single_event("done", {"improved": text, "message": "Service IA non disponible. Texte non modifié."}))
+    
+    ai_service = get_ai_service()
+    company_id = await get_user_company(user_data)
+    if company_id:
+        await _enforce_ai_quota(ai_service, company_id)
+    return _sse_response(ai_service.stream_improve_text(text, company_id))
+
+@router.get("/ai/stats")
+async def ai_stats(
+    days: int = Query(30, ge=1, le=365, description="Historique de consommation (jours)"),
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    📊 STATISTIQUES D'UTILISATION IA
+    
+    Monitoring:
+    - Nombre de requêtes
+    - Cache hit rate
+    - Tokens utilisés
+    - Coût estimé
+    - Consommation historique de l'entreprise (par jour / endpoint) et budget du jour
+    """
+    try:
+        if not AI_SERVICE_AVAILABLE:
+            return {"success": False, "message": "Service IA non disponible"}
+        
+        # Vérifier rôle ADMIN ou BUREAU
+        if user_data.get("role") not in ["ADMIN", "BUREAU"]:
+            raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+        
+        ai_service = get_ai_service()
+        stats = ai_service.get_stats()
+        
+        company_id = await get_user_company(user_data)
+        usage = None
+        if company_id and ai_usage_meter is not None:
+            usage = await asyncio.to_thread(ai_usage_meter.history, company_id, days)
+        
+        return {
+            "success": True,
+            "stats": stats,
+            "usage": usage,
+            "usage_writer": ai_usage_meter.get_metrics() if ai_usage_meter is not None else None,
+            "mode": "simulation" if ai_service.simulation_mode else "production"
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Erreur stats IA: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -6,27 +6,191 @@ Coût estimé : ~150-300€/mois pour 100 utilisateurs actifs
 
 import os
 import json
+import time
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional, Callable
+import threading
+from typing import Dict, List, Any, AsyncIterator, Optional, Callable
 from datetime import datetime, timedelta
 from decimal import Decimal
-import hashlib
 from openai import AsyncOpenAI
 from supabase import Client
 
+from ai_cache import build_ai_cache, make_cache_key, normalize_query, history_digest
+from ai_aggregates import AIAggregates, format_projects_prompt, resolve_project_refs
+from ai_usage import get_usage_meter
+
+# Index BM25 des devis (SciPy optionnel : repli sur la recherche par mots-clés)
+try:
+    from quote_index import get_quote_index
+    QUOTE_INDEX_AVAILABLE = True
+except ImportError:
+    QUOTE_INDEX_AVAILABLE = False
+
 # Configuration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tarifs ($ / 1M tokens : input, output)
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+# Nombre maximal d'allers-retours modèle <-> outils par requête
+MAX_TOOL_ROUNDS = int(os.getenv("AI_MAX_TOOL_ROUNDS", "3"))
+
+# Outils appelés avec un dict de filtres (les autres reçoivent leurs arguments nommés)
+FILTER_TOOLS = {"search_devis", "search_clients", "search_searches", "search_planning"}
+
+# Functions exposées à GPT (tool calling)
+FUNCTIONS_SCHEMA = [
+    {
+        "name": "search_devis",
+        "description": "Recherche des devis avec filtres optionnels (client, montant, statut, dates)",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "client_name": {"type": "string", "description": "Nom du client"},
+                "status": {"type": "string", "enum": ["DRAFT", "SENT", "ACCEPTED", "REJECTED", "EXPIRED"]},
+                "min_amount": {"type": "number", "description": "Montant minimum"},
+                "max_amount": {"type": "number", "description": "Montant maximum"},
+                "date_from": {"type": "string", "description": "Date début ISO"},
+                "date_to": {"type": "string", "description": "Date fin ISO"},
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "search_clients",
+        "description": "Recherche des clients par nom, email ou ville",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string", "description": "Nom du client"},
+                "email": {"type": "string", "description": "Email"},
+                "city": {"type": "string", "description": "Ville"},
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "search_searches",
+        "description": "Recherche des rapports terrain avec filtres (lieu, statut, dates, technicien)",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "status": {"type": "string", "enum": ["DRAFT", "ACTIVE", "PROCESSED", "ARCHIVED"]},
+                "location": {"type": "string", "description": "Lieu de la recherche"},
+                "user_id": {"type": "string", "description": "ID du technicien"},
+                "date_from": {"type": "string", "description": "Date début"},
+                "date_to": {"type": "string", "description": "Date fin"},
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "search_planning",
+        "description": "Recherche dans le planning avec filtres (dates, technicien, lieu)",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "date": {"type": "string", "description": "Date spécifique"},
+                "date_from": {"type": "string", "description": "Date début"},
+                "date_to": {"type": "string", "description": "Date fin"},
+                "user_id": {"type": "string", "description": "ID du technicien"},
+                "location": {"type": "string", "description": "Lieu"},
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "get_statistics",
+        "description": "Récupère les statistiques de l'entreprise",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "period": {"type": "string", "enum": ["week", "month", "year"], "description": "Période"},
+            },
+            "required": []
+        }
+    },
+    {
+        "name": "generate_devis_draft",
+        "description": "Génère un brouillon de devis basé sur une description",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "client_id": {"type": "string", "description": "ID du client"},
+                "description": {"type": "string", "description": "Description des travaux"},
+            },
+            "required": ["client_id", "description"]
+        }
+    },
+    {
+        "name": "analyze_rapport",
+        "description": "Analyse un rapport de recherche terrain",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "search_id": {"type": "string", "description": "ID de la recherche"},
+            },
+            "required": ["search_id"]
+        }
+    },
+    {
+        "name": "predict_delays",
+        "description": "Prédit les retards potentiels dans les projets",
+        "parameters": {
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    },
+    {
+        "name": "get_client_details",
+        "description": "Détails d'un client avec l'historique de ses devis",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "client_id": {"type": "string", "description": "ID du client"},
+            },
+            "required": ["client_id"]
+        }
+    },
+    {
+        "name": "get_devis_details",
+        "description": "Détails complets d'un devis (lignes, client)",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "quote_id": {"type": "string", "description": "ID du devis"},
+            },
+            "required": ["quote_id"]
+        }
+    },
+]
+
+TOOLS_SCHEMA = [{"type": "function", "function": f} for f in FUNCTIONS_SCHEMA]
+
+
 class AIService:
     """Service IA central pour SkyApp avec architecture économique"""
     
-    def __init__(self, supabase_client: Client, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        supabase_client: Client,
+        api_key: Optional[str] = None,
+        openai_client: Optional[AsyncOpenAI] = None
+    ):
         self.supabase = supabase_client
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         
-        # Mode simulation si pas de clé API
-        if not self.api_key or self.api_key == "your-openai-api-key-here":
+        # Client fourni (tests, serveur de complétion local) ou mode simulation si pas de clé API
+        if openai_client is not None:
+            self.client = openai_client
+            self.simulation_mode = False
+        elif not self.api_key or self.api_key == "your-openai-api-key-here":
             self.client = None
             self.simulation_mode = True
             logger.warning("⚠️ Mode simulation - OpenAI API key non configurée")
@@ -35,9 +199,18 @@ class AIService:
             self.simulation_mode = False
             logger.info("✅ Service IA initialisé avec OpenAI")
         
-        # Cache simple en mémoire (utiliser Redis en production)
-        self.cache = {}
-        self.cache_ttl = 3600  # 1 heure
+        # Cache LRU borné + TTL (partagé entre workers si AI_CACHE_SQLITE_PATH)
+        self.cache = build_ai_cache()
+        
+        # Index de similarité des devis (partagé avec les endpoints /quotes)
+        self.quote_index = get_quote_index(supabase_client) if QUOTE_INDEX_AVAILABLE else None
+        
+        # Consommation par entreprise (écrite par lots, budgets et débit)
+        self.usage_meter = get_usage_meter(supabase_client)
+        self.aggregates = AIAggregates(supabase_client)
+        
+        # Durées par outil (tool calling)
+        self.tool_stats: Dict[str, Dict[str, float]] = {}
         
         # Statistiques d'utilisation
         self.stats = {
@@ -77,6 +250,10 @@ class AIService:
     # ÉTAPE 1 : FILTRAGE LOCAL (Supabase) - Pas de coût IA
     # ============================================================================
     
+    async def _execute(self, query):
+        """Exécute une requête Supabase hors de la boucle (outils lancés en parallèle)"""
+        return await asyncio.to_thread(query.execute)
+    
     async def _search_devis(self, company_id: str, filters: Dict[str, Any]) -> List[Dict]:
         """Recherche de devis avec filtrage local Supabase"""
         try:
@@ -85,7 +262,7 @@ class AIService:
             # Filtres optionnels
             if filters.get("client_name"):
                 # Recherche client par nom
-                clients = self.supabase.table("clients").select("id").eq("company_id", company_id).ilike("nom", f"%{filters['client_name']}%").execute()
+                clients = await self._execute(self.supabase.table("clients").select("id").eq("company_id", company_id).ilike("nom", f"%{filters['client_name']}%"))
                 client_ids = [c["id"] for c in clients.data]
                 if client_ids:
                     query = query.in_("client_id", client_ids)
@@ -106,7 +283,7 @@ class AIService:
                 query = query.lte("created_at", filters["date_to"])
             
             # Limite à 10 résultats (envoyer seulement ça à GPT)
-            result = query.order("created_at", desc=True).limit(10).execute()
+            result = await self._execute(query.order("created_at", desc=True).limit(10))
             
             logger.info(f"🔍 Filtrage local: {len(result.data)} devis trouvés")
             return result.data
@@ -129,7 +306,7 @@ class AIService:
             if filters.get("city"):
                 query = query.ilike("adresse", f"%{filters['city']}%")
             
-            result = query.order("nom").limit(10).execute()
+            result = await self._execute(query.order("nom").limit(10))
             logger.info(f"🔍 Filtrage local: {len(result.data)} clients trouvés")
             return result.data
         
@@ -157,7 +334,7 @@ class AIService:
             if filters.get("date_to"):
                 query = query.lte("created_at", filters["date_to"])
             
-            result = query.order("created_at", desc=True).limit(10).execute()
+            result = await self._execute(query.order("created_at", desc=True).limit(10))
             logger.info(f"🔍 Filtrage local: {len(result.data)} recherches trouvées")
             return result.data
         
@@ -185,7 +362,7 @@ class AIService:
             if filters.get("location"):
                 query = query.ilike("location", f"%{filters['location']}%")
             
-            result = query.order("date").limit(20).execute()
+            result = await self._execute(query.order("date").limit(20))
             logger.info(f"🔍 Filtrage local: {len(result.data)} événements trouvés")
             return result.data
         
@@ -196,7 +373,7 @@ class AIService:
     async def _get_devis_details(self, company_id: str, quote_id: str) -> Optional[Dict]:
         """Récupère les détails complets d'un devis"""
         try:
-            result = self.supabase.table("quotes").select("*, client:clients(*)").eq("id", quote_id).eq("company_id", company_id).single().execute()
+            result = await self._execute(self.supabase.table("quotes").select("*, client:clients(*)").eq("id", quote_id).eq("company_id", company_id).single())
             return result.data
         except Exception as e:
             logger.error(f"❌ Erreur détails devis: {e}")
@@ -205,8 +382,8 @@ class AIService:
     async def _get_client_details(self, company_id: str, client_id: str) -> Optional[Dict]:
         """Récupère les détails complets d'un client avec son historique"""
         try:
-            client = self.supabase.table("clients").select("*").eq("id", client_id).eq("company_id", company_id).single().execute()
-            quotes = self.supabase.table("quotes").select("*").eq("client_id", client_id).execute()
+            client = await self._execute(self.supabase.table("clients").select("*").eq("id", client_id).eq("company_id", company_id).single())
+            quotes = await self._execute(self.supabase.table("quotes").select("*").eq("client_id", client_id))
             
             return {
                 **client.data,
@@ -219,7 +396,7 @@ class AIService:
             return None
     
     async def _get_statistics(self, company_id: str, period: str = "month") -> Dict:
-        """Calcule des statistiques pour l'entreprise"""
+        """Statistiques de l'entreprise (agrégat serveur : compteurs, sommes, top devis)"""
         try:
             # Période
             now = datetime.utcnow()
@@ -230,31 +407,9 @@ class AIService:
             else:  # year
                 date_from = now - timedelta(days=365)
             
-            # Devis
-            quotes = self.supabase.table("quotes").select("*").eq("company_id", company_id).gte("created_at", date_from.isoformat()).execute()
-            
-            # Clients
-            clients = self.supabase.table("clients").select("id").eq("company_id", company_id).execute()
-            
-            # Recherches terrain
-            searches = self.supabase.table("searches").select("*").eq("company_id", company_id).gte("created_at", date_from.isoformat()).execute()
-            
-            return {
-                "period": period,
-                "quotes": {
-                    "total": len(quotes.data),
-                    "amount": sum(q.get("amount", 0) for q in quotes.data),
-                    "accepted": len([q for q in quotes.data if q.get("status") == "ACCEPTED"]),
-                    "pending": len([q for q in quotes.data if q.get("status") == "SENT"]),
-                },
-                "clients": {
-                    "total": len(clients.data)
-                },
-                "searches": {
-                    "total": len(searches.data),
-                    "processed": len([s for s in searches.data if s.get("status") == "PROCESSED"]),
-                }
-            }
+            stats = await asyncio.to_thread(self.aggregates.company_statistics, company_id, date_from)
+            stats.pop("source", None)
+            return {"period": period, **stats}
         except Exception as e:
             logger.error(f"❌ Erreur statistiques: {e}")
             return {}
@@ -266,7 +421,17 @@ class AIService:
     async def _analyze_rapport(self, company_id: str, search_id: str) -> Dict:
         """Analyse un rapport de recherche terrain (GPT-4o pour PDF complexes)"""
         try:
-            search = self.supabase.table("searches").select("*").eq("id", search_id).eq("company_id", company_id).single().execute()
+            search = await self._execute(self.supabase.table("searches").select("*").eq("id", search_id).eq("company_id", company_id).single())
+            
+            # Clé sur le contenu analysé : une modification du rapport invalide l'entrée
+            cache_key = make_cache_key(
+                "rapport", company_id, search_id,
+                search.data.get('location'), search.data.get('description'), search.data.get('observations')
+            )
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return cached
             
             if self.simulation_mode:
                 return {
@@ -302,13 +467,33 @@ Réponds en JSON avec:
             )
             
             result = json.loads(response.choices[0].message.content)
-            self._track_usage(response.usage)
+            self._track_usage(response.usage, company_id, "rapport", self.models["advanced"])
+            await self.cache.aset(cache_key, result)
             return result
         
         except Exception as e:
             logger.error(f"❌ Erreur analyse rapport: {e}")
             return {"error": str(e)}
     
+    def _devis_draft_messages(self, description: str, similar: List[Dict]) -> List[Dict[str, str]]:
+        context = f"Devis similaires trouvés:\n" + "\n".join([f"- {s.get('title')}: {s.get('amount')}€" for s in similar[:3]])
+        
+        prompt = f"""Génère un brouillon de devis pour:
+{description}
+
+{context if similar else "Pas de devis similaire trouvé"}
+
+Réponds en JSON avec:
+- title (titre du devis)
+- items (liste: description, quantity, unit_price, total)
+- total_ht, tva (20%), total_ttc
+- notes (conseils pour l'utilisateur)
+"""
+        return [
+            {"role": "system", "content": "Tu es un assistant BTP expert en devis. Sois précis et réaliste sur les prix."},
+            {"role": "user", "content": prompt}
+        ]
+    
     async def _generate_devis_draft(self, company_id: str, client_id: str, description: str) -> Dict:
         """Génère un brouillon de devis basé sur des devis similaires"""
         try:
@@ -330,32 +515,15 @@ Réponds en JSON avec:
                 }
             
             # GPT-4o-mini pour génération rapide
-            context = f"Devis similaires trouvés:\n" + "\n".join([f"- {s.get('title')}: {s.get('amount')}€" for s in similar[:3]])
-            
-            prompt = f"""Génère un brouillon de devis pour:
-{description}
-
-{context if similar else "Pas de devis similaire trouvé"}
-
-Réponds en JSON avec:
-- title (titre du devis)
-- items (liste: description, quantity, unit_price, total)
-- total_ht, tva (20%), total_ttc
-- notes (conseils pour l'utilisateur)
-"""
-            
             response = await self.client.chat.completions.create(
                 model=self.models["fast"],  # GPT-4o-mini suffisant
-                messages=[
-                    {"role": "system", "content": "Tu es un assistant BTP expert en devis. Sois précis et réaliste sur les prix."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._devis_draft_messages(description, similar),
                 temperature=0.5,
                 response_format={"type": "json_object"}
             )
             
             result = json.loads(response.choices[0].message.content)
-            self._track_usage(response.usage)
+            self._track_usage(response.usage, company_id, "devis", self.models["fast"])
             return result
         
         except Exception as e:
@@ -365,6 +533,9 @@ Réponds en JSON avec:
     async def _find_similar_devis(self, company_id: str, description: str) -> List[Dict]:
         """Trouve des devis similaires pour pré-remplissage"""
         try:
+            if self.quote_index is not None:
+                return await asyncio.to_thread(self.quote_index.search, company_id, description, 5)
+            
             # Recherche simple par mots-clés
             quotes = self.supabase.table("quotes").select("*").eq("company_id", company_id).limit(50).execute()
             
@@ -389,8 +560,8 @@ Réponds en JSON avec:
     async def _predict_delays(self, company_id: str) -> Dict:
         """Prédit les retards potentiels dans les projets (IA prédictive)"""
         try:
-            # Récupérer projets en cours
-            projects = self.supabase.table("projects").select("*").eq("company_id", company_id).in_("status", ["ACTIVE", "IN_PROGRESS"]).execute()
+            # Échéances des projets en cours (compteurs + projets les plus urgents)
+            summary = await asyncio.to_thread(self.aggregates.projects_at_risk, company_id)
             
             if self.simulation_mode:
                 return {
@@ -400,19 +571,17 @@ Réponds en JSON avec:
                     ]
                 }
             
-            # Analyser avec GPT-4o-mini
-            projects_summary = "\n".join([
-                f"- {p.get('title')}: statut {p.get('status')}, deadline {p.get('deadline_date', 'N/A')}"
-                for p in projects.data[:10]
-            ])
+            if not summary.get("active"):
+                return {"at_risk": 0, "predictions": []}
             
+            # Analyser avec GPT-4o-mini
             prompt = f"""Analyse ces projets BTP et prédit les risques de retard:
 
-{projects_summary}
+{format_projects_prompt(summary)}
 
 Réponds en JSON avec:
 - at_risk (nombre de projets à risque)
-- predictions (liste: project_id, risk_level (LOW/MEDIUM/HIGH), reasons)
+- predictions (liste: project_id (référence #n), risk_level (LOW/MEDIUM/HIGH), reasons)
 """
             
             response = await self.client.chat.completions.create(
@@ -426,7 +595,9 @@ Réponds en JSON avec:
             )
             
             result = json.loads(response.choices[0].message.content)
-            self._track_usage(response.usage)
+            resolve_project_refs(result.get("predictions") or [], summary)
+            result["summary"] = {k: summary.get(k) for k in ("active", "overdue", "due_soon", "no_end_date")}
+            self._track_usage(response.usage, company_id, "predictions", self.models["fast"])
             return result
         
         except Exception as e:
@@ -437,150 +608,27 @@ Réponds en JSON avec:
     # ÉTAPE 2 : IA DÉCIDE (sur résultats filtrés uniquement)
     # ============================================================================
     
-    async def universal_query(
+    def _build_query_messages(
         self,
         company_id: str,
         user_query: str,
         user_role: str,
         conversation_history: Optional[List[Dict]] = None
-    ) -> Dict[str, Any]:
-        """
-        Requête universelle IA - Interprète la demande et route vers les bonnes functions
-        Architecture: Filtrage local → IA décide
-        """
-        self.stats["total_requests"] += 1
-        
-        # Vérifier cache
-        cache_key = self._get_cache_key(company_id, user_query)
-        if cache_key in self.cache:
-            cache_entry = self.cache[cache_key]
-            if datetime.utcnow().timestamp() - cache_entry["timestamp"] < self.cache_ttl:
-                self.stats["cache_hits"] += 1
-                logger.info("💾 Réponse du cache")
-                return cache_entry["response"]
-        
-        if self.simulation_mode:
-            return self._simulate_response(user_query)
-        
-        try:
-            # Définir les functions disponibles pour GPT
-            functions_schema = [
-                {
-                    "name": "search_devis",
-                    "description": "Recherche des devis avec filtres optionnels (client, montant, statut, dates)",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "client_name": {"type": "string", "description": "Nom du client"},
-                            "status": {"type": "string", "enum": ["DRAFT", "SENT", "ACCEPTED", "REJECTED", "EXPIRED"]},
-                            "min_amount": {"type": "number", "description": "Montant minimum"},
-                            "max_amount": {"type": "number", "description": "Montant maximum"},
-                            "date_from": {"type": "string", "description": "Date début ISO"},
-                            "date_to": {"type": "string", "description": "Date fin ISO"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "search_clients",
-                    "description": "Recherche des clients par nom, email ou ville",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "name": {"type": "string", "description": "Nom du client"},
-                            "email": {"type": "string", "description": "Email"},
-                            "city": {"type": "string", "description": "Ville"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "search_searches",
-                    "description": "Recherche des rapports terrain avec filtres (lieu, statut, dates, technicien)",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "status": {"type": "string", "enum": ["DRAFT", "ACTIVE", "PROCESSED", "ARCHIVED"]},
-                            "location": {"type": "string", "description": "Lieu de la recherche"},
-                            "user_id": {"type": "string", "description": "ID du technicien"},
-                            "date_from": {"type": "string", "description": "Date début"},
-                            "date_to": {"type": "string", "description": "Date fin"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "search_planning",
-                    "description": "Recherche dans le planning avec filtres (dates, technicien, lieu)",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "date": {"type": "string", "description": "Date spécifique"},
-                            "date_from": {"type": "string", "description": "Date début"},
-                            "date_to": {"type": "string", "description": "Date fin"},
-                            "user_id": {"type": "string", "description": "ID du technicien"},
-                            "location": {"type": "string", "description": "Lieu"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "get_statistics",
-                    "description": "Récupère les statistiques de l'entreprise",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "period": {"type": "string", "enum": ["week", "month", "year"], "description": "Période"},
-                        },
-                        "required": []
-                    }
-                },
-                {
-                    "name": "generate_devis_draft",
-                    "description": "Génère un brouillon de devis basé sur une description",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "client_id": {"type": "string", "description": "ID du client"},
-                            "description": {"type": "string", "description": "Description des travaux"},
-                        },
-                        "required": ["client_id", "description"]
-                    }
-                },
-                {
-                    "name": "analyze_rapport",
-                    "description": "Analyse un rapport de recherche terrain",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "search_id": {"type": "string", "description": "ID de la recherche"},
-                        },
-                        "required": ["search_id"]
-                    }
-                },
-                {
-                    "name": "predict_delays",
-                    "description": "Prédit les retards potentiels dans les projets",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                        "required": []
-                    }
-                },
-            ]
-            
-            # Contexte système
-            system_context = f"""Tu es SkyBot, l'assistant IA intelligent de SkyApp, le premier logiciel BTP intelligent en France.
+    ) -> List[Dict[str, Any]]:
+        """Messages de la requête universelle : contexte système, historique, question"""
+        # Contexte système
+        system_context = f"""Tu es SkyBot, l'assistant IA intelligent de SkyApp, le premier logiciel BTP intelligent en France.
 
 Rôle utilisateur: {user_role}
 Entreprise ID: {company_id}
 
 RÈGLES IMPORTANTES:
-1. Tu DOIS utiliser les functions pour chercher des données
+1. Tu DOIS utiliser les outils pour chercher des données
 2. Tu NE PEUX PAS inventer de données
 3. Réponds toujours en français professionnel
 4. Sois concis et précis
 5. Pour les recherches, utilise les filtres appropriés
+6. Si la question porte sur plusieurs éléments (ex: devis ET planning), appelle tous les outils nécessaires en une seule fois
 
 RESTRICTIONS:
 - Tu NE PEUX PAS créer/modifier/supprimer des factures
@@ -594,83 +642,93 @@ CAPACITÉS:
 - Prédire retards et problèmes
 - Calculer statistiques
 """
+        
+        # Messages avec historique
+        messages = [
+            {"role": "system", "content": system_context}
+        ]
+        
+        if conversation_history:
+            messages.extend(conversation_history[-10:])  # 10 derniers messages
+        
+        messages.append({"role": "user", "content": user_query})
+        return messages
+    
+    def check_quota(self, company_id: str):
+        """
+        Budget journalier et débit de l'entreprise, à vérifier avant un appel OpenAI
+        
+        Raises:
+            AIQuotaExceededError
+        """
+        if not self.simulation_mode:
+            self.usage_meter.check(company_id)
+    
+    async def universal_query(
+        self,
+        company_id: str,
+        user_query: str,
+        user_role: str,
+        conversation_history: Optional[List[Dict]] = None
+    ) -> Dict[str, Any]:
+        """
+        Requête universelle IA - Interprète la demande et route vers les bonnes functions
+        Architecture: Filtrage local → IA décide
+        """
+        self.stats["total_requests"] += 1
+        
+        # Vérifier cache
+        cache_key = self._get_cache_key(company_id, user_query, user_role, conversation_history)
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            logger.info("💾 Réponse du cache")
+            return cached
+        
+        if self.simulation_mode:
+            return self._simulate_response(user_query)
+        
+        try:
+            messages = self._build_query_messages(company_id, user_query, user_role, conversation_history)
             
-            # Messages avec historique
-            messages = [
-                {"role": "system", "content": system_context}
-            ]
-            
-            if conversation_history:
-                messages.extend(conversation_history[-10:])  # 10 derniers messages
-            
-            messages.append({"role": "user", "content": user_query})
-            
-            # Appel GPT avec function calling (GPT-4o-mini pour 95% des cas)
-            response = await self.client.chat.completions.create(
-                model=self.models["fast"],  # GPT-4o-mini - économique
-                messages=messages,
-                functions=functions_schema,
-                function_call="auto",
-                temperature=0.5,
-                max_tokens=1000
-            )
-            
-            message = response.choices[0].message
-            self._track_usage(response.usage)
+            tokens_used = 0
+            tool_log: List[Dict[str, Any]] = []
+            tool_results: List[Any] = []
             
-            # Si function call
-            if message.function_call:
-                function_name = message.function_call.name
-                function_args = json.loads(message.function_call.arguments)
+            # Boucle tool calling bornée : tous les outils d'un tour s'exécutent en parallèle
+            for round_index in range(MAX_TOOL_ROUNDS + 1):
+                response = await self.client.chat.completions.create(
+                    model=self.models["fast"],  # GPT-4o-mini - économique
+                    messages=messages,
+                    tools=TOOLS_SCHEMA,
+                    # Dernier tour : réponse finale imposée
+                    tool_choice="auto" if round_index < MAX_TOOL_ROUNDS else "none",
+                    temperature=0.5,
+                    max_tokens=1000
+                )
+                self._track_usage(response.usage, company_id, "query", self.models["fast"])
+                tokens_used += response.usage.total_tokens
+                message = response.choices[0].message
                 
-                logger.info(f"🔧 Function call: {function_name} avec args {function_args}")
+                if not message.tool_calls:
+                    break
                 
-                # Exécuter la function
-                if function_name in self.functions:
-                    function_result = await self.functions[function_name](company_id, **function_args)
-                    
-                    # Envoyer résultat à GPT pour formulation finale
-                    messages.append({
-                        "role": "function",
-                        "name": function_name,
-                        "content": json.dumps(function_result, ensure_ascii=False, default=str)
-                    })
-                    
-                    final_response = await self.client.chat.completions.create(
-                        model=self.models["fast"],
-                        messages=messages,
-                        temperature=0.5,
-                        max_tokens=800
-                    )
-                    
-                    self._track_usage(final_response.usage)
-                    final_message = final_response.choices[0].message.content
-                    
-                    result = {
-                        "success": True,
-                        "message": final_message,
-                        "function_called": function_name,
-                        "data": function_result,
-                        "tokens_used": response.usage.total_tokens + final_response.usage.total_tokens
-                    }
-                else:
-                    result = {
-                        "success": False,
-                        "message": f"Function {function_name} non disponible"
-                    }
-            else:
-                # Réponse directe sans function
-                result = {
-                    "success": True,
-                    "message": message.content,
-                    "tokens_used": response.usage.total_tokens
-                }
+                calls = [
+                    {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+                    for call in message.tool_calls
+                ]
+                messages.append(self._assistant_tool_message(message.content, calls))
+                entries = await self._run_tool_calls(company_id, calls)
+                for call, entry in zip(calls, entries):
+                    messages.append(self._tool_result_message(call["id"], entry["result"]))
+                    tool_results.append(entry.pop("result"))
+                    tool_log.append(entry)
             
-            # Mettre en cache
-            self.cache[cache_key] = {
-                "response": result,
-                "timestamp": datetime.utcnow().timestamp()
-            }
+            result = self._query_result(message.content, tool_log, tool_results, tokens_used, round_index)
+            
+            # Mettre en cache (réponses réussies uniquement)
+            if result.get("success"):
+                await self.cache.aset(cache_key, result)
             
             return result
         
@@ -681,22 +739,376 @@ CAPACITÉS:
                 "message": f"Erreur: {str(e)}"
             }
     
+    # ============================================================================
+    # TOOL CALLING - exécution parallèle des outils demandés par le modèle
+    # ============================================================================
+    
+    async def _call_tool(self, company_id: str, name: str, args: Dict[str, Any]) -> Any:
+        function = self.functions[name]
+        if name in FILTER_TOOLS:
+            return await function(company_id, args)
+        return await function(company_id, **args)
+    
+    async def _run_tool(self, company_id: str, call: Dict[str, Any]) -> Dict[str, Any]:
+        """Exécute un outil ; l'erreur est renvoyée au modèle plutôt que levée"""
+        name = call["name"]
+        args: Dict[str, Any] = {}
+        started = time.perf_counter()
+        try:
+            args = json.loads(call.get("arguments") or "{}")
+            if name not in self.functions:
+                raise ValueError(f"Outil {name} non disponible")
+            result, ok = await self._call_tool(company_id, name, args), True
+        except Exception as e:
+            result, ok = {"error": str(e)}, False
+            logger.error(f"❌ Erreur outil {name}: {e}")
+        duration_ms = (time.perf_counter() - started) * 1000
+        self._record_tool_timing(name, duration_ms, ok)
+        return {"name": name, "arguments": args, "duration_ms": round(duration_ms, 1), "ok": ok, "result": result}
+    
+    async def _run_tool_calls(self, company_id: str, calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Lance tous les outils d'un tour en parallèle (asyncio.gather, ordre conservé)"""
+        logger.info(f"🔧 Outils: {', '.join(c['name'] for c in calls)}")
+        return list(await asyncio.gather(*(self._run_tool(company_id, call) for call in calls)))
+    
+    def _record_tool_timing(self, name: str, duration_ms: float, ok: bool):
+        stats = self.tool_stats.setdefault(name, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += 0 if ok else 1
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+    
+    @staticmethod
+    def _assistant_tool_message(content: Optional[str], calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "role": "assistant",
+            "content": content,
+            "tool_calls": [
+                {"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["arguments"] or "{}"}}
+                for c in calls
+            ]
+        }
+    
+    @staticmethod
+    def _tool_result_message(call_id: str, result: Any) -> Dict[str, Any]:
+        return {
+            "role": "tool",
+            "tool_call_id": call_id,
+            # JSON compact : les séparateurs sans espaces économisent des tokens de prompt
+            "content": json.dumps(result, ensure_ascii=False, default=str, separators=(",", ":"))
+        }
+    
+    @staticmethod
+    def _query_result(
+        content: Optional[str],
+        tool_log: List[Dict[str, Any]],
+        tool_results: List[Any],
+        tokens_used: int,
+        rounds: int
+    ) -> Dict[str, Any]:
+        """Résultat de universal_query (function_called / data conservés pour un seul outil)"""
+        result: Dict[str, Any] = {"success": True, "message": content, "tokens_used": tokens_used}
+        if tool_log:
+            result["function_called"] = tool_log[0]["name"]
+            result["functions_called"] = [t["name"] for t in tool_log]
+            result["data"] = tool_results[0] if len(tool_results) == 1 else [
+                {"tool": t["name"], "arguments": t["arguments"], "result": r}
+                for t, r in zip(tool_log, tool_results)
+            ]
+            result["tool_calls"] = tool_log
+            result["rounds"] = rounds
+        return result
+    
+    def _improve_text_messages(self, text: str) -> List[Dict[str, str]]:
+        messages = [
+            {
+                "role": "system",
+                "content": """Tu es un assistant qui améliore les rapports de techniciens BTP.
+
+RÈGLES:
+1. Corrige TOUTES les fautes d'orthographe et de grammaire
+2. Réécris de manière professionnelle mais concise
+3. Garde le sens exact du message original
+4. Utilise le vocabulaire BTP approprié
+5. Structure en phrases courtes et claires
+6. NE PAS inventer d'informations
+7. Si le texte est déjà correct, retourne-le tel quel
+
+FORMAT DE RÉPONSE:
+Retourne UNIQUEMENT le texte amélioré, sans préambule ni explication."""
+            },
+            {
+                "role": "user",
+                "content": f"Améliore ce rapport technicien:\n\n{text}"
+            }
+        ]
+        return messages
+    
+    async def improve_text(self, text: str, company_id: Optional[str] = None) -> Dict[str, Any]:
+        """Corrige et reformule un rapport technicien (GPT-4o-mini, réponses en cache)"""
+        self.stats["total_requests"] += 1
+        
+        cache_key = make_cache_key("improve_text", text.strip())
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return {**cached, "cached": True}
+        
+        if self.simulation_mode:
+            return {"improved": text, "tokens": 0, "simulation": True}
+        
+        response = await self.client.chat.completions.create(
+            model=self.models["fast"],
+            messages=self._improve_text_messages(text),
+            temperature=0.3,
+            max_tokens=1000
+        )
+        self._track_usage(response.usage, company_id, "improve-text", self.models["fast"])
+        
+        result = {
+            "improved": response.choices[0].message.content.strip(),
+            "tokens": response.usage.total_tokens
+        }
+        await self.cache.aset(cache_key, result)
+        return result
+    
+    # ============================================================================
+    # STREAMING (SSE) - tokens transmis au fil de la génération
+    # ============================================================================
+    
+    async def _stream_completion(
+        self,
+        company_id: Optional[str] = None,
+        endpoint: str = "stream",
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Complétion en streaming : émet {"event": "token"} pour chaque fragment,
+        puis un événement interne "_completion" avec le texte complet, les tool
+        calls reconstitués (fragments indexés) et l'usage (stream_options.include_usage)
+        """
+        stream = await self.client.chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs
+        )
+        content_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        usage = None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield {"event": "token", "data": delta.content}
+            for fragment in delta.tool_calls or []:
+                call = tool_calls.setdefault(fragment.index, {"id": None, "name": None, "arguments": ""})
+                if fragment.id:
+                    call["id"] = fragment.id
+                if fragment.function is not None:
+                    if fragment.function.name:
+                        call["name"] = fragment.function.name
+                    if fragment.function.arguments:
+                        call["arguments"] += fragment.function.arguments
+        if usage is not None:
+            self._track_usage(usage, company_id, endpoint, kwargs.get("model"))
+        yield {
+            "event": "_completion",
+            "content": "".join(content_parts),
+            "tool_calls": [tool_calls[i] for i in sorted(tool_calls)],
+            "tokens": usage.total_tokens if usage is not None else 0,
+        }
+    
+    async def stream_universal_query(
+        self,
+        company_id: str,
+        user_query: str,
+        user_role: str,
+        conversation_history: Optional[List[Dict]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Variante streaming de universal_query
+        
+        Événements: token, function_call, function_result, done (résultat complet
+        identique à universal_query, mis en cache), error
+        """
+        self.stats["total_requests"] += 1
+        
+        cache_key = self._get_cache_key(company_id, user_query, user_role, conversation_history)
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            yield {"event": "done", "data": {**cached, "cached": True}}
+            return
+        
+        if self.simulation_mode:
+            result = self._simulate_response(user_query)
+            yield {"event": "token", "data": result["message"]}
+            yield {"event": "done", "data": result}
+            return
+        
+        try:
+            messages = self._build_query_messages(company_id, user_query, user_role, conversation_history)
+            tokens_used = 0
+            tool_log: List[Dict[str, Any]] = []
+            tool_results: List[Any] = []
+            
+            for round_index in range(MAX_TOOL_ROUNDS + 1):
+                completion = None
+                async for event in self._stream_completion(
+                    company_id, "query",
+                    model=self.models["fast"],
+                    messages=messages,
+                    tools=TOOLS_SCHEMA,
+                    tool_choice="auto" if round_index < MAX_TOOL_ROUNDS else "none",
+                    temperature=0.5,
+                    max_tokens=1000
+                ):
+                    if event["event"] == "_completion":
+                        completion = event
+                    else:
+                        yield event
+                tokens_used += completion["tokens"]
+                
+                calls = completion["tool_calls"]
+                if not calls:
+                    break
+                
+                for call in calls:
+                    try:
+                        arguments = json.loads(call["arguments"] or "{}")
+                    except ValueError:
+                        arguments = call["arguments"]
+                    yield {"event": "function_call", "data": {"name": call["name"], "arguments": arguments}}
+                messages.append(self._assistant_tool_message(completion["content"] or None, calls))
+                entries = await self._run_tool_calls(company_id, calls)
+                for call, entry in zip(calls, entries):
+                    result_data = entry.pop("result")
+                    messages.append(self._tool_result_message(call["id"], result_data))
+                    tool_results.append(result_data)
+                    tool_log.append(entry)
+                    yield {"event": "function_result", "data": {
+                        "name": entry["name"],
+                        "count": len(result_data) if isinstance(result_data, list) else None,
+                        "duration_ms": entry["duration_ms"],
+                        "ok": entry["ok"]
+                    }}
+            
+            result = self._query_result(completion["content"], tool_log, tool_results, tokens_used, round_index)
+            await self.cache.aset(cache_key, result)
+            yield {"event": "done", "data": result}
+        
+        except Exception as e:
+            logger.error(f"❌ Erreur requête universelle (stream): {e}")
+            yield {"event": "error", "data": {"success": False, "message": f"Erreur: {str(e)}"}}
+    
+    async def stream_improve_text(self, text: str, company_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Variante streaming de improve_text (même cache)"""
+        self.stats["total_requests"] += 1
+        
+        cache_key = make_cache_key("improve_text", text.strip())
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            yield {"event": "done", "data": {**cached, "cached": True}}
+            return
+        
+        if self.simulation_mode:
+            yield {"event": "done", "data": {"improved": text, "tokens": 0, "simulation": True}}
+            return
+        
+        try:
+            completion = None
+            async for event in self._stream_completion(
+                company_id, "improve-text",
+                model=self.models["fast"],
+                messages=self._improve_text_messages(text),
+                temperature=0.3,
+                max_tokens=1000
+            ):
+                if event["event"] == "_completion":
+                    completion = event
+                else:
+                    yield event
+            
+            result = {"improved": completion["content"].strip(), "tokens": completion["tokens"]}
+            await self.cache.aset(cache_key, result)
+            yield {"event": "done", "data": result}
+        
+        except Exception as e:
+            logger.error(f"❌ Erreur amélioration texte (stream): {e}")
+            yield {"event": "error", "data": {"success": False, "message": f"Erreur: {str(e)}"}}
+    
+    async def stream_devis_draft(self, company_id: str, client_id: str, description: str) -> AsyncIterator[Dict[str, Any]]:
+        """Variante streaming de _generate_devis_draft (JSON transmis au fil de l'eau)"""
+        try:
+            similar = await self._find_similar_devis(company_id, description)
+            yield {"event": "similar_quotes", "data": [
+                {"id": q.get("id"), "title": q.get("title"), "amount": q.get("amount")} for q in similar[:3]
+            ]}
+            
+            if self.simulation_mode:
+                yield {"event": "done", "data": await self._generate_devis_draft(company_id, client_id, description)}
+                return
+            
+            completion = None
+            async for event in self._stream_completion(
+                company_id, "devis",
+                model=self.models["fast"],
+                messages=self._devis_draft_messages(description, similar),
+                temperature=0.5,
+                response_format={"type": "json_object"}
+            ):
+                if event["event"] == "_completion":
+                    completion = event
+                else:
+                    yield event
+            
+            yield {"event": "done", "data": json.loads(completion["content"])}
+        
+        except Exception as e:
+            logger.error(f"❌ Erreur génération devis (stream): {e}")
+            yield {"event": "error", "data": {"success": False, "message": f"Erreur: {str(e)}"}}
+    
     # ============================================================================
     # UTILITAIRES
     # ============================================================================
     
-    def _get_cache_key(self, company_id: str, query: str) -> str:
-        """Génère une clé de cache unique"""
-        return hashlib.md5(f"{company_id}:{query}".encode()).hexdigest()
+    def _get_cache_key(
+        self,
+        company_id: str,
+        query: str,
+        user_role: str = "",
+        conversation_history: Optional[List[Dict]] = None
+    ) -> str:
+        """Clé de cache : entreprise + rôle + requête normalisée + empreinte de l'historique"""
+        return make_cache_key(
+            "query", company_id, user_role, normalize_query(query), history_digest(conversation_history)
+        )
     
-    def _track_usage(self, usage):
-        """Suit l'utilisation des tokens et estime le coût"""
+    def _track_usage(
+        self,
+        usage,
+        company_id: Optional[str] = None,
+        endpoint: str = "other",
+        model: Optional[str] = None
+    ):
+        """Suit l'utilisation des tokens, estime le coût et l'impute à l'entreprise"""
         self.stats["tokens_used"] += usage.total_tokens
         
-        # Estimation coût (GPT-4o-mini: 0.15$ input + 0.60$ output / 1M tokens)
-        input_cost = (usage.prompt_tokens / 1_000_000) * 0.15
-        output_cost = (usage.completion_tokens / 1_000_000) * 0.60
-        self.stats["cost_estimate"] += input_cost + output_cost
+        # Estimation coût ($ / 1M tokens input, output) - GPT-4o-mini par défaut
+        input_price, output_price = MODEL_PRICING.get(model, MODEL_PRICING["gpt-4o-mini"])
+        cost = (usage.prompt_tokens / 1_000_000) * input_price + (usage.completion_tokens / 1_000_000) * output_price
+        self.stats["cost_estimate"] += cost
+        
+        if company_id:
+            self.usage_meter.record(
+                company_id, endpoint, model or self.models["fast"],
+                usage.prompt_tokens, usage.completion_tokens, cost
+            )
     
     def _simulate_response(self, query: str) -> Dict:
         """Mode simulation sans API key"""
@@ -747,12 +1159,17 @@ CAPACITÉS:
         return {
             **self.stats,
             "cache_hit_rate": f"{(self.stats['cache_hits'] / max(1, self.stats['total_requests'])) * 100:.1f}%",
-            "cost_estimate_formatted": f"{self.stats['cost_estimate']:.4f}€"
+            "cost_estimate_formatted": f"{self.stats['cost_estimate']:.4f}€",
+            "cache": self.cache.get_metrics(),
+            "tools": {
+                name: {**t, "avg_ms": round(t["total_ms"] / max(1, t["calls"]), 1)}
+                for name, t in self.tool_stats.items()
+            }
         }
     
     def clear_cache(self):
         """Vide le cache"""
-        self.cache = {}
+        self.cache.clear()
         logger.info("🗑️ Cache vidé")
 
 
@@ -761,6 +1178,7 @@ CAPACITÉS:
 # ============================================================================
 
 _ai_service_instance: Optional[AIService] = None
+_init_lock = threading.Lock()
 
 def init_ai_service(supabase_client: Client, api_key: Optional[str] = None):
     """Initialise le service IA global"""
@@ -769,6 +1187,13 @@ def init_ai_service(supabase_client: Client, api_key: Optional[str] = None):
     logger.info("✅ Service IA initialisé")
     return _ai_service_instance
 
+def get_or_init_ai_service(supabase_client: Client) -> AIService:
+    """Instance partagée, créée au premier appel (thread-safe : préchargement en tâche de fond)"""
+    with _init_lock:
+        if _ai_service_instance is None:
+            init_ai_service(supabase_client)
+    return _ai_service_instance
+
 def get_ai_service() -> AIService:
     """Retourne l'instance du service IA"""
     if _ai_service_instance is None:
@@ -0,0 +1,348 @@
+"""
+AI Usage - Comptage de la consommation IA par entreprise
+
+- record() cumule en mémoire par (entreprise, jour, endpoint, modèle) ;
+  une tâche de fond écrit les compteurs par lots via la fonction SQL
+  record_ai_usage (un appel par lot, incréments côté serveur)
+- check() est appelé avant chaque appel OpenAI : budget de tokens
+  journalier (persisté + non encore écrit) et limiteur de débit par
+  entreprise ; lève AIQuotaExceededError (=> HTTP 429)
+- history() relit les compteurs journaliers pour /ai/stats
+
+Limites par défaut : AI_DAILY_TOKEN_BUDGET (0 = illimité) et
+AI_REQUESTS_PER_MINUTE ; surcharge possible par entreprise dans
+la table ai_company_limits.
+
+check() s'exécute dans un thread (asyncio.to_thread) pendant que record()
+et flush() tournent sur la boucle : les compteurs en attente et les seaux
+du limiteur sont protégés par un verrou, jamais tenu pendant un appel
+Supabase.
+
+Le limiteur de débit est propre à chaque processus : avec plusieurs
+workers uvicorn (WEB_CONCURRENCY), chacun applique sa part de la limite
+(limite / nombre de workers) pour que le total reste proche de la limite
+configurée. La répartition des requêtes entre workers n'étant pas
+parfaite, une entreprise peut être refusée un peu avant la limite.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+USAGE_TABLE = "ai_usage_daily"
+LIMITS_TABLE = "ai_company_limits"
+
+DEFAULT_DAILY_TOKEN_BUDGET = int(os.getenv("AI_DAILY_TOKEN_BUDGET", "0"))
+DEFAULT_REQUESTS_PER_MINUTE = int(os.getenv("AI_REQUESTS_PER_MINUTE", "30"))
+# Nombre de workers uvicorn (uvicorn lit la même variable quand --workers est absent)
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Durée de validité des valeurs relues en base (consommation du jour, limites)
+PERSISTED_CACHE_TTL = 60.0
+LIMITS_CACHE_TTL = 300.0
+
+
+class AIQuotaExceededError(Exception):
+    """Budget journalier ou débit IA dépassé pour l'entreprise"""
+
+    def __init__(self, reason: str, message: str, retry_after: int):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _seconds_until_midnight_utc() -> int:
+    now = datetime.now(timezone.utc)
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+class CompanyRateLimiter:
+    """Seau à jetons par entreprise (requêtes / minute), sans attente : accepte ou refuse"""
+
+    def __init__(self, requests_per_minute: int, workers: int = WORKER_COUNT):
+        self.requests_per_minute = requests_per_minute
+        self.workers = max(1, workers)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str, requests_per_minute: Optional[int] = None) -> float:
+        """0 si la requête passe, sinon nombre de secondes avant le prochain jeton"""
+        rate = requests_per_minute or self.requests_per_minute
+        if rate <= 0:
+            return 0.0
+        # Part de ce worker dans la limite de l'entreprise (au moins une requête par minute)
+        rate = max(1.0, rate / self.workers)
+        # Lecture-modification-écriture atomique : deux vérifications simultanées ne prennent pas le même jeton
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(key, (float(rate), now))
+            tokens = min(float(rate), tokens + (now - updated) * rate / 60.0)
+            if tokens < 1.0:
+                self._buckets[key] = (tokens, now)
+                return (1.0 - tokens) * 60.0 / rate
+            self._buckets[key] = (tokens - 1.0, now)
+            return 0.0
+
+
+class AIUsageMeter:
+    """Compteurs de consommation IA par entreprise, écrits par lots"""
+
+    def __init__(
+        self,
+        supabase_client,
+        daily_token_budget: int = DEFAULT_DAILY_TOKEN_BUDGET,
+        requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+        flush_interval: float = 5.0,
+        max_pending_keys: int = 500
+    ):
+        self.supabase = supabase_client
+        self.daily_token_budget = daily_token_budget
+        self.flush_interval = flush_interval
+        self.max_pending_keys = max_pending_keys
+        self.rate_limiter = CompanyRateLimiter(requests_per_minute)
+        self._pending: Dict[Tuple[str, str, str, str], Dict[str, float]] = {}
+        self._persisted_today: Dict[str, Tuple[float, str, int]] = {}
+        self._limits: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()  # _pending et _persisted_today (boucle + threads de check())
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"recorded": 0, "flushes": 0, "rows_written": 0, "flush_errors": 0, "rejected": 0}
+
+    # -- enregistrement --------------------------------------------------
+
+    def record(
+        self,
+        company_id: str,
+        endpoint: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost_estimate: float
+    ):
+        """Cumule un appel OpenAI (non bloquant ; écrit au prochain lot)"""
+        key = (company_id, _today().isoformat(), endpoint, model)
+        with self._lock:
+            counters = self._pending.setdefault(key, {
+                "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost_estimate": 0.0
+            })
+            counters["requests"] += 1
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["total_tokens"] += prompt_tokens + completion_tokens
+            counters["cost_estimate"] += cost_estimate
+            pending_keys = len(self._pending)
+        self._stats["recorded"] += 1
+        if pending_keys >= self.max_pending_keys and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _pending_tokens(self, company_id: str) -> int:
+        today = _today().isoformat()
+        with self._lock:
+            return int(sum(
+                c["total_tokens"] for (cid, day, _, _), c in self._pending.items()
+                if cid == company_id and day == today
+            ))
+
+    # -- limites ---------------------------------------------------------
+
+    def _company_limits(self, company_id: str) -> Dict[str, Any]:
+        cached = self._limits.get(company_id)
+        if cached is not None and time.monotonic() - cached[0] < LIMITS_CACHE_TTL:
+            return cached[1]
+        limits: Dict[str, Any] = {}
+        if self.supabase is not None:
+            try:
+                result = self.supabase.table(LIMITS_TABLE).select("daily_token_budget, requests_per_minute") \
+                    .eq("company_id", company_id).limit(1).execute()
+                limits = (result.data or [{}])[0]
+            except Exception as e:
+                logger.warning(f"⚠️ Limites IA indisponibles pour {company_id}: {e}")
+        self._limits[company_id] = (time.monotonic(), limits)
+        return limits
+
+    def _persisted_tokens_today(self, company_id: str) -> int:
+        today = _today().isoformat()
+        with self._lock:
+            cached = self._persisted_today.get(company_id)
+        if cached is not None and cached[1] == today and time.monotonic() - cached[0] < PERSISTED_CACHE_TTL:
+            return cached[2]
+        total = 0
+        if self.supabase is not None:
+            try:
+                result = self.supabase.table(USAGE_TABLE).select("total_tokens") \
+                    .eq("company_id", company_id).eq("usage_date", today).execute()
+                total = sum(int(r.get("total_tokens") or 0) for r in result.data or [])
+            except Exception as e:
+                logger.warning(f"⚠️ Consommation IA indisponible pour {company_id}: {e}")
+        with self._lock:
+            self._persisted_today[company_id] = (time.monotonic(), today, total)
+        return total
+
+    def tokens_today(self, company_id: str) -> int:
+        return self._persisted_tokens_today(company_id) + self._pending_tokens(company_id)
+
+    def daily_budget(self, company_id: str) -> int:
+        return int(self._company_limits(company_id).get("daily_token_budget") or self.daily_token_budget)
+
+    def check(self, company_id: str):
+        """
+        Vérifie budget journalier et débit avant un appel OpenAI
+
+        Raises:
+            AIQuotaExceededError: budget de tokens épuisé ou trop de requêtes
+        """
+        limits = self._company_limits(company_id)
+        budget = int(limits.get("daily_token_budget") or self.daily_token_budget)
+        if budget > 0:
+            used = self.tokens_today(company_id)
+            if used >= budget:
+                self._stats["rejected"] += 1
+                raise AIQuotaExceededError(
+                    "daily_budget",
+                    f"Budget IA journalier atteint ({used}/{budget} tokens)",
+                    _seconds_until_midnight_utc()
+                )
+        wait = self.rate_limiter.try_acquire(company_id, limits.get("requests_per_minute"))
+        if wait > 0:
+            self._stats["rejected"] += 1
+            raise AIQuotaExceededError(
+                "rate_limit",
+                "Trop de requêtes IA, réessayez dans quelques secondes",
+                max(1, int(wait + 0.999))
+            )
+
+    # -- écriture par lots -----------------------------------------------
+
+    def start(self):
+        """Démarre l'écriture périodique (à appeler dans lifespan)"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="ai-usage-writer")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erreur écriture consommation IA: {e}")
+
+    async def flush(self) -> int:
+        """Écrit les compteurs cumulés en un seul appel ; remis en file si l'écriture échoue"""
+        async with self._flush_lock:
+            if self.supabase is None:
+                return 0
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+            rows = [
+                {
+                    "company_id": company_id, "usage_date": day, "endpoint": endpoint, "model": model,
+                    **{k: (round(v, 6) if k == "cost_estimate" else int(v)) for k, v in counters.items()}
+                }
+                for (company_id, day, endpoint, model), counters in batch.items()
+            ]
+            try:
+                await asyncio.to_thread(
+                    lambda: self.supabase.rpc("record_ai_usage", {"p_rows": rows}).execute()
+                )
+            except Exception as e:
+                self._stats["flush_errors"] += 1
+                with self._lock:
+                    for key, counters in batch.items():
+                        merged = self._pending.setdefault(key, dict.fromkeys(counters, 0))
+                        for k, v in counters.items():
+                            merged[k] += v
+                logger.warning(f"⚠️ Écriture consommation IA reportée ({len(rows)} lignes): {e}")
+                return 0
+
+            # Les tokens écrits rejoignent la part "persistée" sans relire la base
+            with self._lock:
+                for (company_id, day, _, _), counters in batch.items():
+                    cached = self._persisted_today.get(company_id)
+                    if cached is not None and cached[1] == day:
+                        self._persisted_today[company_id] = (cached[0], day, cached[2] + int(counters["total_tokens"]))
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(rows)
+            return len(rows)
+
+    # -- lecture ---------------------------------------------------------
+
+    def history(self, company_id: str, days: int = 30) -> Dict[str, Any]:
+        """Consommation journalière persistée (+ part non encore écrite du jour)"""
+        since = (_today() - timedelta(days=days - 1)).isoformat()
+        result = self.supabase.table(USAGE_TABLE) \
+            .select("usage_date, endpoint, model, requests, prompt_tokens, completion_tokens, total_tokens, cost_estimate") \
+            .eq("company_id", company_id) \
+            .gte("usage_date", since) \
+            .order("usage_date", desc=True) \
+            .execute()
+        rows = result.data or []
+        by_endpoint: Dict[str, Dict[str, float]] = {}
+        for r in rows:
+            e = by_endpoint.setdefault(r["endpoint"], {"requests": 0, "total_tokens": 0, "cost_estimate": 0.0})
+            e["requests"] += int(r.get("requests") or 0)
+            e["total_tokens"] += int(r.get("total_tokens") or 0)
+            e["cost_estimate"] += float(r.get("cost_estimate") or 0)
+        budget = self.daily_budget(company_id)
+        used_today = self.tokens_today(company_id)
+        return {
+            "days": days,
+            "daily": rows,
+            "by_endpoint": by_endpoint,
+            "total_tokens": sum(int(r.get("total_tokens") or 0) for r in rows),
+            "cost_estimate": round(sum(float(r.get("cost_estimate") or 0) for r in rows), 6),
+            "today": {
+                "tokens_used": used_today,
+                "daily_token_budget": budget or None,
+                "remaining": max(0, budget - used_today) if budget else None,
+                "pending_write": self._pending_tokens(company_id),
+            },
+        }
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pending_keys": len(self._pending),
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+_meter: Optional[AIUsageMeter] = None
+
+
+def get_usage_meter(supabase_client) -> AIUsageMeter:
+    """Compteur partagé entre AIService et le serveur (lifespan, /ai/stats)"""
+    global _meter
+    if _meter is None or _meter.supabase is not supabase_client:
+        _meter = AIUsageMeter(supabase_client)
+    return _meter
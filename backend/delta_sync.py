@@ -0,0 +1,217 @@
+"""
+Delta Sync - Synchronisation différentielle des clients hors ligne
+
+Un client (application technicien) garde une copie locale de ses recherches,
+missions, matériels et clients. À la reprise il envoie, par ressource, le
+curseur reçu lors de la synchronisation précédente et ne reçoit que :
+- changed : lignes créées ou modifiées depuis, triées par (updated_at, id)
+- deleted : pierres tombales (sync_tombstones, alimentée par trigger sur
+  DELETE, migration 20261019000007) triées par (deleted_at, id)
+
+Pagination par curseur (keyset) : chaque page repart strictement après le
+dernier couple (updated_at, id) transmis, y compris quand un lot de lignes
+partage le même updated_at. Le curseur est opaque pour le client.
+
+Horizon de lecture : updated_at et deleted_at valent NOW(), l'heure de
+*début* de la transaction, et les id des pierres tombales (BIGSERIAL) ne
+suivent pas non plus l'ordre de validation. Une ligne validée après la
+lecture d'une page mais datée d'avant son curseur serait perdue pour
+toujours ; chaque page s'arrête donc à now() - SYNC_SAFETY_LAG_SECONDS.
+Les lignes plus récentes arrivent à la synchronisation suivante. Seule une
+transaction plus longue que ce délai reste hors garantie.
+
+Portée : un technicien ne reçoit que ses recherches et ses missions
+(colonne propriétaire) ; Bureau/Admin reçoivent celles de l'entreprise.
+Une ligne passée à un autre propriétaire produit une pierre tombale
+« reassigned » pour l'ancien seulement.
+
+Le client applique changed puis deleted, en ignorant une suppression plus
+ancienne que la version locale (deleted_at < updated_at).
+
+Pas de pierres tombales (migration absente) ou curseur plus vieux que leur
+rétention : la ressource repart de zéro (reset), sans jamais oublier une
+suppression.
+"""
+
+import os
+import json
+import base64
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "90"))
+SAFETY_LAG = timedelta(seconds=int(os.getenv("SYNC_SAFETY_LAG_SECONDS", "30")))
+
+Cursor = Optional[Tuple[str, Any]]
+
+
+@dataclass(frozen=True)
+class SyncResource:
+    table: str
+    owner_column: Optional[str] = None  # portée technicien (ses lignes seulement)
+    columns: str = "*"
+
+
+SYNC_RESOURCES: Dict[str, SyncResource] = {
+    "searches": SyncResource("searches", owner_column="user_id"),
+    "missions": SyncResource("schedules", owner_column="collaborator_id"),
+    "materials": SyncResource("materials"),
+    "clients": SyncResource("clients"),
+}
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def encode_token(changed: Cursor, deleted: Cursor, issued_at: datetime) -> str:
+    raw = json.dumps({
+        "c": list(changed) if changed else None,
+        "d": list(deleted) if deleted else None,
+        "t": int(issued_at.timestamp()),
+    }, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_token(token: Optional[str]) -> Tuple[Cursor, Cursor, Optional[datetime]]:
+    """(curseur des changements, curseur des suppressions, date d'émission)"""
+    if not token:
+        return None, None, None
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        changed, deleted = raw["c"], raw["d"]
+        issued_at = datetime.fromtimestamp(raw["t"], tz=timezone.utc)
+        return (tuple(changed) if changed else None), (tuple(deleted) if deleted else None), issued_at
+    except Exception:
+        raise InvalidSyncToken("Curseur de synchronisation invalide")
+
+
+def _after(column: str, cursor: Cursor) -> str:
+    """Filtre PostgREST « strictement après (column, id) »"""
+    value, last_id = cursor
+    return f"{column}.gt.{value},and({column}.eq.{value},id.gt.{last_id})"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class DeltaSync:
+    """Pages de changements et de suppressions par ressource, depuis un curseur"""
+
+    def __init__(self, get_client: Callable[[], Any]):
+        self._get_client = get_client
+
+    def sync(self, company_id: str, user_id: str, role: str, tokens: Dict[str, Optional[str]],
+             limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+        unknown = sorted(set(tokens) - set(SYNC_RESOURCES))
+        if unknown:
+            raise InvalidSyncToken(f"Ressource(s) inconnue(s): {', '.join(unknown)} ({', '.join(SYNC_RESOURCES)})")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        # Bureau/Admin : toute l'entreprise ; autres rôles : leurs lignes pour les ressources à propriétaire
+        owner_id = None if role in ("ADMIN", "BUREAU") else user_id
+        resources = {
+            name: self.sync_resource(company_id, name, owner_id, token, limit)
+            for name, token in tokens.items()
+        }
+        return {"resources": resources, "has_more": any(r["has_more"] for r in resources.values())}
+
+    def sync_resource(self, company_id: str, name: str, owner_id: Optional[str], token: Optional[str],
+                      limit: int) -> Dict[str, Any]:
+        resource = SYNC_RESOURCES[name]
+        owner_id = owner_id if resource.owner_column else None
+        changed_cursor, deleted_cursor, issued_at = decode_token(token)
+        now = _utcnow()
+        # Transactions encore ouvertes possibles au-delà : relu à la prochaine synchronisation
+        horizon = (now - SAFETY_LAG).isoformat()
+        reset = False
+
+        if token:
+            # Pierres tombales purgées depuis (purge_sync_tombstones) : suppressions peut-être perdues
+            expired = issued_at < now - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+            try:
+                deleted, deleted_more = ([], False) if expired else self._tombstones(
+                    company_id, name, owner_id, deleted_cursor, horizon, limit)
+            except Exception as e:
+                logger.warning(f"⚠️ Pierres tombales indisponibles ({name}), resynchronisation complète: {e}")
+                expired = True
+            if expired:
+                reset = True
+                changed_cursor = deleted_cursor = None
+        if not token or reset:
+            # Point de départ des suppressions : la plus récente connue (les précédentes ne concernent pas ce client)
+            deleted, deleted_more = [], False
+            deleted_cursor = self._latest_tombstone(company_id, name, horizon)
+
+        rows = self._changed(company_id, resource, owner_id, changed_cursor, horizon, limit)
+        changed_more = len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            changed_cursor = (rows[-1].get("updated_at"), rows[-1]["id"])
+        if deleted:
+            deleted_cursor = (deleted[-1]["deleted_at"], deleted[-1]["tombstone_id"])
+
+        # Même réponse : une suppression antérieure à la version transmise est caduque (réaffectation annulée)
+        versions = {str(r["id"]): _parse_timestamp(r.get("updated_at") or "") for r in rows}
+        deleted = [
+            {"id": d["id"], "deleted_at": d["deleted_at"]} for d in deleted
+            if not (versions.get(d["id"]) and _parse_timestamp(d["deleted_at"]) and
+                    _parse_timestamp(d["deleted_at"]) < versions[d["id"]])
+        ]
+        return {
+            "changed": rows,
+            "deleted": deleted,
+            "next": encode_token(changed_cursor, deleted_cursor, now),
+            "has_more": changed_more or deleted_more,
+            "reset": reset,
+        }
+
+    def _changed(self, company_id: str, resource: SyncResource, owner_id: Optional[str], cursor: Cursor,
+                 horizon: str, limit: int) -> List[Dict[str, Any]]:
+        query = (self._get_client().table(resource.table).select(resource.columns)
+                 .eq("company_id", company_id).lt("updated_at", horizon))
+        if owner_id:
+            query = query.eq(resource.owner_column, owner_id)
+        if cursor and cursor[0]:
+            query = query.or_(_after("updated_at", cursor))
+        return query.order("updated_at").order("id").limit(limit + 1).execute().data or []
+
+    def _tombstones(self, company_id: str, name: str, owner_id: Optional[str], cursor: Cursor,
+                    horizon: str, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        query = (self._get_client().table("sync_tombstones").select("id, record_id, deleted_at")
+                 .eq("company_id", company_id).eq("resource", name).lt("deleted_at", horizon))
+        if owner_id:
+            query = query.eq("owner_id", owner_id)
+        else:
+            # Vue entreprise : une réaffectation n'est pas une suppression
+            query = query.eq("reassigned", False)
+        if cursor:
+            query = query.or_(_after("deleted_at", cursor))
+        rows = query.order("deleted_at").order("id").limit(limit + 1).execute().data or []
+        tombstones = [{"id": str(r["record_id"]), "deleted_at": r["deleted_at"], "tombstone_id": r["id"]}
+                      for r in rows[:limit]]
+        return tombstones, len(rows) > limit
+
+    def _latest_tombstone(self, company_id: str, name: str, horizon: str) -> Cursor:
+        try:
+            rows = (self._get_client().table("sync_tombstones").select("id, deleted_at")
+                    .eq("company_id", company_id).eq("resource", name).lt("deleted_at", horizon)
+                    .order("deleted_at", desc=True).order("id", desc=True).limit(1).execute().data)
+        except Exception as e:
+            logger.warning(f"⚠️ Pierres tombales indisponibles ({name}): {e}")
+            return None
+        return (rows[0]["deleted_at"], rows[0]["id"]) if rows else None
@@ -1,18 +1,220 @@
 """
 Service d'envoi d'emails pour SkyApp
 Supporte Gmail SMTP et SendGrid
+
+Les emails applicatifs passent par une outbox : l'endpoint met le message
+en file et rend la main, un expéditeur en tâche de fond envoie par lots en
+réutilisant une seule connexion SMTP authentifiée (ou un client HTTP
+SendGrid keep-alive), avec reprise exponentielle en cas d'échec. La file
+est persistée dans la table email_outbox quand le serveur lui en attache une.
 """
 
 import os
+import time
+import uuid
+import heapq
+import asyncio
 import smtplib
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional
+from typing import Any, Deque, Dict, List, Optional, Tuple
 import logging
 
+import httpx
+
+from supabase_helpers import is_missing_function
+
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class OutgoingEmail:
+    """Email en attente d'envoi dans l'outbox"""
+    to_email: str
+    subject: str
+    html_body: str
+    text_body: str
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    attempts: int = 0
+    next_attempt_at: float = 0.0
+    last_error: Optional[str] = None
+    persisted: bool = False  # ligne de la table email_outbox
+
+
+class PermanentEmailError(Exception):
+    """Refus définitif (destinataire invalide, 4xx SendGrid...) : pas de nouvel essai"""
+
+
+class SMTPTransport:
+    """
+    Connexion SMTP persistante
+
+    La connexion (EHLO + STARTTLS + LOGIN) est ouverte au premier envoi puis
+    réutilisée ; après `max_idle` secondes sans envoi un NOOP vérifie qu'elle
+    est toujours vivante, sinon elle est rouverte.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        from_header: str = "SkyApp BTP <noreply@skyapp.fr>",
+        use_tls: bool = True,
+        timeout: float = 30.0,
+        max_idle: float = 60.0
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.from_header = from_header
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.connections_opened = 0
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self.connections_opened += 1
+        logger.debug(f"📧 Connexion SMTP ouverte ({self.host}:{self.port})")
+        return server
+
+    def _ensure_connection(self) -> smtplib.SMTP:
+        if self._server is not None and time.monotonic() - self._last_used > self.max_idle:
+            try:
+                self._server.noop()
+            except (smtplib.SMTPException, OSError):
+                self._drop()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def _drop(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+
+    def _build_message(self, email: OutgoingEmail) -> MIMEMultipart:
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = email.subject
+        msg['From'] = self.from_header
+        msg['To'] = email.to_email
+        msg.attach(MIMEText(email.text_body, 'plain', 'utf-8'))
+        msg.attach(MIMEText(email.html_body, 'html', 'utf-8'))
+        return msg
+
+    def send_batch(self, emails: List[OutgoingEmail]) -> List[Optional[Exception]]:
+        """Envoie un lot sur la même connexion ; retourne l'erreur de chaque email (None = envoyé)"""
+        results: List[Optional[Exception]] = []
+        with self._lock:
+            for email in emails:
+                results.append(self._send_one(email))
+            self._last_used = time.monotonic()
+        return results
+
+    def _send_one(self, email: OutgoingEmail) -> Optional[Exception]:
+        msg = self._build_message(email)
+        # Un seul nouvel essai immédiat si le serveur a fermé la connexion réutilisée
+        for reconnect in (False, True):
+            try:
+                self._ensure_connection().send_message(msg)
+                return None
+            except smtplib.SMTPRecipientsRefused as e:
+                return PermanentEmailError(str(e))
+            except smtplib.SMTPResponseException as e:
+                if 500 <= e.smtp_code < 600:
+                    return PermanentEmailError(f"{e.smtp_code} {e.smtp_error!r}")
+                return e
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                # SMTPException hérite d'OSError : déconnexion, erreur réseau ou protocole
+                self._drop()
+                if reconnect:
+                    return e
+        return None
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+
+class SendGridTransport:
+    """Envoi via l'API SendGrid avec un client HTTP keep-alive"""
+
+    API_URL = "https://api.sendgrid.com/v3/mail/send"
+
+    def __init__(self, api_key: str, from_email: str, from_name: str, timeout: float = 30.0):
+        self.api_key = api_key
+        self.from_email = from_email
+        self.from_name = from_name
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._client: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+
+    def _get_client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+            self.connections_opened += 1
+        return self._client
+
+    def send_batch(self, emails: List[OutgoingEmail]) -> List[Optional[Exception]]:
+        results: List[Optional[Exception]] = []
+        with self._lock:
+            client = self._get_client()
+            for email in emails:
+                payload = {
+                    "personalizations": [{
+                        "to": [{"email": email.to_email}],
+                        "subject": email.subject
+                    }],
+                    "from": {
+                        "email": self.from_email,
+                        "name": self.from_name
+                    },
+                    "content": [
+                        {"type": "text/plain", "value": email.text_body},
+                        {"type": "text/html", "value": email.html_body}
+                    ]
+                }
+                try:
+                    response = client.post(self.API_URL, json=payload)
+                except httpx.HTTPError as e:
+                    results.append(e)
+                    continue
+                if response.status_code == 202:
+                    results.append(None)
+                elif response.status_code == 429 or response.status_code >= 500:
+                    results.append(Exception(f"SendGrid {response.status_code}: {response.text[:200]}"))
+                else:
+                    results.append(PermanentEmailError(f"SendGrid {response.status_code}: {response.text[:200]}"))
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
 class EmailService:
     """Service d'envoi d'emails avec support Gmail SMTP et SendGrid"""
     
@@ -32,6 +234,23 @@ class EmailService:
         
         if not self.smtp_user and not self.use_sendgrid:
             logger.warning("⚠️ Aucune configuration email détectée - Les emails ne seront pas envoyés")
+        
+        self.transport = self._build_transport()
+    
+    def _build_transport(self):
+        """Transport partagé (connexion réutilisée entre les envois)"""
+        if self.use_sendgrid:
+            return SendGridTransport(self.sendgrid_api_key, self.from_email, self.from_name)
+        if self.smtp_user and self.smtp_password:
+            return SMTPTransport(
+                self.smtp_host,
+                self.smtp_port,
+                user=self.smtp_user,
+                password=self.smtp_password,
+                from_header=f"{self.from_name} <{self.from_email}>",
+                use_tls=os.getenv("SMTP_USE_TLS", "true").lower() != "false"
+            )
+        return None
     
     def send_invitation_email(
         self, 
@@ -42,7 +261,43 @@ class EmailService:
         invitation_token: str
     ) -> bool:
         """
-        Envoie un email d'invitation à rejoindre une entreprise
+        Envoie immédiatement un email d'invitation (appel bloquant)
+        
+        Les endpoints passent par `email_outbox.enqueue(...)` ; cette méthode
+        reste pour les scripts d'administration.
+        
+        Returns:
+            bool: True si envoyé avec succès, False sinon
+        """
+        try:
+            email = self.build_invitation_email(to_email, company_name, role, invited_by, invitation_token)
+            return self.send_now(email)
+        except Exception as e:
+            logger.error(f"❌ Erreur envoi email invitation: {str(e)}")
+            return False
+    
+    def send_now(self, email: OutgoingEmail) -> bool:
+        """Envoi synchrone d'un email via le transport partagé"""
+        if self.transport is None:
+            logger.warning("⚠️ Email non configuré - Email non envoyé")
+            return False
+        error = self.transport.send_batch([email])[0]
+        if error is not None:
+            logger.error(f"❌ Erreur envoi email à {email.to_email}: {error}")
+            return False
+        logger.info(f"✅ Email envoyé à {email.to_email}")
+        return True
+    
+    def build_invitation_email(
+        self, 
+        to_email: str, 
+        company_name: str, 
+        role: str,
+        invited_by: str,
+        invitation_token: str
+    ) -> OutgoingEmail:
+        """
+        Construit l'email d'invitation à rejoindre une entreprise
         
         Args:
             to_email: Email du destinataire
@@ -52,25 +307,24 @@ class EmailService:
             invitation_token: Token unique pour accepter l'invitation
         
         Returns:
-            bool: True si envoyé avec succès, False sinon
+            OutgoingEmail prêt à être mis en file
         """
-        try:
-            # URL d'acceptation de l'invitation
-            accept_url = f"{self.frontend_url}/accept-invitation?token={invitation_token}"
-            
-            # Traduction du rôle
-            role_names = {
-                "TECHNICIEN": "Technicien Terrain",
-                "BUREAU": "Personnel Bureau",
-                "ADMIN": "Administrateur"
-            }
-            role_display = role_names.get(role, role)
-            
-            # Sujet de l'email
-            subject = f"Invitation à rejoindre {company_name} sur {self.app_name}"
-            
-            # Corps de l'email (HTML)
-            html_body = f"""
+        # URL d'acceptation de l'invitation
+        accept_url = f"{self.frontend_url}/accept-invitation?token={invitation_token}"
+        
+        # Traduction du rôle
+        role_names = {
+            "TECHNICIEN": "Technicien Terrain",
+            "BUREAU": "Personnel Bureau",
+            "ADMIN": "Administrateur"
+        }
+        role_display = role_names.get(role, role)
+        
+        # Sujet de l'email
+        subject = f"Invitation à rejoindre {company_name} sur {self.app_name}"
+        
+        # Corps de l'email (HTML)
+        html_body = f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -80,107 +334,107 @@ class EmailService:
 </head>
 <body style="margin: 0; padding: 0; font-family: 'Segoe UI', Arial, sans-serif; background-color: #0f172a;">
     <table width="100%" cellpadding="0" cellspacing="0" border="0" style="background-color: #0f172a; padding: 40px 20px;">
-        <tr>
-            <td align="center">
-                <table width="600" cellpadding="0" cellspacing="0" border="0" style="background-color: #1e293b; border-radius: 16px; overflow: hidden; box-shadow: 0 8px 32px rgba(0,0,0,0.4);">
-                    
-                    <!-- Header avec logo -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #000000 0%, #1e293b 100%); padding: 50px 40px; text-align: center; border-bottom: 2px solid #334155;">
-                            <img src="{self.frontend_url}/logo.png" 
-                                 alt="Skyapp Logo" 
-                                 style="width: 80px; height: 80px; margin: 0 auto 20px; display: block; border-radius: 50%; background-color: #ffffff; padding: 10px; box-shadow: 0 4px 12px rgba(255,255,255,0.1);" />
-                            <h1 style="margin: 0; color: #ffffff; font-size: 32px; font-weight: bold; letter-spacing: 1px;">
-                                Skyapp
-                            </h1>
-                            <p style="margin: 10px 0 0; color: #94a3b8; font-size: 15px; letter-spacing: 0.5px;">
-                                Plateforme de Gestion BTP Intelligente
-                            </p>
-                        </td>
-                    </tr>
-                    
-                    <!-- Body -->
-                    <tr>
-                        <td style="padding: 50px 40px; background-color: #1e293b;">
-                            <h2 style="margin: 0 0 25px; color: #ffffff; font-size: 26px; font-weight: 600;">
-                                Vous êtes invité à rejoindre une équipe !
-                            </h2>
-                            
-                            <p style="margin: 0 0 20px; color: #cbd5e1; font-size: 16px; line-height: 1.7;">
-                                Bonjour,
-                            </p>
-                            
-                            <p style="margin: 0 0 30px; color: #cbd5e1; font-size: 16px; line-height: 1.7;">
-                                <strong style="color: #ffffff;">{invited_by}</strong> vous invite à rejoindre l'entreprise 
-                                <strong style="color: #ffffff;">{company_name}</strong> sur Skyapp.
-                            </p>
-                            
-                            <div style="background: linear-gradient(135deg, #334155 0%, #475569 100%); border-left: 4px solid #ffffff; padding: 20px 25px; margin: 30px 0; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.2);">
-                                <p style="margin: 0; color: #f1f5f9; font-size: 15px;">
-                                    <strong style="color: #ffffff;">Rôle attribué :</strong> <span style="color: #94a3b8;">{role_display}</span>
-                                </p>
-                                <p style="margin: 15px 0 0; color: #f1f5f9; font-size: 15px;">
-                                    <strong style="color: #ffffff;">Entreprise :</strong> <span style="color: #94a3b8;">{company_name}</span>
-                                </p>
-                            </div>
-                            
-                            <p style="margin: 0 0 30px; color: #cbd5e1; font-size: 16px; line-height: 1.7;">
-                                Cliquez sur le bouton ci-dessous pour accepter l'invitation et créer votre compte :
-                            </p>
-                            
-                            <!-- CTA Button -->
-                            <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin: 30px 0;">
-                                <tr>
-                                    <td align="center">
-                                        <a href="{accept_url}" 
-                                           style="display: inline-block; background: linear-gradient(135deg, #ffffff 0%, #e2e8f0 100%); 
-                                                  color: #000000; text-decoration: none; padding: 18px 50px; 
-                                                  border-radius: 10px; font-size: 17px; font-weight: bold; 
-                                                  box-shadow: 0 6px 20px rgba(255,255,255,0.2); 
-                                                  transition: transform 0.2s;">
-                                            ✨ Accepter l'invitation
-                                        </a>
-                                    </td>
-                                </tr>
-                            </table>
-                            
-                            <p style="margin: 30px 0 10px; color: #94a3b8; font-size: 14px; line-height: 1.6;">
-                                Ou copiez ce lien dans votre navigateur :
-                            </p>
-                            <p style="margin: 0; padding: 15px; background-color: #0f172a; border-radius: 6px; color: #64748b; font-size: 13px; word-break: break-all; border: 1px solid #334155;">
-                                {accept_url}
+    <tr>
+        <td align="center">
+            <table width="600" cellpadding="0" cellspacing="0" border="0" style="background-color: #1e293b; border-radius: 16px; overflow: hidden; box-shadow: 0 8px 32px rgba(0,0,0,0.4);">
+                
+                <!-- Header avec logo -->
+                <tr>
+                    <td style="background: linear-gradient(135deg, #000000 0%, #1e293b 100%); padding: 50px 40px; text-align: center; border-bottom: 2px solid #334155;">
+                        <img src="{self.frontend_url}/logo.png" 
+                             alt="Skyapp Logo" 
+                             style="width: 80px; height: 80px; margin: 0 auto 20px; display: block; border-radius: 50%; background-color: #ffffff; padding: 10px; box-shadow: 0 4px 12px rgba(255,255,255,0.1);" />
+                        <h1 style="margin: 0; color: #ffffff; font-size: 32px; font-weight: bold; letter-spacing: 1px;">
+                            Skyapp
+                        </h1>
+                        <p style="margin: 10px 0 0; color: #94a3b8; font-size: 15px; letter-spacing: 0.5px;">
+                            Plateforme de Gestion BTP Intelligente
+                        </p>
+                    </td>
+                </tr>
+                
+                <!-- Body -->
+                <tr>
+                    <td style="padding: 50px 40px; background-color: #1e293b;">
+                        <h2 style="margin: 0 0 25px; color: #ffffff; font-size: 26px; font-weight: 600;">
+                            Vous êtes invité à rejoindre une équipe !
+                        </h2>
+                        
+                        <p style="margin: 0 0 20px; color: #cbd5e1; font-size: 16px; line-height: 1.7;">
+                            Bonjour,
+                        </p>
+                        
+                        <p style="margin: 0 0 30px; color: #cbd5e1; font-size: 16px; line-height: 1.7;">
+                            <strong style="color: #ffffff;">{invited_by}</strong> vous invite à rejoindre l'entreprise 
+                            <strong style="color: #ffffff;">{company_name}</strong> sur Skyapp.
+                        </p>
+                        
+                        <div style="background: linear-gradient(135deg, #334155 0%, #475569 100%); border-left: 4px solid #ffffff; padding: 20px 25px; margin: 30px 0; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.2);">
+                            <p style="margin: 0; color: #f1f5f9; font-size: 15px;">
+                                <strong style="color: #ffffff;">Rôle attribué :</strong> <span style="color: #94a3b8;">{role_display}</span>
                             </p>
-                            
-                            <div style="margin-top: 35px; padding-top: 25px; border-top: 1px solid #334155;">
-                                <p style="margin: 0; color: #94a3b8; font-size: 14px; line-height: 1.6;">
-                                    ⚠️ <strong style="color: #cbd5e1;">Note importante :</strong> Cette invitation expire dans 7 jours.
-                                </p>
-                            </div>
-                        </td>
-                    </tr>
-                    
-                    <!-- Footer -->
-                    <tr>
-                        <td style="background-color: #0f172a; padding: 30px 40px; text-align: center; border-top: 2px solid #334155;">
-                            <p style="margin: 0 0 12px; color: #64748b; font-size: 13px;">
-                                Cet email a été envoyé par <strong style="color: #94a3b8;">Skyapp BTP</strong>
+                            <p style="margin: 15px 0 0; color: #f1f5f9; font-size: 15px;">
+                                <strong style="color: #ffffff;">Entreprise :</strong> <span style="color: #94a3b8;">{company_name}</span>
                             </p>
-                            <p style="margin: 0; color: #475569; font-size: 12px; line-height: 1.5;">
-                                Si vous n'êtes pas concerné par cette invitation, vous pouvez ignorer cet email.
+                        </div>
+                        
+                        <p style="margin: 0 0 30px; color: #cbd5e1; font-size: 16px; line-height: 1.7;">
+                            Cliquez sur le bouton ci-dessous pour accepter l'invitation et créer votre compte :
+                        </p>
+                        
+                        <!-- CTA Button -->
+                        <table width="100%" cellpadding="0" cellspacing="0" border="0" style="margin: 30px 0;">
+                            <tr>
+                                <td align="center">
+                                    <a href="{accept_url}" 
+                                       style="display: inline-block; background: linear-gradient(135deg, #ffffff 0%, #e2e8f0 100%); 
+                                              color: #000000; text-decoration: none; padding: 18px 50px; 
+                                              border-radius: 10px; font-size: 17px; font-weight: bold; 
+                                              box-shadow: 0 6px 20px rgba(255,255,255,0.2); 
+                                              transition: transform 0.2s;">
+                                        ✨ Accepter l'invitation
+                                    </a>
+                                </td>
+                            </tr>
+                        </table>
+                        
+                        <p style="margin: 30px 0 10px; color: #94a3b8; font-size: 14px; line-height: 1.6;">
+                            Ou copiez ce lien dans votre navigateur :
+                        </p>
+                        <p style="margin: 0; padding: 15px; background-color: #0f172a; border-radius: 6px; color: #64748b; font-size: 13px; word-break: break-all; border: 1px solid #334155;">
+                            {accept_url}
+                        </p>
+                        
+                        <div style="margin-top: 35px; padding-top: 25px; border-top: 1px solid #334155;">
+                            <p style="margin: 0; color: #94a3b8; font-size: 14px; line-height: 1.6;">
+                                ⚠️ <strong style="color: #cbd5e1;">Note importante :</strong> Cette invitation expire dans 7 jours.
                             </p>
-                        </td>
-                    </tr>
-                    
-                </table>
-            </td>
-        </tr>
+                        </div>
+                    </td>
+                </tr>
+                
+                <!-- Footer -->
+                <tr>
+                    <td style="background-color: #0f172a; padding: 30px 40px; text-align: center; border-top: 2px solid #334155;">
+                        <p style="margin: 0 0 12px; color: #64748b; font-size: 13px;">
+                            Cet email a été envoyé par <strong style="color: #94a3b8;">Skyapp BTP</strong>
+                        </p>
+                        <p style="margin: 0; color: #475569; font-size: 12px; line-height: 1.5;">
+                            Si vous n'êtes pas concerné par cette invitation, vous pouvez ignorer cet email.
+                        </p>
+                    </td>
+                </tr>
+                
+            </table>
+        </td>
+    </tr>
     </table>
 </body>
 </html>
-            """
-            
-            # Corps de l'email (texte brut pour clients email basiques)
-            text_body = f"""
+        """
+        
+        # Corps de l'email (texte brut pour clients email basiques)
+        text_body = f"""
 {self.app_name} - Invitation à rejoindre une équipe
 
 Bonjour,
@@ -200,105 +454,355 @@ Si vous n'êtes pas concerné par cette invitation, vous pouvez ignorer cet emai
 ---
 {self.app_name}
 Plateforme de Gestion BTP Intelligente
-            """
-            
-            # Envoi de l'email
-            if self.use_sendgrid:
-                return self._send_via_sendgrid(to_email, subject, html_body, text_body)
-            else:
-                return self._send_via_smtp(to_email, subject, html_body, text_body)
-                
-        except Exception as e:
-            logger.error(f"❌ Erreur envoi email invitation: {str(e)}")
+        """
+        
+        return OutgoingEmail(
+            to_email=to_email,
+            subject=subject,
+            html_body=html_body,
+            text_body=text_body
+        )
+
+
+OUTBOX_TABLE = "email_outbox"
+CLAIM_FUNCTION = "claim_email_outbox"
+
+
+def _utc(moment: datetime) -> str:
+    """Horodatage UTC au format 'Z' (comparable en texte, sûr dans un filtre PostgREST)"""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class EmailOutbox:
+    """
+    File d'envoi des emails, vidée par une tâche de fond
+
+    - enqueue() ne dépend pas du SMTP : l'endpoint HTTP rend la main aussitôt
+    - envoi par lots de `batch_size` sur la connexion partagée du transport
+    - échec transitoire => nouvel essai après backoff exponentiel
+      (backoff_base * 2^n, plafonné), abandon après `max_attempts`
+    - avec une table (attach_store), la file est la table email_outbox : un
+      email en file survit à un redémarrage, les workers se la partagent
+      (réservation exclusive, comme l'inbox IOPOLE) et un email abandonné
+      reste en 'failed', visible dans les métriques et rejouable
+    - sans table (ou si l'écriture échoue), la file est en mémoire : à
+      l'arrêt, stop() la vide avant de couper
+    """
+
+    def __init__(
+        self,
+        transport=None,
+        batch_size: int = 20,
+        max_attempts: int = 5,
+        backoff_base: float = 2.0,
+        backoff_max: float = 300.0,
+        max_queue: int = 10000,
+        poll_interval: float = 5.0,
+        stale_after_seconds: int = 300
+    ):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self.stale_after = timedelta(seconds=stale_after_seconds)
+        self.supabase = None
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._claim_rpc_available = True
+        self._pending: Deque[OutgoingEmail] = deque()
+        self._retry: List[Tuple[float, str, OutgoingEmail]] = []
+        self._dead: Deque[OutgoingEmail] = deque(maxlen=100)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "batches": 0}
+        self._last_error: Optional[str] = None
+
+    def attach_store(self, supabase_client):
+        """Persiste la file dans la table email_outbox (client clé service)"""
+        self.supabase = supabase_client
+
+    @property
+    def queue_depth(self) -> int:
+        """Emails en file en mémoire dans ce processus (la table est comptée par get_metrics)"""
+        return len(self._pending) + len(self._retry)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def enqueue(self, email: OutgoingEmail) -> bool:
+        """
+        Met un email en file (écriture en base si une table est attachée : appel bloquant)
+
+        Returns:
+            False si aucun transport configuré ou file pleine
+        """
+        if self.transport is None:
+            logger.warning("⚠️ Email non configuré - Email non mis en file")
             return False
-    
-    def _send_via_smtp(
-        self, 
-        to_email: str, 
-        subject: str, 
-        html_body: str, 
-        text_body: str
-    ) -> bool:
-        """Envoie un email via SMTP (Gmail)"""
-        try:
-            if not self.smtp_user or not self.smtp_password:
-                logger.warning("⚠️ SMTP non configuré - Email non envoyé")
-                return False
-            
-            # Créer le message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = f"{self.from_name} <{self.from_email}>"
-            msg['To'] = to_email
-            
-            # Ajouter les parties texte et HTML
-            part1 = MIMEText(text_body, 'plain', 'utf-8')
-            part2 = MIMEText(html_body, 'html', 'utf-8')
-            msg.attach(part1)
-            msg.attach(part2)
-            
-            # Connexion au serveur SMTP
-            server = smtplib.SMTP(self.smtp_host, self.smtp_port)
-            server.starttls()
-            server.login(self.smtp_user, self.smtp_password)
-            
-            # Envoi
-            server.send_message(msg)
-            server.quit()
-            
-            logger.info(f"✅ Email d'invitation envoyé à {to_email}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Erreur SMTP: {str(e)}")
+        if self.supabase is not None:
+            try:
+                self.supabase.table(OUTBOX_TABLE).insert({
+                    "id": email.id,
+                    "to_email": email.to_email,
+                    "subject": email.subject,
+                    "html_body": email.html_body,
+                    "text_body": email.text_body,
+                    "status": "pending",
+                    "attempts": 0,
+                    "next_attempt_at": _utc(datetime.now(timezone.utc)),
+                }).execute()
+                self._stats["enqueued"] += 1
+                self._notify()
+                return True
+            except Exception as e:
+                logger.error(f"❌ Outbox email non persistée, mise en file en mémoire: {e}")
+        if self.queue_depth >= self.max_queue:
+            logger.error(f"❌ Outbox email pleine ({self.max_queue}) - Email à {email.to_email} rejeté")
             return False
-    
-    def _send_via_sendgrid(
-        self, 
-        to_email: str, 
-        subject: str, 
-        html_body: str, 
-        text_body: str
-    ) -> bool:
-        """Envoie un email via SendGrid API"""
+        self._pending.append(email)
+        self._stats["enqueued"] += 1
+        self._notify()
+        return True
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        """Démarre l'expéditeur en tâche de fond (à appeler dans lifespan)"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="email-outbox")
+            logger.info(f"📧 Outbox email démarrée (worker {self.worker_id})")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Envoie ce qui est prêt (dans la limite de `drain_timeout`) puis arrête"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
         try:
-            import requests
-            
-            url = "https://api.sendgrid.com/v3/mail/send"
-            
-            payload = {
-                "personalizations": [{
-                    "to": [{"email": to_email}],
-                    "subject": subject
-                }],
-                "from": {
-                    "email": self.from_email,
-                    "name": self.from_name
-                },
-                "content": [
-                    {"type": "text/plain", "value": text_body},
-                    {"type": "text/html", "value": html_body}
-                ]
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {self.sendgrid_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(url, json=payload, headers=headers)
-            
-            if response.status_code == 202:
-                logger.info(f"✅ Email d'invitation envoyé à {to_email} via SendGrid")
-                return True
-            else:
-                logger.error(f"❌ Erreur SendGrid: {response.status_code} - {response.text}")
-                return False
-                
+            await asyncio.wait_for(self._drain(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Outbox email arrêtée avec {self.queue_depth} email(s) non envoyé(s)")
+        if self.transport is not None:
+            await asyncio.to_thread(self.transport.close)
+
+    async def _drain(self):
+        # Seule la file en mémoire est vidée : la table reste à l'expéditeur suivant
+        while self._pending:
+            await self.send_pending()
+
+    async def _run(self):
+        while True:
+            try:
+                handled = await self.send_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erreur expéditeur outbox email: {e}")
+                handled = 0
+            if handled >= self.batch_size:
+                continue
+            timeout = self.poll_interval
+            if self._retry:
+                timeout = max(0.0, min(timeout, self._retry[0][0] - time.monotonic()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _take_batch(self) -> List[OutgoingEmail]:
+        now = time.monotonic()
+        batch: List[OutgoingEmail] = []
+        while self._retry and self._retry[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._retry)[2])
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _claim_batch(self, limit: int) -> List[OutgoingEmail]:
+        """Réserve des emails persistés prêts à partir (ou abandonnés par un worker), exclusivement"""
+        now = datetime.now(timezone.utc)
+        stale_cutoff = _utc(now - self.stale_after)
+        rows = None
+        if self._claim_rpc_available:
+            try:
+                rows = self.supabase.rpc(CLAIM_FUNCTION, {
+                    "p_worker": self.worker_id,
+                    "p_limit": limit,
+                    "p_now": _utc(now),
+                    "p_stale_before": stale_cutoff,
+                }).execute().data or []
+            except Exception as e:
+                if not is_missing_function(e):
+                    raise
+                self._claim_rpc_available = False
+                logger.warning(f"⚠️ Fonction {CLAIM_FUNCTION} absente, réservation par UPDATE conditionnel: {e}")
+
+        if rows is None:
+            claimable = (
+                f"and(status.eq.pending,next_attempt_at.lte.{_utc(now)}),"
+                f"and(status.eq.sending,claimed_at.lt.{stale_cutoff})"
+            )
+            candidates = self.supabase.table(OUTBOX_TABLE)\
+                .select("id")\
+                .or_(claimable)\
+                .order("created_at")\
+                .limit(limit)\
+                .execute()
+            ids = [row["id"] for row in candidates.data or []]
+            if not ids:
+                return []
+            # Même prédicat que la sélection : un email réservé entre-temps par un autre worker n'est pas repris
+            rows = self.supabase.table(OUTBOX_TABLE)\
+                .update({"status": "sending", "claimed_by": self.worker_id, "claimed_at": _utc(now)})\
+                .in_("id", ids)\
+                .or_(claimable)\
+                .execute().data or []
+
+        return [
+            OutgoingEmail(
+                to_email=row["to_email"],
+                subject=row["subject"],
+                html_body=row["html_body"],
+                text_body=row.get("text_body") or "",
+                id=row["id"],
+                attempts=row.get("attempts") or 0,
+                persisted=True,
+            )
+            for row in rows
+        ]
+
+    def _record(self, outcomes: List[Tuple[OutgoingEmail, Dict[str, Any]]]):
+        """Écrit le résultat des envois persistés (seulement si la réservation est toujours à ce worker)"""
+        for email, values in outcomes:
+            try:
+                self.supabase.table(OUTBOX_TABLE)\
+                    .update({"attempts": email.attempts, "last_error": email.last_error, **values})\
+                    .eq("id", email.id)\
+                    .eq("claimed_by", self.worker_id)\
+                    .execute()
+            except Exception as e:
+                logger.warning(f"⚠️ Statut de l'email {email.id} non enregistré: {e}")
+
+    def _backoff_delay(self, attempts: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+
+    async def send_pending(self) -> int:
+        """Envoie un lot d'emails prêts ; retourne le nombre traité"""
+        batch = self._take_batch()
+        if self.supabase is not None and len(batch) < self.batch_size:
+            batch += await asyncio.to_thread(self._claim_batch, self.batch_size - len(batch))
+        if not batch:
+            return 0
+
+        try:
+            results = await asyncio.to_thread(self.transport.send_batch, batch)
         except Exception as e:
-            logger.error(f"❌ Erreur SendGrid: {str(e)}")
-            return False
+            results = [e] * len(batch)
+        self._stats["batches"] += 1
+
+        outcomes: List[Tuple[OutgoingEmail, Dict[str, Any]]] = []
+        for email, error in zip(batch, results):
+            email.attempts += 1
+            if error is None:
+                self._stats["sent"] += 1
+                email.last_error = None
+                outcomes.append((email, {"status": "sent", "sent_at": _utc(datetime.now(timezone.utc))}))
+                logger.info(f"✅ Email envoyé à {email.to_email}")
+                continue
+
+            email.last_error = str(error)[:1000]
+            self._last_error = email.last_error
+            if isinstance(error, PermanentEmailError) or email.attempts >= self.max_attempts:
+                self._stats["failed"] += 1
+                outcomes.append((email, {"status": "failed"}))
+                if not email.persisted:
+                    self._dead.append(email)
+                logger.error(f"❌ Email à {email.to_email} abandonné après {email.attempts} essai(s): {error}")
+            else:
+                self._stats["retried"] += 1
+                delay = self._backoff_delay(email.attempts)
+                email.next_attempt_at = time.monotonic() + delay
+                outcomes.append((email, {
+                    "status": "pending",
+                    "next_attempt_at": _utc(datetime.now(timezone.utc) + timedelta(seconds=delay)),
+                }))
+                if not email.persisted:
+                    heapq.heappush(self._retry, (email.next_attempt_at, email.id, email))
+                logger.warning(f"⚠️ Email à {email.to_email} en échec (essai {email.attempts}), nouvel essai programmé: {error}")
+
+        persisted = [(email, values) for email, values in outcomes if email.persisted]
+        if persisted:
+            await asyncio.to_thread(self._record, persisted)
+        return len(batch)
+
+    def replay(self, email_ids: Optional[List[str]] = None) -> int:
+        """Remet en file les emails persistés abandonnés (tous ou ceux listés)"""
+        if self.supabase is None:
+            return 0
+        query = self.supabase.table(OUTBOX_TABLE)\
+            .update({"status": "pending", "attempts": 0, "last_error": None,
+                     "next_attempt_at": _utc(datetime.now(timezone.utc))})\
+            .eq("status", "failed")
+        if email_ids:
+            query = query.in_("id", email_ids)
+        result = query.execute()
+        self._notify()
+        return len(result.data or [])
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Profondeur de file, compteurs d'envoi et emails abandonnés (depuis la table si attachée : appel bloquant)"""
+        metrics = {
+            "worker_id": self.worker_id,
+            "persistent": self.supabase is not None,
+            "queue_depth": self.queue_depth,
+            "pending": len(self._pending),
+            "retry_scheduled": len(self._retry),
+            **self._stats,
+            "connections_opened": getattr(self.transport, "connections_opened", 0),
+            "last_error": self._last_error,
+            "dead_letters": [
+                {"id": e.id, "to_email": e.to_email, "attempts": e.attempts, "error": e.last_error}
+                for e in self._dead
+            ],
+            "running": self.running,
+        }
+        if self.supabase is None:
+            return metrics
+
+        pending = self.supabase.table(OUTBOX_TABLE)\
+            .select("id", count="exact")\
+            .in_("status", ["pending", "sending"])\
+            .limit(1)\
+            .execute()
+        failed = self.supabase.table(OUTBOX_TABLE)\
+            .select("id, to_email, subject, attempts, last_error, created_at", count="exact")\
+            .eq("status", "failed")\
+            .order("created_at", desc=True)\
+            .limit(20)\
+            .execute()
+        metrics["stored_pending"] = pending.count or 0
+        metrics["stored_failed"] = failed.count or 0
+        metrics["dead_letters"] += [
+            {"id": row["id"], "to_email": row["to_email"], "attempts": row.get("attempts"), "error": row.get("last_error")}
+            for row in failed.data or []
+        ]
+        return metrics
 
 
 # Instance globale du service email
 email_service = EmailService()
+email_outbox = EmailOutbox(
+    email_service.transport,
+    batch_size=int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20")),
+    max_attempts=int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+)
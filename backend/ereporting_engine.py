@@ -0,0 +1,261 @@
+"""
+E-Reporting Engine - Agrégation des factures d'une période
+Totaux par sens (émises / reçues), catégorie de transaction et taux de TVA
+
+Deux stratégies :
+1. Requête groupée côté serveur (fonction SQL `ereporting_period_totals`)
+2. Repli : lecture paginée des lignes + agrégation vectorisée NumPy en
+   centimes entiers (int64), donc sans erreur d'arrondi flottant
+
+operations_count compte les factures distinctes d'un groupe : une facture
+multi-taux compte une opération par taux dans le détail par taux.
+"""
+
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+from supabase import Client
+
+from supabase_helpers import SqlFunction, paged
+
+logger = logging.getLogger(__name__)
+
+# Catégories de transaction (invoices_electronic.transaction_category)
+TRANSACTION_CATEGORIES = ("b2b-fr", "b2c", "export", "intra-ue")
+
+# Type de déclaration e-reporting -> catégorie de transaction
+DECLARATION_CATEGORY = {
+    "b2c": "b2c",
+    "export": "export",
+    "intra-ue": "intra-ue",
+}
+
+VAT_RATES = (Decimal("0"), Decimal("5.5"), Decimal("10"), Decimal("20"))
+
+IN_FILTER_CHUNK = 200
+
+CENT = Decimal("0.01")
+
+
+def from_cents(cents: int) -> Decimal:
+    return (Decimal(int(cents)) / 100).quantize(CENT)
+
+
+def effective_vat_rate(total_ht: Any, total_tva: Any) -> Optional[Decimal]:
+    """Taux de TVA d'une facture sans lignes (reçue), ramené au taux légal le plus proche"""
+    ht = Decimal(str(total_ht or 0))
+    if ht == 0:
+        return None
+    rate = Decimal(str(total_tva or 0)) * 100 / ht
+    for legal in VAT_RATES:
+        if abs(rate - legal) < Decimal("0.05"):
+            return legal
+    return None
+
+
+def _cents_array(values: Iterable[Any], count: int) -> np.ndarray:
+    """
+    Montants DECIMAL(12,2) -> centimes int64
+
+    x * 100 en float64 reste à moins de 1e-6 de l'entier exact pour
+    |x| < 1e10 à 2 décimales : np.rint donne donc le centime exact.
+    """
+    arr = np.fromiter((0.0 if v is None else float(v) for v in values), dtype=np.float64, count=count)
+    return np.rint(arr * 100).astype(np.int64)
+
+
+def _rate_key(rate: Any) -> Optional[int]:
+    return None if rate is None else int(round(float(rate) * 100))
+
+
+def aggregate_lines(
+    rows: Iterable[Tuple[str, str, Optional[Decimal], str, Any, Any, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Agrège des lignes (direction, catégorie, taux TVA, id facture, HT, TVA, TTC)
+
+    Les clés de groupe et les factures sont encodées en entiers (une passe
+    dictionnaire), les montants en centimes int64, puis sommés par groupe
+    avec np.bincount : résultat exact, sans accumulation Decimal par ligne.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    n = len(rows)
+
+    group_ids: Dict[Tuple[str, str, Optional[int]], int] = {}
+    invoice_ids: Dict[str, int] = {}
+    group_index = np.fromiter(
+        (group_ids.setdefault((r[0], r[1], _rate_key(r[2])), len(group_ids)) for r in rows),
+        dtype=np.int64, count=n
+    )
+    inv_index = np.fromiter(
+        (invoice_ids.setdefault(r[3], len(invoice_ids)) for r in rows),
+        dtype=np.int64, count=n
+    )
+    n_groups = len(group_ids)
+
+    # bincount somme en float64 : exact tant que le total reste < 2**53 centimes
+    sums = [
+        np.rint(np.bincount(group_index, weights=_cents_array((r[col] for r in rows), n), minlength=n_groups))
+        .astype(np.int64)
+        for col in (4, 5, 6)
+    ]
+    line_counts = np.bincount(group_index, minlength=n_groups)
+
+    # Nombre de factures distinctes par groupe
+    pairs = np.unique(group_index * len(invoice_ids) + inv_index)
+    invoice_counts = np.bincount(pairs // len(invoice_ids), minlength=n_groups)
+
+    groups = []
+    for (direction, category, rate_code), g in sorted(
+        group_ids.items(), key=lambda item: (item[0][0], item[0][1], -1 if item[0][2] is None else item[0][2])
+    ):
+        groups.append({
+            "direction": direction,
+            "transaction_category": category,
+            "tva_rate": None if rate_code is None else from_cents(rate_code),
+            "operations_count": int(invoice_counts[g]),
+            "lines_count": int(line_counts[g]),
+            "total_ht": from_cents(sums[0][g]),
+            "total_tva": from_cents(sums[1][g]),
+            "total_ttc": from_cents(sums[2][g]),
+        })
+    return groups
+
+
+class EReportingEngine:
+    """Calcule les totaux e-reporting d'une entreprise sur une période"""
+
+    def __init__(self, supabase_client: Client):
+        self.supabase = supabase_client
+        # Un groupe par (sens, catégorie, taux)
+        self._totals_rpc = SqlFunction("ereporting_period_totals", order="direction,transaction_category,tva_rate")
+
+    def period_totals(self, company_id: str, period_start: date, period_end: date) -> Dict[str, Any]:
+        """Totaux groupés de la période (requête serveur, sinon repli NumPy)"""
+        groups = self._period_totals_rpc(company_id, period_start, period_end)
+        source = "sql"
+        if groups is None:
+            groups = aggregate_lines(self._stream_rows(company_id, period_start, period_end))
+            source = "numpy"
+
+        return {
+            "period_start": period_start.isoformat(),
+            "period_end": period_end.isoformat(),
+            "source": source,
+            "groups": groups,
+            "totals": self._summarize(groups),
+        }
+
+    def prefill_declaration(
+        self, company_id: str, declaration_type: str, period_start: date, period_end: date
+    ) -> Dict[str, Any]:
+        """Montants d'une déclaration e-reporting (factures émises de la catégorie)"""
+        category = DECLARATION_CATEGORY[declaration_type]
+        totals = self.period_totals(company_id, period_start, period_end)
+        groups = [
+            g for g in totals["groups"]
+            if g["direction"] == "emitted" and g["transaction_category"] == category
+        ]
+        return {
+            "declaration_type": declaration_type,
+            "period_start": totals["period_start"],
+            "period_end": totals["period_end"],
+            "total_ht": sum((g["total_ht"] for g in groups), Decimal("0.00")),
+            "total_tva": sum((g["total_tva"] for g in groups), Decimal("0.00")),
+            "total_ttc": sum((g["total_ttc"] for g in groups), Decimal("0.00")),
+            "operations_count": sum(g["operations_count"] for g in groups),
+            "operations_details": [
+                {
+                    "tva_rate": float(g["tva_rate"]) if g["tva_rate"] is not None else None,
+                    "operations_count": g["operations_count"],
+                    "total_ht": float(g["total_ht"]),
+                    "total_tva": float(g["total_tva"]),
+                    "total_ttc": float(g["total_ttc"]),
+                }
+                for g in groups
+            ],
+            "source": totals["source"],
+        }
+
+    # ------------------------------------------------------------------
+
+    def _period_totals_rpc(self, company_id: str, period_start: date,
+                           period_end: date) -> Optional[List[Dict[str, Any]]]:
+        rows = self._totals_rpc.rows(self.supabase, {
+            "p_company_id": company_id,
+            "p_period_start": period_start.isoformat(),
+            "p_period_end": period_end.isoformat(),
+        })
+        if rows is None:
+            return None
+        return [
+            {
+                "direction": row["direction"],
+                "transaction_category": row["transaction_category"],
+                "tva_rate": Decimal(str(row["tva_rate"])) if row.get("tva_rate") is not None else None,
+                "operations_count": int(row["operations_count"]),
+                "lines_count": int(row["lines_count"]),
+                "total_ht": Decimal(str(row["total_ht"] or 0)).quantize(CENT),
+                "total_tva": Decimal(str(row["total_tva"] or 0)).quantize(CENT),
+                "total_ttc": Decimal(str(row["total_ttc"] or 0)).quantize(CENT),
+            }
+            for row in rows
+        ]
+
+    def _stream_rows(self, company_id: str, period_start: date, period_end: date) -> Iterator[tuple]:
+        """Lignes émises puis factures reçues de la période, lues par pages"""
+        start, end = period_start.isoformat(), period_end.isoformat()
+
+        invoices = {
+            inv["id"]: inv.get("transaction_category") or "b2b-fr"
+            for inv in paged(lambda: self.supabase.table("invoices_electronic")
+                             .select("id, transaction_category")
+                             .eq("company_id", company_id)
+                             .eq("direction", "outgoing")
+                             .neq("status_pdp", "draft")
+                             .gte("invoice_date", start)
+                             .lte("invoice_date", end)
+                             .order("id"))
+        }
+        invoice_ids = list(invoices)
+        for i in range(0, len(invoice_ids), IN_FILTER_CHUNK):
+            chunk = invoice_ids[i:i + IN_FILTER_CHUNK]
+            for line in paged(lambda: self.supabase.table("invoice_lines")
+                              .select("invoice_id, tva_rate, total_ht, tva_amount, total_ttc")
+                              .in_("invoice_id", chunk)
+                              .order("id")):
+                yield (
+                    "emitted", invoices[line["invoice_id"]], line.get("tva_rate"), line["invoice_id"],
+                    line.get("total_ht"), line.get("tva_amount"), line.get("total_ttc"),
+                )
+
+        for inv in paged(lambda: self.supabase.table("invoices_received")
+                         .select("id, total_ht, total_tva, total_ttc")
+                         .eq("company_id", company_id)
+                         .neq("status", "rejected")
+                         .gte("invoice_date", start)
+                         .lte("invoice_date", end)
+                         .order("id")):
+            yield (
+                "received", "purchase", effective_vat_rate(inv.get("total_ht"), inv.get("total_tva")), inv["id"],
+                inv.get("total_ht"), inv.get("total_tva"), inv.get("total_ttc"),
+            )
+
+    @staticmethod
+    def _summarize(groups: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        summary: Dict[str, Dict[str, Any]] = {}
+        for g in groups:
+            s = summary.setdefault(g["direction"], {
+                "operations_count": 0, "total_ht": Decimal("0.00"),
+                "total_tva": Decimal("0.00"), "total_ttc": Decimal("0.00"),
+            })
+            s["operations_count"] += g["operations_count"]
+            s["total_ht"] += g["total_ht"]
+            s["total_tva"] += g["total_tva"]
+            s["total_ttc"] += g["total_ttc"]
+        return summary
@@ -0,0 +1,120 @@
+"""
+Health Probes - Sondes de dépendances pour /livez et /readyz
+
+Les sondes (base Supabase, OpenAI, IOPOLE, tâches de fond) sont exécutées
+par une tâche de fond toutes les HEALTH_PROBE_INTERVAL secondes, en
+parallèle et avec un timeout chacune. Les endpoints ne font que lire le
+dernier résultat en mémoire : un health checker qui interroge le service
+en boucle ne touche ni la base ni les API externes.
+
+- sonde critique en échec (ou résultats trop anciens) => non prêt (503)
+- sonde non critique en échec => prêt mais "degraded"
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "30"))
+PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+
+# Une sonde renvoie un dict de détails (statut "ok" par défaut) ou lève une exception
+Probe = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class HealthMonitor:
+    """Résultats des sondes mis en cache, rafraîchis en tâche de fond"""
+
+    def __init__(self, interval: float = PROBE_INTERVAL, timeout: float = PROBE_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.started_at = time.monotonic()
+        self._probes: Dict[str, tuple] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._refreshed_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, probe: Probe, critical: bool = True):
+        self._probes[name] = (probe, critical)
+
+    async def _run_probe(self, name: str, probe: Probe, critical: bool) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(probe(), timeout=self.timeout) or {}
+            result = {"status": "ok", **detail}
+        except asyncio.TimeoutError:
+            result = {"status": "error", "error": f"timeout après {self.timeout:g}s"}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        if result["status"] != "ok" and self._results.get(name, {}).get("status") == "ok":
+            logger.warning(f"⚠️ Sonde {name} en échec: {result.get('error') or result['status']}")
+        result["critical"] = critical
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        result["checked_at"] = datetime.now(timezone.utc).isoformat()
+        return result
+
+    async def refresh(self) -> Dict[str, Dict[str, Any]]:
+        """Exécute toutes les sondes en parallèle et remplace les résultats"""
+        names = list(self._probes)
+        results = await asyncio.gather(*(
+            self._run_probe(name, *self._probes[name]) for name in names
+        ))
+        self._results = dict(zip(names, results))
+        self._refreshed_at = time.monotonic()
+        return self._results
+
+    # -- tâche de fond ---------------------------------------------------
+
+    def start(self):
+        """Démarre le rafraîchissement périodique (à appeler dans lifespan)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="health-probes")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erreur rafraîchissement sondes: {e}")
+            await asyncio.sleep(self.interval)
+
+    # -- lecture (endpoints) ---------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Dernier état connu, sans exécuter de sonde"""
+        uptime = round(time.monotonic() - self.started_at, 1)
+        if self._refreshed_at is None:
+            return {"status": "starting", "ready": False, "uptime_seconds": uptime, "checks": {}}
+
+        age = time.monotonic() - self._refreshed_at
+        stale = age > 3 * self.interval + self.timeout
+        critical_ok = all(r["status"] == "ok" for r in self._results.values() if r["critical"])
+        all_ok = all(r["status"] == "ok" for r in self._results.values())
+        ready = critical_ok and not stale
+        if not ready:
+            status = "stale" if critical_ok else "unavailable"
+        else:
+            status = "ok" if all_ok else "degraded"
+        return {
+            "status": status,
+            "ready": ready,
+            "uptime_seconds": uptime,
+            "age_seconds": round(age, 1),
+            "checks": self._results,
+        }
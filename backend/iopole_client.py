@@ -4,36 +4,198 @@ Conforme à la réforme DGFiP 2026-2027
 """
 
 import os
-import requests
+import time
+import random
+import asyncio
 import logging
 import hashlib
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 
+import httpx
+
 logger = logging.getLogger(__name__)
 
+# Codes HTTP considérés comme transitoires (retry avec backoff)
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class IOPOLEError(Exception):
+    """Erreur lors d'un appel à l'API IOPOLE"""
+
+
+class IOPOLECircuitOpenError(IOPOLEError):
+    """Circuit ouvert : IOPOLE est considéré indisponible, appel non tenté"""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur simple (closed → open → half-open)
+
+    Après `failure_threshold` échecs consécutifs, le circuit s'ouvre et les
+    appels échouent immédiatement pendant `reset_timeout` secondes. Un appel
+    d'essai est ensuite autorisé (half-open) : succès → fermé, échec → ouvert.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        if self.state == "open":
+            raise IOPOLECircuitOpenError("Circuit IOPOLE ouvert - appels suspendus temporairement")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            logger.warning(f"⚠️ Circuit IOPOLE ouvert après {self.failures} échec(s)")
+
+
+class AsyncRateLimiter:
+    """Limiteur de débit (token bucket) pour les envois groupés vers IOPOLE"""
+
+    def __init__(self, rate_per_second: float, burst: Optional[int] = None):
+        self.rate = rate_per_second
+        self.capacity = burst or max(1, int(rate_per_second))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
 
 class IOPOLEClient:
-    """Client pour l'API IOPOLE - Plateforme de Dématérialisation Partenaire"""
+    """Client asynchrone pour l'API IOPOLE - Plateforme de Dématérialisation Partenaire"""
     
-    def __init__(self):
-        self.api_base = os.getenv("IOPOLE_API_BASE", "https://api-sandbox.iopole.com/v1")
-        self.api_key = os.getenv("IOPOLE_API_KEY")
+    def __init__(
+        self,
+        api_base: Optional[str] = None,
+        api_key: Optional[str] = None,
+        environment: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0
+    ):
+        self.api_base = api_base or os.getenv("IOPOLE_API_BASE", "https://api-sandbox.iopole.com/v1")
+        self.api_key = api_key or os.getenv("IOPOLE_API_KEY")
         self.client_id = os.getenv("IOPOLE_CLIENT_ID")
         self.client_secret = os.getenv("IOPOLE_CLIENT_SECRET")
         self.webhook_secret = os.getenv("IOPOLE_WEBHOOK_SECRET")
-        self.environment = os.getenv("IOPOLE_ENV", "sandbox")
+        self.environment = environment or os.getenv("IOPOLE_ENV", "sandbox")
         
         # Token OAuth2
         self.access_token: Optional[str] = None
         self.token_expiry: Optional[datetime] = None
         
+        # Session HTTP partagée (keep-alive), créée au premier appel
+        self._transport = transport
+        self._session: Optional[httpx.AsyncClient] = None
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("IOPOLE_MAX_RETRIES", "3"))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv("IOPOLE_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("IOPOLE_BREAKER_RESET_SECONDS", "30"))
+        )
+        
         # Validation configuration
         if not self.api_key:
             logger.warning("⚠️ IOPOLE_API_KEY non configurée - Mode simulation activé")
         
         logger.info(f"🔧 IOPOLE Client initialisé en mode {self.environment}")
     
+    @property
+    def simulation_mode(self) -> bool:
+        return not self.api_key or self.environment == "sandbox"
+    
+    def _get_session(self) -> httpx.AsyncClient:
+        """Session HTTP poolée réutilisée par tous les appels (connexions keep-alive)"""
+        if self._session is None or self._session.is_closed:
+            self._session = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("IOPOLE_MAX_CONNECTIONS", "20")),
+                    max_keepalive_connections=10,
+                    keepalive_expiry=30.0
+                ),
+                transport=self._transport
+            )
+        return self._session
+    
+    async def aclose(self):
+        """Fermer la session HTTP (appelé à l'arrêt de l'application)"""
+        if self._session is not None and not self._session.is_closed:
+            await self._session.aclose()
+        self._session = None
+    
+    def _backoff_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Délai avant retry : Retry-After si fourni, sinon backoff exponentiel avec jitter complet"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Appel HTTP avec retries (erreurs réseau, 429, 5xx) et disjoncteur
+        
+        Raises:
+            IOPOLECircuitOpenError: circuit ouvert, appel non tenté
+            IOPOLEError: échec définitif (après retries ou erreur 4xx)
+        """
+        self.breaker.before_call()
+        session = self._get_session()
+        error: Optional[Exception] = None
+        
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = await session.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # Le service répond : une erreur 4xx n'ouvre pas le circuit
+                    self.breaker.record_success()
+                    if response.is_error:
+                        raise IOPOLEError(f"HTTP {response.status_code}: {response.text[:200]}")
+                    return response
+                error = IOPOLEError(f"HTTP {response.status_code}")
+            
+            if attempt < self.max_retries:
+                delay = self._backoff_delay(attempt, response)
+                logger.warning(f"⚠️ IOPOLE {method} {url} échec ({error}) - retry {attempt + 1}/{self.max_retries} dans {delay:.2f}s")
+                await asyncio.sleep(delay)
+        
+        self.breaker.record_failure()
+        raise IOPOLEError(f"{method} {url} échoué après {self.max_retries + 1} tentative(s): {error}") from error
+    
     def _get_headers(self) -> Dict[str, str]:
         """Génère les headers HTTP pour les requêtes API"""
         headers = {
@@ -50,7 +212,7 @@ class IOPOLEClient:
         
         return headers
     
-    def get_access_token(self) -> str:
+    async def get_access_token(self) -> str:
         """
         Obtenir un token OAuth2 (si nécessaire)
         Note: Certaines APIs utilisent directement l'API Key
@@ -65,7 +227,8 @@ class IOPOLEClient:
         
         # Sinon, demander un token OAuth2
         try:
-            response = requests.post(
+            response = await self._request(
+                "POST",
                 f"{self.api_base.replace('/v1', '')}/oauth/token",
                 json={
                     "grant_type": "client_credentials",
@@ -75,7 +238,6 @@ class IOPOLEClient:
                 timeout=10
             )
             
-            response.raise_for_status()
             data = response.json()
             
             self.access_token = data['access_token']
@@ -85,7 +247,7 @@ class IOPOLEClient:
             logger.info("✅ Token IOPOLE obtenu avec succès")
             return self.access_token
             
-        except requests.exceptions.RequestException as e:
+        except IOPOLEError as e:
             logger.error(f"❌ Erreur authentification IOPOLE: {e}")
             # En mode sandbox/dev, simuler un token
             if self.environment == "sandbox":
@@ -93,9 +255,9 @@ class IOPOLEClient:
                 self.access_token = "sandbox_token_" + hashlib.md5(str(datetime.now()).encode()).hexdigest()[:16]
                 self.token_expiry = datetime.utcnow() + timedelta(hours=1)
                 return self.access_token
-            raise Exception(f"Erreur authentification IOPOLE: {str(e)}")
+            raise IOPOLEError(f"Erreur authentification IOPOLE: {str(e)}")
     
-    def send_invoice(self, invoice_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def send_invoice(self, invoice_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Émettre une facture via IOPOLE
         
@@ -106,34 +268,34 @@ class IOPOLEClient:
             Réponse IOPOLE avec pdp_reference et tracking_url
         """
         try:
-            token = self.get_access_token()
-            
             # Mode simulation si pas d'API configurée
-            if not self.api_key or self.environment == "sandbox":
+            if self.simulation_mode:
                 logger.info("📤 SIMULATION: Émission facture vers IOPOLE")
                 return self._simulate_send_invoice(invoice_data)
             
+            await self.get_access_token()
+            
             # Appel API réel
-            response = requests.post(
+            response = await self._request(
+                "POST",
                 f"{self.api_base}/invoices/send",
                 headers=self._get_headers(),
                 json={"invoice": invoice_data},
                 timeout=30
             )
             
-            response.raise_for_status()
             result = response.json()
             
             logger.info(f"✅ Facture émise avec succès: {result.get('pdp_reference')}")
             return result
             
-        except requests.exceptions.RequestException as e:
+        except IOPOLEError as e:
             logger.error(f"❌ Erreur émission facture IOPOLE: {e}")
             # Fallback simulation en cas d'erreur
             if self.environment == "sandbox":
                 logger.warning("⚠️ Fallback: simulation de l'émission")
                 return self._simulate_send_invoice(invoice_data)
-            raise Exception(f"Erreur émission facture: {str(e)}")
+            raise
     
     def _simulate_send_invoice(self, invoice_data: Dict[str, Any]) -> Dict[str, Any]:
         """Simule l'émission d'une facture (mode dev/sandbox)"""
@@ -149,7 +311,7 @@ class IOPOLEClient:
             "simulation": True
         }
     
-    def receive_invoice(self, iopole_invoice_id: str) -> Dict[str, Any]:
+    async def receive_invoice(self, iopole_invoice_id: str) -> Dict[str, Any]:
         """
         Récupérer les détails d'une facture reçue
         
@@ -160,29 +322,28 @@ class IOPOLEClient:
             Détails de la facture
         """
         try:
-            token = self.get_access_token()
-            
-            if not self.api_key or self.environment == "sandbox":
+            if self.simulation_mode:
                 logger.info(f"📥 SIMULATION: Réception facture {iopole_invoice_id}")
                 return self._simulate_receive_invoice(iopole_invoice_id)
             
-            response = requests.get(
+            await self.get_access_token()
+            response = await self._request(
+                "GET",
                 f"{self.api_base}/invoices/received/{iopole_invoice_id}",
                 headers=self._get_headers(),
                 timeout=30
             )
             
-            response.raise_for_status()
             result = response.json()
             
             logger.info(f"✅ Facture reçue récupérée: {iopole_invoice_id}")
             return result
             
-        except requests.exceptions.RequestException as e:
+        except IOPOLEError as e:
             logger.error(f"❌ Erreur réception facture IOPOLE: {e}")
             if self.environment == "sandbox":
                 return self._simulate_receive_invoice(iopole_invoice_id)
-            raise Exception(f"Erreur réception facture: {str(e)}")
+            raise
     
     def _simulate_receive_invoice(self, invoice_id: str) -> Dict[str, Any]:
         """Simule la réception d'une facture"""
@@ -201,7 +362,7 @@ class IOPOLEClient:
             "simulation": True
         }
     
-    def download_file(self, file_url: str) -> bytes:
+    async def download_file(self, file_url: str) -> bytes:
         """
         Télécharger un fichier (PDF/XML) depuis IOPOLE
         
@@ -212,27 +373,26 @@ class IOPOLEClient:
             Contenu du fichier en bytes
         """
         try:
-            token = self.get_access_token()
-            
-            if not self.api_key or self.environment == "sandbox":
+            if self.simulation_mode:
                 logger.info(f"📥 SIMULATION: Téléchargement fichier {file_url}")
                 return b"PDF_SIMULATION_CONTENT"
             
-            response = requests.get(
+            await self.get_access_token()
+            response = await self._request(
+                "GET",
                 file_url,
                 headers=self._get_headers(),
                 timeout=60
             )
             
-            response.raise_for_status()
             logger.info(f"✅ Fichier téléchargé: {len(response.content)} bytes")
             return response.content
             
-        except requests.exceptions.RequestException as e:
+        except IOPOLEError as e:
             logger.error(f"❌ Erreur téléchargement fichier IOPOLE: {e}")
-            raise Exception(f"Erreur téléchargement fichier: {str(e)}")
+            raise
     
-    def send_ereporting(self, declaration_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def send_ereporting(self, declaration_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Transmettre une déclaration e-reporting au PDP
         
@@ -243,30 +403,29 @@ class IOPOLEClient:
             Réponse IOPOLE avec pdp_reference
         """
         try:
-            token = self.get_access_token()
-            
-            if not self.api_key or self.environment == "sandbox":
+            if self.simulation_mode:
                 logger.info("📊 SIMULATION: Transmission e-reporting")
                 return self._simulate_ereporting(declaration_data)
             
-            response = requests.post(
+            await self.get_access_token()
+            response = await self._request(
+                "POST",
                 f"{self.api_base}/e-reporting/declare",
                 headers=self._get_headers(),
                 json={"declaration": declaration_data},
                 timeout=30
             )
             
-            response.raise_for_status()
             result = response.json()
             
             logger.info(f"✅ E-reporting transmis: {result.get('pdp_reference')}")
             return result
             
-        except requests.exceptions.RequestException as e:
+        except IOPOLEError as e:
             logger.error(f"❌ Erreur e-reporting IOPOLE: {e}")
             if self.environment == "sandbox":
                 return self._simulate_ereporting(declaration_data)
-            raise Exception(f"Erreur e-reporting: {str(e)}")
+            raise
     
     def _simulate_ereporting(self, declaration_data: Dict[str, Any]) -> Dict[str, Any]:
         """Simule la transmission e-reporting"""
@@ -282,7 +441,7 @@ class IOPOLEClient:
             "simulation": True
         }
     
-    def archive_document(
+    async def archive_document(
         self,
         document_data: Dict[str, Any],
         pdf_file: bytes,
@@ -300,12 +459,12 @@ class IOPOLEClient:
             Réponse avec archive_id et hash
         """
         try:
-            token = self.get_access_token()
-            
-            if not self.api_key or self.environment == "sandbox":
+            if self.simulation_mode:
                 logger.info("🗄️ SIMULATION: Archivage document")
                 return self._simulate_archive(document_data, pdf_file, xml_file)
             
+            token = await self.get_access_token()
+            
             files = {
                 'pdf': ('invoice.pdf', pdf_file, 'application/pdf')
             }
@@ -319,7 +478,8 @@ class IOPOLEClient:
                 "User-Agent": "SkyApp/1.0"
             }
             
-            response = requests.post(
+            response = await self._request(
+                "POST",
                 f"{self.api_base}/archives/store",
                 headers=headers,
                 data=document_data,
@@ -327,17 +487,16 @@ class IOPOLEClient:
                 timeout=60
             )
             
-            response.raise_for_status()
             result = response.json()
             
             logger.info(f"✅ Document archivé: {result.get('archive_id')}")
             return result
             
-        except requests.exceptions.RequestException as e:
+        except IOPOLEError as e:
             logger.error(f"❌ Erreur archivage IOPOLE: {e}")
             if self.environment == "sandbox":
                 return self._simulate_archive(document_data, pdf_file, xml_file)
-            raise Exception(f"Erreur archivage: {str(e)}")
+            raise
     
     def _simulate_archive(
         self,
@@ -397,7 +556,7 @@ class IOPOLEClient:
             logger.error(f"❌ Erreur validation signature: {e}")
             return False
     
-    def health_check(self) -> Dict[str, Any]:
+    async def health_check(self) -> Dict[str, Any]:
         """Vérifier la connexion à l'API IOPOLE"""
         try:
             if not self.api_key:
@@ -408,14 +567,15 @@ class IOPOLEClient:
                 }
             
             # Tenter d'obtenir un token
-            token = self.get_access_token()
+            token = await self.get_access_token()
             
             return {
                 "status": "connected",
                 "message": "Connexion IOPOLE OK",
                 "environment": self.environment,
                 "api_base": self.api_base,
-                "token_valid": bool(token)
+                "token_valid": bool(token),
+                "circuit": self.breaker.state
             }
             
         except Exception as e:
@@ -489,7 +649,7 @@ if __name__ == "__main__":
     print("=" * 60)
     
     client = IOPOLEClient()
-    health = client.health_check()
+    health = asyncio.run(client.health_check())
     
     print(f"Status: {health['status']}")
     print(f"Environment: {health['environment']}")
@@ -0,0 +1,217 @@
+"""
+Log Config - Logs structurés écrits hors de la boucle asyncio
+
+configure_logging() remplace logging.basicConfig :
+- la racine n'a qu'un QueueHandler (mise en file, O(1)) ; un QueueListener
+  écrit sur stdout depuis son propre thread : l'I/O des logs ne compte plus
+  dans la latence des requêtes
+- format JSON (LOG_FORMAT=json, défaut) ou texte (LOG_FORMAT=text, en local)
+- identifiant de requête (X-Request-ID repris ou généré par
+  RequestIdMiddleware) ajouté à chaque ligne émise pendant la requête
+- niveaux par module : LOG_LEVEL=INFO, LOG_LEVELS="ai_service=WARNING,httpx=WARNING"
+- échantillonnage des lignes DEBUG : LOG_DEBUG_SAMPLE_RATE=0.1 garde une ligne
+  sur dix par emplacement d'appel (déterministe)
+
+Les loggers uvicorn (accès compris) passent par la même file.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributs standard d'un LogRecord (le reste vient de extra=...)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sampled"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            payload["request_id"] = record.request_id
+        if getattr(record, "sampled", None):
+            payload["sample_rate"] = record.sampled
+        if record.levelno >= logging.WARNING:
+            payload["where"] = f"{record.module}:{record.lineno}"
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{line} [req={request_id}]" if request_id else line
+
+
+class RequestContextFilter(logging.Filter):
+    """Ajoute l'identifiant de requête (exécuté dans le thread appelant, avant la mise en file)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Garde une fraction `rate` des lignes DEBUG, par emplacement d'appel (pathname, lineno)"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            n = self._seen.get(key, 0) + 1
+            self._seen[key] = n
+        # Garde la n-ième ligne si elle fait franchir un entier à n * rate
+        if int(n * self.rate) > int((n - 1) * self.rate):
+            record.sampled = self.rate
+            return True
+        return False
+
+
+class _StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Ne formate pas dans le thread appelant : seul le message (%-args) et la trace d'exception sont figés"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> Dict[str, int]:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    module_levels: Optional[str] = None,
+    debug_sample_rate: Optional[float] = None,
+    stream=None,
+) -> logging.handlers.QueueListener:
+    """Installe la file de logs (idempotent : reconfigure proprement si rappelé)"""
+    global _listener
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    module_levels = module_levels if module_levels is not None else os.getenv("LOG_LEVELS", "httpx=WARNING,hpack=WARNING")
+    if debug_sample_rate is None:
+        debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _StructuredQueueHandler) or not _is_test_capture(handler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    for name, module_level in _parse_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    # uvicorn installe ses propres handlers (écriture synchrone) : tout passe par la file
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def _is_test_capture(handler: logging.Handler) -> bool:
+    # Handlers de capture de pytest (caplog) conservés
+    return type(handler).__module__.startswith("_pytest")
+
+
+def shutdown_logging():
+    """Vide la file et arrête le thread d'écriture"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
+
+
+class RequestIdMiddleware:
+    """Middleware ASGI : X-Request-ID repris (ou généré), exposé aux logs et renvoyé dans la réponse"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
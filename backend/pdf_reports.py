@@ -0,0 +1,1372 @@
+"""
+PDF Reports - Génération des PDF recherches terrain et devis (ReportLab)
+
+Module importé au premier PDF demandé (voir pdf_routes) : ReportLab n'est
+pas chargé au démarrage du serveur.
+"""
+
+import io
+import base64
+import logging
+from datetime import datetime
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as ReportLabImage, PageBreak
+
+from server_supabase import ROOT_DIR, STORAGE_BUCKET, get_user_company, supabase_service
+
+
+async def generate_search_pdf(
+    search_id: str,
+    user_data: dict
+):
+    """Générer un PDF professionnel pour une recherche terrain"""
+    import requests
+    import shutil
+    from reportlab.lib.enums import TA_LEFT, TA_RIGHT
+    from reportlab.lib.units import mm
+    
+    try:
+        logging.info(f"🔍 [PDF] START génération search_id={search_id}")
+        company_id = await get_user_company(user_data)
+        logging.info(f"📡 [PDF] Company ID: {company_id}")
+        
+        # Récupérer la recherche
+        logging.info(f"📥 [PDF] Récupération recherche...")
+        response = supabase_service.table("searches").select("*").eq("id", search_id).execute()
+        
+        if not response.data:
+            logging.error(f"❌ [PDF] Recherche introuvable")
+            raise HTTPException(status_code=404, detail="Recherche introuvable")
+        
+        search = response.data[0]
+        logging.info(f"✅ [PDF] Recherche: {search.get('location', 'N/A')}, photos: {len(search.get('photos', []))}")
+        
+        # Permissions
+        if company_id and search.get("company_id") != company_id:
+            raise HTTPException(status_code=403, detail="Accès refusé")
+        
+        # Récupérer les informations de l'entreprise
+        company_info = {}
+        if company_id:
+            try:
+                company_response = supabase_service.table("companies").select("*").eq("id", company_id).execute()
+                if company_response.data:
+                    company_info = company_response.data[0]
+                    logging.info(f"🏢 [PDF] Entreprise: {company_info.get('name', 'N/A')}")
+            except Exception as e:
+                logging.warning(f"⚠️ [PDF] Impossible de récupérer les infos entreprise: {e}")
+        
+        logging.info(f"📄 [PDF] Création buffer...")
+        
+        buffer = io.BytesIO()
+        
+        # Fonction pour ajouter pied de page avec numéros
+        def add_page_number(canvas, doc):
+            """Ajoute le numéro de page et les infos dans le pied de page"""
+            canvas.saveState()
+            # Pied de page
+            page_num_text = f"Page {doc.page}"
+            canvas.setFont('Helvetica', 8)
+            canvas.setFillColor(colors.Color(0.5, 0.5, 0.5))
+            canvas.drawString(2*cm, 1.5*cm, f"Référence: {search_id[:8].upper()}")
+            canvas.drawCentredString(A4[0]/2, 1.5*cm, page_num_text)
+            canvas.drawRightString(A4[0] - 2*cm, 1.5*cm, f"{datetime.now().strftime('%d/%m/%Y')}")
+            # Ligne de séparation
+            canvas.setStrokeColor(colors.Color(0.85, 0.85, 0.85))
+            canvas.setLineWidth(0.5)
+            canvas.line(2*cm, 1.8*cm, A4[0] - 2*cm, 1.8*cm)
+            canvas.restoreState()
+        
+        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2.5*cm, bottomMargin=2.5*cm, 
+                               leftMargin=2*cm, rightMargin=2*cm)
+        
+        story = []
+        styles = getSampleStyleSheet()
+        primary_color = colors.HexColor("#6366f1")
+        
+        logging.info(f"📝 [PDF] Construction contenu professionnel...")
+        
+        # COULEURS MODERNES ET ÉLÉGANTES
+        dark_indigo = colors.Color(0.26, 0.31, 0.71)  # #4350B5
+        light_indigo = colors.Color(0.38, 0.40, 0.93)  # #6166ED  
+        soft_gray = colors.Color(0.18, 0.20, 0.25)     # #2E3440
+        accent_teal = colors.Color(0.13, 0.69, 0.67)   # #22B0AD
+        accent_orange = colors.Color(0.95, 0.51, 0.20) # #F28234
+        success_green = colors.Color(0.13, 0.77, 0.29) # #22C54A
+        warning_red = colors.Color(0.93, 0.26, 0.26)   # #ED4242
+        
+        search_type = search.get('search_type', 'TERRAIN').upper()
+        type_label = "RECHERCHE D'INFILTRATION" if search_type == 'INFILTRATION' else "RECHERCHE DE FUITE"
+        
+        # ==================== PAGE DE GARDE ====================
+        logging.info(f"📄 [PDF] Création page de garde...")
+        
+        story.append(Spacer(1, 3*cm))
+        
+        # Logo ou nom entreprise centré
+        if company_info.get('name'):
+            company_style = ParagraphStyle('Company', parent=styles['Normal'],
+                                         fontSize=18, textColor=dark_indigo, alignment=TA_CENTER,
+                                         fontName='Helvetica-Bold', spaceAfter=10)
+            story.append(Paragraph(company_info['name'].upper(), company_style))
+        
+        story.append(Spacer(1, 1*cm))
+        
+        # Ligne de séparation
+        line_table = Table([['_' * 80]], colWidths=[15*cm])
+        line_table.setStyle(TableStyle([
+            ('TEXTCOLOR', (0, 0), (-1, -1), light_indigo),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ]))
+        story.append(line_table)
+        story.append(Spacer(1, 1*cm))
+        
+        # Titre principal
+        title_cover = ParagraphStyle('TitleCover', parent=styles['Normal'],
+                                    fontSize=32, textColor=dark_indigo, alignment=TA_CENTER,
+                                    fontName='Helvetica-Bold', leading=40, spaceAfter=20)
+        story.append(Paragraph(f"RAPPORT DE<br/>{type_label}", title_cover))
+        
+        story.append(Spacer(1, 2*cm))
+        
+        # Informations principales
+        cover_info_style = ParagraphStyle('CoverInfo', parent=styles['Normal'],
+                                         fontSize=14, textColor=soft_gray, alignment=TA_CENTER,
+                                         fontName='Helvetica', leading=22)
+        
+        client_name = f"{search.get('prenom', '')} {search.get('nom', '')}".strip()
+        if client_name:
+            story.append(Paragraph(f"<b>Client:</b> {client_name}", cover_info_style))
+        
+        if search.get('location'):
+            story.append(Paragraph(f"<b>Localisation:</b> {search['location']}", cover_info_style))
+        
+        story.append(Spacer(1, 1*cm))
+        story.append(Paragraph(f"<b>Référence:</b> {search_id[:8].upper()}", cover_info_style))
+        story.append(Paragraph(f"<b>Date:</b> {datetime.now().strftime('%d/%m/%Y')}", cover_info_style))
+        
+        story.append(Spacer(1, 3*cm))
+        
+        # Coordonnées entreprise en bas
+        if company_info:
+            footer_style = ParagraphStyle('FooterCover', parent=styles['Normal'],
+                                         fontSize=9, textColor=colors.Color(0.5, 0.5, 0.5),
+                                         alignment=TA_CENTER, fontName='Helvetica')
+            
+            contact_lines = []
+            if company_info.get('address'):
+                contact_lines.append(company_info['address'])
+            if company_info.get('postal_code') and company_info.get('city'):
+                contact_lines.append(f"{company_info['postal_code']} {company_info['city']}")
+            if company_info.get('siret'):
+                contact_lines.append(f"SIRET: {company_info['siret']}")
+            
+            if contact_lines:
+                story.append(Paragraph('<br/>'.join(contact_lines), footer_style))
+        
+        # Mention confidentielle
+        conf_style = ParagraphStyle('Confidential', parent=styles['Normal'],
+                                   fontSize=8, textColor=colors.Color(0.6, 0.6, 0.6),
+                                   alignment=TA_CENTER, fontName='Helvetica-Oblique')
+        story.append(Spacer(1, 0.5*cm))
+        story.append(Paragraph("Document confidentiel - Usage strictement réservé au destinataire", conf_style))
+        
+        # Saut de page vers contenu
+        story.append(PageBreak())
+        
+        # ==================== ÉLÉMENTS DE DÉCORATION ====================
+        # Ligne décorative en haut de chaque section
+        def add_decorative_line(color=light_indigo):
+            """Ajoute une ligne décorative horizontale"""
+            line_data = [['']]
+            line = Table(line_data, colWidths=[17*cm], rowHeights=[0.15*cm])
+            line.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, -1), color),
+                ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+                ('TOPPADDING', (0, 0), (-1, -1), 0),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+            ]))
+            return line
+        
+        # Ajout d'une ligne décorative au début du document
+        story.append(add_decorative_line(dark_indigo))
+        story.append(Spacer(1, 0.8*cm))
+        
+        # ==================== STYLES POUR LES SECTIONS ====================
+        heading_style = ParagraphStyle('CustomHeading', parent=styles['Heading2'],
+                                      fontSize=14, textColor=colors.white, spaceAfter=10, spaceBefore=15,
+                                      fontName='Helvetica-Bold', leftIndent=15, rightIndent=15,
+                                      borderPadding=10, backColor=dark_indigo,
+                                      borderWidth=0, borderRadius=6)
+        
+        # ===== PRÉPARATION: Organiser toutes les photos par section AVANT de construire le PDF =====
+        photos = search.get('photos', [])
+        photos_by_section_id = {}
+        profile_photo = None
+        photo_counter_global = 0
+        
+        if photos and len(photos) > 0:
+            logging.info(f"📷 [PDF] Organisation de {len(photos)} photos...")
+            for photo in photos:
+                # Filtrer photo de profil
+                if photo.get('is_profile'):
+                    profile_photo = photo
+                    logging.info(f"  🖼️ Photo de profil trouvée: {photo.get('filename')}")
+                    continue
+                    
+                section_id = photo.get('section_id', 'autres')
+                if section_id not in photos_by_section_id:
+                    photos_by_section_id[section_id] = []
+                photos_by_section_id[section_id].append(photo)
+            logging.info(f"  📁 {len(photos_by_section_id)} section(s) avec photos: {list(photos_by_section_id.keys())}")
+        
+        # FONCTION HELPER: Ajouter photos 2 PAR LIGNE
+        def add_section_photos_grid(section_name, photos_list, counter_start):
+            """Ajoute les photos d'une section en grille 2x2"""
+            photos_added = 0
+            photo_counter = counter_start
+            
+            if not photos_list or len(photos_list) == 0:
+                return photos_added, photo_counter
+            
+            logging.info(f"  📷 Ajout de {len(photos_list)} photo(s) pour section '{section_name}' (grille 2x2)")
+            
+            # Organiser en lignes de 2 photos
+            for i in range(0, len(photos_list), 2):
+                row_photos = photos_list[i:i+2]
+                row_elements = []
+                
+                for photo in row_photos:
+                    photo_counter += 1
+                    try:
+                        filename = photo.get('filename', '')
+                        photo_path = f"{search_id}/{filename}"
+                        
+                        logging.info(f"    📸 [{photo_counter}] {filename}")
+                        
+                        try:
+                            photo_data = supabase_service.storage.from_(STORAGE_BUCKET).download(photo_path)
+                            
+                            if len(photo_data) > 0:
+                                temp_path = ROOT_DIR / "uploads" / f"temp_{search_id}_{photo_counter}.jpg"
+                                temp_path.parent.mkdir(parents=True, exist_ok=True)
+                                temp_path.write_bytes(photo_data)
+                                
+                                # Image plus petite pour grille 2x2
+                                img = ReportLabImage(str(temp_path), width=7.5*cm, height=5.5*cm, kind='proportional')
+                                
+                                # Légende sous l'image
+                                caption = ""
+                                if photo.get('notes'):
+                                    caption = photo['notes'][:60] + ('...' if len(photo.get('notes', '')) > 60 else '')
+                                
+                                caption_style = ParagraphStyle('Caption', parent=styles['Normal'],
+                                                             fontSize=7.5, textColor=colors.Color(0.4, 0.4, 0.4),
+                                                             alignment=TA_CENTER, fontName='Helvetica-Oblique')
+                                
+                                caption_para = Paragraph(f"📷 Photo {photo_counter}<br/>{caption}" if caption else f"📷 Photo {photo_counter}", caption_style)
+                                
+                                # Conteneur photo + légende
+                                photo_cell = Table([[img], [caption_para]], colWidths=[8*cm], rowHeights=[5.8*cm, 1*cm])
+                                photo_cell.setStyle(TableStyle([
+                                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                                    ('BOX', (0, 0), (0, 0), 1.5, light_indigo),
+                                    ('BACKGROUND', (0, 0), (0, 0), colors.Color(0.99, 0.99, 1)),
+                                    ('PADDING', (0, 0), (0, 0), 4),
+                                ]))
+                                
+                                row_elements.append(photo_cell)
+                                photos_added += 1
+                                logging.info(f"      ✅ Photo ajoutée")
+                            else:
+                                logging.warning(f"      ⚠️ Fichier vide")
+                        except Exception as e:
+                            logging.error(f"      ❌ Erreur: {e}")
+                            
+                    except Exception as e:
+                        logging.error(f"    ❌ Erreur photo: {e}")
+                        continue
+                
+                # Si on a des photos dans la ligne, les ajouter
+                if row_elements:
+                    # Compléter avec une cellule vide si nécessaire
+                    if len(row_elements) == 1:
+                        row_elements.append('')
+                    
+                    row_table = Table([row_elements], colWidths=[8.5*cm, 8.5*cm])
+                    row_table.setStyle(TableStyle([
+                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                    ]))
+                    story.append(row_table)
+                    story.append(Spacer(1, 0.4*cm))
+            
+            return photos_added, photo_counter
+        
+        # FONCTION HELPER: Ajouter photos d'une section
+        def add_section_photos(section_name, photos_list, counter_start):
+            """Ajoute les photos d'une section avec mise en forme élégante"""
+            photos_added = 0
+            photo_counter = counter_start
+            
+            if not photos_list or len(photos_list) == 0:
+                return photos_added, photo_counter
+            
+            logging.info(f"  📷 Ajout de {len(photos_list)} photo(s) pour section '{section_name}'")
+            
+            for photo in photos_list:
+                photo_counter += 1
+                try:
+                    filename = photo.get('filename', '')
+                    photo_path = f"{search_id}/{filename}"
+                    
+                    logging.info(f"    📸 [{photo_counter}] {filename}")
+                    
+                    try:
+                        photo_data = supabase_service.storage.from_(STORAGE_BUCKET).download(photo_path)
+                        
+                        if len(photo_data) > 0:
+                            temp_path = ROOT_DIR / "uploads" / f"temp_{search_id}_{photo_counter}.jpg"
+                            temp_path.parent.mkdir(parents=True, exist_ok=True)
+                            temp_path.write_bytes(photo_data)
+                            
+                            # Photos plus petites et élégantes
+                            img = ReportLabImage(str(temp_path), width=11*cm, height=7.5*cm, kind='proportional')
+                            
+                            # Conteneur avec design moderne
+                            img_container = Table([[img]], colWidths=[12*cm])
+                            img_container.setStyle(TableStyle([
+                                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                                ('BOX', (0, 0), (-1, -1), 2, light_indigo),
+                                ('BACKGROUND', (0, 0), (-1, -1), colors.Color(0.99, 0.99, 1)),
+                                ('PADDING', (0, 0), (-1, -1), 6),
+                                ('TOPPADDING', (0, 0), (-1, -1), 6),
+                                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                            ]))
+                            
+                            story.append(img_container)
+                            story.append(Spacer(1, 0.15*cm))
+                            
+                            # Légende moderne
+                            if photo.get('notes'):
+                                notes_style = ParagraphStyle('PhotoNotes', parent=styles['Normal'],
+                                                           fontSize=8.5, leading=12, 
+                                                           textColor=colors.Color(0.35, 0.37, 0.42),
+                                                           alignment=TA_CENTER, fontName='Helvetica-Oblique',
+                                                           leftIndent=15, rightIndent=15)
+                                story.append(Paragraph(f'💬 {photo["notes"]}', notes_style))
+                            
+                            story.append(Spacer(1, 0.5*cm))
+                            photos_added += 1
+                            logging.info(f"      ✅ Photo ajoutée")
+                        else:
+                            logging.warning(f"      ⚠️ Fichier vide")
+                    except Exception as e:
+                        logging.error(f"      ❌ Erreur: {e}")
+                        
+                except Exception as e:
+                    logging.error(f"    ❌ Erreur photo: {e}")
+                    continue
+            
+            return photos_added, photo_counter
+        
+        # ===== SECTION 1: INFORMATIONS GÉNÉRALES (avec photo de profil) =====
+        story.append(add_decorative_line(colors.Color(0.90, 0.92, 0.98)))
+        story.append(Spacer(1, 0.4*cm))
+        story.append(Paragraph("📋 INFORMATIONS GÉNÉRALES", heading_style))
+        story.append(Spacer(1, 0.3*cm))
+        
+        # Construire les données du tableau
+        info_data = []
+        if search.get('nom') or search.get('prenom'):
+            nom = f"{search.get('prenom', '')} {search.get('nom', '')}".strip()
+            info_data.append(['Client', nom])
+        
+        info_data.extend([
+            ['Type de recherche', search_type],
+            ['Date de création', search.get('created_at', 'N/A')[:10] if search.get('created_at') else 'N/A'],
+            ['Statut', search.get('status', 'ACTIVE')],
+            ['Référence', search_id[:8].upper()],
+        ])
+        
+        # Si photo de profil, créer layout avec photo + tableau
+        if profile_photo:
+            try:
+                filename = profile_photo.get('filename', '')
+                photo_path = f"{search_id}/{filename}"
+                logging.info(f"🖼️ [PDF] Ajout photo de profil: {filename}")
+                
+                photo_data_bytes = supabase_service.storage.from_(STORAGE_BUCKET).download(photo_path)
+                if len(photo_data_bytes) > 0:
+                    temp_path = ROOT_DIR / "uploads" / f"temp_{search_id}_profile.jpg"
+                    temp_path.parent.mkdir(parents=True, exist_ok=True)
+                    temp_path.write_bytes(photo_data_bytes)
+                    
+                    # Photo de profil plus petite et élégante
+                    profile_img = ReportLabImage(str(temp_path), width=3*cm, height=3*cm, kind='proportional')
+                    
+                    # Conteneur photo avec bordure arrondie
+                    photo_container = Table([[profile_img]], colWidths=[3.2*cm])
+                    photo_container.setStyle(TableStyle([
+                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                        ('BOX', (0, 0), (-1, -1), 2, light_indigo),
+                        ('BACKGROUND', (0, 0), (-1, -1), colors.white),
+                        ('PADDING', (0, 0), (-1, -1), 4),
+                    ]))
+                    
+                    info_table = Table(info_data, colWidths=[5.2*cm, 11*cm])
+                    info_table.setStyle(TableStyle([
+                        ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.96, 0.97, 0.99)),
+                        ('TEXTCOLOR', (0, 0), (0, -1), dark_indigo),
+                        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                        ('FONTSIZE', (0, 0), (-1, -1), 9.5),
+                        ('PADDING', (0, 0), (-1, -1), 10),
+                        ('GRID', (0, 0), (-1, -1), 0.8, colors.Color(0.88, 0.90, 0.94)),
+                        ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
+                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                    ]))
+                    
+                    # Layout avec photo à gauche, tableau à droite
+                    layout_table = Table([[photo_container, info_table]], colWidths=[3.5*cm, 13.5*cm], rowHeights=[None])
+                    layout_table.setStyle(TableStyle([
+                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                        ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+                        ('LEFTPADDING', (0, 0), (0, 0), 0),
+                        ('RIGHTPADDING', (0, 0), (0, 0), 8),
+                    ]))
+                    story.append(layout_table)
+                    logging.info(f"  ✅ Photo de profil ajoutée à côté du tableau")
+                else:
+                    # Fallback sans photo
+                    info_table = Table(info_data, colWidths=[6*cm, 11*cm])
+                    info_table.setStyle(TableStyle([
+                        ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.94, 0.95, 1)),
+                        ('TEXTCOLOR', (0, 0), (0, -1), primary_color),
+                        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                        ('FONTSIZE', (0, 0), (-1, -1), 10),
+                        ('PADDING', (0, 0), (-1, -1), 14),
+                        ('LEFTPADDING', (0, 0), (0, -1), 18),
+                        ('GRID', (0, 0), (-1, -1), 1, colors.Color(0.85, 0.85, 0.92)),
+                        ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
+                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                    ]))
+                    story.append(info_table)
+            except Exception as e:
+                logging.error(f"  ❌ Erreur photo profil: {e}")
+                # Fallback sans photo
+                info_table = Table(info_data, colWidths=[6*cm, 11*cm])
+                info_table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.94, 0.95, 1)),
+                    ('TEXTCOLOR', (0, 0), (0, -1), primary_color),
+                    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 10),
+                    ('PADDING', (0, 0), (-1, -1), 14),
+                    ('LEFTPADDING', (0, 0), (0, -1), 18),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.Color(0.85, 0.85, 0.92)),
+                    ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
+                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ]))
+                story.append(info_table)
+        else:
+            # Pas de photo de profil
+            info_table = Table(info_data, colWidths=[6*cm, 11*cm])
+            info_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.94, 0.95, 1)),
+                ('TEXTCOLOR', (0, 0), (0, -1), primary_color),
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 0), (-1, -1), 10),
+                ('PADDING', (0, 0), (-1, -1), 14),
+                ('LEFTPADDING', (0, 0), (0, -1), 18),
+                ('GRID', (0, 0), (-1, -1), 1, colors.Color(0.85, 0.85, 0.92)),
+                ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ]))
+            story.append(info_table)
+        
+        # Photos de la section general_info
+        general_photos = photos_by_section_id.get('general_info', [])
+        if general_photos:
+            story.append(Spacer(1, 0.6*cm))
+            added, photo_counter_global = add_section_photos_grid('Informations générales', general_photos, photo_counter_global)
+        
+        story.append(Spacer(1, 1*cm))
+        
+        # ===== SECTION 2: LOCALISATION & CLIENT =====
+        story.append(add_decorative_line(colors.Color(0.90, 0.98, 0.97)))
+        story.append(Spacer(1, 0.4*cm))
+        story.append(Paragraph("📍 LOCALISATION & CLIENT", heading_style))
+        story.append(Spacer(1, 0.3*cm))
+        
+        location_data = []
+        if search.get('location'):
+            location_data.append(['Adresse', search['location']])
+        if search.get('nom') or search.get('prenom'):
+            client = f"{search.get('prenom', '')} {search.get('nom', '')}".strip()
+            location_data.append(['Client', client])
+        
+        if location_data:
+            location_table = Table(location_data, colWidths=[5.5*cm, 11.5*cm])
+            location_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.95, 0.99, 0.97)),
+                ('TEXTCOLOR', (0, 0), (0, -1), accent_teal),
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9.5),
+                ('PADDING', (0, 0), (-1, -1), 10),
+                ('LEFTPADDING', (0, 0), (0, -1), 15),
+                ('GRID', (0, 0), (-1, -1), 0.8, colors.Color(0.85, 0.94, 0.90)),
+                ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 1, 0.99)]),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ]))
+            story.append(location_table)
+        else:
+            story.append(Paragraph("<i>Aucune information disponible</i>", styles['Normal']))
+        story.append(Spacer(1, 1*cm))
+        
+        # ===== SECTION 3: DESCRIPTION DE LA RECHERCHE + PHOTOS =====
+        if search.get('description'):
+            # PageBreak si la section a des photos pour tout garder ensemble
+            desc_photos = photos_by_section_id.get('description', [])
+            if desc_photos:
+                story.append(PageBreak())
+            
+            story.append(add_decorative_line(colors.Color(0.90, 0.92, 0.98)))
+            story.append(Spacer(1, 0.4*cm))
+            story.append(Paragraph("📝 DESCRIPTION DE LA RECHERCHE", heading_style))
+            story.append(Spacer(1, 0.3*cm))
+            
+            desc_style = ParagraphStyle('Description', parent=styles['Normal'],
+                                       fontSize=10, leading=16, spaceBefore=6, spaceAfter=6,
+                                       leftIndent=18, rightIndent=18, borderPadding=15,
+                                       backColor=colors.Color(0.98, 0.98, 0.99),
+                                       borderColor=light_indigo, borderWidth=1.5, borderRadius=6,
+                                       textColor=colors.Color(0.22, 0.24, 0.30))
+            
+            story.append(Paragraph(search['description'].replace('\n', '<br/>'), desc_style))
+            
+            # Photos de la section description (section_id = 'description')
+            desc_photos = photos_by_section_id.get('description', [])
+            if desc_photos:
+                story.append(Spacer(1, 0.6*cm))
+                added, photo_counter_global = add_section_photos_grid('Description', desc_photos, photo_counter_global)
+            
+            story.append(Spacer(1, 0.8*cm))
+        
+        # ===== SECTION 4: OBSERVATIONS ET REMARQUES + SECTIONS CUSTOM =====
+        # Parser le JSON observations qui contient {text: "...", customSections: [...]}
+        observations_text = ""
+        custom_sections_data = []
+        
+        if search.get('observations'):
+            try:
+                import json
+                observations_json = json.loads(search['observations'])
+                observations_text = observations_json.get('text', '')
+                custom_sections_data = observations_json.get('customSections', [])
+                logging.info(f"📦 [PDF] Observations parsées: texte={bool(observations_text)}, custom_sections={len(custom_sections_data)}")
+            except (json.JSONDecodeError, TypeError):
+                # Ancien format texte simple
+                observations_text = search['observations']
+                logging.info(f"⚠️ [PDF] Observations en ancien format texte")
+        
+        # Afficher la section observations (texte uniquement)
+        if observations_text:
+            # PageBreak si la section a des photos pour tout garder ensemble
+            obs_photos = photos_by_section_id.get('observations', [])
+            if obs_photos:
+                story.append(PageBreak())
+            
+            story.append(add_decorative_line(colors.Color(1, 0.95, 0.88)))
+            story.append(Spacer(1, 0.4*cm))
+            story.append(Paragraph("⚠️ OBSERVATIONS ET REMARQUES", heading_style))
+            story.append(Spacer(1, 0.3*cm))
+            
+            obs_style = ParagraphStyle('Observations', parent=styles['Normal'],
+                                      fontSize=10, leading=16, spaceBefore=6, spaceAfter=6,
+                                      leftIndent=18, rightIndent=18, borderPadding=15,
+                                      backColor=colors.Color(1, 0.97, 0.90),
+                                      borderColor=accent_orange, borderWidth=1.5, borderRadius=6,
+                                      textColor=colors.Color(0.38, 0.20, 0.05))
+            
+            story.append(Paragraph(observations_text.replace('\n', '<br/>'), obs_style))
+            
+            # Photos de la section observations (section_id = 'observations')
+            if obs_photos:
+                story.append(Spacer(1, 0.6*cm))
+                added, photo_counter_global = add_section_photos_grid('Observations', obs_photos, photo_counter_global)
+            
+            story.append(Spacer(1, 0.8*cm))
+        
+        # Afficher les sections personnalisées (custom)
+        if custom_sections_data:
+            logging.info(f"🎨 [PDF] Ajout de {len(custom_sections_data)} section(s) personnalisée(s)")
+            for custom_section in custom_sections_data:
+                section_id = custom_section.get('id', '')
+                section_title = custom_section.get('title', 'Section personnalisée')
+                section_value = custom_section.get('value', '')
+                
+                if section_value or section_id in photos_by_section_id:
+                    custom_photos = photos_by_section_id.get(section_id, [])
+                    
+                    # Toujours PageBreak pour garder titre, contenu et photos ensemble
+                    story.append(PageBreak())
+                    story.append(add_decorative_line(colors.Color(0.95, 0.90, 1)))
+                    story.append(Spacer(1, 0.4*cm))
+                    
+                    story.append(Paragraph(f"✨ {section_title.upper()}", heading_style))
+                    story.append(Spacer(1, 0.3*cm))
+                    
+                    # Contenu texte de la section custom
+                    if section_value:
+                        custom_style = ParagraphStyle('CustomSection', parent=styles['Normal'],
+                                                     fontSize=10, leading=16, spaceBefore=6, spaceAfter=6,
+                                                     leftIndent=18, rightIndent=18, borderPadding=15,
+                                                     backColor=colors.Color(0.98, 0.98, 1),
+                                                     borderColor=light_indigo, borderWidth=1.5, borderRadius=6,
+                                                     textColor=soft_gray)
+                        story.append(Paragraph(section_value.replace('\n', '<br/>'), custom_style))
+                    
+                    # Photos de cette section custom
+                    if custom_photos:
+                        story.append(Spacer(1, 0.6*cm))
+                        added, photo_counter_global = add_section_photos_grid(section_title, custom_photos, photo_counter_global)
+                    
+                    story.append(Spacer(1, 0.8*cm))
+        
+        # ===== SECTIONS SUPPLÉMENTAIRES: Sections personnalisées avec photos =====
+        # Définir les titres des sections standards
+        section_titles = {
+            'general_info': 'Informations Générales',
+            'description': 'Description de la Recherche',
+            'observations': 'Observations et Remarques',
+            'localisation': 'Localisation',
+            'equipements': 'Équipements',
+            'conditions_meteo': 'Conditions Météo',
+            'acces_difficultes': 'Accès et Difficultés',
+            'environnement': 'Environnement',
+            'securite': 'Sécurité',
+            'resultats': 'Résultats',
+            'conclusions': 'Conclusions',
+        }
+        
+        # Sections déjà affichées (sections de base + sections custom)
+        processed_sections = {'general_info', 'description', 'observations'}
+        
+        # Ajouter les IDs des sections custom aux sections déjà traitées
+        if custom_sections_data:
+            for cs in custom_sections_data:
+                if cs.get('id'):
+                    processed_sections.add(cs['id'])
+        
+        # Autres sections avec photos (sections standards restantes uniquement)
+        remaining_sections = {k: v for k, v in photos_by_section_id.items() if k not in processed_sections}
+        
+        if remaining_sections:
+            for section_id, section_photos in remaining_sections.items():
+                # Toujours PageBreak pour garder titre et photos ensemble
+                story.append(PageBreak())
+                story.append(add_decorative_line(colors.Color(0.90, 0.95, 1)))
+                story.append(Spacer(1, 0.4*cm))
+                
+                section_title = section_titles.get(section_id, section_id.replace('_', ' ').title())
+                story.append(Paragraph(f"📷 {section_title.upper()}", heading_style))
+                story.append(Spacer(1, 0.5*cm))
+                
+                # Ajouter les photos de cette section
+                added, photo_counter_global = add_section_photos_grid(section_title, section_photos, photo_counter_global)
+        
+        logging.info(f"✅ [PDF] Total photos ajoutées: {photo_counter_global}/{len(photos) if photos else 0}")
+
+
+        # ==================== SECTION SIGNATURES ====================
+        story.append(PageBreak())
+        story.append(add_decorative_line(colors.Color(1, 0.84, 0.0)))
+        story.append(Spacer(1, 0.4*cm))
+        story.append(Paragraph("✍️ SIGNATURES ET VALIDATION", heading_style))
+        story.append(Spacer(1, 0.8*cm))
+        
+        sig_text_style = ParagraphStyle('SigText', parent=styles['Normal'],
+                                       fontSize=10, textColor=soft_gray, fontName='Helvetica')
+        
+        # Tableau signatures
+        sig_data = [
+            [Paragraph("<b>Technicien</b>", sig_text_style), Paragraph("<b>Client</b>", sig_text_style)],
+            ['', ''],
+            ['', ''],
+            ['', ''],
+            [Paragraph("Nom: ___________________", sig_text_style), Paragraph("Nom: ___________________", sig_text_style)],
+            [Paragraph("Date: ___________________", sig_text_style), Paragraph("Date: ___________________", sig_text_style)],
+            [Paragraph("Signature:", sig_text_style), Paragraph("Signature:", sig_text_style)],
+        ]
+        
+        sig_table = Table(sig_data, colWidths=[8*cm, 8*cm], rowHeights=[0.7*cm, 3*cm, 0.1*cm, 0.1*cm, 0.7*cm, 0.7*cm, 0.7*cm])
+        sig_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.96, 0.97, 0.99)),
+            ('TEXTCOLOR', (0, 0), (-1, 0), dark_indigo),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('BOX', (0, 0), (-1, -1), 1, colors.Color(0.8, 0.8, 0.8)),
+            ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.Color(0.9, 0.9, 0.9)),
+            ('BOTTOMPADDING', (0, 1), (-1, 1), 30),
+            ('BOX', (0, 1), (-1, 1), 1.5, colors.Color(0.7, 0.7, 0.7)),
+        ]))
+        story.append(sig_table)
+        
+        story.append(Spacer(1, 1.5*cm))
+        
+        # Note finale
+        final_note_style = ParagraphStyle('FinalNote', parent=styles['Normal'],
+                                         fontSize=8, textColor=colors.Color(0.5, 0.5, 0.5),
+                                         alignment=TA_CENTER, fontName='Helvetica-Oblique',
+                                         leading=12)
+        
+        story.append(Paragraph(
+            "Ce rapport a été généré automatiquement par SkyApp.<br/>"
+            "Pour toute question ou réclamation, veuillez contacter le service client.",
+            final_note_style
+        ))
+        
+        logging.info(f"📝 [PDF] Construction document ({len(story)} éléments)...")
+        doc.build(story, onFirstPage=add_page_number, onLaterPages=add_page_number)
+        logging.info(f"✅ [PDF] Document construit")
+        
+        buffer.seek(0)
+        
+        # Nettoyer fichiers temporaires
+        try:
+            temp_files = list((ROOT_DIR / "uploads").glob(f"temp_{search_id}_*.jpg"))
+            if temp_files:
+                for f in temp_files:
+                    f.unlink()
+                logging.info(f"🧹 [PDF] {len(temp_files)} fichiers temporaires nettoyés")
+        except Exception as e:
+            logging.warning(f"⚠️ [PDF] Nettoyage: {e}")
+        
+        # Nom de fichier - nettoyer TOUS les caractères spéciaux
+        location = search.get('location', 'recherche')
+        # Supprimer retours à la ligne, tabs, etc
+        location = location.replace('\n', '').replace('\r', '').replace('\t', '')
+        # Remplacer espaces et slashes
+        location = location.replace(' ', '_').replace('/', '_').replace('\\', '_')
+        # Garder seulement les caractères alphanumériques et underscores
+        import re
+        location = re.sub(r'[^a-zA-Z0-9_-]', '', location)[:30]
+        
+        filename = f"rapport_{location}_{search_id[:8]}.pdf"
+        pdf_size = buffer.getbuffer().nbytes
+        logging.info(f"📤 [PDF] Envoi: {filename} ({pdf_size} bytes)")
+        
+        return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"❌❌❌ [PDF] CRASH FATAL: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur PDF: {str(e)}")
+
+# VERSION COMPLETE COMMENTEE TEMPORAIREMENT
+async def generate_search_pdf_full_disabled(search_id: str, user_data: dict):
+    """Version complète temporairement désactivée"""
+    import requests
+    
+    try:
+        company_id = await get_user_company(user_data)
+        response = supabase_service.table("searches").select("*").eq("id", search_id).execute()
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Recherche introuvable")
+        search = response.data[0]
+        if company_id and search.get("company_id") != company_id:
+            raise HTTPException(status_code=403, detail="Accès refusé")
+        company_settings = {}
+        try:
+            if company_id:
+                settings_resp = supabase_service.table("company_settings").select("*").eq("company_id", company_id).execute()
+                if settings_resp.data:
+                    company_settings = settings_resp.data[0]
+        except:
+            pass
+        
+        primary_color = colors.HexColor("#6366f1")
+        secondary_color = colors.HexColor("#333333")
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
+        story = []
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=22, textColor=primary_color, alignment=TA_CENTER, spaceAfter=20)
+        heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, textColor=primary_color, spaceAfter=10, spaceBefore=15)
+        normal_bold = ParagraphStyle('NormalBold', parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=10)
+        
+        # ===== EN-TÊTE AVEC LOGO ET INFORMATIONS SOCIÉTÉ =====
+        header_data = []
+        
+        if company_settings and company_settings.get("logo_url"):
+            # LOGO DÉSACTIVÉ pour test
+            pass
+        
+        return StreamingResponse(
+            buffer,
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f"attachment; filename={filename}"
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Erreur génération PDF: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Erreur génération PDF: {str(e)}")
+
+
+async def generate_quote_pdf(
+    quote_id: str,
+    user_data: dict
+):
+    """Générer un PDF professionnel pour un devis"""
+    try:
+        company_id = await get_user_company(user_data)
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+        
+        # Récupérer le devis
+        response = supabase_service.table("quotes").select("*").eq("id", quote_id).eq("company_id", company_id).execute()
+        
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Devis introuvable")
+        
+        quote = response.data[0]
+        
+        # Log pour déboguer
+        logging.info(f"📄 Génération PDF pour devis: {quote.get('quote_number', quote_id)}")
+        logging.info(f"Client ID: {quote.get('client_id')}")
+        
+        # Vérifier et normaliser items
+        items = quote.get('items', [])
+        if items is None:
+            items = []
+        if not isinstance(items, list):
+            logging.warning(f"⚠️ Items n'est pas une liste: {type(items)}")
+            items = []
+        
+        logging.info(f"Items: {len(items)} articles")
+        
+        # Log des photos dans les items
+        for idx, item in enumerate(items):
+            has_photo = 'photo' in item and item['photo'] is not None
+            logging.info(f"  Article {idx+1}: {item.get('name', 'Sans nom')} - Photo: {'✓' if has_photo else '✗'}")
+        
+        # Récupérer les informations de l'entreprise depuis company_settings
+        company_info = {}
+        company_response = supabase_service.table("company_settings").select("*").eq("company_id", company_id).execute()
+        if company_response.data:
+            company_info = company_response.data[0]
+            logging.info(f"Entreprise: {company_info.get('company_name', 'N/A')}")
+            logging.info(f"Données entreprise: {company_info.keys()}")
+        
+        # Créer le PDF
+        buffer = io.BytesIO()
+        
+        def add_page_number(canvas_obj, doc_obj):
+            """Ajoute le pied de page avec infos société sur chaque page"""
+            canvas_obj.saveState()
+            page_width = A4[0]
+            left_margin = 1.5*cm
+            right_edge = page_width - 1.5*cm
+            usable_width = right_edge - left_margin
+            mid_x = page_width / 2
+            
+            # ==== ZONE SIGNATURES ====
+            # Labels signatures (fond gris clair)
+            canvas_obj.setFillColor(colors.HexColor('#f0f0f0'))
+            canvas_obj.rect(left_margin, 4.8*cm, usable_width/2 - 0.2*cm, 0.9*cm, fill=1, stroke=0)
+            canvas_obj.rect(mid_x + 0.1*cm, 4.8*cm, usable_width/2 - 0.2*cm, 0.9*cm, fill=1, stroke=0)
+            
+            # Texte signatures
+            canvas_obj.setFillColor(colors.black)
+            canvas_obj.setFont('Helvetica-Bold', 8)
+            canvas_obj.drawCentredString(left_margin + usable_width/4, 5.35*cm, "Bon pour accord")
+            canvas_obj.setFont('Helvetica', 6)
+            canvas_obj.drawCentredString(left_margin + usable_width/4, 5.05*cm, "(Date, Cachet, Signature)")
+            canvas_obj.setFont('Helvetica-Bold', 8)
+            canvas_obj.drawCentredString(mid_x + usable_width/4, 5.35*cm, "Signature chargé d'affaire")
+            
+            # ==== LIGNE DE SÉPARATION FOOTER ====
+            canvas_obj.setStrokeColor(colors.black)
+            canvas_obj.setLineWidth(1.2)
+            canvas_obj.line(left_margin, 2.2*cm, right_edge, 2.2*cm)
+            
+            # Nom de l'entreprise
+            canvas_obj.setFont('Helvetica-Bold', 7)
+            canvas_obj.setFillColor(colors.black)
+            company_name = company_info.get('company_name', '')
+            if company_name:
+                canvas_obj.drawCentredString(mid_x, 1.85*cm, company_name)
+            
+            # Infos contact (adresse, tél, email)
+            canvas_obj.setFont('Helvetica', 6)
+            canvas_obj.setFillColor(colors.HexColor('#444444'))
+            contact_parts = []
+            if company_info.get('address'):
+                contact_parts.append(company_info['address'])
+            if company_info.get('phone'):
+                contact_parts.append(f"Tél : {company_info['phone']}")
+            if company_info.get('email'):
+                contact_parts.append(company_info['email'])
+            if contact_parts:
+                canvas_obj.drawCentredString(mid_x, 1.5*cm, " - ".join(contact_parts))
+            
+            # Infos légales (forme juridique, SIRET, RCS, TVA)
+            legal_parts = []
+            if company_info.get('legal_form'):
+                legal_parts.append(company_info['legal_form'])
+            if company_info.get('siret'):
+                legal_parts.append(f"Siret : {company_info['siret']}")
+            if company_info.get('rcs_rm'):
+                legal_parts.append(company_info['rcs_rm'])
+            if company_info.get('tva_number'):
+                legal_parts.append(f"N° TVA : {company_info['tva_number']}")
+            if legal_parts:
+                canvas_obj.drawCentredString(mid_x, 1.15*cm, " - ".join(legal_parts))
+            
+            # Numéro de page + date d'émission
+            canvas_obj.setFont('Helvetica', 5.5)
+            canvas_obj.setFillColor(colors.HexColor('#888888'))
+            canvas_obj.drawCentredString(mid_x, 0.7*cm, 
+                f"Page {doc_obj.page} - Document émis le {datetime.now().strftime('%d/%m/%Y à %H:%M')}")
+            
+            canvas_obj.restoreState()
+        
+        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*cm, bottomMargin=5.5*cm, 
+                               leftMargin=1.5*cm, rightMargin=1.5*cm)
+        
+        story = []
+        styles = getSampleStyleSheet()
+        
+        # Styles personnalisés noir et blanc
+        primary_color = colors.black
+        accent_color = colors.black
+        dark_gray = colors.HexColor('#333333')
+        medium_gray = colors.HexColor('#666666')
+        
+        normal_style = ParagraphStyle('CustomNormal', parent=styles['Normal'],
+                                     fontSize=9, textColor=dark_gray)
+        
+        bold_style = ParagraphStyle('Bold', parent=styles['Normal'],
+                                   fontSize=9, textColor=colors.black, fontName='Helvetica-Bold')
+        
+        small_style = ParagraphStyle('Small', parent=styles['Normal'],
+                                    fontSize=8, textColor=dark_gray)
+        
+        # ==== EN-TÊTE STYLE PROFESSIONNEL ====
+        # Logo + Infos entreprise à gauche | Lieu/Date + Numéro devis à droite
+        
+        # Colonne gauche : Logo et infos entreprise
+        left_content = []
+        
+        # Logo si disponible
+        logo_loaded = False
+        if company_info.get('logo_url'):
+            try:
+                logo_path = company_info['logo_url']
+                # Si le chemin est relatif, utiliser le chemin local
+                if logo_path.startswith('/uploads/'):
+                    logo_path = str(ROOT_DIR / logo_path.lstrip('/'))
+                elif not logo_path.startswith('http'):
+                    # Chemin absolu local
+                    logo_path = str(ROOT_DIR / logo_path.lstrip('/'))
+                
+                # Vérifier que le fichier existe avant de créer l'image
+                from pathlib import Path
+                if Path(logo_path).exists():
+                    logo_img = ReportLabImage(logo_path, width=3*cm, height=3*cm, kind='proportional')
+                    left_content.append(logo_img)
+                    left_content.append(Spacer(1, 0.2*cm))
+                    logo_loaded = True
+                    logging.info(f"✅ Logo chargé: {logo_path}")
+                else:
+                    # Si le logo spécifié n'existe pas, chercher le plus récent dans le dossier
+                    logos_dir = ROOT_DIR / 'uploads' / 'logos'
+                    if logos_dir.exists():
+                        logo_files = sorted(logos_dir.glob(f"company_logo_{company_id}_*.png"), 
+                                          key=lambda x: x.stat().st_mtime, reverse=True)
+                        if logo_files:
+                            logo_img = ReportLabImage(str(logo_files[0]), width=3*cm, height=3*cm, kind='proportional')
+                            left_content.append(logo_img)
+                            left_content.append(Spacer(1, 0.2*cm))
+                            logo_loaded = True
+                            logging.info(f"✅ Logo le plus récent chargé: {logo_files[0]}")
+                        else:
+                            logging.warning(f"⚠️ Aucun logo trouvé pour l'entreprise {company_id}")
+                    else:
+                        logging.warning(f"⚠️ Logo introuvable: {logo_path}")
+            except Exception as e:
+                logging.error(f"Erreur chargement logo: {e}")
+                pass
+        
+        # Infos entreprise sous le logo
+        company_lines = []
+        if company_info.get('company_name'):
+            company_lines.append(f"<b><font size=12>{company_info['company_name']}</font></b>")
+        if company_info.get('legal_form'):
+            company_lines.append(f"<font color='#666666'>{company_info['legal_form']}</font>")
+        if company_info.get('address'):
+            company_lines.append(company_info['address'])
+        if company_info.get('postal_code') or company_info.get('city'):
+            postal = company_info.get('postal_code', '')
+            city = company_info.get('city', '')
+            company_lines.append(f"{postal} {city}".strip())
+        if company_info.get('phone'):
+            company_lines.append(f"<b>Tél : {company_info['phone']}</b>")
+        if company_info.get('email'):
+            company_lines.append(company_info['email'])
+        
+        if company_lines:
+            left_content.append(Paragraph("<br/>".join(company_lines), small_style))
+        
+        # Colonne droite : Lieu, Date et Numéro de devis
+        right_content = []
+        
+        # Ville et date
+        city_name = company_info.get('city', 'Paris').upper()
+        date_str = datetime.now().strftime('%d/%m/%Y')
+        right_content.append(Paragraph(f"<b>{city_name}, le {date_str}</b>", bold_style))
+        right_content.append(Spacer(1, 0.2*cm))
+        
+        # Numéro de devis
+        devis_num = Paragraph(f"<b><font size=14>Devis N° {quote.get('quote_number', 'N/A')}</font></b>", 
+                             ParagraphStyle('DevisNum', fontSize=14, fontName='Helvetica-Bold', alignment=TA_LEFT))
+        right_content.append(devis_num)
+        right_content.append(Spacer(1, 0.3*cm))
+        
+        # Section CLIENT - badge compact
+        client_badge = Table([[Paragraph("<b>CLIENT</b>", ParagraphStyle('CB', fontSize=9, textColor=colors.white, fontName='Helvetica-Bold'))]], 
+                            colWidths=[2.5*cm])
+        client_badge.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.black),
+            ('TOPPADDING', (0, 0), (-1, -1), 3),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ]))
+        right_content.append(client_badge)
+        right_content.append(Spacer(1, 0.15*cm))
+        
+        # Récupérer les infos du client
+        client_lines = []
+        if quote.get('client_id'):
+            try:
+                client_response = supabase_service.table("clients").select("*").eq("id", quote['client_id']).execute()
+                if client_response.data:
+                    client_info = client_response.data[0]
+                    
+                    # Nom complet
+                    if client_info.get('societe'):
+                        client_lines.append(f"<b>{client_info['societe']}</b>")
+                    
+                    full_name = []
+                    if client_info.get('prenom'):
+                        full_name.append(client_info['prenom'])
+                    if client_info.get('nom'):
+                        full_name.append(client_info['nom'])
+                    if full_name:
+                        client_lines.append(" ".join(full_name))
+                    
+                    # Adresse
+                    if client_info.get('adresse'):
+                        client_lines.append(client_info['adresse'])
+                    
+                    # Téléphone
+                    if client_info.get('telephone'):
+                        client_lines.append(f"Tél : {client_info['telephone']}")
+            except Exception as e:
+                logging.error(f"Erreur récupération client: {e}")
+        
+        if not client_lines and quote.get('client_name'):
+            client_lines.append(quote['client_name'])
+        
+        if client_lines:
+            right_content.append(Paragraph("<br/>".join(client_lines), small_style))
+        
+        # Créer le tableau header avec 2 colonnes
+        header_table = Table([[left_content, right_content]], colWidths=[9*cm, 9*cm])
+        header_table.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+            ('ALIGN', (1, 0), (1, 0), 'LEFT'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 0),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+        ]))
+        
+        story.append(header_table)
+        story.append(Spacer(1, 0.3*cm))
+        
+        # ==== LIGNE DE SÉPARATION ====
+        line_table = Table([['']], colWidths=[18*cm])
+        line_table.setStyle(TableStyle([
+            ('LINEABOVE', (0, 0), (-1, 0), 2, colors.black),
+        ]))
+        story.append(line_table)
+        story.append(Spacer(1, 0.2*cm))
+        
+        # ==== AFFAIRE SUIVIE PAR ====
+        if company_info.get('contact_name') or company_info.get('contact_phone'):
+            affaire_text = "<b>Affaire suivie par :</b> "
+            if company_info.get('contact_name'):
+                affaire_text += f"{company_info['contact_name']}"
+            if company_info.get('contact_phone'):
+                affaire_text += f" - Tél : {company_info['contact_phone']}"
+            story.append(Paragraph(affaire_text, normal_style))
+            story.append(Spacer(1, 0.15*cm))
+        
+        # ==== ADRESSE DES TRAVAUX - badge compact ====
+        if quote.get('worksite_address'):
+            addr_badge = Table([[Paragraph("<b>ADRESSE DES TRAVAUX</b>", ParagraphStyle('AB', fontSize=8, textColor=colors.white, fontName='Helvetica-Bold'))]], 
+                              colWidths=[5*cm])
+            addr_badge.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, -1), colors.black),
+                ('TOPPADDING', (0, 0), (-1, -1), 3),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+                ('LEFTPADDING', (0, 0), (-1, -1), 6),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ]))
+            story.append(addr_badge)
+            story.append(Spacer(1, 0.1*cm))
+            story.append(Paragraph(quote['worksite_address'], normal_style))
+            story.append(Spacer(1, 0.2*cm))
+        
+        # ==== OBJET DES TRAVAUX - badge compact ====
+        if quote.get('title') or quote.get('description'):
+            obj_badge = Table([[Paragraph("<b>OBJET DES TRAVAUX</b>", ParagraphStyle('OB', fontSize=8, textColor=colors.white, fontName='Helvetica-Bold'))]], 
+                             colWidths=[5*cm])
+            obj_badge.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, -1), colors.black),
+                ('TOPPADDING', (0, 0), (-1, -1), 3),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+                ('LEFTPADDING', (0, 0), (-1, -1), 6),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ]))
+            story.append(obj_badge)
+            story.append(Spacer(1, 0.1*cm))
+            if quote.get('title'):
+                title_style = ParagraphStyle('WorkTitle', fontSize=9, textColor=colors.black, fontName='Helvetica-Bold')
+                story.append(Paragraph(quote['title'], title_style))
+            if quote.get('description'):
+                story.append(Paragraph(quote['description'], normal_style))
+            story.append(Spacer(1, 0.25*cm))
+        
+        # Items déjà normalisé au début de la fonction
+        if items:
+            total_ht = 0
+            total_tva = 0
+            
+            # En-tête du tableau principal avec couleurs professionnelles
+            header_style = ParagraphStyle('TableHeader', fontSize=9, textColor=colors.white, fontName='Helvetica-Bold', alignment=TA_CENTER)
+            table_data = [
+                [
+                    Paragraph("<b>N°</b>", header_style),
+                    Paragraph("<b>Désignation</b>", header_style),
+                    Paragraph("<b>Unité</b>", header_style),
+                    Paragraph("<b>Quantité</b>", header_style),
+                    Paragraph("<b>Prix HT</b>", header_style),
+                    Paragraph("<b>TVA</b>", header_style),
+                    Paragraph("<b>Total HT</b>", header_style)
+                ]
+            ]
+            
+            for item_idx, item in enumerate(items, 1):
+                qty = float(item.get('quantity', 0))
+                price = float(item.get('price', 0))
+                tva_rate = float(item.get('tva_rate', 20))
+                
+                item_total = qty * price
+                item_tva = item_total * (tva_rate / 100)
+                
+                total_ht += item_total
+                total_tva += item_tva
+                
+                # Description complète avec nom + description
+                desc_text = ""
+                if item.get('name'):
+                    desc_text = f"<b>{item['name']}</b>"
+                if item.get('description'):
+                    if desc_text:
+                        desc_text += f"<br/>{item['description']}"
+                    else:
+                        desc_text = item['description']
+                
+                # Ligne de l'article
+                table_data.append([
+                    Paragraph(str(item_idx), normal_style),
+                    Paragraph(desc_text, small_style),
+                    Paragraph(item.get('unit', 'Ens'), normal_style),
+                    Paragraph(f"{qty:.2f}", normal_style),
+                    Paragraph(f"{price:.2f} €", normal_style),
+                    Paragraph(f"{tva_rate:.0f}%", normal_style),
+                    Paragraph(f"{item_total:.2f} €", normal_style)
+                ])
+                
+                # Si l'article a une photo, l'ajouter sur la ligne suivante
+                if item.get('photo'):
+                    try:
+                        photo_data = item['photo'].get('data', '')
+                        if photo_data and ',' in photo_data:
+                            base64_str = photo_data.split(',')[1]
+                            img_data = base64.b64decode(base64_str)
+                            img_buffer = io.BytesIO(img_data)
+                            
+                            # Image plus petite pour s'intégrer dans le tableau
+                            img = ReportLabImage(img_buffer, width=6*cm, height=4.5*cm, kind='proportional')
+                            
+                            # Ligne pour la photo (span sur toutes les colonnes sauf la première)
+                            table_data.append([
+                                '',
+                                img,
+                                '',
+                                '',
+                                '',
+                                '',
+                                ''
+                            ])
+                    except Exception as e:
+                        logging.error(f"Erreur ajout photo dans tableau: {e}")
+            
+            # Créer le tableau avec les nouvelles largeurs et style professionnel
+            main_table = Table(table_data, colWidths=[1*cm, 7*cm, 1.5*cm, 1.5*cm, 2*cm, 1.5*cm, 2.5*cm])
+            main_table.setStyle(TableStyle([
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
+                ('LINEBELOW', (0, 0), (-1, 0), 2, colors.black),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.black),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+                ('ALIGN', (2, 0), (6, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 8),
+                ('TOPPADDING', (0, 0), (-1, -1), 4),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+                ('LEFTPADDING', (0, 0), (-1, -1), 3),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 3),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
+            ]))
+            
+            story.append(main_table)
+            story.append(Spacer(1, 0.3*cm))
+            
+            # ==== TOTAUX À DROITE AVEC ENCADRÉ ====
+            total_ttc = total_ht + total_tva
+            
+            # Calculer le pourcentage de TVA (éviter division par zéro)
+            tva_percentage = (total_tva/total_ht*100) if total_ht > 0 else 0
+            
+            # Créer un tableau pour les montants (compact)
+            totals_header_style = ParagraphStyle('TotalsHeader', fontSize=8, textColor=colors.white, 
+                                                 fontName='Helvetica-Bold', alignment=TA_CENTER)
+            totals_left_style = ParagraphStyle('TotalsLeft', fontSize=9, leading=13, 
+                                              fontName='Helvetica', textColor=dark_gray)
+            totals_right_style = ParagraphStyle('TotalsRight', fontSize=9, leading=13, 
+                                               fontName='Helvetica', alignment=TA_RIGHT, textColor=dark_gray)
+            totals_ttc_style = ParagraphStyle('TotalsTTC', fontSize=11, leading=13, 
+                                             fontName='Helvetica-Bold', alignment=TA_RIGHT, textColor=colors.black)
+            
+            totals_data = [
+                [Paragraph("MONTANTS EN EUROS", totals_header_style)],
+                [Paragraph(f"Total H.T.<br/>Total T.V.A. {tva_percentage:.0f}%", totals_left_style)],
+                [Paragraph(f"<b>TOTAL T.T.C.</b>", ParagraphStyle('TTCLabel', fontSize=11, fontName='Helvetica-Bold', textColor=colors.black))],
+            ]
+            
+            amounts_data = [
+                [''],
+                [Paragraph(f"{total_ht:.2f} €<br/>{total_tva:.2f} €", totals_right_style)],
+                [Paragraph(f"<b>{total_ttc:.2f} €</b>", totals_ttc_style)],
+            ]
+            
+            # Tableau de gauche (labels)
+            totals_left = Table(totals_data, colWidths=[6*cm])
+            totals_left.setStyle(TableStyle([
+                ('BOX', (0, 0), (-1, -1), 1.5, colors.black),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.black),
+                ('BACKGROUND', (0, 2), (-1, 2), colors.HexColor('#eeeeee')),  # Fond jaune clair pour TTC
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('TOPPADDING', (0, 0), (-1, 0), 4),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
+                ('TOPPADDING', (0, 1), (-1, -1), 5),
+                ('BOTTOMPADDING', (0, 1), (-1, -1), 5),
+                ('LEFTPADDING', (0, 0), (-1, -1), 8),
+            ]))
+            
+            # Tableau de droite (montants)
+            totals_right = Table(amounts_data, colWidths=[5*cm])
+            totals_right.setStyle(TableStyle([
+                ('BOX', (0, 0), (-1, -1), 1.5, colors.black),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.black),
+                ('BACKGROUND', (0, 2), (-1, 2), colors.HexColor('#eeeeee')),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+                ('TOPPADDING', (0, 0), (-1, 0), 4),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
+                ('TOPPADDING', (0, 1), (-1, -1), 5),
+                ('BOTTOMPADDING', (0, 1), (-1, -1), 5),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+            ]))
+            
+            # Assembler les deux tableaux côte à côte, alignés à droite
+            combined_totals = Table([[' ', totals_left, totals_right]], colWidths=[6*cm, 6*cm, 5*cm])
+            combined_totals.setStyle(TableStyle([
+                ('ALIGN', (1, 0), (-1, 0), 'RIGHT'),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ]))
+            
+            story.append(combined_totals)
+        
+        story.append(Spacer(1, 0.3*cm))
+        
+        # ==== MODALITÉS DE RÈGLEMENT (compact) ====
+        modalities_text = []
+        modalities_text.append("<b>MODALITÉS DE RÈGLEMENT</b>")
+        modalities_text.append("TVA AUTOLIQUIDATION : Article 283-2 du CGI | <b>Devis valable 30 JOURS</b> | Escompte anticipé : 0%")
+        
+        modalities_style = ParagraphStyle('Modalities', fontSize=7, textColor=dark_gray, leading=10)
+        modalities_para = Paragraph("<br/>".join(modalities_text), modalities_style)
+        story.append(modalities_para)
+        
+        # Construire le PDF (signatures + pied de page dessinés par add_page_number)
+        doc.build(story, onFirstPage=add_page_number, onLaterPages=add_page_number)
+        
+        buffer.seek(0)
+        
+        return StreamingResponse(
+            io.BytesIO(buffer.getvalue()),
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f"attachment; filename=Devis_{quote.get('quote_number', quote_id)}.pdf"
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        error_detail = traceback.format_exc()
+        logging.error(f"Erreur génération PDF devis: {e}")
+        logging.error(f"Traceback complet:\n{error_detail}")
+        raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du PDF: {str(e)}")
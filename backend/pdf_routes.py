@@ -0,0 +1,39 @@
+"""
+PDF Routes - Téléchargement des PDF recherches terrain et devis
+
+Les endpoints délèguent à pdf_reports, importé au premier PDF demandé :
+ReportLab n'est pas chargé au démarrage du serveur.
+"""
+
+from fastapi import APIRouter, Depends
+
+from server_supabase import get_user_from_token
+
+router = APIRouter()
+
+
+@router.get("/searches/{search_id}/pdf")
+async def generate_search_pdf(
+    search_id: str,
+    user_data: dict = Depends(get_user_from_token)
+):
+    """Générer un PDF professionnel pour une recherche terrain"""
+    import pdf_reports
+    return await pdf_reports.generate_search_pdf(search_id, user_data)
+
+
+@router.get("/searches/{search_id}/pdf-FULL-DISABLED")
+async def generate_search_pdf_full_disabled(search_id: str, user_data: dict = Depends(get_user_from_token)):
+    """Version complète temporairement désactivée"""
+    import pdf_reports
+    return await pdf_reports.generate_search_pdf_full_disabled(search_id, user_data)
+
+
+@router.get("/quotes/{quote_id}/pdf")
+async def generate_quote_pdf(
+    quote_id: str,
+    user_data: dict = Depends(get_user_from_token)
+):
+    """Générer un PDF professionnel pour un devis"""
+    import pdf_reports
+    return await pdf_reports.generate_quote_pdf(quote_id, user_data)
@@ -0,0 +1,305 @@
+"""
+Planning Events - Diffusion en temps réel des changements de planning
+
+Les endpoints de plannings et de chantiers publient un événement court
+(type, identifiants) ; les écrans Planning et « Mes missions » le reçoivent
+par un flux SSE (/api/planning/events) et ne rechargent que ce qui a changé
+au lieu d'interroger /schedules en boucle.
+
+- PlanningEventBroker : abonnements en mémoire par entreprise, ou par
+  technicien (seuls les plannings qui le concernent + les chantiers), file
+  bornée par abonné ; un abonné trop lent reçoit « resync » (tout recharger)
+- publish() est non bloquant et appelable depuis un thread (asyncio.to_thread)
+- derniers événements gardés en mémoire : reprise après reconnexion
+  (Last-Event-ID), « resync » si l'événement n'y est plus
+- backend interchangeable pour la livraison :
+  * LocalBackend (défaut) : un seul processus ; avec plusieurs workers
+    uvicorn, un événement publié par un worker n'atteint pas les abonnés
+    des autres (développement, ou déploiement à un seul worker)
+  * RedisBackend (PLANNING_EVENTS_REDIS_URL, paquet redis) : pub/sub
+    partagé entre les workers uvicorn (déploiement Render, render.yaml)
+- StreamTickets : EventSource ne permet pas d'en-tête Authorization ; le
+  client échange son JWT contre un ticket signé de courte durée passé en
+  ?ticket=, pour que le JWT n'apparaisse jamais dans une URL (logs d'accès)
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set
+
+import jwt
+
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    aioredis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CREATED = "schedule.created"
+SCHEDULE_UPDATED = "schedule.updated"
+SCHEDULE_DELETED = "schedule.deleted"
+WORKSITE_CREATED = "worksite.created"
+WORKSITE_UPDATED = "worksite.updated"
+WORKSITE_DELETED = "worksite.deleted"
+RESYNC = "resync"
+
+REDIS_CHANNEL = "skyapp:planning-events"
+TICKET_AUDIENCE = "planning-events"
+
+
+class LocalBackend:
+    """Livraison directe aux abonnés du processus"""
+
+    def __init__(self):
+        self._deliver: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    async def start(self, deliver: Callable[[Dict[str, Any]], None]):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    def publish(self, event: Dict[str, Any]):
+        if self._deliver is not None:
+            self._deliver(event)
+
+
+class RedisBackend:
+    """Pub/sub Redis : chaque worker publie sur le canal et livre ce qu'il y lit"""
+
+    def __init__(self, url: str, channel: str = REDIS_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Callable[[Dict[str, Any]], None]):
+        self._client = aioredis.from_url(self.url)
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(self.channel)
+        self._task = asyncio.create_task(self._listen(pubsub, deliver), name="planning-events-redis")
+
+    async def _listen(self, pubsub, deliver):
+        async for message in pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            try:
+                deliver(json.loads(message["data"]))
+            except Exception as e:
+                logger.warning(f"⚠️ Événement planning illisible: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def publish(self, event: Dict[str, Any]):
+        if self._client is None:
+            return
+        task = asyncio.ensure_future(self._client.publish(self.channel, json.dumps(event, default=str)))
+        task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"⚠️ Publication Redis échouée: {task.exception()}")
+
+
+class Subscription:
+    """Abonnement SSE : file bornée des événements de sa portée"""
+
+    def __init__(self, broker: "PlanningEventBroker", company_id: str, technician_id: Optional[str], max_queue: int):
+        self.broker = broker
+        self.company_id = company_id
+        self.technician_id = technician_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if event.get("company_id") != self.company_id:
+            return False
+        if self.technician_id is None or not event["type"].startswith("schedule."):
+            return True
+        return self.technician_id in (event.get("technician_ids") or [])
+
+    def offer(self, event: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Abonné trop lent : on vide sa file, il rechargera tout
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.broker.resync_event(self.company_id))
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Prochain événement, None après `timeout` secondes (battement de cœur)"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class PlanningEventBroker:
+    """Publication des événements de planning et répartition entre abonnés"""
+
+    def __init__(self, backend=None, max_queue: int = 200, history_size: int = 1000):
+        self.backend = backend or LocalBackend()
+        self.max_queue = max_queue
+        self._subscribers: Set[Subscription] = set()
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats = {"published": 0, "delivered": 0}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def start(self):
+        """Démarre le backend sur la boucle courante (lifespan, ou premier abonnement)"""
+        if self._loop is not None and not self._loop.is_closed():
+            return
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self.backend.start(self._dispatch)
+        except Exception as e:
+            logger.error(f"❌ Backend événements planning indisponible, repli local: {e}")
+            self.backend = LocalBackend()
+            await self.backend.start(self._dispatch)
+
+    async def stop(self):
+        await self.backend.stop()
+        self._loop = None
+
+    def publish(self, event_type: str, company_id: Optional[str], *, schedule_id: Optional[str] = None,
+                worksite_id: Optional[str] = None, technician_ids: Iterable[Optional[str]] = ()) -> Optional[Dict[str, Any]]:
+        """Publie un événement (n'échoue jamais : le temps réel ne bloque pas l'écriture)"""
+        if not company_id:
+            return None
+        event = {
+            "id": uuid.uuid4().hex,
+            "type": event_type,
+            "company_id": str(company_id),
+            "schedule_id": schedule_id,
+            "worksite_id": worksite_id,
+            "technician_ids": sorted({str(t) for t in technician_ids if t}),
+            "at": time.time(),
+        }
+        self._stats["published"] += 1
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # Backend pas démarré : aucun abonné dans ce processus
+            return event
+        try:
+            loop.call_soon_threadsafe(self._publish_on_loop, event)
+        except RuntimeError as e:
+            logger.warning(f"⚠️ Événement planning non publié: {e}")
+        return event
+
+    def _publish_on_loop(self, event: Dict[str, Any]):
+        try:
+            self.backend.publish(event)
+        except Exception as e:
+            logger.warning(f"⚠️ Événement planning non publié: {e}")
+
+    def _dispatch(self, event: Dict[str, Any]):
+        self._history.append(event)
+        for subscription in list(self._subscribers):
+            if subscription.matches(event):
+                subscription.offer(event)
+                self._stats["delivered"] += 1
+
+    async def subscribe(self, company_id: str, technician_id: Optional[str] = None,
+                        last_event_id: Optional[str] = None) -> Subscription:
+        """
+        Abonnement à l'entreprise (technician_id None) ou aux plannings d'un technicien.
+        last_event_id : événements manqués depuis celui-ci rejoués, ou « resync » s'ils sont perdus.
+        """
+        await self.start()
+        subscription = Subscription(self, str(company_id), technician_id and str(technician_id), self.max_queue)
+        if last_event_id:
+            missed = self._since(last_event_id)
+            if missed is None:
+                subscription.offer(self.resync_event(subscription.company_id))
+            else:
+                for event in missed:
+                    if subscription.matches(event):
+                        subscription.offer(event)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def _since(self, event_id: str) -> Optional[List[Dict[str, Any]]]:
+        events = list(self._history)
+        for i in range(len(events) - 1, -1, -1):
+            if events[i]["id"] == event_id:
+                return events[i + 1:]
+        return None
+
+    @staticmethod
+    def resync_event(company_id: str) -> Dict[str, Any]:
+        return {"id": uuid.uuid4().hex, "type": RESYNC, "company_id": company_id, "at": time.time()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "subscribers": len(self._subscribers),
+                "backend": type(self.backend).__name__}
+
+
+class StreamTickets:
+    """
+    Tickets d'ouverture du flux SSE : JWT HS256 signé par le serveur, valable
+    `ttl` secondes, vérifiable par n'importe quel worker (clé partagée).
+    Vérifié seulement à l'ouverture : le client en redemande un à chaque
+    (re)connexion.
+    """
+
+    def __init__(self, secret: Optional[str], ttl: int = 60):
+        if not secret:
+            # Clé propre au processus : un ticket n'est accepté que par le worker qui l'a émis
+            logger.warning("⚠️ Aucune clé de ticket SSE (PLANNING_EVENTS_TICKET_SECRET) : clé aléatoire par processus")
+            secret = uuid.uuid4().hex
+        self._secret = secret
+        self.ttl = ttl
+
+    def issue(self, user_id: str, role: Optional[str], company_id: str) -> str:
+        now = int(time.time())
+        claims = {"sub": str(user_id), "role": role, "company_id": str(company_id),
+                  "aud": TICKET_AUDIENCE, "iat": now, "exp": now + self.ttl}
+        return jwt.encode(claims, self._secret, algorithm="HS256")
+
+    def verify(self, ticket: str) -> Optional[Dict[str, Any]]:
+        """Claims du ticket, None s'il est invalide ou expiré"""
+        try:
+            return jwt.decode(ticket, self._secret, algorithms=["HS256"], audience=TICKET_AUDIENCE)
+        except jwt.InvalidTokenError:
+            return None
+
+
+def backend_from_env():
+    """RedisBackend si PLANNING_EVENTS_REDIS_URL est défini (et redis installé), sinon LocalBackend"""
+    url = os.getenv("PLANNING_EVENTS_REDIS_URL")
+    if url and REDIS_AVAILABLE:
+        return RedisBackend(url)
+    if url:
+        logger.warning("⚠️ PLANNING_EVENTS_REDIS_URL défini mais paquet redis absent : événements limités au processus")
+    else:
+        logger.info("📡 Événements planning limités au processus (un seul worker, ou définir PLANNING_EVENTS_REDIS_URL)")
+    return LocalBackend()
+
+
+planning_events = PlanningEventBroker(backend_from_env())
+stream_tickets = StreamTickets(os.getenv("PLANNING_EVENTS_TICKET_SECRET") or os.getenv("SUPABASE_SERVICE_KEY"))
@@ -0,0 +1,255 @@
+"""
+Query Tracer - Requêtes PostgREST par requête HTTP, détection des N+1
+
+trace_client() enveloppe un client Supabase : chaque .table()/.rpc() ...
+.execute() est enregistré (table, opération, filtres, durée, lignes) dans la
+trace de la requête HTTP en cours (ContextVar, propagée à asyncio.to_thread
+et au threadpool des endpoints synchrones). Hors requête (tâches de fond),
+rien n'est enregistré.
+
+QueryTraceMiddleware ouvre une trace par requête, ajoute l'en-tête
+Server-Timing (db;dur=...;desc="N queries") et écrit une ligne de log JSON,
+en WARNING si la requête dépasse QUERY_TRACE_MAX_QUERIES requêtes ou répète
+la même forme de requête (même table, mêmes filtres, valeurs différentes)
+au moins QUERY_TRACE_REPEAT_THRESHOLD fois : signature d'un N+1.
+
+Les tests enveloppent leur faux client avec trace_client() et vérifient le
+nombre de requêtes via l'en-tête Server-Timing ou trace_queries().
+"""
+
+import os
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUERY_TRACE_ENABLED = os.getenv("QUERY_TRACE_ENABLED", "1") in ("1", "true", "True", "yes", "on")
+QUERY_TRACE_MAX_QUERIES = int(os.getenv("QUERY_TRACE_MAX_QUERIES", "25"))
+QUERY_TRACE_REPEAT_THRESHOLD = int(os.getenv("QUERY_TRACE_REPEAT_THRESHOLD", "5"))
+
+# Méthodes du builder qui changent l'opération (le reste = filtres / modificateurs)
+_OPERATIONS = {"select", "insert", "update", "upsert", "delete"}
+# Modificateurs sans colonne significative pour la forme
+_MODIFIERS = {"limit", "range", "single", "maybe_single", "order", "csv", "explain"}
+# Filtres dont le premier argument est une expression (valeurs comprises)
+_EXPRESSIONS = {"or_", "match", "filter"}
+
+
+@dataclass
+class QueryRecord:
+    table: str
+    operation: str
+    filters: List[str]
+    shape: Tuple[str, ...]
+    duration_ms: float
+    rows: int
+    error: Optional[str] = None
+
+
+class RequestTrace:
+    """Requêtes exécutées pendant une requête HTTP"""
+
+    def __init__(self):
+        self.records: List[QueryRecord] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.records)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(r.duration_ms for r in self.records)
+
+    def repeated(self, threshold: int = QUERY_TRACE_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Formes de requête exécutées au moins `threshold` fois (N+1 probable)"""
+        counts = Counter(r.shape for r in self.records)
+        return [(" ".join(shape), n) for shape, n in counts.most_common() if n >= threshold]
+
+    def problems(self, max_queries: int = QUERY_TRACE_MAX_QUERIES,
+                 repeat_threshold: int = QUERY_TRACE_REPEAT_THRESHOLD) -> List[str]:
+        issues = []
+        if self.count > max_queries:
+            issues.append(f"{self.count} requêtes (> {max_queries})")
+        issues += [f"N+1 probable: {shape} x{n}" for shape, n in self.repeated(repeat_threshold)]
+        return issues
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total_ms:.1f};desc="{self.count} queries"'
+
+    def to_log(self) -> List[Dict[str, Any]]:
+        return [
+            {"table": r.table, "op": r.operation, "filters": r.filters,
+             "ms": round(r.duration_ms, 2), "rows": r.rows, **({"error": r.error} if r.error else {})}
+            for r in self.records
+        ]
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("query_trace", default=None)
+
+
+@contextmanager
+def trace_queries():
+    """Ouvre une trace (tests, scripts) : with trace_queries() as trace: ..."""
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def _short(value: Any, limit: int = 60) -> str:
+    text = str(value)
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class _TracedBuilder:
+    """Proxy d'un request builder postgrest : mémorise la chaîne d'appels jusqu'à execute()"""
+
+    __slots__ = ("_builder", "_table", "_operation", "_calls")
+
+    def __init__(self, builder, table: str, operation: str, calls: Tuple[Tuple[str, str, str], ...]):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+        self._calls = calls
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if name == "execute":
+            return self._execute
+        if not callable(attr):
+            # .not_ et autres propriétés renvoyant un builder
+            if hasattr(attr, "execute"):
+                return _TracedBuilder(attr, self._table, self._operation, self._calls + ((name, "", ""),))
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not hasattr(result, "execute"):
+                return result
+            operation = name if name in _OPERATIONS else self._operation
+            if name in _EXPRESSIONS:
+                column, value = "*", _short(args[0] if args else kwargs)
+            else:
+                column = "" if name in _OPERATIONS or name in _MODIFIERS or not args else str(args[0])
+                value = _short(args[1]) if len(args) > 1 and name not in _MODIFIERS else ""
+            return _TracedBuilder(result, self._table, operation, self._calls + ((name, column, value),))
+        return call
+
+    def _execute(self):
+        trace = _current_trace.get()
+        if trace is None:
+            return self._builder.execute()
+        started = time.perf_counter()
+        error = None
+        rows = 0
+        try:
+            response = self._builder.execute()
+            data = getattr(response, "data", None)
+            rows = len(data) if isinstance(data, list) else int(data is not None)
+            return response
+        except Exception as e:
+            error = _short(e, 200)
+            raise
+        finally:
+            trace.records.append(QueryRecord(
+                table=self._table,
+                operation=self._operation,
+                filters=[f"{m}({c}{'=' + v if v else ''})" for m, c, v in self._calls if c],
+                shape=(self._table, self._operation) + tuple(f"{m}:{c}" if c else m for m, c, _ in self._calls
+                                                            if m not in _OPERATIONS),
+                duration_ms=(time.perf_counter() - started) * 1000,
+                rows=rows,
+                error=error,
+            ))
+
+
+class TracedClient:
+    """Client Supabase instrumenté : table()/from_()/rpc() tracés, le reste (auth, storage) inchangé"""
+
+    def __init__(self, client):
+        self._client = client
+
+    @property
+    def wrapped(self):
+        return self._client
+
+    def table(self, name: str):
+        return _TracedBuilder(self._client.table(name), name, "select", ())
+
+    def from_(self, name: str):
+        return _TracedBuilder(self._client.from_(name), name, "select", ())
+
+    def rpc(self, fn: str, *args, **kwargs):
+        return _TracedBuilder(self._client.rpc(fn, *args, **kwargs), f"rpc:{fn}", "rpc", ())
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def trace_client(client):
+    """Enveloppe un client (None et QUERY_TRACE_ENABLED=0 : renvoyé tel quel)"""
+    if client is None or not QUERY_TRACE_ENABLED or isinstance(client, TracedClient):
+        return client
+    return TracedClient(client)
+
+
+class QueryTraceMiddleware:
+    """Middleware ASGI : une trace par requête, en-tête Server-Timing, log JSON (WARNING si N+1)"""
+
+    def __init__(self, app, max_queries: int = QUERY_TRACE_MAX_QUERIES,
+                 repeat_threshold: int = QUERY_TRACE_REPEAT_THRESHOLD):
+        self.app = app
+        self.max_queries = max_queries
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and trace.records:
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", trace.server_timing().encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            if trace.records:
+                self._log(scope, trace)
+
+    def _log(self, scope, trace: RequestTrace):
+        problems = trace.problems(self.max_queries, self.repeat_threshold)
+        level = logging.WARNING if problems else logging.DEBUG
+        if not logger.isEnabledFor(level):
+            return
+        route = scope.get("route")
+        fields = {
+            "event": "db_queries",
+            "method": scope.get("method"),
+            "route": getattr(route, "path", scope.get("path")),
+            "queries": trace.count,
+            "db_ms": round(trace.total_ms, 1),
+            "problems": problems,
+            **({"detail": trace.to_log()} if problems else {}),
+        }
+        # Champs structurés (extra) : repris tels quels par le formateur JSON de log_config
+        logger.log(level, "%s %s : %d requêtes, %.1f ms%s", fields["method"], fields["route"], trace.count,
+                   trace.total_ms, f" - {'; '.join(problems)}" if problems else "", extra=fields)
@@ -0,0 +1,257 @@
+"""
+Quote Index - Recherche de devis similaires (BM25) par entreprise
+
+Index construit sur tout l'historique de devis d'une entreprise :
+titre (poids x2), description et libellés des lignes (name / description).
+
+- segment principal : matrice creuse SciPy CSC (devis x termes) des
+  fréquences, scorée en une passe vectorisée sur les termes de la requête
+- segment delta : devis créés / modifiés depuis la dernière compaction,
+  gardés en Counter ; l'ancienne version d'un devis modifié est masquée
+- compaction en matrice unique quand le delta dépasse un seuil
+- reconstruction complète après QUOTE_INDEX_MAX_AGE secondes (les autres
+  workers ne voient pas les créations faites ailleurs)
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from supabase_helpers import paged
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 2
+INDEX_MAX_AGE = float(os.getenv("QUOTE_INDEX_MAX_AGE", "900"))
+
+# Colonnes conservées pour les résultats (utilisées par le brouillon de devis)
+QUOTE_COLUMNS = "id, company_id, quote_number, title, description, amount, status, client_id, items, created_at"
+
+STOPWORDS = frozenset("""
+au aux avec ce ces dans de des du en et la le les leur lui ma mes mon ne nos notre
+ou par pas pour qu que qui sa se ses son sur ta te tes ton un une vos votre est sont
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Minuscules sans accents, mots de 2 caractères et plus hors mots vides, pluriel en -s retiré"""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", str(text).lower())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    tokens = []
+    for token in _TOKEN_RE.findall(folded):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def quote_terms(quote: Dict[str, Any]) -> List[str]:
+    """Termes indexés d'un devis"""
+    terms = tokenize(quote.get("title")) * TITLE_WEIGHT + tokenize(quote.get("description"))
+    for item in quote.get("items") or []:
+        if isinstance(item, dict):
+            terms += tokenize(item.get("name")) + tokenize(item.get("description"))
+    return terms
+
+
+class CompanyQuoteIndex:
+    """Index BM25 des devis d'une entreprise (segment principal + delta)"""
+
+    def __init__(self, quotes: Iterable[Dict[str, Any]] = ()):
+        self.vocab: Dict[str, int] = {}
+        self.quotes: Dict[str, Dict[str, Any]] = {}
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Counter] = {}
+        self._set_base({q["id"]: self._counts(quote_terms(q)) for q in quotes if q.get("id")}, quotes)
+
+    # -- construction ---------------------------------------------------
+
+    def _counts(self, terms: List[str]) -> Counter:
+        return Counter(self.vocab.setdefault(t, len(self.vocab)) for t in terms)
+
+    def _set_base(self, docs: Dict[str, Counter], quotes: Iterable[Dict[str, Any]] = ()):
+        for q in quotes:
+            if q.get("id"):
+                self.quotes[q["id"]] = q
+        self.base_ids = list(docs)
+        self.base_pos = {qid: i for i, qid in enumerate(self.base_ids)}
+        rows, cols, vals = [], [], []
+        for i, counts in enumerate(docs.values()):
+            rows.extend([i] * len(counts))
+            cols.extend(counts.keys())
+            vals.extend(counts.values())
+        shape = (len(self.base_ids), len(self.vocab))
+        csr = sparse.csr_matrix(
+            (np.asarray(vals, dtype=np.float32), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+            shape=shape
+        )
+        self.base_csc = csr.tocsc()
+        self.base_len = np.asarray(csr.sum(axis=1), dtype=np.float64).ravel()
+        self.base_alive = np.ones(len(self.base_ids), dtype=bool)
+        self.base_df = np.diff(self.base_csc.indptr).astype(np.int64)
+        self._base_csr = csr
+        self._pending = {}
+
+    def _compact(self):
+        """Fusionne segment principal vivant + delta en une nouvelle matrice"""
+        docs: Dict[str, Counter] = {}
+        for i, qid in enumerate(self.base_ids):
+            if self.base_alive[i]:
+                row = self._base_csr.getrow(i)
+                docs[qid] = Counter(dict(zip(row.indices.tolist(), row.data.astype(int).tolist())))
+        docs.update(self._pending)
+        self._set_base(docs)
+
+    # -- mises à jour incrémentales --------------------------------------
+
+    def _tombstone(self, quote_id: str):
+        pos = self.base_pos.get(quote_id)
+        if pos is not None and self.base_alive[pos]:
+            self.base_alive[pos] = False
+            row = self._base_csr.getrow(pos)
+            self.base_df[row.indices] -= 1
+
+    def upsert(self, quote: Dict[str, Any]):
+        """Ajoute ou remplace un devis (création / modification)"""
+        with self._lock:
+            qid = quote["id"]
+            self._tombstone(qid)
+            self.quotes[qid] = {**self.quotes.get(qid, {}), **quote}
+            self._pending[qid] = self._counts(quote_terms(self.quotes[qid]))
+            if len(self._pending) > max(64, len(self.base_ids) // 10):
+                self._compact()
+
+    def remove(self, quote_id: str):
+        with self._lock:
+            self._tombstone(quote_id)
+            self._pending.pop(quote_id, None)
+            self.quotes.pop(quote_id, None)
+
+    def __len__(self) -> int:
+        return int(self.base_alive.sum()) + len(self._pending)
+
+    # -- recherche -------------------------------------------------------
+
+    def search(self, text: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Top-k devis par score BM25 décroissant"""
+        with self._lock:
+            q_ids = sorted({self.vocab[t] for t in tokenize(text) if t in self.vocab})
+            n_docs = len(self)
+            if not q_ids or n_docs == 0:
+                return []
+
+            base_n = len(self.base_ids)
+            n_base_terms = self.base_csc.shape[1]
+            pending_lens = {qid: sum(c.values()) for qid, c in self._pending.items()}
+            total_len = float(self.base_len[self.base_alive].sum()) + sum(pending_lens.values())
+            avgdl = max(total_len / n_docs, 1.0)
+
+            df = np.array([
+                (self.base_df[t] if t < n_base_terms else 0) + sum(1 for c in self._pending.values() if t in c)
+                for t in q_ids
+            ], dtype=np.float64)
+            idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+            scores = np.zeros(base_n, dtype=np.float64)
+            base_cols = [i for i, t in enumerate(q_ids) if t < n_base_terms]
+            if base_n and base_cols:
+                sub = self.base_csc[:, [q_ids[i] for i in base_cols]].tocoo()
+                tf = sub.data.astype(np.float64)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.base_len[sub.row] / avgdl)
+                weights = idf[np.asarray(base_cols)[sub.col]] * tf * (BM25_K1 + 1) / (tf + norm)
+                scores = np.bincount(sub.row, weights=weights, minlength=base_n)
+                scores[~self.base_alive] = 0.0
+
+            candidates = []
+            if base_n:
+                top = min(k, base_n)
+                best = np.argpartition(-scores, top - 1)[:top]
+                candidates = [(float(scores[i]), self.base_ids[i]) for i in best if scores[i] > 0]
+
+            for qid, counts in self._pending.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * pending_lens[qid] / avgdl)
+                score = sum(
+                    idf[i] * counts[t] * (BM25_K1 + 1) / (counts[t] + norm)
+                    for i, t in enumerate(q_ids) if t in counts
+                )
+                if score > 0:
+                    candidates.append((float(score), qid))
+
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            return [
+                {**self.quotes[qid], "similarity_score": round(score, 4)}
+                for score, qid in candidates[:k]
+            ]
+
+
+class QuoteIndexRegistry:
+    """Index par entreprise, construits à la demande depuis Supabase"""
+
+    def __init__(self, supabase_client, max_age: float = INDEX_MAX_AGE):
+        self.supabase = supabase_client
+        self.max_age = max_age
+        self._indexes: Dict[str, CompanyQuoteIndex] = {}
+        self._lock = threading.Lock()
+
+    def _load_quotes(self, company_id: str) -> List[Dict[str, Any]]:
+        return list(paged(lambda: self.supabase.table("quotes").select(QUOTE_COLUMNS)
+                          .eq("company_id", company_id)
+                          .order("id")))
+
+    def get(self, company_id: str) -> CompanyQuoteIndex:
+        index = self._indexes.get(company_id)
+        if index is not None and time.monotonic() - index.built_at < self.max_age:
+            return index
+        with self._lock:
+            index = self._indexes.get(company_id)
+            if index is None or time.monotonic() - index.built_at >= self.max_age:
+                started = time.perf_counter()
+                index = CompanyQuoteIndex(self._load_quotes(company_id))
+                self._indexes[company_id] = index
+                logger.info(
+                    f"🔎 Index devis construit ({company_id}): {len(index)} devis, "
+                    f"{len(index.vocab)} termes en {(time.perf_counter() - started) * 1000:.0f} ms"
+                )
+        return index
+
+    def search(self, company_id: str, text: str, k: int = 5) -> List[Dict[str, Any]]:
+        return self.get(company_id).search(text, k)
+
+    def upsert_quote(self, quote: Dict[str, Any]):
+        """À appeler après création / modification d'un devis (ignoré si l'index n'est pas encore construit)"""
+        index = self._indexes.get(quote.get("company_id"))
+        if index is not None and quote.get("id"):
+            index.upsert(quote)
+
+    def remove_quote(self, company_id: str, quote_id: str):
+        index = self._indexes.get(company_id)
+        if index is not None:
+            index.remove(quote_id)
+
+
+_registry: Optional[QuoteIndexRegistry] = None
+
+
+def get_quote_index(supabase_client) -> QuoteIndexRegistry:
+    """Registre partagé entre AIService et les endpoints devis"""
+    global _registry
+    if _registry is None or _registry.supabase is not supabase_client:
+        _registry = QuoteIndexRegistry(supabase_client)
+    return _registry
@@ -0,0 +1,225 @@
+"""
+Request Metrics - Latence et volumes par route, export Prometheus
+
+Middleware ASGI pur (pas de BaseHTTPMiddleware : les réponses en streaming
+ne sont pas mises en tampon) qui enregistre par (méthode, route) :
+- histogramme de latence (jusqu'au dernier octet envoyé)
+- nombre de réponses par code HTTP
+- octets reçus (Content-Length) et envoyés
+et le nombre de requêtes en cours.
+
+Les routes sont identifiées par leur gabarit (/api/quotes/{quote_id}), pas
+par le chemin réel : cardinalité bornée. p50 / p95 / p99 sont estimés par
+interpolation dans les buckets (comme histogram_quantile de Prometheus).
+
+METRICS_ENABLED=0 : le middleware n'est pas installé (aucun surcoût).
+Les compteurs sont propres à chaque processus (uvicorn --workers N) :
+Prometheus agrège les séries de chaque worker scrapé.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") in ("1", "true", "True", "yes", "on")
+
+# Bornes supérieures des buckets (secondes)
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+    1.0, 2.5, 5.0, 7.5, 10.0, 30.0,
+)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """Histogramme à buckets fixes (comptes non cumulés, +Inf en dernier)"""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimation par interpolation linéaire dans le bucket contenant le rang q"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n > 0:
+                if i == len(LATENCY_BUCKETS):
+                    return LATENCY_BUCKETS[-1]
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                return lower + (LATENCY_BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return LATENCY_BUCKETS[-1]
+
+
+class RouteStats:
+    __slots__ = ("latency", "statuses", "request_bytes", "response_bytes")
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses: Dict[int, int] = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class RequestMetrics:
+    """Registre des statistiques par route (mis à jour depuis la boucle asyncio uniquement)"""
+
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], RouteStats] = {}
+        self.in_flight = 0
+        self.started_at = time.time()
+
+    def record(self, method: str, route: str, status: int, seconds: float, request_bytes: int, response_bytes: int):
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = RouteStats()
+        stats.latency.observe(seconds)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        stats.request_bytes += request_bytes
+        stats.response_bytes += response_bytes
+
+    def reset(self):
+        self.routes.clear()
+
+    # -- exports ---------------------------------------------------------
+
+    def summary(self, min_count: int = 1) -> List[Dict[str, Any]]:
+        """p50 / p95 / p99 (ms) par route, les plus lentes (p95) en premier"""
+        rows = []
+        for (method, route), stats in self.routes.items():
+            h = stats.latency
+            if h.count < min_count:
+                continue
+            rows.append({
+                "method": method,
+                "route": route,
+                "count": h.count,
+                "mean_ms": round(h.total / h.count * 1000, 2),
+                **{f"p{int(q * 100)}_ms": round(h.quantile(q) * 1000, 2) for q in QUANTILES},
+                "errors": sum(n for code, n in stats.statuses.items() if code >= 500),
+                "statuses": dict(sorted(stats.statuses.items())),
+                "request_bytes": stats.request_bytes,
+                "response_bytes": stats.response_bytes,
+            })
+        rows.sort(key=lambda r: r["p95_ms"], reverse=True)
+        return rows
+
+    def render_prometheus(self) -> str:
+        """Format texte d'exposition Prometheus (version 0.0.4)"""
+        lines = [
+            "# HELP skyapp_http_requests_in_flight Requêtes HTTP en cours",
+            "# TYPE skyapp_http_requests_in_flight gauge",
+            f"skyapp_http_requests_in_flight {self.in_flight}",
+            "# HELP skyapp_http_request_duration_seconds Latence des requêtes HTTP par route",
+            "# TYPE skyapp_http_request_duration_seconds histogram",
+        ]
+        items = sorted(self.routes.items())
+        for (method, route), stats in items:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            h = stats.latency
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, h.counts):
+                cumulative += n
+                lines.append(f'skyapp_http_request_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'skyapp_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f"skyapp_http_request_duration_seconds_sum{{{labels}}} {h.total:.6f}")
+            lines.append(f"skyapp_http_request_duration_seconds_count{{{labels}}} {h.count}")
+
+        lines += [
+            "# HELP skyapp_http_request_duration_quantile_seconds Latence estimée p50/p95/p99 par route",
+            "# TYPE skyapp_http_request_duration_quantile_seconds gauge",
+        ]
+        for (method, route), stats in items:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            for q in QUANTILES:
+                lines.append(
+                    f'skyapp_http_request_duration_quantile_seconds{{{labels},quantile="{q:g}"}} '
+                    f"{stats.latency.quantile(q):.6f}"
+                )
+
+        lines += [
+            "# HELP skyapp_http_responses_total Réponses HTTP par route et code",
+            "# TYPE skyapp_http_responses_total counter",
+        ]
+        for (method, route), stats in items:
+            for code, n in sorted(stats.statuses.items()):
+                lines.append(
+                    f'skyapp_http_responses_total{{method="{method}",route="{_escape(route)}",status="{code}"}} {n}'
+                )
+
+        for name, attr, help_text in (
+            ("skyapp_http_request_bytes_total", "request_bytes", "Octets reçus (Content-Length) par route"),
+            ("skyapp_http_response_bytes_total", "response_bytes", "Octets envoyés par route"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), stats in items:
+                lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {getattr(stats, attr)}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "<unknown>")
+    root_path = scope.get("root_path")
+    return f"{root_path}/*" if root_path else "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI : temps jusqu'au dernier octet, code, tailles, requêtes en cours"""
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        started = time.perf_counter()
+        response = [500, 0]  # statut, octets envoyés
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                response[1] += len(message.get("body", b""))
+            await send(message)
+
+        request_bytes = 0
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                request_bytes = int(value) if value.isdigit() else 0
+                break
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            metrics.record(
+                scope["method"], _route_label(scope), response[0],
+                time.perf_counter() - started, request_bytes, response[1]
+            )
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,228 @@
+"""
+Schedule Conflicts - Détection des chevauchements de plannings d'un technicien
+
+Un planning occupe une plage de jours [start_date, end_date] (date unique ou
+période) et, chacun de ces jours, une plage horaire [time, end_time). Deux
+plannings d'un même technicien sont en conflit si leurs plages de jours se
+recouvrent et que leurs plages horaires se recouvrent sur un de ces jours.
+Une plage de nuit (end_time <= time) déborde sur le lendemain.
+
+Les plannings existants sont chargés en une requête pour tout un lot de
+propositions (tous les techniciens, toute la plage de jours concernée) :
+1. fonction SQL `schedule_conflict_candidates` (index GiST sur la plage de
+   jours, migration 20261019000005)
+2. repli si la fonction n'est pas déployée : filtre PostgREST équivalent
+
+Ils sont ensuite indexés par technicien et triés par premier jour
+(ScheduleIndex) : une proposition n'est comparée qu'aux plannings dont la
+plage de jours peut la recouvrir, puis aux propositions précédentes du lot.
+
+Une proposition dont la date ou l'horaire est illisible est refusée
+(ValueError) ; un planning existant illisible est ignoré et journalisé.
+"""
+
+import bisect
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from supabase_helpers import SqlFunction, paged
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+DEFAULT_HOURS = 8
+
+# Plannings qui n'occupent plus le technicien
+INACTIVE_STATUSES = {"cancelled", "canceled"}
+
+CANDIDATE_COLUMNS = "id, collaborator_id, worksite_id, date, start_date, end_date, time, end_time, hours, status"
+
+
+def parse_minutes(value: Any) -> Optional[int]:
+    """'HH:MM' ou 'HH:MM:SS' (colonne time) -> minutes depuis minuit ; ValueError si illisible"""
+    if value in (None, ""):
+        return None
+    parts = str(value).split(":")
+    if len(parts) not in (2, 3) or not all(len(p) == 2 and p.isdigit() for p in parts):
+        raise ValueError(f"Horaire invalide (HH:MM): {value!r}")
+    hours, minutes = int(parts[0]), int(parts[1])
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Horaire invalide (HH:MM): {value!r}")
+    return hours * 60 + minutes
+
+
+def parse_day(value: Any) -> Optional[date]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+@dataclass(frozen=True)
+class Slot:
+    """Occupation d'un technicien : chaque jour de [first_day, last_day], minutes [start_min, end_min)"""
+
+    collaborator_id: str
+    first_day: date
+    last_day: date
+    start_min: int
+    end_min: int
+    schedule_id: Optional[str] = None
+    batch_index: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any], batch_index: Optional[int] = None) -> Optional["Slot"]:
+        """Ligne schedules (ou proposition au même format) ; None si technicien ou date manquant, ValueError si illisible"""
+        first_day = parse_day(row.get("start_date") or row.get("period_start") or row.get("date"))
+        if not row.get("collaborator_id") or first_day is None:
+            return None
+        last_day = parse_day(row.get("end_date") or row.get("period_end") or row.get("date")) or first_day
+
+        start_min = parse_minutes(row.get("time"))
+        if start_min is None:
+            start_min, end_min = 0, MINUTES_PER_DAY
+        else:
+            end_min = parse_minutes(row.get("end_time"))
+            if end_min is None:
+                end_min = start_min + 60 * int(row.get("hours") or DEFAULT_HOURS)
+            elif end_min <= start_min:
+                end_min += MINUTES_PER_DAY
+            end_min = min(end_min, start_min + MINUTES_PER_DAY)
+
+        return cls(str(row["collaborator_id"]), first_day, max(first_day, last_day), start_min, end_min,
+                   row.get("id"), batch_index)
+
+    @property
+    def span_days(self) -> int:
+        return (self.last_day - self.first_day).days
+
+    def overlaps(self, other: "Slot") -> bool:
+        # Un jour d de self contre le jour d + shift de other (plages horaires < 24 h : shift dans -1..1)
+        for shift in (-1, 0, 1):
+            lo = max(self.first_day, other.first_day - timedelta(days=shift))
+            hi = min(self.last_day, other.last_day - timedelta(days=shift))
+            if lo > hi:
+                continue
+            offset = shift * MINUTES_PER_DAY
+            if self.start_min < other.end_min + offset and other.start_min + offset < self.end_min:
+                return True
+        return False
+
+
+class ScheduleIndex:
+    """Plannings par technicien, triés par premier jour (recherche par bisection sur la plage de jours)"""
+
+    def __init__(self, slots: Iterable[Slot] = ()):
+        self._days: Dict[str, List[date]] = {}
+        self._slots: Dict[str, List[Slot]] = {}
+        self._max_span: Dict[str, int] = {}
+        for slot in slots:
+            self.add(slot)
+
+    def __len__(self) -> int:
+        return sum(len(slots) for slots in self._slots.values())
+
+    def add(self, slot: Slot):
+        days = self._days.setdefault(slot.collaborator_id, [])
+        position = bisect.bisect_right(days, slot.first_day)
+        days.insert(position, slot.first_day)
+        self._slots.setdefault(slot.collaborator_id, []).insert(position, slot)
+        self._max_span[slot.collaborator_id] = max(self._max_span.get(slot.collaborator_id, 0), slot.span_days)
+
+    def conflicts(self, slot: Slot) -> List[Slot]:
+        """Plannings du technicien qui chevauchent `slot` (hors `slot` lui-même s'il a un id)"""
+        days = self._days.get(slot.collaborator_id)
+        if not days:
+            return []
+        # Seuls ceux qui commencent entre (premier jour - plus longue période - 1) et (dernier jour + 1)
+        lo = bisect.bisect_left(days, slot.first_day - timedelta(days=self._max_span[slot.collaborator_id] + 1))
+        hi = bisect.bisect_right(days, slot.last_day + timedelta(days=1))
+        return [
+            other for other in self._slots[slot.collaborator_id][lo:hi]
+            if not (slot.schedule_id and other.schedule_id == slot.schedule_id) and other.overlaps(slot)
+        ]
+
+
+def existing_slot(row: Dict[str, Any]) -> Optional[Slot]:
+    """Slot d'un planning enregistré ; None (journalisé) si sa date ou son horaire est illisible"""
+    try:
+        return Slot.from_row(row)
+    except ValueError as e:
+        logger.warning(f"⚠️ Planning {row.get('id')} ignoré: {e}")
+        return None
+
+
+class ScheduleConflictEngine:
+    """Vérifie une ou plusieurs affectations proposées contre les plannings existants"""
+
+    def __init__(self, get_client: Callable[[], Any]):
+        self._get_client = get_client
+        self._candidates_rpc = SqlFunction("schedule_conflict_candidates", order="id")
+
+    def check(self, company_id: str, proposal: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Plannings existants en conflit avec une proposition (son `id` éventuel est ignoré : modification)"""
+        return [c for c in self.check_many(company_id, [proposal])[0]["conflicts"] if c["source"] == "existing"]
+
+    def check_many(self, company_id: str, proposals: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Pour chaque proposition, dans l'ordre : conflits avec les plannings existants et
+        avec les propositions précédentes du même lot. Une seule lecture de la base.
+        """
+        slots = []
+        for i, proposal in enumerate(proposals):
+            try:
+                slot = Slot.from_row(proposal, batch_index=i)
+            except ValueError as e:
+                raise ValueError(f"Affectation {i}: {e}")
+            if slot is None:
+                raise ValueError(f"Affectation {i}: collaborator_id et date (ou période) requis")
+            slots.append(slot)
+
+        rows_by_id = {row["id"]: row for row in self.load_candidates(company_id, slots)}
+        existing = ScheduleIndex(
+            slot for slot in (existing_slot(row) for row in rows_by_id.values()) if slot is not None
+        )
+        batch = ScheduleIndex()
+        results = []
+        for slot in slots:
+            conflicts = [
+                {"source": "existing", "schedule_id": other.schedule_id, "schedule": rows_by_id[other.schedule_id]}
+                for other in existing.conflicts(slot)
+            ]
+            conflicts.extend(
+                {"source": "batch", "index": other.batch_index}
+                for other in sorted(batch.conflicts(slot), key=lambda s: s.batch_index)
+            )
+            results.append({"index": slot.batch_index, "conflicts": conflicts})
+            batch.add(slot)
+        return results
+
+    def load_candidates(self, company_id: str, slots: Sequence[Slot]) -> List[Dict[str, Any]]:
+        """Plannings actifs des techniciens concernés dont la plage de jours touche celle du lot"""
+        if not slots:
+            return []
+        collaborator_ids = sorted({slot.collaborator_id for slot in slots})
+        # Veille : plage de nuit qui déborde ; lendemain : la proposition elle-même déborde
+        first = (min(slot.first_day for slot in slots) - timedelta(days=1)).isoformat()
+        last = (max(slot.last_day for slot in slots) + timedelta(days=1)).isoformat()
+
+        rows = self._candidates_rpc.rows(self._get_client(), {
+            "p_company_id": company_id,
+            "p_collaborator_ids": collaborator_ids,
+            "p_from": first,
+            "p_to": last,
+        })
+        if rows is None:
+            rows = list(paged(lambda: self._get_client().table("schedules").select(CANDIDATE_COLUMNS)
+                              .eq("company_id", company_id)
+                              .in_("collaborator_id", collaborator_ids)
+                              .or_(f"and(start_date.lte.{last},end_date.gte.{first}),"
+                                   f"and(start_date.lte.{last},end_date.is.null),"
+                                   f"and(start_date.is.null,date.gte.{first},date.lte.{last})")
+                              .order("id")))
+        return [row for row in rows if str(row.get("status") or "").lower() not in INACTIVE_STATUSES]
@@ -1,68 +1,60 @@
 ﻿from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Form, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
+import sys
 import logging
+import importlib.util
 from pathlib import Path
 from pydantic import BaseModel, Field
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logs JSON écrits par un thread dédié (QueueHandler/QueueListener), voir log_config
+from log_config import configure_logging, RequestIdMiddleware
+configure_logging()
 logger = logging.getLogger(__name__)
 
 logger.info("=" * 100)
 logger.info("CHARGEMENT DU FICHIER server_supabase.py - CODE MIS A JOUR LE 29 JANVIER 2026")
 logger.info("=" * 100)
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime, timedelta, date, timezone
 from decimal import Decimal
 import tempfile
-import io
+import json
 import asyncio
-import aiofiles
 import shutil
 from supabase import create_client, Client
 from enum import Enum
 
-# ReportLab imports for PDF generation
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch, cm
-from reportlab.lib import colors
-from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image as ReportLabImage, PageBreak, KeepTogether
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT, TA_JUSTIFY
-from reportlab.lib.utils import ImageReader
-from PIL import Image as PILImage
-import qrcode
-import base64
+# ReportLab (PDF) : importé au premier PDF demandé, voir pdf_routes / pdf_reports
 import secrets
+import hmac
+from upload_service import (
+    save_upload_file, save_upload_to_tempfile, UploadTooLargeError,
+    MAX_INVOICE_SIZE, MAX_PHOTO_SIZE, MAX_LOGO_SIZE
+)
 
 # IOPOLE Client for electronic invoicing
 try:
-    from iopole_client import iopole_client, format_invoice_for_iopole
+    from iopole_client import iopole_client, format_invoice_for_iopole, AsyncRateLimiter
     IOPOLE_AVAILABLE = True
     logging.info("✅ Client IOPOLE chargé avec succès")
 except ImportError as e:
     IOPOLE_AVAILABLE = False
     logging.warning(f"⚠️ Client IOPOLE non disponible: {e}")
 
-# AI Service for intelligent assistance
-try:
-    from ai_service import init_ai_service, get_ai_service
-    AI_SERVICE_AVAILABLE = True
-    logging.info("✅ Service IA chargé avec succès")
-except ImportError as e:
-    AI_SERVICE_AVAILABLE = False
-    logging.warning(f"⚠️ Service IA non disponible: {e}")
+# AI Service : ai_service (OpenAI, SciPy) importé au premier usage, voir get_ai_service()
+AI_SERVICE_AVAILABLE = importlib.util.find_spec("openai") is not None
+if AI_SERVICE_AVAILABLE:
+    from ai_usage import get_usage_meter
+else:
+    logging.warning("⚠️ Service IA non disponible: module openai absent")
 
 # Configuration
 ROOT_DIR = Path(__file__).parent
@@ -76,14 +68,103 @@ ALLOW_DEV_LOGIN = os.environ.get('ALLOW_DEV_LOGIN', '0') in ('1', 'true', 'True'
 # Founder email (unique creator of the application)
 FOUNDER_EMAIL = os.environ.get('FOUNDER_EMAIL', 'contact@skyapp.fr').lower()
 
-# Clients Supabase (anon pour auth, service pour admin)
-supabase_anon: Client = create_client(supabase_url, supabase_anon_key)
-supabase_service: Client = create_client(supabase_url, supabase_service_key) if supabase_service_key else None
+# Clients Supabase (anon pour auth, service pour admin), requêtes tracées par requête HTTP
+from query_tracer import QUERY_TRACE_ENABLED, QueryTraceMiddleware, trace_client
+supabase_anon: Client = trace_client(create_client(supabase_url, supabase_anon_key))
+supabase_service: Client = trace_client(create_client(supabase_url, supabase_service_key)) if supabase_service_key else None
 
 # Create uploads directory
 UPLOADS_DIR = Path(__file__).parent / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
 
+# Agrégation e-reporting (requête SQL groupée, repli NumPy)
+from ereporting_engine import EReportingEngine, DECLARATION_CATEGORY, TRANSACTION_CATEGORIES
+ereporting_engine = EReportingEngine(supabase_service) if supabase_service is not None else None
+
+# Planning : conflits, disponibilités, avancement des chantiers, synchronisation hors ligne, temps réel (SSE)
+from schedule_conflicts import MINUTES_PER_DAY, ScheduleConflictEngine, Slot, parse_minutes
+from technician_availability import AVAILABILITY_WINDOWS, MAX_AVAILABILITY_DAYS, build_availability, filter_technicians
+from worksite_progress import WorksiteProgress
+from delta_sync import DEFAULT_PAGE_SIZE as SYNC_PAGE_SIZE, SYNC_RESOURCES, DeltaSync, InvalidSyncToken
+from planning_events import (
+    planning_events, stream_tickets, SCHEDULE_CREATED, SCHEDULE_UPDATED, SCHEDULE_DELETED,
+    WORKSITE_CREATED, WORKSITE_UPDATED, WORKSITE_DELETED,
+)
+
+def get_ai_service():
+    """Service IA partagé : import d'OpenAI et initialisation au premier appel (une seule fois)"""
+    from ai_service import get_or_init_ai_service
+    return get_or_init_ai_service(supabase_service)
+
+async def _warm_up_ai_service():
+    try:
+        await asyncio.to_thread(get_ai_service)
+    except Exception as e:
+        logging.warning(f"⚠️ Impossible d'initialiser le service IA: {e}")
+
+def _loaded_quote_index():
+    """Index BM25 des devis s'il est déjà chargé (par le service IA) ; sinon aucun index à tenir à jour"""
+    module = sys.modules.get("quote_index")
+    if module is None or supabase_service is None:
+        return None
+    return module.get_quote_index(supabase_service)
+
+# Consommation IA par entreprise (compteurs écrits par lots, budgets journaliers)
+ai_usage_meter = get_usage_meter(supabase_service) if AI_SERVICE_AVAILABLE and supabase_service is not None else None
+
+# Outbox email (envoi en tâche de fond, connexion SMTP/SendGrid réutilisée)
+from email_service import email_service, email_outbox
+if supabase_service is not None:
+    email_outbox.attach_store(supabase_service)
+
+# Inbox durable des webhooks IOPOLE (traitement en tâche de fond)
+from webhook_inbox import WebhookInbox
+webhook_inbox = WebhookInbox(
+    supabase_service,
+    iopole_client=iopole_client if IOPOLE_AVAILABLE else None,
+    uploads_dir=UPLOADS_DIR
+) if supabase_service is not None else None
+
+# Sondes de santé (/livez, /readyz) : résultats en cache rafraîchis en tâche de fond
+from health_probes import HealthMonitor
+health_monitor = HealthMonitor()
+
+async def _probe_database():
+    if supabase_service is None:
+        raise RuntimeError("SUPABASE_SERVICE_KEY manquante (mode anon)")
+    await asyncio.to_thread(lambda: supabase_service.table("companies").select("id").limit(1).execute())
+    return {"mode": "service"}
+
+async def _probe_ai():
+    ai_service = await asyncio.to_thread(get_ai_service)
+    return {"mode": "simulation" if ai_service.simulation_mode else "production"}
+
+async def _probe_iopole():
+    result = await iopole_client.health_check()
+    if result["status"] == "error":
+        raise RuntimeError(result["message"])
+    return {"mode": result["status"], "environment": result.get("environment"), "circuit": iopole_client.breaker.state}
+
+async def _probe_workers():
+    workers = {
+        "email_outbox": email_outbox.running,
+        "webhook_inbox": webhook_inbox.running if webhook_inbox is not None else None,
+        "ai_usage_writer": ai_usage_meter.get_metrics()["running"] if ai_usage_meter is not None else None,
+    }
+    stopped = [name for name, running in workers.items() if running is False]
+    return {
+        "status": "degraded" if stopped else "ok",
+        "workers": workers,
+        "email_queue_depth": email_outbox.queue_depth,
+    }
+
+health_monitor.register("database", _probe_database)
+if AI_SERVICE_AVAILABLE:
+    health_monitor.register("ai", _probe_ai, critical=False)
+if IOPOLE_AVAILABLE:
+    health_monitor.register("iopole", _probe_iopole, critical=False)
+health_monitor.register("workers", _probe_workers, critical=False)
+
 # Lifespan context manager pour remplacer @app.on_event
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -91,14 +172,35 @@ async def lifespan(app: FastAPI):
     try:
         mode = "service" if supabase_service is not None else "anon"
         logging.info("SkyApp Supabase API starting... mode=%s host=127.0.0.1 port=8001", mode)
-        logging.info("Health: http://127.0.0.1:8001/api/health  Docs: http://127.0.0.1:8001/docs")
+        logging.info("Health: http://127.0.0.1:8001/readyz  Docs: http://127.0.0.1:8001/docs")
     except Exception:
         pass
     
+    # Service IA initialisé une seule fois (client OpenAI, cache et statistiques conservés),
+    # en tâche de fond : le serveur répond pendant l'import d'OpenAI
+    if AI_SERVICE_AVAILABLE and supabase_service is not None:
+        asyncio.create_task(_warm_up_ai_service(), name="ai-warmup")
+    
+    if webhook_inbox is not None:
+        webhook_inbox.start()
+    email_outbox.start()
+    if ai_usage_meter is not None:
+        ai_usage_meter.start()
+    health_monitor.start()
+    await planning_events.start()
+    
     yield
     
-    # Shutdown (si besoin)
-    pass
+    # Shutdown : arrêter l'inbox webhooks, vider l'outbox email et fermer la session HTTP poolée IOPOLE
+    await health_monitor.stop()
+    await planning_events.stop()
+    if webhook_inbox is not None:
+        await webhook_inbox.stop()
+    await email_outbox.stop()
+    if ai_usage_meter is not None:
+        await ai_usage_meter.stop()
+    if IOPOLE_AVAILABLE:
+        await iopole_client.aclose()
 
 # Create the main app
 app = FastAPI(
@@ -146,6 +248,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métriques par route (/metrics) : middleware ASGI installé seulement si METRICS_ENABLED
+from request_metrics import METRICS_ENABLED, MetricsMiddleware, request_metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, metrics=request_metrics)
+
+# Requêtes PostgREST par requête : Server-Timing + log JSON (WARNING si N+1 / trop de requêtes)
+if QUERY_TRACE_ENABLED:
+    app.add_middleware(QueryTraceMiddleware)
+
+# Identifiant de requête (X-Request-ID) repris dans toutes les lignes de log : ajouté en dernier = le plus externe
+app.add_middleware(RequestIdMiddleware)
+
 # Exception handler pour les erreurs de validation Pydantic
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -376,7 +491,7 @@ class UserProfileUpdate(BaseModel):
 # Fonctions utilitaires Supabase
 async def get_user_from_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Récupère l'utilisateur à partir du token Supabase JWT"""
-    logger.debug(f"🔑 get_user_from_token appelé - credentials présents: {credentials is not None}")
+    logger.debug("🔑 get_user_from_token appelé - credentials présents: %s", credentials is not None)
     try:
         # Autoriser le mode test sans en-tête Authorization (pour pytest)
         if credentials is None:
@@ -420,7 +535,7 @@ async def get_user_from_token(credentials: HTTPAuthorizationCredentials = Depend
                 user_data = supabase_service.table("users").select("*").eq("id", user_response.user.id).execute()
                 if user_data.data:
                     user_info = user_data.data[0]
-                    logger.debug(f"🔐 User data from service: id={user_info.get('id')}, email={user_info.get('email')}, is_fondateur={user_info.get('is_fondateur')}")
+                    logger.debug("🔐 User data from service: id=%s, is_fondateur=%s", user_info.get('id'), user_info.get('is_fondateur'))
                     return user_info
             except Exception as e:
                 logger.error(f"❌ Service client error: {e}")
@@ -431,7 +546,7 @@ async def get_user_from_token(credentials: HTTPAuthorizationCredentials = Depend
             user_data = supabase_anon.table("users").select("*").eq("id", user_response.user.id).execute()
             if user_data.data:
                 user_info = user_data.data[0]
-                logger.debug(f"🔐 User data from anon: id={user_info.get('id')}, email={user_info.get('email')}, is_fondateur={user_info.get('is_fondateur')}")
+                logger.debug("🔐 User data from anon: id=%s, is_fondateur=%s", user_info.get('id'), user_info.get('is_fondateur'))
                 return user_info
         except Exception as e:
             logger.error(f"❌ Anon client error: {e}")
@@ -503,37 +618,64 @@ def require_role(user_data: dict, allowed_roles: List[str]):
 async def root():
     return {"message": "SkyApp API avec Supabase - Opérationnel", "version": "2.0"}
 
+@app.get("/livez")
+@app.get("/api/livez")
+async def livez():
+    """Liveness : le processus répond (aucune dépendance interrogée)"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+@app.get("/api/readyz")
+async def readyz():
+    """Readiness : dernier résultat des sondes (base, IA, IOPOLE, tâches de fond), 503 si non prêt"""
+    snapshot = health_monitor.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
+
+def _check_metrics_access(request: Request):
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métriques désactivées (METRICS_ENABLED=0)")
+    if METRICS_TOKEN:
+        provided = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(provided.encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(status_code=401, detail="Token métriques invalide")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Exposition Prometheus : histogrammes de latence, codes HTTP, tailles, requêtes en cours"""
+    _check_metrics_access(request)
+    return PlainTextResponse(request_metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/summary", include_in_schema=False)
+async def metrics_summary(request: Request, min_count: int = Query(1, ge=1)):
+    """p50 / p95 / p99 par route (JSON), routes les plus lentes en premier"""
+    _check_metrics_access(request)
+    return {
+        "in_flight": request_metrics.in_flight,
+        "since": datetime.fromtimestamp(request_metrics.started_at, timezone.utc).isoformat(),
+        "routes": request_metrics.summary(min_count=min_count),
+    }
+
 @api_router.get("/health")
 async def health_check():
-    try:
-        # Initialiser le service IA si disponible
-        if AI_SERVICE_AVAILABLE and supabase_service is not None:
-            try:
-                init_ai_service(supabase_service)
-                logging.info("✅ Service IA initialisé")
-            except Exception as e:
-                logging.warning(f"⚠️ Impossible d'initialiser le service IA: {e}")
-        
-        # Vérifier l'accès DB via clé service si disponible
-        if supabase_service is not None:
-            try:
-                supabase_service.table("companies").select("id").limit(1).execute()
-                return {
-                    "status": "OK", 
-                    "database": "Connected", 
-                    "service": "SkyApp Supabase", 
-                    "mode": "service",
-                    "ai_service": AI_SERVICE_AVAILABLE,
-                    "iopole": IOPOLE_AVAILABLE
-                }
-            except Exception as e:
-                # Service key invalide
-                return {"status": "DEGRADED", "database": "ServiceKeyInvalid", "error": str(e), "service": "SkyApp Supabase", "mode": "anon"}
-        else:
-            # Pas de service key: API en mode dégradé mais opérationnelle
-            return {"status": "DEGRADED", "database": "ServiceKeyMissing", "service": "SkyApp Supabase", "mode": "anon"}
-    except Exception as e:
-        return {"status": "ERROR", "database": "Disconnected", "error": str(e)}
+    """Compatibilité : même format qu'avant, calculé depuis les sondes en cache"""
+    snapshot = health_monitor.snapshot()
+    database = snapshot["checks"].get("database")
+    if supabase_service is None:
+        # Pas de service key: API en mode dégradé mais opérationnelle
+        return {"status": "DEGRADED", "database": "ServiceKeyMissing", "service": "SkyApp Supabase", "mode": "anon"}
+    if database is None:
+        return {"status": "STARTING", "database": "Unknown", "service": "SkyApp Supabase", "mode": "service"}
+    if database["status"] != "ok":
+        return {"status": "DEGRADED", "database": "ServiceKeyInvalid", "error": database.get("error"), "service": "SkyApp Supabase", "mode": "anon"}
+    return {
+        "status": "OK",
+        "database": "Connected",
+        "service": "SkyApp Supabase",
+        "mode": "service",
+        "ai_service": AI_SERVICE_AVAILABLE,
+        "iopole": IOPOLE_AVAILABLE,
+        "checked_at": database["checked_at"]
+    }
 
 # Routes d'authentification
 @api_router.post("/auth/register")
@@ -741,10 +883,6 @@ async def list_searches(
 
     Rétro‑compat: si `page` absent => retourne simplement la liste (comme avant).
     """
-    logger.info("=" * 80)
-    logger.info("🚀 ENTRÉE DANS list_searches() - FONCTION APPELÉE !")
-    logger.info("=" * 80)
-    
     try:
         if supabase_service is None:
             raise HTTPException(status_code=503, detail="Service key manquante - impossible de récupérer les recherches")
@@ -753,14 +891,7 @@ async def list_searches(
         role = (user_data.get("role") or "").upper()
         user_id = user_data.get('id')
         
-        logger.info(f"🟠 ========================================")
-        logger.info(f"🟠 list_searches appelé")
-        logger.info(f"🟠 User ID: {user_id}")
-        logger.info(f"🟠 Role: {role}")
-        logger.info(f"🟠 Company ID: {company_id}")
-        logger.info(f"🟠 ========================================")
-        
-        logging.info(f"🔍 list_searches - user_id={user_id}, role={role}, company_id={company_id}")
+        logger.debug("🔍 list_searches - user_id=%s, role=%s, company_id=%s", user_id, role, company_id)
 
         allowed_sort_fields = {"updated_at", "created_at", "status", "location"}
         if sort_by not in allowed_sort_fields:
@@ -772,14 +903,6 @@ async def list_searches(
         # - Admin/Bureau voient EN PLUS les recherches partagées (SHARED) des autres
         
         if role in ["ADMIN", "BUREAU"]:
-            logger.info(f"🔵 ========================================")
-            logger.info(f"🔵 list_searches - Admin/Bureau (role={role})")
-            logger.info(f"🔵 User ID: {user_id}")
-            logger.info(f"🔵 Company ID: {company_id}")
-            logging.info(f"👑 list_searches - Admin/Bureau: Recherches personnelles + partagées (role={role})")
-            logging.info(f"   User ID: {user_id}")
-            logging.info(f"   Company ID: {company_id}")
-            
             # Récupérer MES recherches
             my_query = supabase_service.table("searches").select("*")
             if company_id:
@@ -807,32 +930,12 @@ async def list_searches(
             my_results = my_query.execute()
             shared_results = shared_query.execute()
             
-            logger.info(f"🔵 ✅ Mes recherches: {len(my_results.data or [])} trouvées")
-            for s in (my_results.data or [])[:3]:  # Afficher max 3
-                logger.debug(f"🔵    - {s.get('location', 'N/A')[:40]} | Status: {s.get('status')} | User: {s.get('user_id')[:8]}...")
-            
-            logger.info(f"🔵 ✅ Recherches partagées: {len(shared_results.data or [])} trouvées")
-            for s in (shared_results.data or [])[:3]:  # Afficher max 3
-                logger.debug(f"🔵    - {s.get('location', 'N/A')[:40]} | Status: {s.get('status')} | User: {s.get('user_id')[:8]}...")
-            
-            # Fusionner les résultats
-            all_items = (my_results.data or []) + (shared_results.data or [])
-            
-            logger.info(f"🔵 📋 Total à retourner: {len(all_items)} recherches")
-            logger.info(f"🔵 ========================================")
-            
-            logging.info(f"   ✅ Mes recherches: {len(my_results.data or [])} trouvées")
-            for s in (my_results.data or [])[:3]:  # Afficher max 3
-                logging.info(f"      - {s.get('location', 'N/A')[:40]} | Status: {s.get('status')} | User: {s.get('user_id')[:8]}...")
-            
-            logging.info(f"   ✅ Recherches partagées: {len(shared_results.data or [])} trouvées")
-            for s in (shared_results.data or [])[:3]:  # Afficher max 3
-                logging.info(f"      - {s.get('location', 'N/A')[:40]} | Status: {s.get('status')} | User: {s.get('user_id')[:8]}...")
-            
             # Fusionner les résultats
             all_items = (my_results.data or []) + (shared_results.data or [])
-            
-            logging.info(f"   📋 Total à retourner: {len(all_items)} recherches")
+            logger.info(
+                "📋 list_searches Admin/Bureau: %d personnelles + %d partagées",
+                len(my_results.data or []), len(shared_results.data or [])
+            )
             
             # Trier les résultats fusionnés
             all_items.sort(key=lambda x: x.get(sort_by, ''), reverse=desc)
@@ -848,8 +951,6 @@ async def list_searches(
             
         else:
             # Techniciens : uniquement leurs recherches
-            logging.info(f"🔒 list_searches - Technicien: Mes recherches uniquement (user_id={user_id})")
-            
             query = supabase_service.table("searches").select("*")
             if company_id:
                 query = query.eq("company_id", company_id)
@@ -1166,21 +1267,13 @@ async def get_searches(
         if not company_id:
             raise HTTPException(status_code=400, detail="company_id manquant")
         
-        logger.info(f"🟢 ========================================")
-        logger.info(f"🟢 /api/searches appelé (endpoint principal)")
-        logger.info(f"🟢 User ID: {user_id}")
-        logger.info(f"🟢 Role: {user_data.get('role', 'TECHNICIEN')}")
-        logger.info(f"🟢 ========================================")
-        
         # 🔒 FILTRE PAR RÔLE : 
         # - Admin/Bureau : MES recherches + SHARED des autres
         # - Technicien : MES recherches uniquement
         user_role = user_data.get("role", "TECHNICIEN")
+        logger.debug("🔍 get_searches - user_id=%s, role=%s, company_id=%s", user_id, user_role, company_id)
         
         if user_role in ["ADMIN", "BUREAU"]:
-            logger.info(f"🔵 Admin/Bureau détecté - Deux requêtes (mes recherches + SHARED)")
-            logging.info(f"👑 [/api/searches] Admin/Bureau: Mes recherches + SHARED des autres (role={user_role})")
-            
             # 1️⃣ MES recherches (tous statuts)
             my_query = supabase_service.table("searches").select("*").eq("company_id", company_id).eq("user_id", user_id)
             
@@ -1217,17 +1310,15 @@ async def get_searches(
             # Fusionner les résultats
             all_searches = (my_results.data or []) + (shared_results.data or [])
             
-            logger.info(f"🔵 Mes recherches: {len(my_results.data or [])} trouvées")
-            logger.info(f"🔵 Recherches SHARED: {len(shared_results.data or [])} trouvées")
-            logger.info(f"🔵 Total retourné: {len(all_searches)} recherches")
+            logger.info(
+                "📋 get_searches Admin/Bureau: %d personnelles + %d partagées",
+                len(my_results.data or []), len(shared_results.data or [])
+            )
             
             return {"data": all_searches, "count": len(all_searches)}
         
         else:
             # 👤 TECHNICIEN : Uniquement ses propres recherches
-            logger.info(f"🟡 Technicien détecté - Une seule requête (mes recherches)")
-            logging.info(f"🔒 [/api/searches] Technicien: Filtre par user_id={user_id}")
-            
             query = supabase_service.table("searches").select("*").eq("company_id", company_id).eq("user_id", user_id)
             
             if without_client:
@@ -1244,13 +1335,10 @@ async def get_searches(
                 query = query.is_("project_id", None)
             
             result = query.order("created_at", desc=True).execute()
-            
-            logger.info(f"🟡 Résultats technicien: {len(result.data or [])} recherches")
-            
             return {"data": result.data or [], "count": len(result.data or [])}
     
     except Exception as e:
-        logging.error(f"Error fetching searches: {e}")
+        logger.error("❌ Erreur récupération recherches: %s", e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 @app.get("/api/projects")
@@ -1289,435 +1377,6 @@ async def get_projects(
         logging.error(f"Error fetching projects: {e}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
-# ============================================================================
-# ENDPOINTS IA INTELLIGENTS - Architecture économique GPT-4o-mini (95%)
-# ============================================================================
-
-class AIQueryModel(BaseModel):
-    """Requête IA universelle"""
-    query: str = Field(..., description="Question ou commande en langage naturel")
-    conversation_history: Optional[List[Dict]] = Field(default=None, description="Historique conversation (optionnel)")
-
-@api_router.post("/ai/query")
-async def ai_universal_query(data: AIQueryModel, user_data: dict = Depends(get_user_from_token)):
-    """
-    🤖 RECHERCHE UNIVERSELLE IA
-    
-    L'utilisateur pose une question en langage naturel:
-    - "Montre-moi les devis de Dupont à Mennecy"
-    - "Quelles sont les recherches terrain terminées la semaine dernière à St-Fargeau?"
-    - "Statistiques du mois"
-    
-    Architecture 2 étapes:
-    1. Filtrage local Supabase (pas de coût IA)
-    2. IA décide sur 3-10 résultats max
-    
-    Modèle: GPT-4o-mini (95% des requêtes) - ultra économique
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {
-                "success": False,
-                "message": "Service IA non disponible. Contactez l'administrateur."
-            }
-        
-        company_id = await get_user_company(user_data)
-        if not company_id:
-            raise HTTPException(status_code=400, detail="Entreprise non trouvée")
-        
-        ai_service = get_ai_service()
-        result = await ai_service.universal_query(
-            company_id=company_id,
-            user_query=data.query,
-            user_role=user_data.get("role", "TECHNICIEN"),
-            conversation_history=data.conversation_history
-        )
-        
-        return result
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur AI query: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Erreur IA: {str(e)}")
-
-@api_router.post("/ai/devis")
-async def ai_generate_devis(
-    client_id: str = Query(..., description="ID du client"),
-    description: str = Query(..., description="Description des travaux"),
-    user_data: dict = Depends(get_user_from_token)
-):
-    """
-    📝 GÉNÉRATION AUTOMATIQUE DE DEVIS
-    
-    L'IA:
-    1. Cherche des devis similaires dans l'historique
-    2. Copie les lignes de travail pertinentes
-    3. Ajuste quantités et prix selon le contexte
-    4. Propose un devis pré-rempli prêt à valider
-    
-    Exemple:
-    - description: "Réparation fissure + traitement humidité 30m²"
-    - Retour: devis avec lignes, prix, TVA calculée
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {
-                "success": False,
-                "message": "Service IA non disponible"
-            }
-        
-        company_id = await get_user_company(user_data)
-        if not company_id:
-            raise HTTPException(status_code=400, detail="Entreprise non trouvée")
-        
-        # Vérifier que le client appartient à l'entreprise
-        client_check = supabase_service.table("clients").select("id").eq("id", client_id).eq("company_id", company_id).execute()
-        if not client_check.data:
-            raise HTTPException(status_code=404, detail="Client non trouvé dans votre entreprise")
-        
-        ai_service = get_ai_service()
-        result = await ai_service._generate_devis_draft(company_id, client_id, description)
-        
-        return {
-            "success": True,
-            "devis_draft": result,
-            "message": "Brouillon de devis généré. Vérifiez et ajustez avant validation."
-        }
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur génération devis IA: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.post("/ai/planning")
-async def ai_planning_assistant(
-    action: str = Query(..., description="suggest_slots | detect_conflicts | optimize"),
-    date_from: Optional[str] = Query(None, description="Date début (ISO)"),
-    date_to: Optional[str] = Query(None, description="Date fin (ISO)"),
-    user_data: dict = Depends(get_user_from_token)
-):
-    """
-    📅 ASSISTANT PLANNING INTELLIGENT
-    
-    Actions:
-    - suggest_slots: Propose créneaux optimaux pour techniciens disponibles
-    - detect_conflicts: Détecte conflits dans le planning
-    - optimize: Optimise les déplacements et l'organisation
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {"success": False, "message": "Service IA non disponible"}
-        
-        company_id = await get_user_company(user_data)
-        
-        # Pour l'instant, utiliser la recherche planning standard
-        ai_service = get_ai_service()
-        filters = {}
-        if date_from:
-            filters["date_from"] = date_from
-        if date_to:
-            filters["date_to"] = date_to
-        
-        schedules = await ai_service._search_planning(company_id, filters)
-        
-        if action == "detect_conflicts":
-            # Détecter conflits (même technicien, même jour, heures qui se chevauchent)
-            conflicts = []
-            for i, s1 in enumerate(schedules):
-                for s2 in schedules[i+1:]:
-                    if s1.get("user_id") == s2.get("user_id") and s1.get("date") == s2.get("date"):
-                        conflicts.append({
-                            "schedule1": s1,
-                            "schedule2": s2,
-                            "reason": "Même technicien, même jour"
-                        })
-            
-            return {
-                "success": True,
-                "action": action,
-                "conflicts": conflicts,
-                "total_conflicts": len(conflicts)
-            }
-        
-        elif action == "suggest_slots":
-            # Suggérer créneaux libres
-            return {
-                "success": True,
-                "action": action,
-                "message": "Fonctionnalité en développement - bientôt disponible",
-                "current_schedules": len(schedules)
-            }
-        
-        else:
-            return {
-                "success": True,
-                "action": action,
-                "schedules": schedules,
-                "total": len(schedules)
-            }
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur planning IA: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.post("/ai/rapport/{search_id}")
-async def ai_analyze_rapport(
-    search_id: str,
-    user_data: dict = Depends(get_user_from_token)
-):
-    """
-    📊 ANALYSE INTELLIGENTE DE RAPPORT TERRAIN
-    
-    L'IA (GPT-4o pour documents complexes):
-    - Résume immédiatement le rapport
-    - Détecte problèmes et anomalies
-    - Évalue la dangerosité/urgence
-    - Recommande actions à faire
-    - Identifie matériel nécessaire
-    
-    Exemple:
-    - Input: "Fissure mur porteur + humidité 30%"
-    - Output: Analyse détaillée + recommandations + niveau urgence
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {"success": False, "message": "Service IA non disponible"}
-        
-        company_id = await get_user_company(user_data)
-        
-        # Vérifier que la recherche appartient à l'entreprise
-        search_check = supabase_service.table("searches").select("id").eq("id", search_id).eq("company_id", company_id).execute()
-        if not search_check.data:
-            raise HTTPException(status_code=404, detail="Rapport non trouvé dans votre entreprise")
-        
-        ai_service = get_ai_service()
-        analysis = await ai_service._analyze_rapport(company_id, search_id)
-        
-        return {
-            "success": True,
-            "search_id": search_id,
-            "analysis": analysis,
-            "message": "Rapport analysé par IA"
-        }
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur analyse rapport IA: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.get("/ai/client/{client_id}/insights")
-async def ai_client_insights(
-    client_id: str,
-    user_data: dict = Depends(get_user_from_token)
-):
-    """
-    👤 INSIGHTS CLIENT INTELLIGENTS
-    
-    Analyse:
-    - Historique achats et comportement
-    - Chiffre d'affaires généré
-    - Fréquence et régularité
-    - Recommandations (relance, offre spéciale, etc.)
-    - Détection client "important" ou "à risque"
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {"success": False, "message": "Service IA non disponible"}
-        
-        company_id = await get_user_company(user_data)
-        
-        ai_service = get_ai_service()
-        client_details = await ai_service._get_client_details(company_id, client_id)
-        
-        if not client_details:
-            raise HTTPException(status_code=404, detail="Client non trouvé")
-        
-        # Analyse basique (à enrichir avec GPT si besoin)
-        total_amount = client_details.get("total_amount", 0)
-        total_quotes = client_details.get("total_quotes", 0)
-        
-        insights = {
-            "client_id": client_id,
-            "total_amount": total_amount,
-            "total_quotes": total_quotes,
-            "average_quote": total_amount / max(1, total_quotes),
-            "status": "VIP" if total_amount > 10000 else "STANDARD" if total_amount > 2000 else "NOUVEAU",
-            "recommendations": []
-        }
-        
-        if total_quotes == 0:
-            insights["recommendations"].append("Premier devis - Bien accueillir ce nouveau client")
-        elif total_amount > 10000:
-            insights["recommendations"].append("Client VIP - Priorité maximale")
-        
-        return {
-            "success": True,
-            "insights": insights,
-            "client_details": client_details
-        }
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur insights client: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.get("/ai/predictions")
-async def ai_predictions(
-    prediction_type: str = Query("delays", description="delays | payment_defaults | stock_needs"),
-    user_data: dict = Depends(get_user_from_token)
-):
-    """
-    🔮 IA PRÉDICTIVE
-    
-    Prédictions basées sur l'historique:
-    - delays: Anticipe les retards de projets
-    - payment_defaults: Prédit défauts de paiement
-    - stock_needs: Anticipe besoins matériels
-    
-    Nécessite quelques mois de données pour précision.
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {"success": False, "message": "Service IA non disponible"}
-        
-        company_id = await get_user_company(user_data)
-        ai_service = get_ai_service()
-        
-        if prediction_type == "delays":
-            predictions = await ai_service._predict_delays(company_id)
-        else:
-            predictions = {
-                "message": f"Prédiction '{prediction_type}' en développement",
-                "available_soon": True
-            }
-        
-        return {
-            "success": True,
-            "prediction_type": prediction_type,
-            "predictions": predictions
-        }
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur prédictions IA: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.post("/ai/improve-text")
-async def ai_improve_text(
-    text: str = Query(..., description="Texte à améliorer (rapport technicien)"),
-    user_data: dict = Depends(get_user_from_token)
-):
-    """
-    ✨ CORRECTION ORTHOGRAPHIQUE & AMÉLIORATION TEXTE TECHNICIEN
-    
-    Améliore automatiquement les rapports techniciens:
-    - Correction orthographe et grammaire
-    - Réécriture professionnelle
-    - Clarification des phrases
-    - Terminologie BTP appropriée
-    
-    Exemple:
-    Entrée: "jai fé le travail ojourdui sa c bien passé"
-    Sortie: "J'ai effectué les travaux aujourd'hui. L'intervention s'est déroulée sans incident."
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {
-                "success": False,
-                "original": text,
-                "improved": text,
-                "message": "Service IA non disponible. Texte non modifié."
-            }
-        
-        ai_service = get_ai_service()
-        
-        # Utiliser GPT-4o-mini pour correction rapide et économique
-        messages = [
-            {
-                "role": "system",
-                "content": """Tu es un assistant qui améliore les rapports de techniciens BTP.
-
-RÈGLES:
-1. Corrige TOUTES les fautes d'orthographe et de grammaire
-2. Réécris de manière professionnelle mais concise
-3. Garde le sens exact du message original
-4. Utilise le vocabulaire BTP approprié
-5. Structure en phrases courtes et claires
-6. NE PAS inventer d'informations
-7. Si le texte est déjà correct, retourne-le tel quel
-
-FORMAT DE RÉPONSE:
-Retourne UNIQUEMENT le texte amélioré, sans préambule ni explication."""
-            },
-            {
-                "role": "user",
-                "content": f"Améliore ce rapport technicien:\n\n{text}"
-            }
-        ]
-        
-        result = await ai_service.chat_completion(messages, use_functions=False)
-        improved_text = result.choices[0].message.content.strip()
-        
-        return {
-            "success": True,
-            "original": text,
-            "improved": improved_text,
-            "tokens": result.usage.total_tokens,
-            "cost_euros": result.usage.total_tokens * 0.15 / 1000000
-        }
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur amélioration texte IA: {e}")
-        return {
-            "success": False,
-            "original": text,
-            "improved": text,
-            "message": f"Erreur: {str(e)}"
-        }
-
-@api_router.get("/ai/stats")
-async def ai_stats(user_data: dict = Depends(get_user_from_token)):
-    """
-    📊 STATISTIQUES D'UTILISATION IA
-    
-    Monitoring:
-    - Nombre de requêtes
-    - Cache hit rate
-    - Tokens utilisés
-    - Coût estimé
-    """
-    try:
-        if not AI_SERVICE_AVAILABLE:
-            return {"success": False, "message": "Service IA non disponible"}
-        
-        # Vérifier rôle ADMIN ou BUREAU
-        if user_data.get("role") not in ["ADMIN", "BUREAU"]:
-            raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
-        
-        ai_service = get_ai_service()
-        stats = ai_service.get_stats()
-        
-        return {
-            "success": True,
-            "stats": stats,
-            "mode": "simulation" if ai_service.simulation_mode else "production"
-        }
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"❌ Erreur stats IA: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
 @api_router.post("/invitations/{invitation_id}/accept")
 async def accept_invitation(invitation_id: str, user_data: dict = Depends(get_user_from_token)):
     """Accepte une invitation Supabase et rattache l'utilisateur à l'entreprise."""
@@ -2170,9 +1829,10 @@ async def get_user_by_id(user_id: str, user_data: dict = Depends(get_user_from_t
 @api_router.get("/worksites")
 async def get_worksites(
     client_id: Optional[str] = None,
+    include_progress: bool = False,
     user_data: dict = Depends(get_user_from_token)
 ):
-    """Récupérer la liste des chantiers avec détails complets"""
+    """Récupérer la liste des chantiers avec détails complets (include_progress : avancement calculé)"""
     try:
         company_id = await get_user_company(user_data)
         user_id = user_data.get("id")
@@ -2203,7 +1863,7 @@ async def get_worksites(
         # 🔄 AUTO-UPDATE : Passer en COMPLETED les chantiers dont la date de fin est dépassée
         from datetime import datetime, date
         today = date.today()
-        updated_ids = []
+        expired = []
         
         for worksite in (response.data or []):
             ws_status = (worksite.get("status") or "").upper()
@@ -2213,17 +1873,24 @@ async def get_worksites(
                 try:
                     end_dt = datetime.strptime(ws_end_date[:10], "%Y-%m-%d").date()
                     if end_dt < today:
-                        # Date de fin dépassée → mettre à jour en COMPLETED
-                        supabase_service.table("worksites").update({
-                            "status": "COMPLETED"
-                        }).eq("id", worksite["id"]).execute()
-                        worksite["status"] = "COMPLETED"
-                        updated_ids.append(worksite.get("title", worksite["id"]))
+                        expired.append(worksite)
                 except Exception as parse_err:
                     logging.warning(f"⚠️ Impossible de parser end_date '{ws_end_date}' pour worksite {worksite['id']}: {parse_err}")
         
-        if updated_ids:
-            logger.info(f"✅ Auto-COMPLETED: {len(updated_ids)} chantier(s) passé(s) en terminé: {updated_ids}")
+        if expired:
+            # Date de fin dépassée → COMPLETED, une seule mise à jour pour tous
+            supabase_service.table("worksites").update({
+                "status": "COMPLETED"
+            }).in_("id", [w["id"] for w in expired]).execute()
+            for worksite in expired:
+                worksite["status"] = "COMPLETED"
+            logger.info(f"✅ Auto-COMPLETED: {len(expired)} chantier(s) passé(s) en terminé: {[w.get('title', w['id']) for w in expired]}")
+        
+        # 📊 Avancement : valeur persistée du jour, sinon une requête groupée (puis persistée)
+        if include_progress and response.data:
+            progress = await asyncio.to_thread(worksite_progress.current, company_id, response.data)
+            for worksite in response.data:
+                worksite["progress"] = progress.get(str(worksite["id"]), worksite.get("progress") or 0)
         
         return response.data
     except Exception as e:
@@ -2297,7 +1964,9 @@ async def create_worksite(worksite_data: dict, user_data: dict = Depends(get_use
             logging.info(f"👥 Équipe à affecter (pour usage futur): {team_id}")
         
         response = supabase_service.table("worksites").insert(clean_data).execute()
-        return response.data[0] if response.data else {}
+        created = response.data[0] if response.data else {}
+        planning_events.publish(WORKSITE_CREATED, company_id, worksite_id=created.get("id"))
+        return created
     except Exception as e:
         logging.error(f"❌ Erreur création worksite: {str(e)}")
         logging.error(f"❌ Type erreur: {type(e)}")
@@ -2306,62 +1975,11 @@ async def create_worksite(worksite_data: dict, user_data: dict = Depends(get_use
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du chantier: {str(e)}")
 
 async def calculate_worksite_progress(worksite_id: str, company_id: str) -> int:
-    """Calcule automatiquement le progrès d'un chantier basé sur les jours de planning"""
+    """Calcule automatiquement le progrès d'un chantier basé sur les jours de planning (persisté)"""
     try:
-        from datetime import datetime, date
-        
-        # Récupérer le chantier
-        worksite = supabase_service.table("worksites").select("*").eq("id", worksite_id).eq("company_id", company_id).execute()
-        if not worksite.data:
-            return 0
-        
-        worksite_data = worksite.data[0]
-        start_date = worksite_data.get('start_date')
-        end_date = worksite_data.get('end_date')
-        
-        # Si pas de dates définies, retourner 0
-        if not start_date or not end_date:
-            logging.info(f"📊 Chantier {worksite_id}: pas de dates définies")
-            return 0
-        
-        # Convertir les dates
-        if isinstance(start_date, str):
-            start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00')).date()
-        if isinstance(end_date, str):
-            end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00')).date()
-        
-        # Calculer le nombre total de jours
-        total_days = (end_date - start_date).days + 1
-        if total_days <= 0:
-            return 0
-        
-        # Récupérer les schedules pour ce chantier
-        schedules = supabase_service.table("schedules").select("*").eq("worksite_id", worksite_id).eq("company_id", company_id).execute()
-        
-        if not schedules.data:
-            logging.info(f"📊 Chantier {worksite_id}: aucun schedule trouvé")
-            return 0
-        
-        # Compter le nombre de jours uniques passés (date < aujourd'hui)
-        today = date.today()
-        completed_dates = set()
-        
-        for schedule in schedules.data:
-            schedule_date = schedule.get('date')
-            if schedule_date:
-                if isinstance(schedule_date, str):
-                    schedule_date = datetime.fromisoformat(schedule_date.replace('Z', '+00:00')).date()
-                
-                # Si la date du schedule est passée, on la compte
-                if schedule_date < today:
-                    completed_dates.add(schedule_date)
-        
-        completed_days = len(completed_dates)
-        progress = min(100, int((completed_days / total_days) * 100))
-        
-        logging.info(f"📊 Chantier {worksite_id}: {completed_days}/{total_days} jours = {progress}%")
+        progress = (await asyncio.to_thread(worksite_progress.refresh, company_id, [worksite_id])).get(str(worksite_id), 0)
+        logging.info(f"📊 Chantier {worksite_id}: {progress}%")
         return progress
-        
     except Exception as e:
         logging.error(f"❌ Erreur calcul progress: {str(e)}")
         return 0
@@ -2419,13 +2037,6 @@ async def update_worksite(worksite_id: str, worksite_data: dict, user_data: dict
             if field in clean_data and clean_data[field] == '':
                 clean_data[field] = None
         
-        # Calculer automatiquement le progress si des dates sont définies
-        if 'start_date' in clean_data or 'end_date' in clean_data:
-            # Recalculer avec les nouvelles dates
-            calculated_progress = await calculate_worksite_progress(worksite_id, company_id)
-            clean_data['progress'] = calculated_progress
-            logging.info(f"📊 Progress auto-calculé: {calculated_progress}%")
-        
         logging.info(f"✅ Données nettoyées: {clean_data}")
         
         # Si les dates changent, recréer les schedules associés
@@ -2484,9 +2095,18 @@ async def update_worksite(worksite_id: str, worksite_data: dict, user_data: dict
                 # Ne pas bloquer la mise à jour du chantier
         
         response = supabase_service.table("worksites").update(clean_data).eq("id", worksite_id).execute()
+        updated = response.data[0] if response.data else {}
+        
+        # Calculer automatiquement le progress avec les nouvelles dates (une fois le chantier et ses schedules à jour)
+        if 'start_date' in clean_data or 'end_date' in clean_data:
+            calculated_progress = await calculate_worksite_progress(worksite_id, company_id)
+            supabase_service.table("worksites").update({"progress": calculated_progress}).eq("id", worksite_id).execute()
+            updated["progress"] = calculated_progress
+            logging.info(f"📊 Progress auto-calculé: {calculated_progress}%")
         
         logging.info(f"✅ Chantier modifié avec succès")
-        return response.data[0] if response.data else {}
+        planning_events.publish(WORKSITE_UPDATED, company_id, worksite_id=worksite_id)
+        return updated
     except HTTPException:
         raise
     except Exception as e:
@@ -2509,6 +2129,7 @@ async def delete_worksite(worksite_id: str, user_data: dict = Depends(get_user_f
             raise HTTPException(status_code=404, detail="Chantier non trouvé ou accès refusé")
         
         supabase_service.table("worksites").delete().eq("id", worksite_id).execute()
+        planning_events.publish(WORKSITE_DELETED, company_id, worksite_id=worksite_id)
         return {"message": "Chantier supprimé avec succès"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du chantier: {str(e)}")
@@ -2918,15 +2539,21 @@ async def upload_search_photos(
             unique_filename = f"{uuid.uuid4()}{file_extension}"
             storage_path = f"{search_id}/{unique_filename}"
             
-            # Lire le contenu du fichier
-            content = await file.read()
+            # Copier le fichier en streaming dans un fichier temporaire
+            try:
+                stored = await save_upload_to_tempfile(file, max_bytes=MAX_PHOTO_SIZE)
+            except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
             
-            # Upload vers Supabase Storage
-            supabase_service.storage.from_(STORAGE_BUCKET).upload(
-                path=storage_path,
-                file=content,
-                file_options={"content-type": file.content_type}
-            )
+            # Upload vers Supabase Storage (lecture depuis le disque)
+            try:
+                supabase_service.storage.from_(STORAGE_BUCKET).upload(
+                    path=storage_path,
+                    file=stored.path,
+                    file_options={"content-type": file.content_type}
+                )
+            finally:
+                stored.path.unlink(missing_ok=True)
             
             # Générer l'URL publique signée (valide 1 an)
             signed_url = supabase_service.storage.from_(STORAGE_BUCKET).create_signed_url(
@@ -2942,6 +2569,8 @@ async def upload_search_photos(
                 "url": signed_url.get('signedURL') if signed_url else None,
                 "section_id": section_id,  # Lier la photo à sa section
                 "number": len(photos) + len(uploaded_files) + 1,
+                "size_bytes": stored.size_bytes,
+                "sha256": stored.sha256,
                 "uploaded_at": datetime.utcnow().isoformat()
             }
             
@@ -3050,824 +2679,6 @@ async def delete_search_photo(search_id: str, filename: str, user_data: dict = D
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur suppression photo: {str(e)}")
 
-# ============================================================================
-# GÉNÉRATION PDF POUR RECHERCHES
-# ============================================================================
-
-@api_router.get("/searches/{search_id}/pdf")
-async def generate_search_pdf(
-    search_id: str,
-    user_data: dict = Depends(get_user_from_token)
-):
-    """Générer un PDF professionnel pour une recherche terrain"""
-    import requests
-    import shutil
-    from reportlab.lib.enums import TA_LEFT, TA_RIGHT
-    from reportlab.lib.units import mm
-    
-    try:
-        logging.info(f"🔍 [PDF] START génération search_id={search_id}")
-        company_id = await get_user_company(user_data)
-        logging.info(f"📡 [PDF] Company ID: {company_id}")
-        
-        # Récupérer la recherche
-        logging.info(f"📥 [PDF] Récupération recherche...")
-        response = supabase_service.table("searches").select("*").eq("id", search_id).execute()
-        
-        if not response.data:
-            logging.error(f"❌ [PDF] Recherche introuvable")
-            raise HTTPException(status_code=404, detail="Recherche introuvable")
-        
-        search = response.data[0]
-        logging.info(f"✅ [PDF] Recherche: {search.get('location', 'N/A')}, photos: {len(search.get('photos', []))}")
-        
-        # Permissions
-        if company_id and search.get("company_id") != company_id:
-            raise HTTPException(status_code=403, detail="Accès refusé")
-        
-        # Récupérer les informations de l'entreprise
-        company_info = {}
-        if company_id:
-            try:
-                company_response = supabase_service.table("companies").select("*").eq("id", company_id).execute()
-                if company_response.data:
-                    company_info = company_response.data[0]
-                    logging.info(f"🏢 [PDF] Entreprise: {company_info.get('name', 'N/A')}")
-            except Exception as e:
-                logging.warning(f"⚠️ [PDF] Impossible de récupérer les infos entreprise: {e}")
-        
-        logging.info(f"📄 [PDF] Création buffer...")
-        
-        buffer = io.BytesIO()
-        
-        # Fonction pour ajouter pied de page avec numéros
-        def add_page_number(canvas, doc):
-            """Ajoute le numéro de page et les infos dans le pied de page"""
-            canvas.saveState()
-            # Pied de page
-            page_num_text = f"Page {doc.page}"
-            canvas.setFont('Helvetica', 8)
-            canvas.setFillColor(colors.Color(0.5, 0.5, 0.5))
-            canvas.drawString(2*cm, 1.5*cm, f"Référence: {search_id[:8].upper()}")
-            canvas.drawCentredString(A4[0]/2, 1.5*cm, page_num_text)
-            canvas.drawRightString(A4[0] - 2*cm, 1.5*cm, f"{datetime.now().strftime('%d/%m/%Y')}")
-            # Ligne de séparation
-            canvas.setStrokeColor(colors.Color(0.85, 0.85, 0.85))
-            canvas.setLineWidth(0.5)
-            canvas.line(2*cm, 1.8*cm, A4[0] - 2*cm, 1.8*cm)
-            canvas.restoreState()
-        
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2.5*cm, bottomMargin=2.5*cm, 
-                               leftMargin=2*cm, rightMargin=2*cm)
-        
-        story = []
-        styles = getSampleStyleSheet()
-        primary_color = colors.HexColor("#6366f1")
-        
-        logging.info(f"📝 [PDF] Construction contenu professionnel...")
-        
-        # COULEURS MODERNES ET ÉLÉGANTES
-        dark_indigo = colors.Color(0.26, 0.31, 0.71)  # #4350B5
-        light_indigo = colors.Color(0.38, 0.40, 0.93)  # #6166ED  
-        soft_gray = colors.Color(0.18, 0.20, 0.25)     # #2E3440
-        accent_teal = colors.Color(0.13, 0.69, 0.67)   # #22B0AD
-        accent_orange = colors.Color(0.95, 0.51, 0.20) # #F28234
-        success_green = colors.Color(0.13, 0.77, 0.29) # #22C54A
-        warning_red = colors.Color(0.93, 0.26, 0.26)   # #ED4242
-        
-        search_type = search.get('search_type', 'TERRAIN').upper()
-        type_label = "RECHERCHE D'INFILTRATION" if search_type == 'INFILTRATION' else "RECHERCHE DE FUITE"
-        
-        # ==================== PAGE DE GARDE ====================
-        logging.info(f"📄 [PDF] Création page de garde...")
-        
-        story.append(Spacer(1, 3*cm))
-        
-        # Logo ou nom entreprise centré
-        if company_info.get('name'):
-            company_style = ParagraphStyle('Company', parent=styles['Normal'],
-                                         fontSize=18, textColor=dark_indigo, alignment=TA_CENTER,
-                                         fontName='Helvetica-Bold', spaceAfter=10)
-            story.append(Paragraph(company_info['name'].upper(), company_style))
-        
-        story.append(Spacer(1, 1*cm))
-        
-        # Ligne de séparation
-        line_table = Table([['_' * 80]], colWidths=[15*cm])
-        line_table.setStyle(TableStyle([
-            ('TEXTCOLOR', (0, 0), (-1, -1), light_indigo),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ]))
-        story.append(line_table)
-        story.append(Spacer(1, 1*cm))
-        
-        # Titre principal
-        title_cover = ParagraphStyle('TitleCover', parent=styles['Normal'],
-                                    fontSize=32, textColor=dark_indigo, alignment=TA_CENTER,
-                                    fontName='Helvetica-Bold', leading=40, spaceAfter=20)
-        story.append(Paragraph(f"RAPPORT DE<br/>{type_label}", title_cover))
-        
-        story.append(Spacer(1, 2*cm))
-        
-        # Informations principales
-        cover_info_style = ParagraphStyle('CoverInfo', parent=styles['Normal'],
-                                         fontSize=14, textColor=soft_gray, alignment=TA_CENTER,
-                                         fontName='Helvetica', leading=22)
-        
-        client_name = f"{search.get('prenom', '')} {search.get('nom', '')}".strip()
-        if client_name:
-            story.append(Paragraph(f"<b>Client:</b> {client_name}", cover_info_style))
-        
-        if search.get('location'):
-            story.append(Paragraph(f"<b>Localisation:</b> {search['location']}", cover_info_style))
-        
-        story.append(Spacer(1, 1*cm))
-        story.append(Paragraph(f"<b>Référence:</b> {search_id[:8].upper()}", cover_info_style))
-        story.append(Paragraph(f"<b>Date:</b> {datetime.now().strftime('%d/%m/%Y')}", cover_info_style))
-        
-        story.append(Spacer(1, 3*cm))
-        
-        # Coordonnées entreprise en bas
-        if company_info:
-            footer_style = ParagraphStyle('FooterCover', parent=styles['Normal'],
-                                         fontSize=9, textColor=colors.Color(0.5, 0.5, 0.5),
-                                         alignment=TA_CENTER, fontName='Helvetica')
-            
-            contact_lines = []
-            if company_info.get('address'):
-                contact_lines.append(company_info['address'])
-            if company_info.get('postal_code') and company_info.get('city'):
-                contact_lines.append(f"{company_info['postal_code']} {company_info['city']}")
-            if company_info.get('siret'):
-                contact_lines.append(f"SIRET: {company_info['siret']}")
-            
-            if contact_lines:
-                story.append(Paragraph('<br/>'.join(contact_lines), footer_style))
-        
-        # Mention confidentielle
-        conf_style = ParagraphStyle('Confidential', parent=styles['Normal'],
-                                   fontSize=8, textColor=colors.Color(0.6, 0.6, 0.6),
-                                   alignment=TA_CENTER, fontName='Helvetica-Oblique')
-        story.append(Spacer(1, 0.5*cm))
-        story.append(Paragraph("Document confidentiel - Usage strictement réservé au destinataire", conf_style))
-        
-        # Saut de page vers contenu
-        story.append(PageBreak())
-        
-        # ==================== ÉLÉMENTS DE DÉCORATION ====================
-        # Ligne décorative en haut de chaque section
-        def add_decorative_line(color=light_indigo):
-            """Ajoute une ligne décorative horizontale"""
-            line_data = [['']]
-            line = Table(line_data, colWidths=[17*cm], rowHeights=[0.15*cm])
-            line.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, -1), color),
-                ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                ('TOPPADDING', (0, 0), (-1, -1), 0),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-            ]))
-            return line
-        
-        # Ajout d'une ligne décorative au début du document
-        story.append(add_decorative_line(dark_indigo))
-        story.append(Spacer(1, 0.8*cm))
-        
-        # ==================== STYLES POUR LES SECTIONS ====================
-        heading_style = ParagraphStyle('CustomHeading', parent=styles['Heading2'],
-                                      fontSize=14, textColor=colors.white, spaceAfter=10, spaceBefore=15,
-                                      fontName='Helvetica-Bold', leftIndent=15, rightIndent=15,
-                                      borderPadding=10, backColor=dark_indigo,
-                                      borderWidth=0, borderRadius=6)
-        
-        # ===== PRÉPARATION: Organiser toutes les photos par section AVANT de construire le PDF =====
-        photos = search.get('photos', [])
-        photos_by_section_id = {}
-        profile_photo = None
-        photo_counter_global = 0
-        
-        if photos and len(photos) > 0:
-            logging.info(f"📷 [PDF] Organisation de {len(photos)} photos...")
-            for photo in photos:
-                # Filtrer photo de profil
-                if photo.get('is_profile'):
-                    profile_photo = photo
-                    logging.info(f"  🖼️ Photo de profil trouvée: {photo.get('filename')}")
-                    continue
-                    
-                section_id = photo.get('section_id', 'autres')
-                if section_id not in photos_by_section_id:
-                    photos_by_section_id[section_id] = []
-                photos_by_section_id[section_id].append(photo)
-            logging.info(f"  📁 {len(photos_by_section_id)} section(s) avec photos: {list(photos_by_section_id.keys())}")
-        
-        # FONCTION HELPER: Ajouter photos 2 PAR LIGNE
-        def add_section_photos_grid(section_name, photos_list, counter_start):
-            """Ajoute les photos d'une section en grille 2x2"""
-            photos_added = 0
-            photo_counter = counter_start
-            
-            if not photos_list or len(photos_list) == 0:
-                return photos_added, photo_counter
-            
-            logging.info(f"  📷 Ajout de {len(photos_list)} photo(s) pour section '{section_name}' (grille 2x2)")
-            
-            # Organiser en lignes de 2 photos
-            for i in range(0, len(photos_list), 2):
-                row_photos = photos_list[i:i+2]
-                row_elements = []
-                
-                for photo in row_photos:
-                    photo_counter += 1
-                    try:
-                        filename = photo.get('filename', '')
-                        photo_path = f"{search_id}/{filename}"
-                        
-                        logging.info(f"    📸 [{photo_counter}] {filename}")
-                        
-                        try:
-                            photo_data = supabase_service.storage.from_(STORAGE_BUCKET).download(photo_path)
-                            
-                            if len(photo_data) > 0:
-                                temp_path = ROOT_DIR / "uploads" / f"temp_{search_id}_{photo_counter}.jpg"
-                                temp_path.parent.mkdir(parents=True, exist_ok=True)
-                                temp_path.write_bytes(photo_data)
-                                
-                                # Image plus petite pour grille 2x2
-                                img = ReportLabImage(str(temp_path), width=7.5*cm, height=5.5*cm, kind='proportional')
-                                
-                                # Légende sous l'image
-                                caption = ""
-                                if photo.get('notes'):
-                                    caption = photo['notes'][:60] + ('...' if len(photo.get('notes', '')) > 60 else '')
-                                
-                                caption_style = ParagraphStyle('Caption', parent=styles['Normal'],
-                                                             fontSize=7.5, textColor=colors.Color(0.4, 0.4, 0.4),
-                                                             alignment=TA_CENTER, fontName='Helvetica-Oblique')
-                                
-                                caption_para = Paragraph(f"📷 Photo {photo_counter}<br/>{caption}" if caption else f"📷 Photo {photo_counter}", caption_style)
-                                
-                                # Conteneur photo + légende
-                                photo_cell = Table([[img], [caption_para]], colWidths=[8*cm], rowHeights=[5.8*cm, 1*cm])
-                                photo_cell.setStyle(TableStyle([
-                                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                    ('BOX', (0, 0), (0, 0), 1.5, light_indigo),
-                                    ('BACKGROUND', (0, 0), (0, 0), colors.Color(0.99, 0.99, 1)),
-                                    ('PADDING', (0, 0), (0, 0), 4),
-                                ]))
-                                
-                                row_elements.append(photo_cell)
-                                photos_added += 1
-                                logging.info(f"      ✅ Photo ajoutée")
-                            else:
-                                logging.warning(f"      ⚠️ Fichier vide")
-                        except Exception as e:
-                            logging.error(f"      ❌ Erreur: {e}")
-                            
-                    except Exception as e:
-                        logging.error(f"    ❌ Erreur photo: {e}")
-                        continue
-                
-                # Si on a des photos dans la ligne, les ajouter
-                if row_elements:
-                    # Compléter avec une cellule vide si nécessaire
-                    if len(row_elements) == 1:
-                        row_elements.append('')
-                    
-                    row_table = Table([row_elements], colWidths=[8.5*cm, 8.5*cm])
-                    row_table.setStyle(TableStyle([
-                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ]))
-                    story.append(row_table)
-                    story.append(Spacer(1, 0.4*cm))
-            
-            return photos_added, photo_counter
-        
-        # FONCTION HELPER: Ajouter photos d'une section
-        def add_section_photos(section_name, photos_list, counter_start):
-            """Ajoute les photos d'une section avec mise en forme élégante"""
-            photos_added = 0
-            photo_counter = counter_start
-            
-            if not photos_list or len(photos_list) == 0:
-                return photos_added, photo_counter
-            
-            logging.info(f"  📷 Ajout de {len(photos_list)} photo(s) pour section '{section_name}'")
-            
-            for photo in photos_list:
-                photo_counter += 1
-                try:
-                    filename = photo.get('filename', '')
-                    photo_path = f"{search_id}/{filename}"
-                    
-                    logging.info(f"    📸 [{photo_counter}] {filename}")
-                    
-                    try:
-                        photo_data = supabase_service.storage.from_(STORAGE_BUCKET).download(photo_path)
-                        
-                        if len(photo_data) > 0:
-                            temp_path = ROOT_DIR / "uploads" / f"temp_{search_id}_{photo_counter}.jpg"
-                            temp_path.parent.mkdir(parents=True, exist_ok=True)
-                            temp_path.write_bytes(photo_data)
-                            
-                            # Photos plus petites et élégantes
-                            img = ReportLabImage(str(temp_path), width=11*cm, height=7.5*cm, kind='proportional')
-                            
-                            # Conteneur avec design moderne
-                            img_container = Table([[img]], colWidths=[12*cm])
-                            img_container.setStyle(TableStyle([
-                                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                ('BOX', (0, 0), (-1, -1), 2, light_indigo),
-                                ('BACKGROUND', (0, 0), (-1, -1), colors.Color(0.99, 0.99, 1)),
-                                ('PADDING', (0, 0), (-1, -1), 6),
-                                ('TOPPADDING', (0, 0), (-1, -1), 6),
-                                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                            ]))
-                            
-                            story.append(img_container)
-                            story.append(Spacer(1, 0.15*cm))
-                            
-                            # Légende moderne
-                            if photo.get('notes'):
-                                notes_style = ParagraphStyle('PhotoNotes', parent=styles['Normal'],
-                                                           fontSize=8.5, leading=12, 
-                                                           textColor=colors.Color(0.35, 0.37, 0.42),
-                                                           alignment=TA_CENTER, fontName='Helvetica-Oblique',
-                                                           leftIndent=15, rightIndent=15)
-                                story.append(Paragraph(f'💬 {photo["notes"]}', notes_style))
-                            
-                            story.append(Spacer(1, 0.5*cm))
-                            photos_added += 1
-                            logging.info(f"      ✅ Photo ajoutée")
-                        else:
-                            logging.warning(f"      ⚠️ Fichier vide")
-                    except Exception as e:
-                        logging.error(f"      ❌ Erreur: {e}")
-                        
-                except Exception as e:
-                    logging.error(f"    ❌ Erreur photo: {e}")
-                    continue
-            
-            return photos_added, photo_counter
-        
-        # ===== SECTION 1: INFORMATIONS GÉNÉRALES (avec photo de profil) =====
-        story.append(add_decorative_line(colors.Color(0.90, 0.92, 0.98)))
-        story.append(Spacer(1, 0.4*cm))
-        story.append(Paragraph("📋 INFORMATIONS GÉNÉRALES", heading_style))
-        story.append(Spacer(1, 0.3*cm))
-        
-        # Construire les données du tableau
-        info_data = []
-        if search.get('nom') or search.get('prenom'):
-            nom = f"{search.get('prenom', '')} {search.get('nom', '')}".strip()
-            info_data.append(['Client', nom])
-        
-        info_data.extend([
-            ['Type de recherche', search_type],
-            ['Date de création', search.get('created_at', 'N/A')[:10] if search.get('created_at') else 'N/A'],
-            ['Statut', search.get('status', 'ACTIVE')],
-            ['Référence', search_id[:8].upper()],
-        ])
-        
-        # Si photo de profil, créer layout avec photo + tableau
-        if profile_photo:
-            try:
-                filename = profile_photo.get('filename', '')
-                photo_path = f"{search_id}/{filename}"
-                logging.info(f"🖼️ [PDF] Ajout photo de profil: {filename}")
-                
-                photo_data_bytes = supabase_service.storage.from_(STORAGE_BUCKET).download(photo_path)
-                if len(photo_data_bytes) > 0:
-                    temp_path = ROOT_DIR / "uploads" / f"temp_{search_id}_profile.jpg"
-                    temp_path.parent.mkdir(parents=True, exist_ok=True)
-                    temp_path.write_bytes(photo_data_bytes)
-                    
-                    # Photo de profil plus petite et élégante
-                    profile_img = ReportLabImage(str(temp_path), width=3*cm, height=3*cm, kind='proportional')
-                    
-                    # Conteneur photo avec bordure arrondie
-                    photo_container = Table([[profile_img]], colWidths=[3.2*cm])
-                    photo_container.setStyle(TableStyle([
-                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                        ('BOX', (0, 0), (-1, -1), 2, light_indigo),
-                        ('BACKGROUND', (0, 0), (-1, -1), colors.white),
-                        ('PADDING', (0, 0), (-1, -1), 4),
-                    ]))
-                    
-                    info_table = Table(info_data, colWidths=[5.2*cm, 11*cm])
-                    info_table.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.96, 0.97, 0.99)),
-                        ('TEXTCOLOR', (0, 0), (0, -1), dark_indigo),
-                        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                        ('FONTSIZE', (0, 0), (-1, -1), 9.5),
-                        ('PADDING', (0, 0), (-1, -1), 10),
-                        ('GRID', (0, 0), (-1, -1), 0.8, colors.Color(0.88, 0.90, 0.94)),
-                        ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
-                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ]))
-                    
-                    # Layout avec photo à gauche, tableau à droite
-                    layout_table = Table([[photo_container, info_table]], colWidths=[3.5*cm, 13.5*cm], rowHeights=[None])
-                    layout_table.setStyle(TableStyle([
-                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                        ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-                        ('LEFTPADDING', (0, 0), (0, 0), 0),
-                        ('RIGHTPADDING', (0, 0), (0, 0), 8),
-                    ]))
-                    story.append(layout_table)
-                    logging.info(f"  ✅ Photo de profil ajoutée à côté du tableau")
-                else:
-                    # Fallback sans photo
-                    info_table = Table(info_data, colWidths=[6*cm, 11*cm])
-                    info_table.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.94, 0.95, 1)),
-                        ('TEXTCOLOR', (0, 0), (0, -1), primary_color),
-                        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                        ('FONTSIZE', (0, 0), (-1, -1), 10),
-                        ('PADDING', (0, 0), (-1, -1), 14),
-                        ('LEFTPADDING', (0, 0), (0, -1), 18),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.Color(0.85, 0.85, 0.92)),
-                        ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
-                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ]))
-                    story.append(info_table)
-            except Exception as e:
-                logging.error(f"  ❌ Erreur photo profil: {e}")
-                # Fallback sans photo
-                info_table = Table(info_data, colWidths=[6*cm, 11*cm])
-                info_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.94, 0.95, 1)),
-                    ('TEXTCOLOR', (0, 0), (0, -1), primary_color),
-                    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                    ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 10),
-                    ('PADDING', (0, 0), (-1, -1), 14),
-                    ('LEFTPADDING', (0, 0), (0, -1), 18),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.Color(0.85, 0.85, 0.92)),
-                    ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-                story.append(info_table)
-        else:
-            # Pas de photo de profil
-            info_table = Table(info_data, colWidths=[6*cm, 11*cm])
-            info_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.94, 0.95, 1)),
-                ('TEXTCOLOR', (0, 0), (0, -1), primary_color),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('PADDING', (0, 0), (-1, -1), 14),
-                ('LEFTPADDING', (0, 0), (0, -1), 18),
-                ('GRID', (0, 0), (-1, -1), 1, colors.Color(0.85, 0.85, 0.92)),
-                ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 0.99, 1)]),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ]))
-            story.append(info_table)
-        
-        # Photos de la section general_info
-        general_photos = photos_by_section_id.get('general_info', [])
-        if general_photos:
-            story.append(Spacer(1, 0.6*cm))
-            added, photo_counter_global = add_section_photos_grid('Informations générales', general_photos, photo_counter_global)
-        
-        story.append(Spacer(1, 1*cm))
-        
-        # ===== SECTION 2: LOCALISATION & CLIENT =====
-        story.append(add_decorative_line(colors.Color(0.90, 0.98, 0.97)))
-        story.append(Spacer(1, 0.4*cm))
-        story.append(Paragraph("📍 LOCALISATION & CLIENT", heading_style))
-        story.append(Spacer(1, 0.3*cm))
-        
-        location_data = []
-        if search.get('location'):
-            location_data.append(['Adresse', search['location']])
-        if search.get('nom') or search.get('prenom'):
-            client = f"{search.get('prenom', '')} {search.get('nom', '')}".strip()
-            location_data.append(['Client', client])
-        
-        if location_data:
-            location_table = Table(location_data, colWidths=[5.5*cm, 11.5*cm])
-            location_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.Color(0.95, 0.99, 0.97)),
-                ('TEXTCOLOR', (0, 0), (0, -1), accent_teal),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 9.5),
-                ('PADDING', (0, 0), (-1, -1), 10),
-                ('LEFTPADDING', (0, 0), (0, -1), 15),
-                ('GRID', (0, 0), (-1, -1), 0.8, colors.Color(0.85, 0.94, 0.90)),
-                ('ROWBACKGROUNDS', (1, 0), (1, -1), [colors.white, colors.Color(0.99, 1, 0.99)]),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ]))
-            story.append(location_table)
-        else:
-            story.append(Paragraph("<i>Aucune information disponible</i>", styles['Normal']))
-        story.append(Spacer(1, 1*cm))
-        
-        # ===== SECTION 3: DESCRIPTION DE LA RECHERCHE + PHOTOS =====
-        if search.get('description'):
-            # PageBreak si la section a des photos pour tout garder ensemble
-            desc_photos = photos_by_section_id.get('description', [])
-            if desc_photos:
-                story.append(PageBreak())
-            
-            story.append(add_decorative_line(colors.Color(0.90, 0.92, 0.98)))
-            story.append(Spacer(1, 0.4*cm))
-            story.append(Paragraph("📝 DESCRIPTION DE LA RECHERCHE", heading_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            desc_style = ParagraphStyle('Description', parent=styles['Normal'],
-                                       fontSize=10, leading=16, spaceBefore=6, spaceAfter=6,
-                                       leftIndent=18, rightIndent=18, borderPadding=15,
-                                       backColor=colors.Color(0.98, 0.98, 0.99),
-                                       borderColor=light_indigo, borderWidth=1.5, borderRadius=6,
-                                       textColor=colors.Color(0.22, 0.24, 0.30))
-            
-            story.append(Paragraph(search['description'].replace('\n', '<br/>'), desc_style))
-            
-            # Photos de la section description (section_id = 'description')
-            desc_photos = photos_by_section_id.get('description', [])
-            if desc_photos:
-                story.append(Spacer(1, 0.6*cm))
-                added, photo_counter_global = add_section_photos_grid('Description', desc_photos, photo_counter_global)
-            
-            story.append(Spacer(1, 0.8*cm))
-        
-        # ===== SECTION 4: OBSERVATIONS ET REMARQUES + SECTIONS CUSTOM =====
-        # Parser le JSON observations qui contient {text: "...", customSections: [...]}
-        observations_text = ""
-        custom_sections_data = []
-        
-        if search.get('observations'):
-            try:
-                import json
-                observations_json = json.loads(search['observations'])
-                observations_text = observations_json.get('text', '')
-                custom_sections_data = observations_json.get('customSections', [])
-                logging.info(f"📦 [PDF] Observations parsées: texte={bool(observations_text)}, custom_sections={len(custom_sections_data)}")
-            except (json.JSONDecodeError, TypeError):
-                # Ancien format texte simple
-                observations_text = search['observations']
-                logging.info(f"⚠️ [PDF] Observations en ancien format texte")
-        
-        # Afficher la section observations (texte uniquement)
-        if observations_text:
-            # PageBreak si la section a des photos pour tout garder ensemble
-            obs_photos = photos_by_section_id.get('observations', [])
-            if obs_photos:
-                story.append(PageBreak())
-            
-            story.append(add_decorative_line(colors.Color(1, 0.95, 0.88)))
-            story.append(Spacer(1, 0.4*cm))
-            story.append(Paragraph("⚠️ OBSERVATIONS ET REMARQUES", heading_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            obs_style = ParagraphStyle('Observations', parent=styles['Normal'],
-                                      fontSize=10, leading=16, spaceBefore=6, spaceAfter=6,
-                                      leftIndent=18, rightIndent=18, borderPadding=15,
-                                      backColor=colors.Color(1, 0.97, 0.90),
-                                      borderColor=accent_orange, borderWidth=1.5, borderRadius=6,
-                                      textColor=colors.Color(0.38, 0.20, 0.05))
-            
-            story.append(Paragraph(observations_text.replace('\n', '<br/>'), obs_style))
-            
-            # Photos de la section observations (section_id = 'observations')
-            if obs_photos:
-                story.append(Spacer(1, 0.6*cm))
-                added, photo_counter_global = add_section_photos_grid('Observations', obs_photos, photo_counter_global)
-            
-            story.append(Spacer(1, 0.8*cm))
-        
-        # Afficher les sections personnalisées (custom)
-        if custom_sections_data:
-            logging.info(f"🎨 [PDF] Ajout de {len(custom_sections_data)} section(s) personnalisée(s)")
-            for custom_section in custom_sections_data:
-                section_id = custom_section.get('id', '')
-                section_title = custom_section.get('title', 'Section personnalisée')
-                section_value = custom_section.get('value', '')
-                
-                if section_value or section_id in photos_by_section_id:
-                    custom_photos = photos_by_section_id.get(section_id, [])
-                    
-                    # Toujours PageBreak pour garder titre, contenu et photos ensemble
-                    story.append(PageBreak())
-                    story.append(add_decorative_line(colors.Color(0.95, 0.90, 1)))
-                    story.append(Spacer(1, 0.4*cm))
-                    
-                    story.append(Paragraph(f"✨ {section_title.upper()}", heading_style))
-                    story.append(Spacer(1, 0.3*cm))
-                    
-                    # Contenu texte de la section custom
-                    if section_value:
-                        custom_style = ParagraphStyle('CustomSection', parent=styles['Normal'],
-                                                     fontSize=10, leading=16, spaceBefore=6, spaceAfter=6,
-                                                     leftIndent=18, rightIndent=18, borderPadding=15,
-                                                     backColor=colors.Color(0.98, 0.98, 1),
-                                                     borderColor=light_indigo, borderWidth=1.5, borderRadius=6,
-                                                     textColor=soft_gray)
-                        story.append(Paragraph(section_value.replace('\n', '<br/>'), custom_style))
-                    
-                    # Photos de cette section custom
-                    if custom_photos:
-                        story.append(Spacer(1, 0.6*cm))
-                        added, photo_counter_global = add_section_photos_grid(section_title, custom_photos, photo_counter_global)
-                    
-                    story.append(Spacer(1, 0.8*cm))
-        
-        # ===== SECTIONS SUPPLÉMENTAIRES: Sections personnalisées avec photos =====
-        # Définir les titres des sections standards
-        section_titles = {
-            'general_info': 'Informations Générales',
-            'description': 'Description de la Recherche',
-            'observations': 'Observations et Remarques',
-            'localisation': 'Localisation',
-            'equipements': 'Équipements',
-            'conditions_meteo': 'Conditions Météo',
-            'acces_difficultes': 'Accès et Difficultés',
-            'environnement': 'Environnement',
-            'securite': 'Sécurité',
-            'resultats': 'Résultats',
-            'conclusions': 'Conclusions',
-        }
-        
-        # Sections déjà affichées (sections de base + sections custom)
-        processed_sections = {'general_info', 'description', 'observations'}
-        
-        # Ajouter les IDs des sections custom aux sections déjà traitées
-        if custom_sections_data:
-            for cs in custom_sections_data:
-                if cs.get('id'):
-                    processed_sections.add(cs['id'])
-        
-        # Autres sections avec photos (sections standards restantes uniquement)
-        remaining_sections = {k: v for k, v in photos_by_section_id.items() if k not in processed_sections}
-        
-        if remaining_sections:
-            for section_id, section_photos in remaining_sections.items():
-                # Toujours PageBreak pour garder titre et photos ensemble
-                story.append(PageBreak())
-                story.append(add_decorative_line(colors.Color(0.90, 0.95, 1)))
-                story.append(Spacer(1, 0.4*cm))
-                
-                section_title = section_titles.get(section_id, section_id.replace('_', ' ').title())
-                story.append(Paragraph(f"📷 {section_title.upper()}", heading_style))
-                story.append(Spacer(1, 0.5*cm))
-                
-                # Ajouter les photos de cette section
-                added, photo_counter_global = add_section_photos_grid(section_title, section_photos, photo_counter_global)
-        
-        logging.info(f"✅ [PDF] Total photos ajoutées: {photo_counter_global}/{len(photos) if photos else 0}")
-
-
-        # ==================== SECTION SIGNATURES ====================
-        story.append(PageBreak())
-        story.append(add_decorative_line(colors.Color(1, 0.84, 0.0)))
-        story.append(Spacer(1, 0.4*cm))
-        story.append(Paragraph("✍️ SIGNATURES ET VALIDATION", heading_style))
-        story.append(Spacer(1, 0.8*cm))
-        
-        sig_text_style = ParagraphStyle('SigText', parent=styles['Normal'],
-                                       fontSize=10, textColor=soft_gray, fontName='Helvetica')
-        
-        # Tableau signatures
-        sig_data = [
-            [Paragraph("<b>Technicien</b>", sig_text_style), Paragraph("<b>Client</b>", sig_text_style)],
-            ['', ''],
-            ['', ''],
-            ['', ''],
-            [Paragraph("Nom: ___________________", sig_text_style), Paragraph("Nom: ___________________", sig_text_style)],
-            [Paragraph("Date: ___________________", sig_text_style), Paragraph("Date: ___________________", sig_text_style)],
-            [Paragraph("Signature:", sig_text_style), Paragraph("Signature:", sig_text_style)],
-        ]
-        
-        sig_table = Table(sig_data, colWidths=[8*cm, 8*cm], rowHeights=[0.7*cm, 3*cm, 0.1*cm, 0.1*cm, 0.7*cm, 0.7*cm, 0.7*cm])
-        sig_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.96, 0.97, 0.99)),
-            ('TEXTCOLOR', (0, 0), (-1, 0), dark_indigo),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('BOX', (0, 0), (-1, -1), 1, colors.Color(0.8, 0.8, 0.8)),
-            ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.Color(0.9, 0.9, 0.9)),
-            ('BOTTOMPADDING', (0, 1), (-1, 1), 30),
-            ('BOX', (0, 1), (-1, 1), 1.5, colors.Color(0.7, 0.7, 0.7)),
-        ]))
-        story.append(sig_table)
-        
-        story.append(Spacer(1, 1.5*cm))
-        
-        # Note finale
-        final_note_style = ParagraphStyle('FinalNote', parent=styles['Normal'],
-                                         fontSize=8, textColor=colors.Color(0.5, 0.5, 0.5),
-                                         alignment=TA_CENTER, fontName='Helvetica-Oblique',
-                                         leading=12)
-        
-        story.append(Paragraph(
-            "Ce rapport a été généré automatiquement par SkyApp.<br/>"
-            "Pour toute question ou réclamation, veuillez contacter le service client.",
-            final_note_style
-        ))
-        
-        logging.info(f"📝 [PDF] Construction document ({len(story)} éléments)...")
-        doc.build(story, onFirstPage=add_page_number, onLaterPages=add_page_number)
-        logging.info(f"✅ [PDF] Document construit")
-        
-        buffer.seek(0)
-        
-        # Nettoyer fichiers temporaires
-        try:
-            temp_files = list((ROOT_DIR / "uploads").glob(f"temp_{search_id}_*.jpg"))
-            if temp_files:
-                for f in temp_files:
-                    f.unlink()
-                logging.info(f"🧹 [PDF] {len(temp_files)} fichiers temporaires nettoyés")
-        except Exception as e:
-            logging.warning(f"⚠️ [PDF] Nettoyage: {e}")
-        
-        # Nom de fichier - nettoyer TOUS les caractères spéciaux
-        location = search.get('location', 'recherche')
-        # Supprimer retours à la ligne, tabs, etc
-        location = location.replace('\n', '').replace('\r', '').replace('\t', '')
-        # Remplacer espaces et slashes
-        location = location.replace(' ', '_').replace('/', '_').replace('\\', '_')
-        # Garder seulement les caractères alphanumériques et underscores
-        import re
-        location = re.sub(r'[^a-zA-Z0-9_-]', '', location)[:30]
-        
-        filename = f"rapport_{location}_{search_id[:8]}.pdf"
-        pdf_size = buffer.getbuffer().nbytes
-        logging.info(f"📤 [PDF] Envoi: {filename} ({pdf_size} bytes)")
-        
-        return StreamingResponse(buffer, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename={filename}"})
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"❌❌❌ [PDF] CRASH FATAL: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Erreur PDF: {str(e)}")
-
-# VERSION COMPLETE COMMENTEE TEMPORAIREMENT
-@api_router.get("/searches/{search_id}/pdf-FULL-DISABLED")
-async def generate_search_pdf_full_disabled(search_id: str, user_data: dict = Depends(get_user_from_token)):
-    """Version complète temporairement désactivée"""
-    import requests
-    
-    try:
-        company_id = await get_user_company(user_data)
-        response = supabase_service.table("searches").select("*").eq("id", search_id).execute()
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Recherche introuvable")
-        search = response.data[0]
-        if company_id and search.get("company_id") != company_id:
-            raise HTTPException(status_code=403, detail="Accès refusé")
-        company_settings = {}
-        try:
-            if company_id:
-                settings_resp = supabase_service.table("company_settings").select("*").eq("company_id", company_id).execute()
-                if settings_resp.data:
-                    company_settings = settings_resp.data[0]
-        except:
-            pass
-        
-        primary_color = colors.HexColor("#6366f1")
-        secondary_color = colors.HexColor("#333333")
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
-        story = []
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=22, textColor=primary_color, alignment=TA_CENTER, spaceAfter=20)
-        heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, textColor=primary_color, spaceAfter=10, spaceBefore=15)
-        normal_bold = ParagraphStyle('NormalBold', parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=10)
-        
-        # ===== EN-TÊTE AVEC LOGO ET INFORMATIONS SOCIÉTÉ =====
-        header_data = []
-        
-        if company_settings and company_settings.get("logo_url"):
-            # LOGO DÉSACTIVÉ pour test
-            pass
-        
-        return StreamingResponse(
-            buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Erreur génération PDF: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Erreur génération PDF: {str(e)}")
-
 # Routes pour les clients
 @api_router.get("/clients")
 async def get_clients(user_data: dict = Depends(get_user_from_token)):
@@ -4167,6 +2978,9 @@ async def create_quote(quote_data: dict, user_data: dict = Depends(get_user_from
         
         response = supabase_service.table("quotes").insert(new_quote).execute()
         logger.info(f"Devis créé avec succès: {response.data[0]}")
+        quote_index = _loaded_quote_index()
+        if quote_index is not None:
+            quote_index.upsert_quote(response.data[0])
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la création du devis: {str(e)}")
@@ -4216,14 +3030,19 @@ async def update_quote(quote_id: str, quote_data: dict, user_data: dict = Depend
         
         # Mise à jour
         response = supabase_service.table("quotes").update(update_data).eq("id", quote_id).execute()
+        quote_index = _loaded_quote_index()
         
         # Vérifier que la réponse contient des données
         if response.data and len(response.data) > 0:
+            if quote_index is not None:
+                quote_index.upsert_quote(response.data[0])
             return response.data[0]
         else:
             # Si pas de données retournées, récupérer le devis mis à jour
             updated = supabase_service.table("quotes").select("*").eq("id", quote_id).execute()
             if updated.data and len(updated.data) > 0:
+                if quote_index is not None:
+                    quote_index.upsert_quote(updated.data[0])
                 return updated.data[0]
             else:
                 raise HTTPException(status_code=500, detail="Erreur lors de la récupération du devis mis à jour")
@@ -4247,550 +3066,15 @@ async def delete_quote(quote_id: str, user_data: dict = Depends(get_user_from_to
         
         # Suppression
         supabase_service.table("quotes").delete().eq("id", quote_id).execute()
+        quote_index = _loaded_quote_index()
+        if quote_index is not None:
+            quote_index.remove_quote(company_id, quote_id)
         return {"message": "Devis supprimé avec succès"}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du devis: {str(e)}")
 
-@api_router.get("/quotes/{quote_id}/pdf")
-async def generate_quote_pdf(
-    quote_id: str,
-    user_data: dict = Depends(get_user_from_token)
-):
-    """Générer un PDF professionnel pour un devis"""
-    try:
-        company_id = await get_user_company(user_data)
-        if not company_id:
-            raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
-        
-        # Récupérer le devis
-        response = supabase_service.table("quotes").select("*").eq("id", quote_id).eq("company_id", company_id).execute()
-        
-        if not response.data:
-            raise HTTPException(status_code=404, detail="Devis introuvable")
-        
-        quote = response.data[0]
-        
-        # Log pour déboguer
-        logging.info(f"📄 Génération PDF pour devis: {quote.get('quote_number', quote_id)}")
-        logging.info(f"Client ID: {quote.get('client_id')}")
-        
-        # Vérifier et normaliser items
-        items = quote.get('items', [])
-        if items is None:
-            items = []
-        if not isinstance(items, list):
-            logging.warning(f"⚠️ Items n'est pas une liste: {type(items)}")
-            items = []
-        
-        logging.info(f"Items: {len(items)} articles")
-        
-        # Log des photos dans les items
-        for idx, item in enumerate(items):
-            has_photo = 'photo' in item and item['photo'] is not None
-            logging.info(f"  Article {idx+1}: {item.get('name', 'Sans nom')} - Photo: {'✓' if has_photo else '✗'}")
-        
-        # Récupérer les informations de l'entreprise depuis company_settings
-        company_info = {}
-        company_response = supabase_service.table("company_settings").select("*").eq("company_id", company_id).execute()
-        if company_response.data:
-            company_info = company_response.data[0]
-            logging.info(f"Entreprise: {company_info.get('company_name', 'N/A')}")
-            logging.info(f"Données entreprise: {company_info.keys()}")
-        
-        # Créer le PDF
-        buffer = io.BytesIO()
-        
-        def add_page_number(canvas_obj, doc_obj):
-            """Ajoute le pied de page avec infos société sur chaque page"""
-            canvas_obj.saveState()
-            page_width = A4[0]
-            left_margin = 1.5*cm
-            right_edge = page_width - 1.5*cm
-            usable_width = right_edge - left_margin
-            mid_x = page_width / 2
-            
-            # ==== ZONE SIGNATURES ====
-            # Labels signatures (fond gris clair)
-            canvas_obj.setFillColor(colors.HexColor('#f0f0f0'))
-            canvas_obj.rect(left_margin, 4.8*cm, usable_width/2 - 0.2*cm, 0.9*cm, fill=1, stroke=0)
-            canvas_obj.rect(mid_x + 0.1*cm, 4.8*cm, usable_width/2 - 0.2*cm, 0.9*cm, fill=1, stroke=0)
-            
-            # Texte signatures
-            canvas_obj.setFillColor(colors.black)
-            canvas_obj.setFont('Helvetica-Bold', 8)
-            canvas_obj.drawCentredString(left_margin + usable_width/4, 5.35*cm, "Bon pour accord")
-            canvas_obj.setFont('Helvetica', 6)
-            canvas_obj.drawCentredString(left_margin + usable_width/4, 5.05*cm, "(Date, Cachet, Signature)")
-            canvas_obj.setFont('Helvetica-Bold', 8)
-            canvas_obj.drawCentredString(mid_x + usable_width/4, 5.35*cm, "Signature chargé d'affaire")
-            
-            # ==== LIGNE DE SÉPARATION FOOTER ====
-            canvas_obj.setStrokeColor(colors.black)
-            canvas_obj.setLineWidth(1.2)
-            canvas_obj.line(left_margin, 2.2*cm, right_edge, 2.2*cm)
-            
-            # Nom de l'entreprise
-            canvas_obj.setFont('Helvetica-Bold', 7)
-            canvas_obj.setFillColor(colors.black)
-            company_name = company_info.get('company_name', '')
-            if company_name:
-                canvas_obj.drawCentredString(mid_x, 1.85*cm, company_name)
-            
-            # Infos contact (adresse, tél, email)
-            canvas_obj.setFont('Helvetica', 6)
-            canvas_obj.setFillColor(colors.HexColor('#444444'))
-            contact_parts = []
-            if company_info.get('address'):
-                contact_parts.append(company_info['address'])
-            if company_info.get('phone'):
-                contact_parts.append(f"Tél : {company_info['phone']}")
-            if company_info.get('email'):
-                contact_parts.append(company_info['email'])
-            if contact_parts:
-                canvas_obj.drawCentredString(mid_x, 1.5*cm, " - ".join(contact_parts))
-            
-            # Infos légales (forme juridique, SIRET, RCS, TVA)
-            legal_parts = []
-            if company_info.get('legal_form'):
-                legal_parts.append(company_info['legal_form'])
-            if company_info.get('siret'):
-                legal_parts.append(f"Siret : {company_info['siret']}")
-            if company_info.get('rcs_rm'):
-                legal_parts.append(company_info['rcs_rm'])
-            if company_info.get('tva_number'):
-                legal_parts.append(f"N° TVA : {company_info['tva_number']}")
-            if legal_parts:
-                canvas_obj.drawCentredString(mid_x, 1.15*cm, " - ".join(legal_parts))
-            
-            # Numéro de page + date d'émission
-            canvas_obj.setFont('Helvetica', 5.5)
-            canvas_obj.setFillColor(colors.HexColor('#888888'))
-            canvas_obj.drawCentredString(mid_x, 0.7*cm, 
-                f"Page {doc_obj.page} - Document émis le {datetime.now().strftime('%d/%m/%Y à %H:%M')}")
-            
-            canvas_obj.restoreState()
-        
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=1*cm, bottomMargin=5.5*cm, 
-                               leftMargin=1.5*cm, rightMargin=1.5*cm)
-        
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # Styles personnalisés noir et blanc
-        primary_color = colors.black
-        accent_color = colors.black
-        dark_gray = colors.HexColor('#333333')
-        medium_gray = colors.HexColor('#666666')
-        
-        normal_style = ParagraphStyle('CustomNormal', parent=styles['Normal'],
-                                     fontSize=9, textColor=dark_gray)
-        
-        bold_style = ParagraphStyle('Bold', parent=styles['Normal'],
-                                   fontSize=9, textColor=colors.black, fontName='Helvetica-Bold')
-        
-        small_style = ParagraphStyle('Small', parent=styles['Normal'],
-                                    fontSize=8, textColor=dark_gray)
-        
-        # ==== EN-TÊTE STYLE PROFESSIONNEL ====
-        # Logo + Infos entreprise à gauche | Lieu/Date + Numéro devis à droite
-        
-        # Colonne gauche : Logo et infos entreprise
-        left_content = []
-        
-        # Logo si disponible
-        logo_loaded = False
-        if company_info.get('logo_url'):
-            try:
-                logo_path = company_info['logo_url']
-                # Si le chemin est relatif, utiliser le chemin local
-                if logo_path.startswith('/uploads/'):
-                    logo_path = str(ROOT_DIR / logo_path.lstrip('/'))
-                elif not logo_path.startswith('http'):
-                    # Chemin absolu local
-                    logo_path = str(ROOT_DIR / logo_path.lstrip('/'))
-                
-                # Vérifier que le fichier existe avant de créer l'image
-                from pathlib import Path
-                if Path(logo_path).exists():
-                    logo_img = ReportLabImage(logo_path, width=3*cm, height=3*cm, kind='proportional')
-                    left_content.append(logo_img)
-                    left_content.append(Spacer(1, 0.2*cm))
-                    logo_loaded = True
-                    logging.info(f"✅ Logo chargé: {logo_path}")
-                else:
-                    # Si le logo spécifié n'existe pas, chercher le plus récent dans le dossier
-                    logos_dir = ROOT_DIR / 'uploads' / 'logos'
-                    if logos_dir.exists():
-                        logo_files = sorted(logos_dir.glob(f"company_logo_{company_id}_*.png"), 
-                                          key=lambda x: x.stat().st_mtime, reverse=True)
-                        if logo_files:
-                            logo_img = ReportLabImage(str(logo_files[0]), width=3*cm, height=3*cm, kind='proportional')
-                            left_content.append(logo_img)
-                            left_content.append(Spacer(1, 0.2*cm))
-                            logo_loaded = True
-                            logging.info(f"✅ Logo le plus récent chargé: {logo_files[0]}")
-                        else:
-                            logging.warning(f"⚠️ Aucun logo trouvé pour l'entreprise {company_id}")
-                    else:
-                        logging.warning(f"⚠️ Logo introuvable: {logo_path}")
-            except Exception as e:
-                logging.error(f"Erreur chargement logo: {e}")
-                pass
-        
-        # Infos entreprise sous le logo
-        company_lines = []
-        if company_info.get('company_name'):
-            company_lines.append(f"<b><font size=12>{company_info['company_name']}</font></b>")
-        if company_info.get('legal_form'):
-            company_lines.append(f"<font color='#666666'>{company_info['legal_form']}</font>")
-        if company_info.get('address'):
-            company_lines.append(company_info['address'])
-        if company_info.get('postal_code') or company_info.get('city'):
-            postal = company_info.get('postal_code', '')
-            city = company_info.get('city', '')
-            company_lines.append(f"{postal} {city}".strip())
-        if company_info.get('phone'):
-            company_lines.append(f"<b>Tél : {company_info['phone']}</b>")
-        if company_info.get('email'):
-            company_lines.append(company_info['email'])
-        
-        if company_lines:
-            left_content.append(Paragraph("<br/>".join(company_lines), small_style))
-        
-        # Colonne droite : Lieu, Date et Numéro de devis
-        right_content = []
-        
-        # Ville et date
-        city_name = company_info.get('city', 'Paris').upper()
-        date_str = datetime.now().strftime('%d/%m/%Y')
-        right_content.append(Paragraph(f"<b>{city_name}, le {date_str}</b>", bold_style))
-        right_content.append(Spacer(1, 0.2*cm))
-        
-        # Numéro de devis
-        devis_num = Paragraph(f"<b><font size=14>Devis N° {quote.get('quote_number', 'N/A')}</font></b>", 
-                             ParagraphStyle('DevisNum', fontSize=14, fontName='Helvetica-Bold', alignment=TA_LEFT))
-        right_content.append(devis_num)
-        right_content.append(Spacer(1, 0.3*cm))
-        
-        # Section CLIENT - badge compact
-        client_badge = Table([[Paragraph("<b>CLIENT</b>", ParagraphStyle('CB', fontSize=9, textColor=colors.white, fontName='Helvetica-Bold'))]], 
-                            colWidths=[2.5*cm])
-        client_badge.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.black),
-            ('TOPPADDING', (0, 0), (-1, -1), 3),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ]))
-        right_content.append(client_badge)
-        right_content.append(Spacer(1, 0.15*cm))
-        
-        # Récupérer les infos du client
-        client_lines = []
-        if quote.get('client_id'):
-            try:
-                client_response = supabase_service.table("clients").select("*").eq("id", quote['client_id']).execute()
-                if client_response.data:
-                    client_info = client_response.data[0]
-                    
-                    # Nom complet
-                    if client_info.get('societe'):
-                        client_lines.append(f"<b>{client_info['societe']}</b>")
-                    
-                    full_name = []
-                    if client_info.get('prenom'):
-                        full_name.append(client_info['prenom'])
-                    if client_info.get('nom'):
-                        full_name.append(client_info['nom'])
-                    if full_name:
-                        client_lines.append(" ".join(full_name))
-                    
-                    # Adresse
-                    if client_info.get('adresse'):
-                        client_lines.append(client_info['adresse'])
-                    
-                    # Téléphone
-                    if client_info.get('telephone'):
-                        client_lines.append(f"Tél : {client_info['telephone']}")
-            except Exception as e:
-                logging.error(f"Erreur récupération client: {e}")
-        
-        if not client_lines and quote.get('client_name'):
-            client_lines.append(quote['client_name'])
-        
-        if client_lines:
-            right_content.append(Paragraph("<br/>".join(client_lines), small_style))
-        
-        # Créer le tableau header avec 2 colonnes
-        header_table = Table([[left_content, right_content]], colWidths=[9*cm, 9*cm])
-        header_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-            ('ALIGN', (1, 0), (1, 0), 'LEFT'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        
-        story.append(header_table)
-        story.append(Spacer(1, 0.3*cm))
-        
-        # ==== LIGNE DE SÉPARATION ====
-        line_table = Table([['']], colWidths=[18*cm])
-        line_table.setStyle(TableStyle([
-            ('LINEABOVE', (0, 0), (-1, 0), 2, colors.black),
-        ]))
-        story.append(line_table)
-        story.append(Spacer(1, 0.2*cm))
-        
-        # ==== AFFAIRE SUIVIE PAR ====
-        if company_info.get('contact_name') or company_info.get('contact_phone'):
-            affaire_text = "<b>Affaire suivie par :</b> "
-            if company_info.get('contact_name'):
-                affaire_text += f"{company_info['contact_name']}"
-            if company_info.get('contact_phone'):
-                affaire_text += f" - Tél : {company_info['contact_phone']}"
-            story.append(Paragraph(affaire_text, normal_style))
-            story.append(Spacer(1, 0.15*cm))
-        
-        # ==== ADRESSE DES TRAVAUX - badge compact ====
-        if quote.get('worksite_address'):
-            addr_badge = Table([[Paragraph("<b>ADRESSE DES TRAVAUX</b>", ParagraphStyle('AB', fontSize=8, textColor=colors.white, fontName='Helvetica-Bold'))]], 
-                              colWidths=[5*cm])
-            addr_badge.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, -1), colors.black),
-                ('TOPPADDING', (0, 0), (-1, -1), 3),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ]))
-            story.append(addr_badge)
-            story.append(Spacer(1, 0.1*cm))
-            story.append(Paragraph(quote['worksite_address'], normal_style))
-            story.append(Spacer(1, 0.2*cm))
-        
-        # ==== OBJET DES TRAVAUX - badge compact ====
-        if quote.get('title') or quote.get('description'):
-            obj_badge = Table([[Paragraph("<b>OBJET DES TRAVAUX</b>", ParagraphStyle('OB', fontSize=8, textColor=colors.white, fontName='Helvetica-Bold'))]], 
-                             colWidths=[5*cm])
-            obj_badge.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, -1), colors.black),
-                ('TOPPADDING', (0, 0), (-1, -1), 3),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-                ('LEFTPADDING', (0, 0), (-1, -1), 6),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ]))
-            story.append(obj_badge)
-            story.append(Spacer(1, 0.1*cm))
-            if quote.get('title'):
-                title_style = ParagraphStyle('WorkTitle', fontSize=9, textColor=colors.black, fontName='Helvetica-Bold')
-                story.append(Paragraph(quote['title'], title_style))
-            if quote.get('description'):
-                story.append(Paragraph(quote['description'], normal_style))
-            story.append(Spacer(1, 0.25*cm))
-        
-        # Items déjà normalisé au début de la fonction
-        if items:
-            total_ht = 0
-            total_tva = 0
-            
-            # En-tête du tableau principal avec couleurs professionnelles
-            header_style = ParagraphStyle('TableHeader', fontSize=9, textColor=colors.white, fontName='Helvetica-Bold', alignment=TA_CENTER)
-            table_data = [
-                [
-                    Paragraph("<b>N°</b>", header_style),
-                    Paragraph("<b>Désignation</b>", header_style),
-                    Paragraph("<b>Unité</b>", header_style),
-                    Paragraph("<b>Quantité</b>", header_style),
-                    Paragraph("<b>Prix HT</b>", header_style),
-                    Paragraph("<b>TVA</b>", header_style),
-                    Paragraph("<b>Total HT</b>", header_style)
-                ]
-            ]
-            
-            for item_idx, item in enumerate(items, 1):
-                qty = float(item.get('quantity', 0))
-                price = float(item.get('price', 0))
-                tva_rate = float(item.get('tva_rate', 20))
-                
-                item_total = qty * price
-                item_tva = item_total * (tva_rate / 100)
-                
-                total_ht += item_total
-                total_tva += item_tva
-                
-                # Description complète avec nom + description
-                desc_text = ""
-                if item.get('name'):
-                    desc_text = f"<b>{item['name']}</b>"
-                if item.get('description'):
-                    if desc_text:
-                        desc_text += f"<br/>{item['description']}"
-                    else:
-                        desc_text = item['description']
-                
-                # Ligne de l'article
-                table_data.append([
-                    Paragraph(str(item_idx), normal_style),
-                    Paragraph(desc_text, small_style),
-                    Paragraph(item.get('unit', 'Ens'), normal_style),
-                    Paragraph(f"{qty:.2f}", normal_style),
-                    Paragraph(f"{price:.2f} €", normal_style),
-                    Paragraph(f"{tva_rate:.0f}%", normal_style),
-                    Paragraph(f"{item_total:.2f} €", normal_style)
-                ])
-                
-                # Si l'article a une photo, l'ajouter sur la ligne suivante
-                if item.get('photo'):
-                    try:
-                        photo_data = item['photo'].get('data', '')
-                        if photo_data and ',' in photo_data:
-                            base64_str = photo_data.split(',')[1]
-                            img_data = base64.b64decode(base64_str)
-                            img_buffer = io.BytesIO(img_data)
-                            
-                            # Image plus petite pour s'intégrer dans le tableau
-                            img = ReportLabImage(img_buffer, width=6*cm, height=4.5*cm, kind='proportional')
-                            
-                            # Ligne pour la photo (span sur toutes les colonnes sauf la première)
-                            table_data.append([
-                                '',
-                                img,
-                                '',
-                                '',
-                                '',
-                                '',
-                                ''
-                            ])
-                    except Exception as e:
-                        logging.error(f"Erreur ajout photo dans tableau: {e}")
-            
-            # Créer le tableau avec les nouvelles largeurs et style professionnel
-            main_table = Table(table_data, colWidths=[1*cm, 7*cm, 1.5*cm, 1.5*cm, 2*cm, 1.5*cm, 2.5*cm])
-            main_table.setStyle(TableStyle([
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cccccc')),
-                ('LINEBELOW', (0, 0), (-1, 0), 2, colors.black),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.black),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-                ('ALIGN', (2, 0), (6, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 8),
-                ('TOPPADDING', (0, 0), (-1, -1), 4),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-                ('LEFTPADDING', (0, 0), (-1, -1), 3),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 3),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f5f5f5')]),
-            ]))
-            
-            story.append(main_table)
-            story.append(Spacer(1, 0.3*cm))
-            
-            # ==== TOTAUX À DROITE AVEC ENCADRÉ ====
-            total_ttc = total_ht + total_tva
-            
-            # Calculer le pourcentage de TVA (éviter division par zéro)
-            tva_percentage = (total_tva/total_ht*100) if total_ht > 0 else 0
-            
-            # Créer un tableau pour les montants (compact)
-            totals_header_style = ParagraphStyle('TotalsHeader', fontSize=8, textColor=colors.white, 
-                                                 fontName='Helvetica-Bold', alignment=TA_CENTER)
-            totals_left_style = ParagraphStyle('TotalsLeft', fontSize=9, leading=13, 
-                                              fontName='Helvetica', textColor=dark_gray)
-            totals_right_style = ParagraphStyle('TotalsRight', fontSize=9, leading=13, 
-                                               fontName='Helvetica', alignment=TA_RIGHT, textColor=dark_gray)
-            totals_ttc_style = ParagraphStyle('TotalsTTC', fontSize=11, leading=13, 
-                                             fontName='Helvetica-Bold', alignment=TA_RIGHT, textColor=colors.black)
-            
-            totals_data = [
-                [Paragraph("MONTANTS EN EUROS", totals_header_style)],
-                [Paragraph(f"Total H.T.<br/>Total T.V.A. {tva_percentage:.0f}%", totals_left_style)],
-                [Paragraph(f"<b>TOTAL T.T.C.</b>", ParagraphStyle('TTCLabel', fontSize=11, fontName='Helvetica-Bold', textColor=colors.black))],
-            ]
-            
-            amounts_data = [
-                [''],
-                [Paragraph(f"{total_ht:.2f} €<br/>{total_tva:.2f} €", totals_right_style)],
-                [Paragraph(f"<b>{total_ttc:.2f} €</b>", totals_ttc_style)],
-            ]
-            
-            # Tableau de gauche (labels)
-            totals_left = Table(totals_data, colWidths=[6*cm])
-            totals_left.setStyle(TableStyle([
-                ('BOX', (0, 0), (-1, -1), 1.5, colors.black),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.black),
-                ('BACKGROUND', (0, 2), (-1, 2), colors.HexColor('#eeeeee')),  # Fond jaune clair pour TTC
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('TOPPADDING', (0, 0), (-1, 0), 4),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
-                ('TOPPADDING', (0, 1), (-1, -1), 5),
-                ('BOTTOMPADDING', (0, 1), (-1, -1), 5),
-                ('LEFTPADDING', (0, 0), (-1, -1), 8),
-            ]))
-            
-            # Tableau de droite (montants)
-            totals_right = Table(amounts_data, colWidths=[5*cm])
-            totals_right.setStyle(TableStyle([
-                ('BOX', (0, 0), (-1, -1), 1.5, colors.black),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.black),
-                ('BACKGROUND', (0, 2), (-1, 2), colors.HexColor('#eeeeee')),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-                ('TOPPADDING', (0, 0), (-1, 0), 4),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 4),
-                ('TOPPADDING', (0, 1), (-1, -1), 5),
-                ('BOTTOMPADDING', (0, 1), (-1, -1), 5),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-            ]))
-            
-            # Assembler les deux tableaux côte à côte, alignés à droite
-            combined_totals = Table([[' ', totals_left, totals_right]], colWidths=[6*cm, 6*cm, 5*cm])
-            combined_totals.setStyle(TableStyle([
-                ('ALIGN', (1, 0), (-1, 0), 'RIGHT'),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ]))
-            
-            story.append(combined_totals)
-        
-        story.append(Spacer(1, 0.3*cm))
-        
-        # ==== MODALITÉS DE RÈGLEMENT (compact) ====
-        modalities_text = []
-        modalities_text.append("<b>MODALITÉS DE RÈGLEMENT</b>")
-        modalities_text.append("TVA AUTOLIQUIDATION : Article 283-2 du CGI | <b>Devis valable 30 JOURS</b> | Escompte anticipé : 0%")
-        
-        modalities_style = ParagraphStyle('Modalities', fontSize=7, textColor=dark_gray, leading=10)
-        modalities_para = Paragraph("<br/>".join(modalities_text), modalities_style)
-        story.append(modalities_para)
-        
-        # Construire le PDF (signatures + pied de page dessinés par add_page_number)
-        doc.build(story, onFirstPage=add_page_number, onLaterPages=add_page_number)
-        
-        buffer.seek(0)
-        
-        return StreamingResponse(
-            io.BytesIO(buffer.getvalue()),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename=Devis_{quote.get('quote_number', quote_id)}.pdf"
-            }
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        logging.error(f"Erreur génération PDF devis: {e}")
-        logging.error(f"Traceback complet:\n{error_detail}")
-        raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du PDF: {str(e)}")
-
-
 # Routes pour les templates de devis
 @api_router.get("/quote-templates")
 async def get_quote_templates(user_data: dict = Depends(get_user_from_token)):
@@ -4924,7 +3208,6 @@ async def send_invitation(invitation: dict, user_data: dict = Depends(get_user_f
         response = supabase_service.table("invitations").insert(new_invitation).execute()
         
         # Récupérer les infos pour l'email
-        from email_service import email_service
         company_response = supabase_service.table("companies").select("name").eq("id", company_id).limit(1).execute()
         company_name = company_response.data[0]["name"] if company_response.data else "Votre entreprise"
         
@@ -4939,18 +3222,19 @@ async def send_invitation(invitation: dict, user_data: dict = Depends(get_user_f
             invited_by_email = "un administrateur"
             invited_by_name = "un administrateur"
         
-        # Envoyer l'email d'invitation via notre service email
-        email_sent = False
+        # Mettre l'email d'invitation en file (envoyé en tâche de fond par l'outbox) :
+        # "queued" ne garantit pas la remise, le statut final est dans la table email_outbox
+        email_queued = False
         try:
-            email_sent = email_service.send_invitation_email(
+            email_queued = await asyncio.to_thread(email_outbox.enqueue, email_service.build_invitation_email(
                 to_email=email,
                 company_name=company_name,
                 role=role,
                 invited_by=invited_by_email,
                 invitation_token=token
-            )
-            if email_sent:
-                logging.info(f"✅ Email d'invitation envoyé à {email}")
+            ))
+            if email_queued:
+                logging.info(f"📧 Email d'invitation mis en file pour {email}")
             else:
                 logging.warning(f"⚠️ Email d'invitation non envoyé - Vérifiez la configuration SMTP")
         except Exception as e:
@@ -4963,10 +3247,10 @@ async def send_invitation(invitation: dict, user_data: dict = Depends(get_user_f
         }).eq("id", response.data[0]["id"]).execute()
         
         return {
-            "message": "Invitation créée avec succès" + (" - Email envoyé ✉️" if email_sent else " ⚠️ Email non envoyé - Partagez le lien manuellement"),
+            "message": "Invitation créée avec succès" + (" - Email en cours d'envoi ✉️" if email_queued else " ⚠️ Email non envoyé - Partagez le lien manuellement"),
             "invitation": response.data[0],
             "invitation_token": token,
-            "email_sent": email_sent,
+            "email_status": "queued" if email_queued else "not_sent",
             "accept_url": f"{os.getenv('FRONTEND_URL', 'http://localhost:3002')}/accept-invitation?token={token}"
         }
     except HTTPException:
@@ -5712,11 +3996,22 @@ async def update_schedule(schedule_id: str, schedule_data: dict, user_data: dict
         for field in allowed_fields:
             if field in schedule_data:
                 update_data[field] = schedule_data[field]
+        # Convertir les strings vides en None pour les UUIDs
+        for field in ("worksite_id", "team_leader_id", "collaborator_id"):
+            if field in update_data:
+                update_data[field] = update_data[field] or None
+        # Mêmes règles que PATCH : date/horaires valides, start_date/end_date synchronisées, conflits
+        update_data = _normalize_schedule_changes(update_data)
+        merged = {**existing.data[0], **update_data, "id": schedule_id}
+        if merged.get("collaborator_id") and any(k in update_data for k in ("date", "time", "collaborator_id")):
+            _ensure_no_schedule_conflict(company_id, merged)
         
         response = supabase_service.table("schedules").update(update_data).eq("id", schedule_id).execute()
         
         # Recalculer le progress du chantier si un worksite_id est présent
         worksite_id = update_data.get("worksite_id") or existing.data[0].get("worksite_id")
+        planning_events.publish(SCHEDULE_UPDATED, company_id, schedule_id=schedule_id, worksite_id=worksite_id,
+                                technician_ids=[existing.data[0].get("collaborator_id"), update_data.get("collaborator_id")])
         if worksite_id:
             try:
                 progress = await calculate_worksite_progress(worksite_id, company_id)
@@ -5752,6 +4047,8 @@ async def delete_schedule(schedule_id: str, user_data: dict = Depends(get_user_f
         
         # Supprimer
         supabase_service.table("schedules").delete().eq("id", schedule_id).execute()
+        planning_events.publish(SCHEDULE_DELETED, company_id, schedule_id=schedule_id, worksite_id=worksite_id,
+                                technician_ids=[existing.data[0].get("collaborator_id")])
         
         # Recalculer le progress du chantier si un worksite_id était présent
         if worksite_id:
@@ -5768,6 +4065,80 @@ async def delete_schedule(schedule_id: str, user_data: dict = Depends(get_user_f
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression du planning: {str(e)}")
 
+PLANNING_EVENTS_HEARTBEAT = 25.0  # secondes : commentaire SSE pour garder la connexion ouverte (proxies)
+
+@api_router.post("/planning/events/ticket")
+async def planning_events_ticket(user_data: dict = Depends(get_user_from_token)):
+    """Ticket de courte durée pour ouvrir le flux SSE (?ticket=) sans mettre le JWT dans l'URL"""
+    company_id = await get_user_company(user_data)
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    ticket = stream_tickets.issue(user_data["id"], user_data.get("role"), company_id)
+    return {"ticket": ticket, "expires_in": stream_tickets.ttl}
+
+@api_router.get("/planning/events")
+async def planning_events_stream(
+    request: Request,
+    scope: str = "company",
+    technician_id: Optional[str] = None,
+    ticket: Optional[str] = None,
+    last_event_id: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+):
+    """
+    Flux SSE des changements de plannings et de chantiers (schedule.*, worksite.*, resync).
+    Authentification une fois à l'ouverture : en-tête Authorization, ou ?ticket= obtenu par
+    POST /planning/events/ticket (EventSource ne permet pas d'en-tête). Bureau/Admin :
+    scope=company (défaut) ou scope=technician ; technicien : ses propres plannings.
+    Reprise après coupure via l'en-tête Last-Event-ID (ou ?last_event_id= pour un nouvel EventSource).
+    """
+    if credentials is None and ticket:
+        claims = stream_tickets.verify(ticket)
+        if claims is None:
+            raise HTTPException(status_code=401, detail="Ticket invalide ou expiré")
+        user_data = {"id": claims["sub"], "role": claims.get("role")}
+        company_id = claims["company_id"]
+    else:
+        user_data = await get_user_from_token(credentials)
+        company_id = await get_user_company(user_data)
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    if scope not in ("company", "technician"):
+        raise HTTPException(status_code=400, detail="scope doit valoir 'company' ou 'technician'")
+
+    if user_data.get("role") not in ("ADMIN", "BUREAU"):
+        if technician_id and technician_id != user_data.get("id"):
+            raise HTTPException(status_code=403, detail="Accès refusé")
+        scope, technician_id = "technician", user_data.get("id")
+    elif scope == "technician":
+        technician_id = technician_id or user_data.get("id")
+    else:
+        technician_id = None
+
+    subscription = await planning_events.subscribe(company_id, technician_id,
+                                                   request.headers.get("last-event-id") or last_event_id)
+    logging.info(f"📡 Abonnement événements planning: company={company_id} technicien={technician_id}")
+
+    async def body():
+        try:
+            ready = {"scope": scope, "technician_id": technician_id}
+            yield f"event: ready\ndata: {json.dumps(ready)}\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=PLANNING_EVENTS_HEARTBEAT)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                payload = json.dumps({k: v for k, v in event.items() if k != "company_id"}, default=str)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.get("/planning/my-missions")
 async def get_my_missions(user_data: dict = Depends(get_user_from_token)):
     """
@@ -5843,28 +4214,23 @@ async def create_mission_report(
         
         user_id = user_data.get('id')
         
-        # Créer le dossier uploads si nécessaire
-        os.makedirs("uploads", exist_ok=True)
-        
-        # Uploader les photos avant
-        photos_before_urls = []
-        for photo in photos_before:
-            if photo.filename:
-                filename = f"{uuid.uuid4()}_{photo.filename}"
-                filepath = os.path.join("uploads", filename)
-                with open(filepath, "wb") as f:
-                    f.write(await photo.read())
-                photos_before_urls.append(filename)
-        
-        # Uploader les photos après
-        photos_after_urls = []
-        for photo in photos_after:
-            if photo.filename:
-                filename = f"{uuid.uuid4()}_{photo.filename}"
-                filepath = os.path.join("uploads", filename)
-                with open(filepath, "wb") as f:
-                    f.write(await photo.read())
-                photos_after_urls.append(filename)
+        # Uploader les photos avant / après (écriture en streaming dans UPLOADS_DIR)
+        try:
+            photos_before_urls = []
+            for photo in photos_before:
+                if photo.filename:
+                    filename = f"{uuid.uuid4()}_{Path(photo.filename).name}"
+                    await save_upload_file(photo, UPLOADS_DIR / filename, max_bytes=MAX_PHOTO_SIZE)
+                    photos_before_urls.append(filename)
+            
+            photos_after_urls = []
+            for photo in photos_after:
+                if photo.filename:
+                    filename = f"{uuid.uuid4()}_{Path(photo.filename).name}"
+                    await save_upload_file(photo, UPLOADS_DIR / filename, max_bytes=MAX_PHOTO_SIZE)
+                    photos_after_urls.append(filename)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
         # Préparer les données du compte-rendu
         report_data = {
@@ -6297,6 +4663,7 @@ class CreateInvoiceModel(BaseModel):
     total_tva: Decimal
     total_ttc: Decimal
     notes: Optional[str] = None
+    transaction_category: str = 'b2b-fr'  # 'b2b-fr', 'b2c', 'export', 'intra-ue'
     lines: List[InvoiceLineModel]
 
 async def generate_invoice_number(company_id: str) -> str:
@@ -6341,6 +4708,8 @@ async def create_electronic_invoice(
             raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
         if not invoice.siren_client or len(invoice.siren_client) != 9 or not invoice.siren_client.isdigit():
             raise HTTPException(status_code=400, detail="SIREN client invalide (9 chiffres obligatoires)")
+        if invoice.transaction_category not in TRANSACTION_CATEGORIES:
+            raise HTTPException(status_code=400, detail=f"Catégorie invalide. Valeurs: {', '.join(TRANSACTION_CATEGORIES)}")
         invoice_number = await generate_invoice_number(company_id)
         invoice_data = {
             "company_id": company_id,
@@ -6360,6 +4729,7 @@ async def create_electronic_invoice(
             "direction": "outgoing",
             "payment_terms": invoice.payment_terms,
             "payment_method": invoice.payment_method,
+            "transaction_category": invoice.transaction_category,
             "created_by": user_data["sub"]
         }
         result = supabase_service.table("invoices_electronic").insert(invoice_data).execute()
@@ -6456,6 +4826,47 @@ async def get_electronic_invoice(
 # TRANSMISSION FACTURE AU PDP (IOPOLE)
 # =====================================================
 
+IOPOLE_BULK_CONCURRENCY = int(os.environ.get('IOPOLE_BULK_CONCURRENCY', '8'))
+IOPOLE_BULK_RATE_PER_SECOND = float(os.environ.get('IOPOLE_BULK_RATE_PER_SECOND', '5'))
+
+async def _transmit_invoice(invoice: dict, lines: List[dict], user_data: dict) -> dict:
+    """Formate, transmet une facture à IOPOLE puis met à jour son statut PDP"""
+    iopole_data = format_invoice_for_iopole(invoice, lines)
+    
+    logging.info(f"📤 Transmission facture {invoice['invoice_number']} vers IOPOLE...")
+    iopole_response = await iopole_client.send_invoice(iopole_data)
+    
+    update_data = {
+        "status_pdp": "transmitted",
+        "transmission_date": datetime.utcnow().isoformat(),
+        "pdp_reference": iopole_response.get('pdp_reference'),
+        "pdp_response": iopole_response,
+        "updated_at": datetime.utcnow().isoformat()
+    }
+    
+    supabase_service.table("invoices_electronic")\
+        .update(update_data)\
+        .eq("id", invoice["id"])\
+        .execute()
+    
+    await log_invoice_action(
+        invoice["id"],
+        "transmitted",
+        f"Facture transmise à IOPOLE: {iopole_response.get('pdp_reference')}",
+        user_data.get("sub")
+    )
+    
+    logging.info(f"✅ Facture {invoice['invoice_number']} transmise avec succès")
+    
+    return {
+        "success": True,
+        "message": "Facture transmise avec succès",
+        "pdp_reference": iopole_response.get('pdp_reference'),
+        "tracking_url": iopole_response.get('tracking_url'),
+        "timestamp": iopole_response.get('timestamp'),
+        "simulation": iopole_response.get('simulation', False)
+    }
+
 @api_router.patch("/invoices/electronic/{invoice_id}/transmit")
 async def transmit_invoice_to_pdp(
     invoice_id: str,
@@ -6514,57 +4925,109 @@ async def transmit_invoice_to_pdp(
         if not lines_result.data:
             raise HTTPException(status_code=400, detail="Facture sans lignes")
         
-        # 3. Formater pour IOPOLE
-        iopole_data = format_invoice_for_iopole(invoice, lines_result.data)
+        # 3-6. Formater, transmettre, mettre à jour et logger
+        return await _transmit_invoice(invoice, lines_result.data, user_data)
         
-        # 4. Transmettre à IOPOLE
-        logging.info(f"📤 Transmission facture {invoice['invoice_number']} vers IOPOLE...")
-        iopole_response = iopole_client.send_invoice(iopole_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Erreur transmission IOPOLE: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur transmission: {str(e)}")
+
+class BulkTransmitModel(BaseModel):
+    invoice_ids: List[str] = Field(..., min_length=1, max_length=500)
+
+@api_router.post("/invoices/electronic/transmit-bulk")
+async def transmit_invoices_bulk(
+    payload: BulkTransmitModel,
+    user_data: dict = Depends(get_user_from_token)
+):
+    """
+    Transmettre plusieurs factures électroniques au PDP (IOPOLE)
+    
+    Les factures et leurs lignes sont chargées en 2 requêtes, puis envoyées
+    en parallèle (IOPOLE_BULK_CONCURRENCY) sous une limite de débit
+    (IOPOLE_BULK_RATE_PER_SECOND). Le résultat est détaillé par facture.
+    """
+    try:
+        company_id = await get_user_company(user_data)
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
         
-        # 5. Mettre à jour la facture
-        update_data = {
-            "status_pdp": "transmitted",
-            "transmission_date": datetime.utcnow().isoformat(),
-            "pdp_reference": iopole_response.get('pdp_reference'),
-            "pdp_response": iopole_response,
-            "updated_at": datetime.utcnow().isoformat()
-        }
+        if not IOPOLE_AVAILABLE:
+            raise HTTPException(
+                status_code=503,
+                detail="Service IOPOLE non disponible. Contactez l'administrateur."
+            )
         
-        supabase_service.table("invoices_electronic")\
-            .update(update_data)\
-            .eq("id", invoice_id)\
+        invoice_ids = list(dict.fromkeys(payload.invoice_ids))
+        
+        invoices_result = supabase_service.table("invoices_electronic")\
+            .select("*")\
+            .eq("company_id", company_id)\
+            .in_("id", invoice_ids)\
             .execute()
+        invoices = {inv["id"]: inv for inv in (invoices_result.data or [])}
+        
+        lines_by_invoice: Dict[str, List[dict]] = {}
+        if invoices:
+            lines_result = supabase_service.table("invoice_lines")\
+                .select("*")\
+                .in_("invoice_id", list(invoices.keys()))\
+                .order("line_number")\
+                .execute()
+            for line in lines_result.data or []:
+                lines_by_invoice.setdefault(line["invoice_id"], []).append(line)
         
-        # 6. Logger l'action
-        await log_invoice_action(
-            invoice_id,
-            "transmitted",
-            f"Facture transmise à IOPOLE: {iopole_response.get('pdp_reference')}",
-            user_data.get("sub")
-        )
+        semaphore = asyncio.Semaphore(IOPOLE_BULK_CONCURRENCY)
+        limiter = AsyncRateLimiter(IOPOLE_BULK_RATE_PER_SECOND)
+        
+        async def transmit_one(invoice_id: str) -> dict:
+            invoice = invoices.get(invoice_id)
+            if invoice is None:
+                return {"invoice_id": invoice_id, "success": False, "error": "Facture non trouvée"}
+            if invoice.get('status_pdp') == 'transmitted':
+                return {
+                    "invoice_id": invoice_id,
+                    "success": True,
+                    "already_transmitted": True,
+                    "pdp_reference": invoice.get('pdp_reference')
+                }
+            lines = lines_by_invoice.get(invoice_id)
+            if not lines:
+                return {"invoice_id": invoice_id, "success": False, "error": "Facture sans lignes"}
+            async with semaphore:
+                await limiter.acquire()
+                try:
+                    result = await _transmit_invoice(invoice, lines, user_data)
+                    return {"invoice_id": invoice_id, **result}
+                except Exception as e:
+                    logging.error(f"❌ Erreur transmission IOPOLE {invoice_id}: {str(e)}")
+                    return {"invoice_id": invoice_id, "success": False, "error": str(e)}
         
-        logging.info(f"✅ Facture {invoice['invoice_number']} transmise avec succès")
+        results = await asyncio.gather(*(transmit_one(i) for i in invoice_ids))
+        transmitted = sum(1 for r in results if r.get("success") and not r.get("already_transmitted"))
+        failed = sum(1 for r in results if not r.get("success"))
         
         return {
-            "success": True,
-            "message": "Facture transmise avec succès",
-            "pdp_reference": iopole_response.get('pdp_reference'),
-            "tracking_url": iopole_response.get('tracking_url'),
-            "timestamp": iopole_response.get('timestamp'),
-            "simulation": iopole_response.get('simulation', False)
+            "success": failed == 0,
+            "total": len(results),
+            "transmitted": transmitted,
+            "failed": failed,
+            "results": results
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"❌ Erreur transmission IOPOLE: {str(e)}")
+        logging.error(f"❌ Erreur transmission groupée IOPOLE: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur transmission: {str(e)}")
 
 # =====================================================
 # WEBHOOK IOPOLE - Réception événements
 # =====================================================
 
-@app.post("/api/webhooks/iopole/received")
+@app.post("/api/webhooks/iopole/received", status_code=202)
 async def iopole_webhook_received(request: Request):
     """
     Recevoir les notifications IOPOLE (factures reçues, changements de statut)
@@ -6572,6 +5035,9 @@ async def iopole_webhook_received(request: Request):
     Ce webhook est appelé par IOPOLE quand :
     - Une nouvelle facture est reçue d'un fournisseur
     - Le statut d'une facture émise change (acceptée, rejetée, payée)
+    
+    L'événement brut est persisté dans l'inbox (dédupliqué) puis acquitté
+    immédiatement ; le traitement est fait en tâche de fond (webhook_inbox).
     """
     try:
         # Récupérer le corps de la requête
@@ -6587,45 +5053,74 @@ async def iopole_webhook_received(request: Request):
                 logging.warning("⚠️ Signature webhook IOPOLE invalide")
                 raise HTTPException(status_code=401, detail="Signature invalide")
         
-        event_type = data.get('event')
-        logging.info(f"📥 Webhook IOPOLE reçu: {event_type}")
-        
-        # Traiter selon le type d'événement
-        if event_type == 'invoice.received':
-            # Nouvelle facture reçue d'un fournisseur
-            invoice_data = data.get('data', {})
-            
-            # TODO: Télécharger le fichier PDF/XML
-            # TODO: Créer l'entrée dans invoices_received
-            # TODO: Notifier l'utilisateur
-            
-            logging.info(f"✅ Facture reçue: {invoice_data.get('invoice_number')}")
-            return {"status": "processed", "event": event_type}
+        if webhook_inbox is None:
+            raise HTTPException(status_code=503, detail="Inbox webhooks indisponible")
         
-        elif event_type == 'invoice.status_changed':
-            # Changement de statut d'une facture émise
-            pdp_reference = data.get('data', {}).get('invoice_reference')
-            new_status = data.get('data', {}).get('status')
-            
-            # Mettre à jour dans la base
-            supabase_service.table("invoices_electronic")\
-                .update({"status_pdp": new_status, "updated_at": datetime.utcnow().isoformat()})\
-                .eq("pdp_reference", pdp_reference)\
-                .execute()
-            
-            logging.info(f"✅ Statut facture {pdp_reference} mis à jour: {new_status}")
-            return {"status": "updated", "event": event_type}
+        event_type = data.get('event')
+        is_new = await webhook_inbox.enqueue(data, body, request.headers.get("X-IOPOLE-Event-Id"))
+        logging.info(f"📥 Webhook IOPOLE reçu: {event_type} ({'nouveau' if is_new else 'doublon'})")
         
-        else:
-            logging.warning(f"⚠️ Type d'événement inconnu: {event_type}")
-            return {"status": "unknown_event", "event": event_type}
+        return {"status": "accepted" if is_new else "duplicate", "event": event_type}
         
     except HTTPException:
         raise
     except Exception as e:
+        # 500 => IOPOLE renverra l'événement plus tard
         logging.error(f"❌ Erreur webhook IOPOLE: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+@api_router.get("/founder/webhooks/iopole/metrics")
+async def iopole_inbox_metrics(user_data: dict = Depends(get_user_from_token)):
+    """Métriques de l'inbox webhooks IOPOLE (profondeur, retard, échecs)"""
+    if not user_data.get('is_fondateur'):
+        raise HTTPException(status_code=403, detail="Accès réservé aux fondateurs")
+    if webhook_inbox is None:
+        raise HTTPException(status_code=503, detail="Inbox webhooks indisponible")
+    try:
+        return await asyncio.to_thread(webhook_inbox.get_metrics)
+    except Exception as e:
+        logger.error(f"Erreur métriques inbox IOPOLE: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/founder/email/outbox/metrics")
+async def email_outbox_metrics(user_data: dict = Depends(get_user_from_token)):
+    """Métriques de l'outbox email (profondeur de file, envois, emails abandonnés)"""
+    if not user_data.get('is_fondateur'):
+        raise HTTPException(status_code=403, detail="Accès réservé aux fondateurs")
+    try:
+        return await asyncio.to_thread(email_outbox.get_metrics)
+    except Exception as e:
+        logger.error(f"Erreur métriques outbox email: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/founder/email/outbox/replay")
+async def email_outbox_replay(payload: dict = None, user_data: dict = Depends(get_user_from_token)):
+    """Remettre en file les emails abandonnés (tous, ou `email_ids`)"""
+    if not user_data.get('is_fondateur'):
+        raise HTTPException(status_code=403, detail="Accès réservé aux fondateurs")
+    try:
+        email_ids = (payload or {}).get("email_ids")
+        replayed = await asyncio.to_thread(email_outbox.replay, email_ids)
+        return {"success": True, "replayed": replayed}
+    except Exception as e:
+        logger.error(f"Erreur replay outbox email: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/founder/webhooks/iopole/replay")
+async def iopole_inbox_replay(payload: dict = None, user_data: dict = Depends(get_user_from_token)):
+    """Rejouer les événements IOPOLE en échec (tous, ou `event_ids`)"""
+    if not user_data.get('is_fondateur'):
+        raise HTTPException(status_code=403, detail="Accès réservé aux fondateurs")
+    if webhook_inbox is None:
+        raise HTTPException(status_code=503, detail="Inbox webhooks indisponible")
+    try:
+        event_ids = (payload or {}).get("event_ids")
+        replayed = await asyncio.to_thread(webhook_inbox.replay, event_ids)
+        return {"success": True, "replayed": replayed}
+    except Exception as e:
+        logger.error(f"Erreur replay inbox IOPOLE: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # =====================================================
 # MODULE RÉCEPTION FACTURES
 # =====================================================
@@ -6678,13 +5173,12 @@ async def upload_received_invoice(
         file_extension = Path(file.filename).suffix
         file_path = upload_dir / f"{invoice_id}{file_extension}"
         
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        
-        # Calculer hash SHA256
-        import hashlib
-        pdf_hash = hashlib.sha256(content).hexdigest()
+        # Écriture en streaming avec calcul du hash SHA256 à la volée
+        try:
+            stored = await save_upload_file(file, file_path, max_bytes=MAX_INVOICE_SIZE)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        pdf_hash = stored.sha256
         
         # Insérer dans la base de données
         invoice_data = {
@@ -6702,7 +5196,7 @@ async def upload_received_invoice(
             "reception_method": "manual-upload",
             "status": "received",
             "pdf_file_path": str(file_path),
-            "file_size_bytes": len(content),
+            "file_size_bytes": stored.size_bytes,
             "pdf_hash": pdf_hash,
             "notes": notes,
             "created_by": user_data.get("sub")
@@ -6823,10 +5317,11 @@ class EReportingDeclarationModel(BaseModel):
     declaration_type: str  # 'b2c', 'export', 'intra-ue'
     period_start: date
     period_end: date
-    total_ht: Decimal
-    total_tva: Decimal
-    total_ttc: Decimal
-    operations_count: int
+    # Montants omis => pré-remplis depuis les factures de la période
+    total_ht: Optional[Decimal] = None
+    total_tva: Optional[Decimal] = None
+    total_ttc: Optional[Decimal] = None
+    operations_count: Optional[int] = None
     operations_details: Optional[List[dict]] = None
     notes: Optional[str] = None
 
@@ -6850,6 +5345,21 @@ async def create_ereporting_declaration(
         if declaration.period_end < declaration.period_start:
             raise HTTPException(status_code=400, detail="Date de fin doit être après la date de début")
         
+        # Pré-remplissage des montants manquants (agrégation groupée de la période)
+        totals = {
+            "total_ht": declaration.total_ht,
+            "total_tva": declaration.total_tva,
+            "total_ttc": declaration.total_ttc,
+            "operations_count": declaration.operations_count,
+            "operations_details": declaration.operations_details,
+        }
+        if any(v is None for k, v in totals.items() if k != "operations_details"):
+            prefill = await asyncio.to_thread(
+                ereporting_engine.prefill_declaration,
+                company_id, declaration.declaration_type, declaration.period_start, declaration.period_end
+            )
+            totals = {k: prefill[k] if v is None else v for k, v in totals.items()}
+        
         declaration_id = str(uuid.uuid4())
         
         declaration_data = {
@@ -6858,11 +5368,11 @@ async def create_ereporting_declaration(
             "declaration_type": declaration.declaration_type,
             "period_start": declaration.period_start.isoformat(),
             "period_end": declaration.period_end.isoformat(),
-            "total_ht": float(declaration.total_ht),
-            "total_tva": float(declaration.total_tva),
-            "total_ttc": float(declaration.total_ttc),
-            "operations_count": declaration.operations_count,
-            "operations_details": declaration.operations_details,
+            "total_ht": float(totals["total_ht"]),
+            "total_tva": float(totals["total_tva"]),
+            "total_ttc": float(totals["total_ttc"]),
+            "operations_count": totals["operations_count"],
+            "operations_details": totals["operations_details"],
             "status": "draft",
             "notes": declaration.notes,
             "created_by": user_data.get("sub")
@@ -6878,6 +5388,55 @@ async def create_ereporting_declaration(
         logging.error(f"Erreur création déclaration e-reporting: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+@api_router.get("/e-reporting/period-totals")
+async def get_ereporting_period_totals(
+    period_start: date,
+    period_end: date,
+    user_data: dict = Depends(get_user_from_token)
+):
+    """Totaux des factures émises et reçues d'une période, par catégorie et taux de TVA"""
+    try:
+        company_id = await get_user_company(user_data)
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+        if period_end < period_start:
+            raise HTTPException(status_code=400, detail="Date de fin doit être après la date de début")
+        
+        return await asyncio.to_thread(ereporting_engine.period_totals, company_id, period_start, period_end)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Erreur agrégation e-reporting: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
+@api_router.get("/e-reporting/prefill")
+async def prefill_ereporting_declaration(
+    declaration_type: str,
+    period_start: date,
+    period_end: date,
+    user_data: dict = Depends(get_user_from_token)
+):
+    """Montants pré-remplis d'une déclaration e-reporting pour la période"""
+    try:
+        company_id = await get_user_company(user_data)
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+        if declaration_type not in DECLARATION_CATEGORY:
+            raise HTTPException(status_code=400, detail=f"Type invalide. Valeurs: {', '.join(DECLARATION_CATEGORY)}")
+        if period_end < period_start:
+            raise HTTPException(status_code=400, detail="Date de fin doit être après la date de début")
+        
+        return await asyncio.to_thread(
+            ereporting_engine.prefill_declaration, company_id, declaration_type, period_start, period_end
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Erreur pré-remplissage e-reporting: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
+
 @api_router.get("/e-reporting")
 async def get_ereporting_declarations(
     declaration_type: Optional[str] = None,
@@ -6949,20 +5508,40 @@ async def transmit_ereporting_declaration(
         if not company_id:
             raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
         
-        # TODO: Implémenter l'envoi réel au PDP
-        # Pour l'instant, simulation
-        
-        pdp_reference = f"EREP-{datetime.utcnow().strftime('%Y%m%d')}-{secrets.token_hex(4).upper()}"
+        if IOPOLE_AVAILABLE:
+            declaration_result = supabase_service.table("e_reporting_declarations")\
+                .select("*")\
+                .eq("id", declaration_id)\
+                .eq("company_id", company_id)\
+                .execute()
+            if not declaration_result.data:
+                raise HTTPException(status_code=404, detail="Déclaration non trouvée")
+            declaration = declaration_result.data[0]
+            pdp_response = await iopole_client.send_ereporting({
+                "type": declaration.get("declaration_type"),
+                "period_start": declaration.get("period_start"),
+                "period_end": declaration.get("period_end"),
+                "total_ht": declaration.get("total_ht"),
+                "total_tva": declaration.get("total_tva"),
+                "total_ttc": declaration.get("total_ttc"),
+                "operations_count": declaration.get("operations_count"),
+                "operations": declaration.get("operations_details")
+            })
+            pdp_reference = pdp_response.get("pdp_reference")
+        else:
+            # Pas de client IOPOLE : simulation locale
+            pdp_reference = f"EREP-{datetime.utcnow().strftime('%Y%m%d')}-{secrets.token_hex(4).upper()}"
+            pdp_response = {
+                "status": "success",
+                "reference": pdp_reference,
+                "timestamp": datetime.utcnow().isoformat()
+            }
         
         update_data = {
             "status": "transmitted",
             "transmission_date": datetime.utcnow().isoformat(),
             "pdp_reference": pdp_reference,
-            "pdp_response": {
-                "status": "success",
-                "reference": pdp_reference,
-                "timestamp": datetime.utcnow().isoformat()
-            },
+            "pdp_response": pdp_response,
             "transmitted_by": user_data.get("sub"),
             "updated_at": datetime.utcnow().isoformat()
         }
@@ -7225,6 +5804,43 @@ class ScheduleCreate(BaseModel):
     client_address: Optional[str] = None
     intervention_category: Optional[str] = "worksite"  # 'worksite', 'rdv', 'urgence'
 
+class ScheduleAssignment(BaseModel):
+    id: Optional[str] = None  # Planning existant déplacé (exclu de la comparaison)
+    collaborator_id: str
+    date: Optional[str] = None
+    period_start: Optional[str] = None
+    period_end: Optional[str] = None
+    time: Optional[str] = None
+    end_time: Optional[str] = None
+    hours: Optional[int] = 8
+
+class ScheduleConflictCheck(BaseModel):
+    assignments: List[ScheduleAssignment]
+
+SCHEDULE_RECURRENCES = ("period", "daily", "weekdays", "weekly")
+MAX_BULK_SCHEDULES = 500
+
+class ScheduleBulkCreate(BaseModel):
+    team_leader_id: Optional[str] = None  # Équipe : collaborateurs actifs du chef d'équipe
+    collaborator_ids: List[str] = []  # Techniciens ajoutés à l'équipe (ou seuls)
+    worksite_id: Optional[str] = None
+    start_date: str  # "YYYY-MM-DD"
+    end_date: str  # "YYYY-MM-DD" inclus
+    recurrence: str = "weekdays"  # 'period' (une ligne par technicien), 'daily', 'weekdays', 'weekly'
+    weekdays: Optional[List[int]] = None  # 'weekly' : 0 = lundi ... 6 = dimanche
+    interval: int = 1  # Tous les N jours ('daily') ou toutes les N semaines ('weekdays', 'weekly')
+    time: str  # Format "HH:MM"
+    end_time: Optional[str] = None
+    hours: Optional[int] = 8
+    shift: Optional[str] = "day"
+    description: Optional[str] = ""
+    status: Optional[str] = "scheduled"
+    client_name: Optional[str] = None
+    client_address: Optional[str] = None
+    intervention_category: Optional[str] = "worksite"
+    on_conflict: str = "reject"  # 'reject' : rien n'est créé (409) ; 'skip' : seuls les créneaux libres
+    dry_run: bool = False  # Rapport de conflits sans création
+
 class ScheduleUpdate(BaseModel):
     date: Optional[str] = None
     time: Optional[str] = None
@@ -7238,6 +5854,35 @@ class ScheduleUpdate(BaseModel):
 def _svc():
     return supabase_service or supabase_anon
 
+schedule_conflicts = ScheduleConflictEngine(_svc)
+worksite_progress = WorksiteProgress(_svc)
+delta_sync = DeltaSync(_svc)
+
+def _refresh_worksite_progress(company_id: str, worksite_ids) -> Dict[str, int]:
+    """Recalcule et persiste l'avancement des chantiers dont les plannings ont changé"""
+    try:
+        return worksite_progress.refresh(company_id, worksite_ids)
+    except Exception as e:
+        logging.error(f"❌ Erreur mise à jour progress: {e}")
+        return {}
+
+def _rows_by_id(table: str, columns: str, ids) -> Dict[str, Dict[str, Any]]:
+    """Lignes de `table` indexées par id, en une seule requête (évite les N+1 par ligne)"""
+    ids = sorted({i for i in ids if i})
+    if not ids:
+        return {}
+    try:
+        res = _svc().table(table).select(f"id, {columns}").in_("id", ids).execute()
+    except Exception as e:
+        logging.warning(f"⚠️ Lecture groupée {table} impossible: {e}")
+        return {}
+    return {row["id"]: row for row in res.data or []}
+
+def _team_leader_display_name(team_leader: Dict[str, Any], users_by_id: Dict[str, Dict[str, Any]]) -> str:
+    """Nom du chef d'équipe : à jour depuis users si possible, sinon celui de planning_team_leaders"""
+    source = users_by_id.get(team_leader.get("user_id")) or team_leader
+    return f"{source.get('first_name', '')} {source.get('last_name', '')}".strip()
+
 def _ensure_bureau_or_admin(user: Dict[str, Any]):
     """Vérifie que l'utilisateur a le rôle Bureau ou Admin"""
     role = (user or {}).get("role")
@@ -7245,77 +5890,170 @@ def _ensure_bureau_or_admin(user: Dict[str, Any]):
         return
     raise HTTPException(status_code=403, detail="Accès réservé au Bureau/Admin")
 
-def _check_schedule_overlap(company_id: str, collaborator_id: str, date_val: date, 
-                            time_start: str, time_end: str, exclude_id: Optional[str] = None) -> bool:
-    """Détecte si un technicien a déjà un planning qui chevauche cette plage horaire"""
-    q = _svc().table("schedules").select("id,time,end_time").eq("company_id", company_id)\
-        .eq("collaborator_id", collaborator_id).eq("date", date_val.isoformat())
-    
-    res = q.execute()
-    for schedule in (res.data or []):
-        if exclude_id and schedule.get("id") == exclude_id:
-            continue
-        existing_start = schedule.get("time", "00:00")
-        existing_end = schedule.get("end_time") or schedule.get("time", "23:59")
-        # Overlap si: existing_start < time_end ET existing_end > time_start
-        if existing_start < time_end and existing_end > time_start:
-            return True
-    return False
-
-@api_router.get("/schedules")
-async def list_schedules(
-    from_date: Optional[date] = Query(None, alias="from"),
-    to_date: Optional[date] = Query(None, alias="to"),
-    collaborator_id: Optional[str] = None,
+def _schedule_end_time(time_start: str, time_end: Optional[str], hours: Optional[int]) -> str:
+    """end_time fourni, sinon time + hours (8 h par défaut)"""
+    if time_end:
+        return time_end
+    return (datetime.strptime(time_start, "%H:%M") + timedelta(hours=hours or 8)).strftime("%H:%M")
+
+def _resolve_schedule_worksite(worksite_id: Optional[str], client_name: Optional[str],
+                               client_address: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Titre du chantier, nom et adresse du client (ceux fournis sont prioritaires), en une requête"""
+    if not worksite_id:
+        return None, client_name, client_address
+    worksite_title = None
+    try:
+        ws_res = _svc().table("worksites").select(
+            "title, address, client_id, clients:client_id(name, prenom, nom, adresse, email, telephone)"
+        ).eq("id", worksite_id).execute()
+        if ws_res.data:
+            ws = ws_res.data[0]
+            worksite_title = ws.get("title")
+            logging.info(f"🏗️ Chantier: {worksite_title}")
+            # Récupérer adresse du chantier si pas fournie
+            if not client_address and ws.get("address"):
+                client_address = ws["address"]
+            # Récupérer infos client depuis la relation
+            client_data = ws.get("clients")
+            if client_data and not client_name:
+                if client_data.get("name"):
+                    client_name = client_data["name"]
+                elif client_data.get("prenom") or client_data.get("nom"):
+                    client_name = f"{client_data.get('prenom', '')} {client_data.get('nom', '')}".strip()
+                if not client_address and client_data.get("adresse"):
+                    client_address = client_data["adresse"]
+                logging.info(f"👤 Client: {client_name} - {client_address}")
+    except Exception as e:
+        logging.warning(f"⚠️ Impossible de récupérer les infos du chantier: {e}")
+    return worksite_title, client_name, client_address
+
+def _recurrence_days(start: date, end: date, recurrence: str, weekdays: Optional[List[int]], interval: int) -> List[date]:
+    """Jours d'occurrence entre start et end inclus ; les semaines sont comptées depuis celle de start"""
+    if recurrence == "daily":
+        return [start + timedelta(days=i) for i in range(0, (end - start).days + 1, interval)]
+    allowed = set(range(5)) if recurrence == "weekdays" else set(weekdays or [start.weekday()])
+    first_monday = start - timedelta(days=start.weekday())
+    days = []
+    for i in range((end - start).days + 1):
+        day = start + timedelta(days=i)
+        if day.weekday() in allowed and ((day - first_monday).days // 7) % interval == 0:
+            days.append(day)
+    return days
+
+def _normalize_schedule_changes(changes: Dict[str, Any]) -> Dict[str, Any]:
+    """400 si date (YYYY-MM-DD) ou horaires (HH:MM) illisibles ; nouvelle date unique : start_date/end_date suivent"""
+    try:
+        for field in ("time", "end_time"):
+            if changes.get(field):
+                parse_minutes(changes[field])
+        if "date" in changes:
+            changes["date"] = date.fromisoformat(changes["date"]).isoformat()
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Date (YYYY-MM-DD) ou horaires (HH:MM) invalides")
+    if "date" in changes:
+        changes["start_date"] = changes["end_date"] = changes["date"]
+    return changes
+
+def _ensure_no_schedule_conflict(company_id: str, proposal: Dict[str, Any]):
+    """409 si l'affectation chevauche un planning du technicien (dates uniques comme périodes)"""
+    try:
+        conflicts = schedule_conflicts.check(company_id, proposal)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if conflicts:
+        logging.info(f"⛔ Conflit de planning: {[c['schedule_id'] for c in conflicts]}")
+        raise HTTPException(status_code=409, detail="Conflit de planning pour ce technicien")
+
+@api_router.post("/schedules/conflicts")
+async def check_schedule_conflicts(payload: ScheduleConflictCheck, user=Depends(get_user_from_token)):
+    """Vérifie plusieurs affectations d'un coup (plannings existants + affectations précédentes du lot)"""
+    _ensure_bureau_or_admin(user)
+    company_id = user.get("company_id")
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    try:
+        results = await asyncio.to_thread(
+            schedule_conflicts.check_many, company_id, [a.model_dump() for a in payload.assignments]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "results": results,
+        "conflicts": sum(1 for r in results if r["conflicts"]),
+    }
+
+@api_router.get("/schedules/availability")
+async def get_technician_availability(
+    from_date: date = Query(..., alias="from"),
+    to_date: date = Query(..., alias="to"),
+    granularity: str = "day",
+    skills: Optional[str] = None,
+    team_leader_id: Optional[str] = None,
     user=Depends(get_user_from_token),
 ):
-    """Liste les plannings (filtrable par dates et technicien). Bureau/Admin peuvent tout voir."""
+    """
+    Disponibilité des techniciens par jour ou demi-journée (granularity=half_day) sur [from, to].
+    skills : compétences requises séparées par des virgules ; team_leader_id : équipe d'un chef.
+    Bureau/Admin uniquement.
+    """
     _ensure_bureau_or_admin(user)
     company_id = user.get("company_id")
-    q = _svc().table("schedules").select("""
-        *,
-        worksites:worksite_id(id, title, client_id, status, address),
-        users:collaborator_id(id, email, first_name, last_name),
-        planning_team_leaders:team_leader_id(id, first_name, last_name, user_id)
-    """).eq("company_id", company_id)
-    
-    if from_date:
-        q = q.gte("date", from_date.isoformat())
-    if to_date:
-        q = q.lte("date", to_date.isoformat())
-    if collaborator_id:
-        q = q.eq("collaborator_id", collaborator_id)
-    
-    res = q.order("date").order("time").execute()
-    
-    # Enrichir avec les noms des chefs d'équipe à jour depuis users
-    schedules = res.data or []
-    for schedule in schedules:
-        team_leader = schedule.get("planning_team_leaders")
-        if team_leader:
-            # Si le chef a un user_id, récupérer le nom à jour depuis users
-            user_id = team_leader.get("user_id")
-            if user_id:
-                try:
-                    user_res = _svc().table("users").select("first_name, last_name").eq("id", user_id).execute()
-                    if user_res.data:
-                        user_data = user_res.data[0]
-                        schedule["team_leader_name"] = f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip()
-                    else:
-                        # Fallback sur les données de planning_team_leaders
-                        schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-                except:
-                    schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-            else:
-                # Pas de user_id, utiliser les données de planning_team_leaders
-                schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-            
-            # Récupérer le nom du chantier
-            worksite = schedule.get("worksites")
-            if worksite:
-                schedule["worksite_name"] = worksite.get("title", "Chantier")
-    
-    return schedules
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    if granularity not in AVAILABILITY_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Granularité invalide ({', '.join(AVAILABILITY_WINDOWS)})")
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="'to' doit être postérieure à 'from'")
+    if (to_date - from_date).days + 1 > MAX_AVAILABILITY_DAYS:
+        raise HTTPException(status_code=400, detail=f"Plage limitée à {MAX_AVAILABILITY_DAYS} jours")
+
+    return await asyncio.to_thread(
+        _technician_availability, company_id, from_date, to_date, granularity, skills, team_leader_id
+    )
+
+def _technician_availability(company_id: str, from_date: date, to_date: date, granularity: str,
+                             skills: Optional[str], team_leader_id: Optional[str]) -> Dict[str, Any]:
+    # Techniciens : équipe du chef d'équipe (tous rôles) ou tous les techniciens de l'entreprise
+    users_query = _svc().table("users").select("id, first_name, last_name, role, skills").eq("company_id", company_id)
+    if team_leader_id:
+        tl_check = _svc().table("planning_team_leaders").select("id").eq("id", team_leader_id).eq("company_id", company_id).execute()
+        if not tl_check.data:
+            raise HTTPException(status_code=404, detail="Chef d'équipe introuvable")
+        team = _svc().table("team_leader_collaborators").select("collaborator_id")\
+            .eq("team_leader_id", team_leader_id).eq("is_active", True).execute()
+        team_ids = sorted({r["collaborator_id"] for r in team.data or [] if r.get("collaborator_id")})
+        users = users_query.in_("id", team_ids).execute().data if team_ids else []
+    else:
+        users = users_query.eq("role", "TECHNICIEN").execute().data or []
+    technicians = filter_technicians(users, skills)
+
+    # Plannings de tous ces techniciens sur la plage : une requête (même lecture que la détection de conflits)
+    schedules = schedule_conflicts.load_candidates(company_id, [
+        Slot(str(t["id"]), from_date, to_date, 0, MINUTES_PER_DAY) for t in technicians
+    ])
+    return build_availability(technicians, schedules, from_date, to_date, granularity)
+
+class SyncRequest(BaseModel):
+    resources: Optional[Dict[str, Optional[str]]] = None  # {ressource: 'next' de la synchro précédente, ou null}
+    limit: int = SYNC_PAGE_SIZE
+
+@api_router.post("/sync")
+async def sync_changes(payload: SyncRequest, user_data: dict = Depends(get_user_from_token)):
+    """
+    Synchronisation différentielle (application hors ligne) : par ressource (searches, missions,
+    materials, clients), lignes modifiées et suppressions depuis le curseur envoyé.
+    Sans curseur : tout, paginé. Rappeler avec les 'next' tant que has_more est vrai.
+    """
+    company_id = await get_user_company(user_data)
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    tokens = payload.resources if payload.resources is not None else {name: None for name in SYNC_RESOURCES}
+    try:
+        return await asyncio.to_thread(
+            delta_sync.sync, company_id, user_data.get("id"), (user_data.get("role") or "").upper(), tokens, payload.limit
+        )
+    except InvalidSyncToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.post("/schedules")
 async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_token)):
@@ -7334,16 +6072,17 @@ async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_to
         
         # Calculer end_time si absent
         time_start = payload.time
-        time_end = payload.end_time
-        if not time_end:
-            from datetime import datetime as dt, timedelta
-            t = dt.strptime(time_start, "%H:%M")
-            t_end = t + timedelta(hours=payload.hours or 8)
-            time_end = t_end.strftime("%H:%M")
+        time_end = _schedule_end_time(time_start, payload.end_time, payload.hours)
         
-        # Vérifier conflits (seulement pour date unique)
-        if payload.date and _check_schedule_overlap(company_id, payload.collaborator_id, payload.date, time_start, time_end):
-            raise HTTPException(status_code=409, detail="Conflit de planning pour ce technicien")
+        # Vérifier conflits (date unique ou période)
+        _ensure_no_schedule_conflict(company_id, {
+            "collaborator_id": payload.collaborator_id,
+            "date": payload.date,
+            "period_start": payload.period_start,
+            "period_end": payload.period_end,
+            "time": time_start,
+            "end_time": time_end,
+        })
         
         # Récupérer le nom/prénom du collaborateur depuis la table users
         collab_first_name = None
@@ -7358,33 +6097,9 @@ async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_to
             logging.warning(f"⚠️ Impossible de récupérer le nom du collaborateur: {e}")
 
         # Récupérer les infos du chantier et du client si worksite_id fourni
-        worksite_title = None
-        resolved_client_name = payload.client_name
-        resolved_client_address = payload.client_address
-        if payload.worksite_id:
-            try:
-                ws_res = _svc().table("worksites").select(
-                    "title, address, client_id, clients:client_id(name, prenom, nom, adresse, email, telephone)"
-                ).eq("id", payload.worksite_id).execute()
-                if ws_res.data:
-                    ws = ws_res.data[0]
-                    worksite_title = ws.get("title")
-                    logging.info(f"🏗️ Chantier: {worksite_title}")
-                    # Récupérer adresse du chantier si pas fournie
-                    if not resolved_client_address and ws.get("address"):
-                        resolved_client_address = ws["address"]
-                    # Récupérer infos client depuis la relation
-                    client_data = ws.get("clients")
-                    if client_data and not resolved_client_name:
-                        if client_data.get("name"):
-                            resolved_client_name = client_data["name"]
-                        elif client_data.get("prenom") or client_data.get("nom"):
-                            resolved_client_name = f"{client_data.get('prenom', '')} {client_data.get('nom', '')}".strip()
-                        if not resolved_client_address and client_data.get("adresse"):
-                            resolved_client_address = client_data["adresse"]
-                        logging.info(f"👤 Client: {resolved_client_name} - {resolved_client_address}")
-            except Exception as e:
-                logging.warning(f"⚠️ Impossible de récupérer les infos du chantier: {e}")
+        worksite_title, resolved_client_name, resolved_client_address = _resolve_schedule_worksite(
+            payload.worksite_id, payload.client_name, payload.client_address
+        )
 
         data = {
             "company_id": company_id,
@@ -7426,6 +6141,9 @@ async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_to
         logging.info(f"📝 Insertion schedule: {data}")
         res = _svc().table("schedules").insert(data).execute()
         logging.info(f"✅ Schedule créé: {res.data}")
+        _refresh_worksite_progress(company_id, [payload.worksite_id])
+        planning_events.publish(SCHEDULE_CREATED, company_id, schedule_id=res.data[0].get("id"),
+                                worksite_id=payload.worksite_id, technician_ids=[payload.collaborator_id])
         return res.data[0]
     except HTTPException:
         raise
@@ -7435,6 +6153,150 @@ async def create_schedule(payload: ScheduleCreate, user=Depends(get_user_from_to
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+@api_router.post("/schedules/bulk")
+async def create_schedules_bulk(payload: ScheduleBulkCreate, user=Depends(get_user_from_token)):
+    """
+    Planifier une équipe sur une plage de dates selon une récurrence. Bureau/Admin uniquement.
+    Noms et chantier lus une fois, conflits vérifiés pour tout le lot, une seule insertion multi-lignes.
+    Retourne le rapport par créneau (planning créé ou conflits).
+    """
+    _ensure_bureau_or_admin(user)
+    company_id = user.get("company_id")
+    if not company_id:
+        raise HTTPException(status_code=400, detail="Vous devez appartenir à une entreprise")
+    if payload.recurrence not in SCHEDULE_RECURRENCES:
+        raise HTTPException(status_code=400, detail=f"Récurrence invalide ({', '.join(SCHEDULE_RECURRENCES)})")
+    if payload.on_conflict not in ("reject", "skip"):
+        raise HTTPException(status_code=400, detail="on_conflict doit valoir 'reject' ou 'skip'")
+    if payload.interval < 1 or any(d not in range(7) for d in payload.weekdays or []):
+        raise HTTPException(status_code=400, detail="interval >= 1 et weekdays entre 0 (lundi) et 6 (dimanche)")
+    try:
+        start = date.fromisoformat(payload.start_date)
+        end = date.fromisoformat(payload.end_date)
+        for value in (payload.time, payload.end_time):
+            if value is not None:
+                datetime.strptime(value, "%H:%M")
+        time_end = _schedule_end_time(payload.time, payload.end_time, payload.hours)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates (YYYY-MM-DD) ou horaires (HH:MM) invalides")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date doit être postérieure à start_date")
+
+    return await asyncio.to_thread(_create_schedules_bulk, payload, user, start, end, time_end)
+
+def _create_schedules_bulk(payload: ScheduleBulkCreate, user: Dict[str, Any], start: date, end: date,
+                           time_end: str) -> Dict[str, Any]:
+    company_id = user["company_id"]
+
+    # Équipe : collaborateurs actifs du chef d'équipe + techniciens donnés explicitement
+    collaborator_ids = list(dict.fromkeys(payload.collaborator_ids))
+    if payload.team_leader_id:
+        tl_check = _svc().table("planning_team_leaders").select("id").eq("id", payload.team_leader_id).eq("company_id", company_id).execute()
+        if not tl_check.data:
+            raise HTTPException(status_code=404, detail="Chef d'équipe introuvable")
+        team = _svc().table("team_leader_collaborators").select("collaborator_id")\
+            .eq("team_leader_id", payload.team_leader_id).eq("is_active", True).execute()
+        collaborator_ids.extend(
+            r["collaborator_id"] for r in team.data or [] if r.get("collaborator_id") not in collaborator_ids
+        )
+    if not collaborator_ids:
+        raise HTTPException(status_code=400, detail="Aucun technicien à planifier")
+
+    users_by_id = _rows_by_id("users", "first_name, last_name, company_id", collaborator_ids)
+    unknown = [c for c in collaborator_ids if (users_by_id.get(c) or {}).get("company_id") != company_id]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Collaborateur(s) introuvable(s): {', '.join(unknown)}")
+
+    # Créneaux : une période par technicien, ou une ligne par technicien et par occurrence
+    if payload.recurrence == "period":
+        ranges = [(start, end)]
+    else:
+        ranges = [(day, day) for day in _recurrence_days(start, end, payload.recurrence, payload.weekdays, payload.interval)]
+    slots = [(collab_id, first, last) for first, last in ranges for collab_id in collaborator_ids]
+    if not slots:
+        raise HTTPException(status_code=400, detail="Aucune occurrence dans la plage de dates")
+    if len(slots) > MAX_BULK_SCHEDULES:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BULK_SCHEDULES} plannings par lot ({len(slots)} demandés)")
+
+    report = schedule_conflicts.check_many(company_id, [
+        {"collaborator_id": collab_id, "start_date": first.isoformat(), "end_date": last.isoformat(),
+         "time": payload.time, "end_time": time_end}
+        for collab_id, first, last in slots
+    ])
+    slot_reports = [
+        {
+            "index": i,
+            "collaborator_id": collab_id,
+            "start_date": first.isoformat(),
+            "end_date": last.isoformat(),
+            "schedule_id": None,
+            "conflicts": [
+                {"source": "batch", "index": c["index"]} if c["source"] == "batch" else {
+                    "source": "existing",
+                    "schedule_id": c["schedule_id"],
+                    **{k: c["schedule"].get(k) for k in ("date", "start_date", "end_date", "time", "end_time", "worksite_id")},
+                }
+                for c in result["conflicts"]
+            ],
+        }
+        for i, ((collab_id, first, last), result) in enumerate(zip(slots, report))
+    ]
+    conflicted = sum(1 for r in slot_reports if r["conflicts"])
+    summary = {"requested": len(slots), "conflicts": conflicted, "dry_run": payload.dry_run}
+
+    if conflicted and payload.on_conflict == "reject":
+        logging.info(f"⛔ Planification groupée refusée: {conflicted}/{len(slots)} créneau(x) en conflit")
+        raise HTTPException(status_code=409, detail={
+            "message": "Conflit de planning pour un ou plusieurs techniciens",
+            **summary, "slots": slot_reports,
+        })
+    if payload.dry_run:
+        return {**summary, "created": 0, "slots": slot_reports}
+
+    worksite_title, client_name, client_address = _resolve_schedule_worksite(
+        payload.worksite_id, payload.client_name, payload.client_address
+    )
+    to_create = [r for r in slot_reports if not r["conflicts"]]
+    rows = []
+    for r in to_create:
+        collaborator = users_by_id[r["collaborator_id"]]
+        row = {
+            "company_id": company_id,
+            "worksite_id": payload.worksite_id,
+            "team_leader_id": payload.team_leader_id,
+            "collaborator_id": r["collaborator_id"],
+            "collaborator_first_name": collaborator.get("first_name", ""),
+            "collaborator_last_name": collaborator.get("last_name", ""),
+            "worksite_title": worksite_title,
+            "time": payload.time,
+            "end_time": time_end,
+            "hours": payload.hours or 8,
+            "shift": payload.shift or "day",
+            "description": payload.description or "",
+            "status": payload.status or "scheduled",
+            "created_by": user.get("id"),
+            "client_name": client_name,
+            "client_address": client_address,
+            "intervention_category": payload.intervention_category or "worksite",
+            "start_date": r["start_date"],
+            "end_date": r["end_date"],
+        }
+        # Date unique : colonne date remplie comme à la création unitaire (toutes les lignes ont les mêmes clés)
+        if payload.recurrence != "period":
+            row["date"] = r["start_date"]
+        rows.append(row)
+
+    created = _svc().table("schedules").insert(rows).execute().data if rows else []
+    for r, schedule in zip(to_create, created):
+        r["schedule_id"] = schedule.get("id")
+    if created:
+        _refresh_worksite_progress(company_id, [payload.worksite_id])
+        # Un seul événement pour le lot (schedule_id absent : recharger la plage des techniciens concernés)
+        planning_events.publish(SCHEDULE_CREATED, company_id, worksite_id=payload.worksite_id,
+                                technician_ids=[r["collaborator_id"] for r in to_create])
+    logging.info(f"✅ Planification groupée: {len(created)}/{len(slots)} planning(s) créé(s), {conflicted} en conflit")
+    return {**summary, "created": len(created), "slots": slot_reports}
+
 @api_router.patch("/schedules/{schedule_id}")
 async def update_schedule(schedule_id: str, payload: ScheduleUpdate, user=Depends(get_user_from_token)):
     """Modifier un planning (dates, horaires, technicien). Bureau/Admin uniquement."""
@@ -7448,25 +6310,21 @@ async def update_schedule(schedule_id: str, payload: ScheduleUpdate, user=Depend
     
     current = existing.data[0]
     
-    # Préparer changements
-    changes = {k: v for k, v in payload.dict().items() if v is not None}
+    # Préparer changements (start_date/end_date lues pour les conflits et le planning)
+    changes = _normalize_schedule_changes({k: v for k, v in payload.dict().items() if v is not None})
     
     # Vérifier conflits si date/horaire/technicien changent
     if any(k in changes for k in ("date", "time", "end_time", "collaborator_id")):
-        date_val = changes.get("date") or date.fromisoformat(current["date"])
-        time_start = changes.get("time") or current["time"]
-        time_end = changes.get("end_time") or current.get("end_time") or current["time"]
-        collab_id = changes.get("collaborator_id") or current["collaborator_id"]
-        
-        if _check_schedule_overlap(company_id, collab_id, date_val, time_start, time_end, exclude_id=schedule_id):
-            raise HTTPException(status_code=409, detail="Conflit de planning pour ce technicien")
-    
-    if "date" in changes:
-        changes["date"] = changes["date"].isoformat()
+        _ensure_no_schedule_conflict(company_id, {**current, **changes, "id": schedule_id})
     
     changes["updated_at"] = datetime.utcnow().isoformat()
     
     res = _svc().table("schedules").update(changes).eq("id", schedule_id).execute()
+    # Jours passés ou planning annulé : l'avancement du chantier change
+    if "date" in changes or "status" in changes:
+        _refresh_worksite_progress(company_id, [current.get("worksite_id")])
+    planning_events.publish(SCHEDULE_UPDATED, company_id, schedule_id=schedule_id, worksite_id=current.get("worksite_id"),
+                            technician_ids=[current.get("collaborator_id"), changes.get("collaborator_id")])
     return res.data[0]
 
 @api_router.delete("/schedules/{schedule_id}")
@@ -7477,7 +6335,7 @@ async def delete_schedule(schedule_id: str, user=Depends(get_user_from_token)):
     
     logger.info(f"🗑️ [delete_schedule] Tentative suppression schedule_id={schedule_id}, company_id={company_id}")
     
-    existing = _svc().table("schedules").select("id, company_id").eq("id", schedule_id).execute()
+    existing = _svc().table("schedules").select("id, company_id, worksite_id, collaborator_id").eq("id", schedule_id).execute()
     logger.debug(f"🔍 [delete_schedule] Recherche schedule: {existing.data}")
     
     if not existing.data:
@@ -7491,6 +6349,10 @@ async def delete_schedule(schedule_id: str, user=Depends(get_user_from_token)):
     
     _svc().table("schedules").delete().eq("id", schedule_id).execute()
     logger.info(f"✅ [delete_schedule] Schedule {schedule_id} supprimé")
+    _refresh_worksite_progress(company_id, [existing.data[0].get("worksite_id")])
+    planning_events.publish(SCHEDULE_DELETED, company_id, schedule_id=schedule_id,
+                            worksite_id=existing.data[0].get("worksite_id"),
+                            technician_ids=[existing.data[0].get("collaborator_id")])
     return {"deleted": True}
 
 @api_router.get("/technicians/{technician_id}/missions")
@@ -7531,6 +6393,7 @@ async def list_missions_for_technician(
     today_date = date.today()
     
     schedules = res.data or []
+    expired = []
     for schedule in schedules:
         sch_status = (schedule.get("status") or "").lower()
         sch_end_date = schedule.get("end_date")
@@ -7539,49 +6402,42 @@ async def list_missions_for_technician(
             try:
                 end_dt = dt_cls.strptime(sch_end_date[:10], "%Y-%m-%d").date()
                 if end_dt < today_date:
-                    _svc().table("schedules").update({
-                        "status": "completed"
-                    }).eq("id", schedule["id"]).execute()
-                    schedule["status"] = "completed"
+                    expired.append(schedule)
             except Exception:
                 pass
+    if expired:
+        # Une seule mise à jour pour toutes les missions échues
+        try:
+            _svc().table("schedules").update({
+                "status": "completed"
+            }).in_("id", [s["id"] for s in expired]).execute()
+            for schedule in expired:
+                schedule["status"] = "completed"
+        except Exception as e:
+            logging.warning(f"⚠️ Passage en 'completed' impossible: {e}")
     
     # Enrichir avec les noms des chefs d'équipe à jour depuis users et les données clients
+    # (une requête groupée par table plutôt qu'une par mission)
+    users_by_id = _rows_by_id("users", "first_name, last_name", (
+        (s.get("planning_team_leaders") or {}).get("user_id") for s in schedules
+    ))
+    clients_by_id = _rows_by_id("clients", "name, prenom, nom, adresse", (
+        (s.get("worksites") or {}).get("client_id") for s in schedules
+    ))
     for schedule in schedules:
         team_leader = schedule.get("planning_team_leaders")
         if team_leader:
-            # Si le chef a un user_id, récupérer le nom à jour depuis users
-            user_id = team_leader.get("user_id")
-            if user_id:
-                try:
-                    user_res = _svc().table("users").select("first_name, last_name").eq("id", user_id).execute()
-                    if user_res.data:
-                        user_data = user_res.data[0]
-                        schedule["team_leader_name"] = f"{user_data.get('first_name', '')} {user_data.get('last_name', '')}".strip()
-                    else:
-                        schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-                except:
-                    schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
-            else:
-                schedule["team_leader_name"] = f"{team_leader.get('first_name', '')} {team_leader.get('last_name', '')}".strip()
+            schedule["team_leader_name"] = _team_leader_display_name(team_leader, users_by_id)
         
         # Récupérer le nom du chantier et les données du client
         worksite = schedule.get("worksites")
         if worksite:
             schedule["worksite_name"] = worksite.get("title", "Chantier")
             
-            # Récupérer les données du client si client_id existe
-            client_id = worksite.get("client_id")
-            if client_id:
-                try:
-                    client_res = _svc().table("clients").select("id, name, prenom, nom, adresse").eq("id", client_id).execute()
-                    if client_res.data:
-                        # Injecter les données du client dans worksites
-                        if "worksites" not in schedule:
-                            schedule["worksites"] = {}
-                        schedule["worksites"]["clients"] = client_res.data[0]
-                except Exception as e:
-                    logging.warning(f"Impossible de récupérer le client {client_id}: {e}")
+            # Injecter les données du client dans worksites
+            client = clients_by_id.get(worksite.get("client_id"))
+            if client:
+                worksite["clients"] = client
     
     return schedules
 
@@ -7688,35 +6544,23 @@ async def get_team_leaders_with_stats(user=Depends(get_user_from_token)):
     team_leaders = _svc().table("planning_team_leaders").select("*").eq("company_id", company_id).execute()
     logger.info(f"👥 [team-leaders-stats] Chefs trouvés: {len(team_leaders.data or [])}")
     
-    result = []
-    for tl in team_leaders.data or []:
-        logger.debug(f"\n📊 [team-leaders-stats] Traitement chef ID: {tl['id']}")
-        logger.debug(f"   user_id dans planning_team_leaders: {tl.get('user_id')}")
-        logger.debug(f"   Données planning_team_leaders: first_name={tl.get('first_name')}, last_name={tl.get('last_name')}")
-        
-        # Récupérer les infos à jour depuis users en utilisant user_id
-        user_info = None
-        user_id = tl.get("user_id")  # Utiliser user_id au lieu de id
-        if user_id:
-            try:
-                user_res = _svc().table("users").select("first_name, last_name, email").eq("id", user_id).execute()
-                if user_res.data:
-                    user_info = user_res.data[0]
-                    logger.debug(f"   ✅ Données users récupérées: first_name={user_info.get('first_name')}, last_name={user_info.get('last_name')}")
-                else:
-                    logger.debug(f"   ⚠️ Aucune donnée users trouvée pour user_id={user_id}")
-            except Exception as e:
-                logger.error(f"   ❌ Erreur récupération users: {e}")
-        else:
-            logger.debug(f"   ⚠️ Pas de user_id défini")
-        
-        # Compter collaborateurs actifs
-        count_res = _svc().table("team_leader_collaborators").select("id", count="exact").eq("team_leader_id", tl["id"]).eq("is_active", True).execute()
-        
-        # Récupérer liste collaborateurs
+    leaders = team_leaders.data or []
+    
+    # Infos à jour depuis users (via user_id) et collaborateurs actifs : une requête chacune pour tous les chefs
+    users_by_id = _rows_by_id("users", "first_name, last_name, email", (tl.get("user_id") for tl in leaders))
+    collabs_by_leader: Dict[str, List[Dict[str, Any]]] = {tl["id"]: [] for tl in leaders}
+    if leaders:
         collabs_res = _svc().table("team_leader_collaborators").select("""
+            team_leader_id,
             collaborator:collaborator_id(id, first_name, last_name, email)
-        """).eq("team_leader_id", tl["id"]).eq("is_active", True).execute()
+        """).in_("team_leader_id", list(collabs_by_leader)).eq("is_active", True).execute()
+        for row in collabs_res.data or []:
+            collabs_by_leader.setdefault(row.get("team_leader_id"), []).append(row)
+    
+    result = []
+    for tl in leaders:
+        user_info = users_by_id.get(tl.get("user_id"))
+        collabs = collabs_by_leader.get(tl["id"], [])
         
         # Utiliser les données de users si disponibles (plus à jour), sinon garder celles de planning_team_leaders
         final_first = user_info.get("first_name") if user_info else tl.get("first_name")
@@ -7728,13 +6572,11 @@ async def get_team_leaders_with_stats(user=Depends(get_user_from_token)):
             "first_name": final_first,
             "last_name": final_last,
             "email": user_info.get("email") if user_info else tl.get("email"),
-            "collaborators_count": count_res.count,
-            "collaborators": [c["collaborator"] for c in (collabs_res.data or []) if c.get("collaborator")]
+            "collaborators_count": len(collabs),
+            "collaborators": [c["collaborator"] for c in collabs if c.get("collaborator")]
         })
     
     return result
-    
-    return result
 
 @api_router.get("/worksites/validated")
 async def list_validated_worksites(user=Depends(get_user_from_token)):
@@ -8075,9 +6917,10 @@ async def upload_company_logo(
         uploads_dir.mkdir(parents=True, exist_ok=True)
         file_path = uploads_dir / unique_filename
         
-        with open(file_path, "wb") as f:
-            content = await logo.read()
-            f.write(content)
+        try:
+            await save_upload_file(logo, file_path, max_bytes=MAX_LOGO_SIZE)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
         logo_url = f"/uploads/logos/{unique_filename}"
         
@@ -8364,6 +7207,14 @@ async def get_company_checkouts(user_data: dict = Depends(get_user_from_token)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Routes par domaine (modules séparés ; ReportLab et OpenAI importés au premier appel).
+# Les modules de routes importent ce module par son nom, y compris en lancement direct.
+sys.modules.setdefault("server_supabase", sys.modules[__name__])
+from ai_routes import router as ai_router
+from pdf_routes import router as pdf_router
+api_router.include_router(ai_router)
+api_router.include_router(pdf_router)
+
 app.include_router(api_router)
 
 # Monter le répertoire uploads pour servir les fichiers statiques (logos, etc.)
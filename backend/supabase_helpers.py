@@ -0,0 +1,76 @@
+"""
+Supabase Helpers - Lecture par pages et fonctions SQL optionnelles
+
+- paged() : parcourt un résultat PostgREST (table ou fonction SQL) par pages
+  de PAGE_SIZE (limite max-rows de PostgREST). La requête doit être triée
+  sur une clé unique, sinon deux pages peuvent se chevaucher ou sauter des
+  lignes.
+- SqlFunction : fonction SQL livrée par une migration, avec repli côté
+  appelant. Ses lignes sont lues par pages triées sur `order` (colonnes
+  séparées par des virgules formant une clé unique du résultat). Absente
+  (PGRST202, migration non appliquée), elle n'est plus redemandée par ce
+  processus ; toute autre erreur est journalisée comme un échec et seul
+  l'appel en cours se replie. value() lit une fonction renvoyant un seul
+  objet (JSONB) avec les mêmes règles.
+"""
+
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 1000
+
+
+def paged(build_query: Callable[[], Any], page_size: int = PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """Lignes de build_query() (nouvelle requête à chaque page), lues par pages"""
+    offset = 0
+    while True:
+        page = build_query().range(offset, offset + page_size - 1).execute().data or []
+        yield from page
+        if len(page) < page_size:
+            break
+        offset += page_size
+
+
+def is_missing_function(error: Exception) -> bool:
+    """Fonction SQL inconnue de PostgREST (migration non appliquée)"""
+    return "PGRST202" in str(error) or "Could not find the function" in str(error)
+
+
+class SqlFunction:
+    """Fonction SQL optionnelle renvoyant des lignes ; None si indisponible (l'appelant se replie)"""
+
+    def __init__(self, name: str, order: str = ""):
+        self.name = name
+        self.order = order
+        self.available = True
+
+    def rows(self, client, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        if not self.available:
+            return None
+        try:
+            return list(paged(lambda: self._ordered(client.rpc(self.name, params))))
+        except Exception as e:
+            return self._unavailable(e)
+
+    def value(self, client, params: Dict[str, Any]) -> Optional[Any]:
+        if not self.available:
+            return None
+        try:
+            return client.rpc(self.name, params).execute().data
+        except Exception as e:
+            return self._unavailable(e)
+
+    def _unavailable(self, error: Exception) -> None:
+        if not is_missing_function(error):
+            logger.error(f"❌ Fonction SQL {self.name} en échec, repli pour cet appel: {error}")
+            return None
+        self.available = False
+        logger.warning(f"⚠️ Fonction SQL {self.name} absente (migration non appliquée), repli: {error}")
+        return None
+
+    def _ordered(self, query):
+        for column in self.order.split(","):
+            query = query.order(column.strip())
+        return query
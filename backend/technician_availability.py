@@ -0,0 +1,119 @@
+"""
+Technician Availability - Matrice de disponibilité techniciens x jours
+
+Pour une plage de dates, chaque technicien a une case par jour (granularité
+"day") ou par demi-journée ("half_day" : matin avant 12:00, après-midi
+ensuite). Une case est occupée si un planning actif du technicien chevauche
+sa plage horaire ; une plage de nuit (end_time <= time) occupe aussi le
+début du lendemain, comme pour la détection de conflits (schedule_conflicts).
+
+Calcul vectorisé NumPy : pour chaque fenêtre horaire, les plannings qui la
+touchent marquent leur plage de jours dans un tableau de différences
+(technicien x fenêtre x jour), puis une somme cumulée donne l'occupation.
+Aucune boucle par jour ni par technicien : 100 techniciens x 90 jours se
+calculent en quelques millisecondes, la lecture des plannings (une requête,
+voir ScheduleConflictEngine.load_candidates) domine.
+
+Réponse compacte : une chaîne de '1' (libre) / '0' (occupé) par technicien,
+jours dans l'ordre puis fenêtres de chaque jour.
+"""
+
+import re
+import unicodedata
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from schedule_conflicts import MINUTES_PER_DAY, Slot, existing_slot
+
+MAX_AVAILABILITY_DAYS = 366
+
+# Granularité -> fenêtres horaires (nom, début, fin en minutes depuis minuit)
+AVAILABILITY_WINDOWS = {
+    "day": (("day", 0, MINUTES_PER_DAY),),
+    "half_day": (("am", 0, 12 * 60), ("pm", 12 * 60, MINUTES_PER_DAY)),
+}
+
+_SKILL_SEPARATORS = re.compile(r"[,;/|\n]+")
+
+
+def _fold(text: Any) -> str:
+    folded = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(c for c in folded if not unicodedata.combining(c)).strip()
+
+
+def parse_skills(value: Any) -> List[str]:
+    """'Maçonnerie, Plomberie' (colonne users.skills) ou liste -> compétences normalisées"""
+    items = value if isinstance(value, (list, tuple)) else _SKILL_SEPARATORS.split(str(value or ""))
+    return [skill for skill in (_fold(item) for item in items) if skill]
+
+
+def has_skills(technician_skills: Any, required: Sequence[str]) -> bool:
+    """Toutes les compétences demandées (déjà normalisées) ; 'plomb' trouve 'plomberie'"""
+    skills = parse_skills(technician_skills)
+    return all(any(wanted in skill for skill in skills) for wanted in required)
+
+
+def busy_matrix(slots: Iterable[Slot], technician_ids: Sequence[str], first_day: date, days: int,
+                windows: Sequence[tuple]) -> np.ndarray:
+    """Occupation booléenne (technicien, jour, fenêtre) sur [first_day, first_day + days)"""
+    index = {tid: i for i, tid in enumerate(technician_ids)}
+    slots = [slot for slot in slots if slot.collaborator_id in index]
+    diff = np.zeros((len(technician_ids), len(windows), days + 1), dtype=np.int32)
+    if slots:
+        tech = np.fromiter((index[s.collaborator_id] for s in slots), dtype=np.intp, count=len(slots))
+        first = np.fromiter(((s.first_day - first_day).days for s in slots), dtype=np.int64, count=len(slots))
+        last = np.fromiter(((s.last_day - first_day).days for s in slots), dtype=np.int64, count=len(slots))
+        start = np.fromiter((s.start_min for s in slots), dtype=np.int64, count=len(slots))
+        end = np.fromiter((s.end_min for s in slots), dtype=np.int64, count=len(slots))
+        for w, (_, lo, hi) in enumerate(windows):
+            # shift 0 : fenêtre du jour même ; shift 1 : fenêtre du lendemain (plage de nuit)
+            for shift in (0, 1):
+                offset = shift * MINUTES_PER_DAY
+                a = np.clip(first + shift, 0, days)
+                b = np.clip(last + shift + 1, 0, days)
+                keep = (start < hi + offset) & (lo + offset < end) & (a < b)
+                np.add.at(diff, (tech[keep], w, a[keep]), 1)
+                np.add.at(diff, (tech[keep], w, b[keep]), -1)
+    return (np.cumsum(diff[:, :, :days], axis=2) > 0).transpose(0, 2, 1)
+
+
+def build_availability(technicians: Sequence[Dict[str, Any]], schedules: Iterable[Dict[str, Any]],
+                       first_day: date, last_day: date, granularity: str = "day") -> Dict[str, Any]:
+    """Matrice de disponibilité des techniciens (lignes users) d'après leurs plannings actifs"""
+    windows = AVAILABILITY_WINDOWS[granularity]
+    days = (last_day - first_day).days + 1
+    ids = [str(t["id"]) for t in technicians]
+    slots = (slot for slot in (existing_slot(row) for row in schedules) if slot is not None)
+    free = ~busy_matrix(slots, ids, first_day, days, windows)
+
+    flat = free.reshape(len(ids), days * len(windows))
+    encoded = np.where(flat, ord("1"), ord("0")).astype(np.uint8)
+    return {
+        "from": first_day.isoformat(),
+        "to": last_day.isoformat(),
+        "granularity": granularity,
+        "days": [(first_day + timedelta(days=i)).isoformat() for i in range(days)],
+        "slots": [name for name, _, _ in windows],
+        "technicians": [
+            {
+                "id": tid,
+                "first_name": technician.get("first_name"),
+                "last_name": technician.get("last_name"),
+                "skills": technician.get("skills"),
+                "availability": chars.tobytes().decode("ascii"),
+                "free_slots": int(row.sum()),
+            }
+            for tid, technician, row, chars in zip(ids, technicians, flat, encoded)
+        ],
+        # Nombre de techniciens libres par case (jours dans l'ordre, puis fenêtres)
+        "free_count": flat.sum(axis=0).astype(int).tolist(),
+    }
+
+
+def filter_technicians(users: Iterable[Dict[str, Any]], skills: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Techniciens ayant toutes les compétences demandées, triés par nom"""
+    required = parse_skills(skills)
+    selected = [u for u in users if not required or has_skills(u.get("skills"), required)]
+    return sorted(selected, key=lambda u: (_fold(u.get("last_name")), _fold(u.get("first_name")), str(u["id"])))
@@ -4,6 +4,7 @@ Test rapide de la connexion IOPOLE avec les identifiants sandbox
 
 import sys
 import os
+import asyncio
 
 # Ajouter le dossier backend au path
 sys.path.insert(0, os.path.dirname(__file__))
@@ -16,7 +17,7 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def test_iopole_connection():
+async def test_iopole_connection():
     """Test de connexion à l'API IOPOLE sandbox"""
     
     print("\n" + "="*70)
@@ -25,7 +26,7 @@ def test_iopole_connection():
     
     # 1. Health Check
     print("1️⃣ Health Check IOPOLE...")
-    health = iopole_client.health_check()
+    health = await iopole_client.health_check()
     print(f"   ✅ Status: {health['status']}")
     print(f"   ✅ Environment: {health['environment']}")
     print(f"   ✅ API Base: {health.get('api_base', 'N/A')}")
@@ -34,7 +35,7 @@ def test_iopole_connection():
     # 2. Test Authentification
     print("2️⃣ Test Authentification...")
     try:
-        token = iopole_client.get_access_token()
+        token = await iopole_client.get_access_token()
         print(f"   ✅ Token obtenu: {token[:20]}...\n")
     except Exception as e:
         print(f"   ⚠️ Erreur token: {e}\n")
@@ -70,7 +71,7 @@ def test_iopole_connection():
     }
     
     try:
-        response = iopole_client.send_invoice(test_invoice)
+        response = await iopole_client.send_invoice(test_invoice)
         print(f"   ✅ Facture transmise!")
         print(f"   ✅ PDP Reference: {response['pdp_reference']}")
         print(f"   ✅ Status: {response['status']}")
@@ -102,7 +103,7 @@ def test_iopole_connection():
     }
     
     try:
-        response = iopole_client.send_ereporting(test_declaration)
+        response = await iopole_client.send_ereporting(test_declaration)
         print(f"   ✅ E-Reporting transmis!")
         print(f"   ✅ PDP Reference: {response['pdp_reference']}")
         print(f"   ✅ Type: {response.get('declaration_type', 'N/A')}")
@@ -125,7 +126,7 @@ def test_iopole_connection():
     test_pdf = b"PDF_TEST_CONTENT_" + b"X" * 1000  # Simuler un PDF
     
     try:
-        response = iopole_client.archive_document(test_doc_data, test_pdf)
+        response = await iopole_client.archive_document(test_doc_data, test_pdf)
         print(f"   ✅ Document archivé!")
         print(f"   ✅ Archive ID: {response['archive_id']}")
         print(f"   ✅ Hash SHA256: {response['hash_sha256'][:16]}...")
@@ -150,7 +151,9 @@ def test_iopole_connection():
     print("\n💡 Note: Les tests s'exécutent en mode SIMULATION")
     print("   Pour activer le mode RÉEL, vérifiez la configuration IOPOLE")
     print("="*70 + "\n")
+    
+    await iopole_client.aclose()
 
 
 if __name__ == "__main__":
-    test_iopole_connection()
+    asyncio.run(test_iopole_connection())
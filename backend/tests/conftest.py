@@ -0,0 +1,247 @@
+"""
+Client Supabase en mémoire partagé par les tests (fixture fake_supabase)
+
+Sous-ensemble du request builder postgrest-py : select, filtres (eq, neq,
+gt, gte, lt, lte, in_, is_, not_, or_ avec and(...)/or(...) imbriqués),
+order, limit, range, insert, upsert, update, delete, execute. Les filtres
+sont évalués à execute() sur l'état courant des tables, comme en base.
+
+client.log : une entrée par execute() ("table", "update table", nom de la
+fonction SQL...) pour vérifier le nombre et l'ordre des requêtes.
+Fonctions SQL : client.rpcs[nom] = fonction(params) -> lignes ; une
+fonction non déclarée répond PGRST202 (migration non appliquée).
+"""
+
+import itertools
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, current = [], 0, ""
+    for char in text:
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    return [p for p in parts + [current] if p]
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _compare(value: Any, op: str, arg: Any) -> bool:
+    if op == "is":
+        return _as_text(value) == _as_text(arg).lower()
+    if op == "in":
+        return _as_text(value) in {_as_text(a) for a in arg}
+    if op == "eq":
+        return _as_text(value) == _as_text(arg)
+    if op == "neq":
+        return _as_text(value) != _as_text(arg)
+    if value is None:
+        return False
+    try:
+        left, right = float(value), float(arg)
+    except (TypeError, ValueError):
+        left, right = str(value), str(arg)
+    return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}[op]
+
+
+def _or_predicate(expression: str, combine=any) -> Callable[[dict], bool]:
+    """'a.eq.1,and(b.gt.2,c.is.null)' -> prédicat sur une ligne"""
+    predicates = []
+    for item in _split_top_level(expression):
+        if item.startswith(("and(", "or(")):
+            name, _, rest = item.partition("(")
+            predicates.append(_or_predicate(rest[:-1], all if name == "and" else any))
+            continue
+        column, op, arg = item.split(".", 2)
+        if op == "in":
+            arg = [a.strip('"') for a in _split_top_level(arg[1:-1])]
+        predicates.append(lambda row, c=column, o=op, a=arg: _compare(row.get(c), o, a))
+    return lambda row: combine(p(row) for p in predicates)
+
+
+def _sort_key(value: Any):
+    return (value is None, value if value is not None else "")
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeSupabase", name: str, source: Optional[Callable[[], List[dict]]] = None):
+        self.client = client
+        self.name = name
+        self.source = source  # fonction SQL : lignes calculées à execute()
+        self.operation = "select"
+        self.values: Any = None
+        self.options: Dict[str, Any] = {}
+        self.predicates: List[Callable[[dict], bool]] = []
+        self.sort: List[tuple] = []
+        self.window: Optional[tuple] = None
+        self.count = False
+        self._negate = False
+
+    # Opérations
+
+    def select(self, columns: str = "*", count: Optional[str] = None, **kwargs):
+        self.client.selects.append((self.name, " ".join(columns.split())))
+        self.count = count is not None
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.operation, self.values = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = "id", ignore_duplicates: bool = False, **kwargs):
+        self.operation, self.values = "upsert", rows
+        self.options = {"on_conflict": on_conflict.split(","), "ignore_duplicates": ignore_duplicates}
+        return self
+
+    def update(self, values):
+        self.operation, self.values = "update", values
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    # Filtres
+
+    def _where(self, op: str, column: str, value: Any):
+        negate, self._negate = self._negate, False
+        self.predicates.append(lambda row: _compare(row.get(column), op, value) != negate)
+        return self
+
+    def eq(self, column, value):
+        return self._where("eq", column, value)
+
+    def neq(self, column, value):
+        return self._where("neq", column, value)
+
+    def gt(self, column, value):
+        return self._where("gt", column, value)
+
+    def gte(self, column, value):
+        return self._where("gte", column, value)
+
+    def lt(self, column, value):
+        return self._where("lt", column, value)
+
+    def lte(self, column, value):
+        return self._where("lte", column, value)
+
+    def in_(self, column, values):
+        return self._where("in", column, list(values))
+
+    def is_(self, column, value):
+        return self._where("is", column, value)
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def or_(self, expression: str):
+        self.predicates.append(_or_predicate(expression))
+        return self
+
+    # Modificateurs
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        self.sort.append((column, desc))
+        return self
+
+    def limit(self, size: int):
+        self.window = (0, size)
+        return self
+
+    def range(self, start: int, end: int):
+        self.window = (start, end - start + 1)
+        return self
+
+    def execute(self) -> FakeResponse:
+        for hook in list(self.client.hooks):
+            hook(self)
+        label = self.name if self.operation == "select" else f"{self.operation} {self.name}"
+        self.client.log.append(label)
+        if self.name in self.client.missing:
+            raise Exception(f"{{'code': '42P01', 'message': 'relation \"public.{self.name}\" does not exist'}}")
+        if self.operation in ("insert", "upsert"):
+            return FakeResponse(self._write())
+
+        table = self.source() if self.source else self.client.tables.setdefault(self.name, [])
+        rows = [row for row in table if all(p(row) for p in self.predicates)]
+        if self.operation == "update":
+            for row in rows:
+                row.update(self.values)
+        elif self.operation == "delete":
+            self.client.tables[self.name] = [row for row in table if not any(row is r for r in rows)]
+        total = len(rows)
+        for column, desc in reversed(self.sort):
+            rows.sort(key=lambda r: _sort_key(r.get(column)), reverse=desc)
+        if self.window:
+            start, size = self.window
+            rows = rows[start:start + size]
+        return FakeResponse([dict(row) for row in rows], total if self.count else None)
+
+    def _write(self) -> List[dict]:
+        table = self.client.tables.setdefault(self.name, [])
+        written = []
+        for row in self.values if isinstance(self.values, list) else [self.values]:
+            keys = self.options.get("on_conflict", ["id"])
+            existing = next((r for r in table if all(k in row and r.get(k) == row[k] for k in keys)), None)
+            if existing is not None and self.operation == "upsert":
+                if self.options["ignore_duplicates"]:
+                    continue
+                existing.update(row)
+                written.append(dict(existing))
+                continue
+            if existing is not None:
+                raise Exception("{'code': '23505', 'message': 'duplicate key value violates unique constraint'}")
+            stored = {"id": f"new{next(self.client.ids)}", **row}
+            table.append(stored)
+            written.append(dict(stored))
+        return written
+
+
+class FakeSupabase:
+    """Tables en mémoire : FakeSupabase(schedules=[...], users=[...])"""
+
+    def __init__(self, **tables: List[dict]):
+        self.tables: Dict[str, List[dict]] = tables
+        self.rpcs: Dict[str, Callable[[Dict[str, Any]], List[dict]]] = {}
+        self.hooks: List[Callable[[FakeQuery], None]] = []  # appelés avant chaque execute()
+        self.missing = set()  # tables absentes (migration non appliquée)
+        self.log: List[str] = []
+        self.selects: List[tuple] = []
+        self.ids = itertools.count(1)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> FakeQuery:
+        def source():
+            if name not in self.rpcs:
+                raise Exception(f"{{'code': 'PGRST202', 'message': 'Could not find the function public.{name}'}}")
+            return self.rpcs[name](params)
+        return FakeQuery(self, name, source)
+
+
+@pytest.fixture
+def fake_supabase():
+    """Fabrique de clients en mémoire : fake_supabase(table=[lignes, ...])"""
+    return FakeSupabase
@@ -0,0 +1,115 @@
+import sys
+from datetime import date, datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_aggregates import (
+    AIAggregates, format_projects_prompt, resolve_project_refs, summarize_projects, summarize_quotes
+)
+
+
+class _Query:
+    def __init__(self, client, table):
+        self.client, self.table, self.columns = client, table, None
+
+    def select(self, columns, **kwargs):
+        self.columns = columns
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.client.selects.append((self.table, self.columns))
+        rows = self.client.rows.get(self.table, [])
+        return SimpleNamespace(data=rows, count=len(rows))
+
+
+class _MissingRPC:
+    def __init__(self, name):
+        self.name = name
+
+    def execute(self):
+        raise RuntimeError(f"{{'code': 'PGRST202', 'message': 'Could not find the function public.{self.name}'}}")
+
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.selects = []
+        self.rpcs = []
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        self.rpcs.append(name)
+        return _MissingRPC(name)
+
+
+def test_summarize_quotes_counts_and_sums():
+    rows = [
+        {"id": "q1", "title": "Toiture", "amount": "1200.50", "status": "ACCEPTED"},
+        {"id": "q2", "title": "Façade", "amount": 300, "status": "SENT"},
+        {"id": "q3", "title": "Dalle", "amount": 8000, "status": "DRAFT"},
+        {"id": "q4", "title": "Clôture", "amount": None, "status": "SENT"},
+    ]
+    summary = summarize_quotes(rows)
+    assert summary["total"] == 4
+    assert summary["amount"] == 9500.5
+    assert (summary["accepted"], summary["accepted_amount"], summary["pending"]) == (1, 1200.5, 2)
+
+
+def test_summarize_projects_orders_by_nearest_deadline():
+    today = date(2026, 10, 19)
+    rows = [
+        {"id": "p1", "name": "Gymnase", "status": "ACTIVE", "end_date": "2026-12-01"},
+        {"id": "p2", "name": "École", "status": "IN_PROGRESS", "end_date": "2026-10-10"},
+        {"id": "p3", "name": "Mairie", "status": "ACTIVE", "end_date": None},
+        {"id": "p4", "name": "Piscine", "status": "ACTIVE", "end_date": "2026-10-25T00:00:00+00:00"},
+    ]
+    summary = summarize_projects(rows, today, top=3)
+    assert (summary["active"], summary["overdue"], summary["due_soon"], summary["no_end_date"]) == (4, 1, 1, 1)
+    assert [p["id"] for p in summary["projects"]] == ["p2", "p4", "p1"]
+    assert summary["projects"][0]["days_left"] == -9
+
+    prompt = format_projects_prompt(summary)
+    assert "4 projets en cours, 1 en retard" in prompt
+    assert "#1 École | IN_PROGRESS | N/A | J-9" in prompt
+    assert "p2" not in prompt
+
+    predictions = resolve_project_refs([{"project_id": "#2", "risk_level": "HIGH"}, {"project_id": "p9"}], summary)
+    assert predictions[0]["project_id"] == "p4" and predictions[0]["project_name"] == "Piscine"
+    assert predictions[1]["project_id"] == "p9"
+
+
+def test_fallback_reads_only_needed_columns():
+    client = FakeSupabase({
+        "quotes": [{"id": "q1", "title": "Toiture", "amount": 100, "status": "ACCEPTED"}],
+        "clients": [{"id": "c1"}, {"id": "c2"}],
+        "searches": [{"status": "PROCESSED"}, {"status": "ACTIVE"}],
+        "projects": [{"id": "p1", "name": "Gymnase", "status": "ACTIVE", "end_date": "2026-10-20"}],
+    })
+    aggregates = AIAggregates(client)
+
+    stats = aggregates.company_statistics("company-1", datetime(2026, 9, 19))
+    assert stats["source"] == "python"
+    assert stats["quotes"]["total"] == 1 and stats["clients"]["total"] == 2
+    assert stats["searches"] == {"total": 2, "processed": 1}
+
+    risk = aggregates.projects_at_risk("company-1", today=date(2026, 10, 19))
+    assert risk["source"] == "python" and risk["due_soon"] == 1
+
+    assert all(columns != "*" for _, columns in client.selects)
+
+
+def test_missing_sql_functions_are_asked_once_per_process():
+    client = FakeSupabase({"projects": []})
+    aggregates = AIAggregates(client)
+    for _ in range(3):
+        assert aggregates.company_statistics("company-1", datetime(2026, 9, 19))["source"] == "python"
+        assert aggregates.projects_at_risk("company-1", today=date(2026, 10, 19))["source"] == "python"
+    assert client.rpcs == ["ai_company_statistics", "ai_projects_at_risk"]
@@ -0,0 +1,73 @@
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_cache import AICache, LRUTTLCache, SQLiteCacheBackend, history_digest, make_cache_key, normalize_query
+
+
+def _query_key(role, query, history=None):
+    return make_cache_key("query", "company-1", role, normalize_query(query), history_digest(history))
+
+
+def test_lru_evicts_least_recently_used_and_expires():
+    cache = LRUTTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+    cache.set("short", "x", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+
+
+def test_key_normalizes_query_but_separates_role_and_history():
+    assert _query_key("ADMIN", "Devis  de Dupont ") == _query_key("ADMIN", "devis de dupont")
+    assert _query_key("ADMIN", "devis") != _query_key("TECHNICIEN", "devis")
+    history = [{"role": "user", "content": "et à Mennecy ?"}]
+    assert _query_key("ADMIN", "devis") != _query_key("ADMIN", "devis", history)
+
+
+def test_sqlite_backend_shares_hits_between_workers(tmp_path):
+    path = str(tmp_path / "ai_cache.sqlite")
+    worker_a = AICache(LRUTTLCache(), SQLiteCacheBackend(path))
+    worker_b = AICache(LRUTTLCache(), SQLiteCacheBackend(path))
+    key = _query_key("ADMIN", "statistiques du mois")
+
+    assert worker_b.get(key) is None
+    worker_a.set(key, {"success": True, "message": "45 devis"})
+    assert worker_b.get(key) == {"success": True, "message": "45 devis"}
+
+    metrics = worker_b.get_metrics()
+    assert metrics["hits"] == 1 and metrics["misses"] == 1
+    assert metrics["namespaces"]["query"]["shared_hits"] == 1
+
+
+def test_async_shared_tier_runs_off_the_loop_and_hits_stay_read_only(tmp_path):
+    path = str(tmp_path / "ai_cache.sqlite")
+    shared = SQLiteCacheBackend(path)
+    worker_a, worker_b = AICache(LRUTTLCache(), SQLiteCacheBackend(path)), AICache(LRUTTLCache(), shared)
+    key = _query_key("ADMIN", "chantiers en retard")
+    threads = []
+    read = shared.get
+    shared.get = lambda k: threads.append(threading.current_thread()) or read(k)
+
+    async def scenario():
+        await worker_a.aset(key, {"success": True})
+        touched = shared._conn.execute("SELECT last_access FROM ai_cache").fetchone()[0]
+        assert await worker_b.aget(key) == {"success": True}
+        assert await worker_b.aget(key) == {"success": True}  # LRU local : pas de relecture
+        return touched
+    touched = asyncio.run(scenario())
+
+    assert threads and threading.main_thread() not in threads
+    assert shared._conn.execute("SELECT last_access FROM ai_cache").fetchone()[0] == touched
+    assert worker_b.get_metrics()["namespaces"]["query"] == {"hits": 2, "shared_hits": 1, "misses": 0, "sets": 0}
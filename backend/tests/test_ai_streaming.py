@@ -0,0 +1,106 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from openai import AsyncOpenAI
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_service import AIService
+
+
+def _chunk(delta: dict, finish_reason=None, usage=None) -> str:
+    body = {
+        "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+        "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+
+def make_fake_completion_server():
+    """Faux serveur OpenAI : 1er appel => tool call search_devis, 2e appel => texte"""
+    fake = FastAPI()
+    fake.state.requests = []
+
+    @fake.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        fake.state.requests.append(body)
+        usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        if any(m["role"] == "tool" for m in body["messages"]):
+            parts = [_chunk({"role": "assistant", "content": ""})]
+            parts += [_chunk({"content": piece}) for piece in ["3 devis ", "pour ", "Dupont."]]
+        else:
+            parts = [
+                _chunk({"role": "assistant", "tool_calls": [
+                    {"index": 0, "id": "call_1", "type": "function", "function": {"name": "search_devis", "arguments": ""}}
+                ]}),
+                _chunk({"tool_calls": [{"index": 0, "function": {"arguments": '{"client_'}}]}),
+                _chunk({"tool_calls": [{"index": 0, "function": {"arguments": 'name": "Dupont"}'}}]}),
+            ]
+        parts += [_chunk({}, finish_reason="stop"), _chunk({}, usage=usage), "data: [DONE]\n\n"]
+
+        async def stream():
+            for part in parts:
+                yield part
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return fake
+
+
+def make_service(fake: FastAPI) -> AIService:
+    client = AsyncOpenAI(
+        api_key="test-key",
+        base_url="http://openai.test/v1",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake)),
+    )
+    service = AIService(None, openai_client=client)
+
+    async def fake_search_devis(company_id, filters):
+        return [{"id": "q1", "client": filters.get("client_name")}] * 3
+
+    service.functions["search_devis"] = fake_search_devis
+    return service
+
+
+async def _collect(gen):
+    return [event async for event in gen]
+
+
+def test_stream_universal_query_forwards_tokens_and_function_progress():
+    fake = make_fake_completion_server()
+    service = make_service(fake)
+
+    events = asyncio.run(_collect(service.stream_universal_query("company-1", "Devis de Dupont", "ADMIN")))
+    kinds = [e["event"] for e in events]
+
+    assert kinds[0] == "function_call"
+    assert events[0]["data"] == {"name": "search_devis", "arguments": {"client_name": "Dupont"}}
+    assert kinds[1] == "function_result" and events[1]["data"]["count"] == 3
+    assert "".join(e["data"] for e in events if e["event"] == "token") == "3 devis pour Dupont."
+    done = events[-1]
+    assert done["event"] == "done"
+    assert done["data"]["function_called"] == "search_devis"
+    assert done["data"]["tokens_used"] == 30
+    assert service.stats["tokens_used"] == 30
+    assert fake.state.requests[0]["stream"] is True
+
+
+def test_stream_result_is_cached_for_next_call():
+    fake = make_fake_completion_server()
+    service = make_service(fake)
+
+    asyncio.run(_collect(service.stream_universal_query("company-1", "Devis de Dupont", "ADMIN")))
+    events = asyncio.run(_collect(service.stream_universal_query("company-1", "devis de  dupont", "ADMIN")))
+
+    assert [e["event"] for e in events] == ["done"]
+    assert events[0]["data"]["cached"] is True
+    assert len(fake.state.requests) == 2
+    assert service.get_stats()["cache"]["hits"] == 1
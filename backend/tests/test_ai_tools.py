@@ -0,0 +1,93 @@
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, Request
+from openai import AsyncOpenAI
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_service import AIService
+
+TOOL_DELAY = 0.2
+
+
+def make_fake_tool_server():
+    """Faux serveur OpenAI : 1er tour => 3 tool calls en parallèle, 2e tour => réponse"""
+    fake = FastAPI()
+    fake.state.requests = []
+
+    @fake.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        fake.state.requests.append(body)
+        if any(m["role"] == "tool" for m in body["messages"]):
+            message = {"role": "assistant", "content": "2 devis et 1 intervention pour Dupont."}
+            finish = "stop"
+        else:
+            calls = [
+                ("search_devis", {"client_name": "Dupont"}),
+                ("search_planning", {"date_from": "2026-10-01"}),
+                ("get_client_details", {"client_id": "c1"}),
+            ]
+            message = {"role": "assistant", "content": None, "tool_calls": [
+                {"id": f"call_{i}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+                for i, (name, args) in enumerate(calls)
+            ]}
+            finish = "tool_calls"
+        return {
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30},
+        }
+
+    return fake
+
+
+def make_service(fake: FastAPI) -> AIService:
+    client = AsyncOpenAI(
+        api_key="test-key",
+        base_url="http://openai.test/v1",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=fake)),
+    )
+    service = AIService(None, openai_client=client)
+
+    async def slow_filter_tool(company_id, filters):
+        await asyncio.sleep(TOOL_DELAY)
+        return [{"company_id": company_id, **filters}]
+
+    async def slow_client_details(company_id, client_id):
+        await asyncio.sleep(TOOL_DELAY)
+        return {"id": client_id, "nom": "Dupont"}
+
+    service.functions["search_devis"] = slow_filter_tool
+    service.functions["search_planning"] = slow_filter_tool
+    service.functions["get_client_details"] = slow_client_details
+    return service
+
+
+def test_multiple_tool_calls_run_concurrently_in_one_round():
+    fake = make_fake_tool_server()
+    service = make_service(fake)
+
+    started = time.perf_counter()
+    result = asyncio.run(service.universal_query("company-1", "devis et planning de Dupont ce mois", "ADMIN"))
+    elapsed = time.perf_counter() - started
+
+    assert result["success"] is True
+    assert result["functions_called"] == ["search_devis", "search_planning", "get_client_details"]
+    assert result["data"][2]["result"] == {"id": "c1", "nom": "Dupont"}
+    assert result["rounds"] == 1
+    assert len(fake.state.requests) == 2
+    assert elapsed < 3 * TOOL_DELAY
+
+    second = fake.state.requests[1]["messages"]
+    assert [m["tool_call_id"] for m in second if m["role"] == "tool"] == ["call_0", "call_1", "call_2"]
+
+    tools = service.get_stats()["tools"]
+    assert tools["search_devis"]["calls"] == 1
+    assert tools["get_client_details"]["avg_ms"] >= TOOL_DELAY * 1000 * 0.9
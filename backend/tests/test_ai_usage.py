@@ -0,0 +1,164 @@
+import sys
+import asyncio
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ai_usage import AIQuotaExceededError, AIUsageMeter, CompanyRateLimiter
+
+
+class _Query:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        self.client.selects.append(self.table)
+        return SimpleNamespace(data=self.client.rows.get(self.table, []))
+
+
+class _RPC:
+    def __init__(self, client, name, params):
+        self.client, self.name, self.params = client, name, params
+
+    def execute(self):
+        if self.client.fail_rpc:
+            raise RuntimeError("PostgREST indisponible")
+        self.client.rpc_calls.append((self.name, self.params))
+        return SimpleNamespace(data=None)
+
+
+class FakeSupabase:
+    def __init__(self, rows=None):
+        self.rows = rows or {}
+        self.selects = []
+        self.rpc_calls = []
+        self.fail_rpc = False
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        return _RPC(self, name, params)
+
+
+def test_rate_limiter_refuses_burst_beyond_rpm():
+    limiter = CompanyRateLimiter(requests_per_minute=3)
+    assert [limiter.try_acquire("c1") for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = limiter.try_acquire("c1")
+    assert 0 < wait <= 20
+    # Seau indépendant par entreprise
+    assert limiter.try_acquire("c2") == 0.0
+
+
+def test_rate_limiter_applies_its_share_of_the_limit_per_worker():
+    # 2 workers uvicorn : 6 requêtes / minute au total, 3 par worker (limite par entreprise comprise)
+    limiter = CompanyRateLimiter(requests_per_minute=6, workers=2)
+    assert [limiter.try_acquire("c1") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.try_acquire("c1") > 0
+    # Limite inférieure au nombre de workers : au moins une requête par minute et par worker
+    assert limiter.try_acquire("c2", requests_per_minute=1) == 0.0
+    assert limiter.try_acquire("c2", requests_per_minute=1) > 0
+
+
+def test_daily_budget_counts_persisted_and_pending_tokens():
+    client = FakeSupabase({"ai_usage_daily": [{"total_tokens": 900}]})
+    meter = AIUsageMeter(client, daily_token_budget=1000, requests_per_minute=0)
+
+    meter.check("c1")
+    meter.record("c1", "query", "gpt-4o", 80, 40, 0.001)
+    with pytest.raises(AIQuotaExceededError) as exc:
+        meter.check("c1")
+    assert exc.value.reason == "daily_budget"
+    assert exc.value.retry_after > 0
+
+    # Les autres entreprises ne sont pas concernées
+    client.rows["ai_usage_daily"] = []
+    meter.check("c2")
+
+
+def test_company_limits_override_defaults():
+    client = FakeSupabase({"ai_company_limits": [{"daily_token_budget": None, "requests_per_minute": 1}]})
+    meter = AIUsageMeter(client, daily_token_budget=0, requests_per_minute=100)
+    meter.check("c1")
+    with pytest.raises(AIQuotaExceededError) as exc:
+        meter.check("c1")
+    assert exc.value.reason == "rate_limit"
+
+
+def test_flush_writes_all_counters_in_one_rpc_and_requeues_on_failure():
+    client = FakeSupabase()
+    meter = AIUsageMeter(client)
+    for _ in range(5):
+        meter.record("c1", "query", "gpt-4o", 100, 20, 0.002)
+    meter.record("c1", "devis", "gpt-4o", 300, 200, 0.01)
+    meter.record("c2", "query", "gpt-4o-mini", 50, 10, 0.0001)
+
+    client.fail_rpc = True
+    assert asyncio.run(meter.flush()) == 0
+    assert meter.get_metrics()["pending_keys"] == 3
+
+    client.fail_rpc = False
+    assert asyncio.run(meter.flush()) == 3
+    assert len(client.rpc_calls) == 1
+    name, params = client.rpc_calls[0]
+    assert name == "record_ai_usage"
+    rows = {(r["company_id"], r["endpoint"]): r for r in params["p_rows"]}
+    assert rows[("c1", "query")]["requests"] == 5
+    assert rows[("c1", "query")]["total_tokens"] == 600
+    assert rows[("c1", "devis")]["prompt_tokens"] == 300
+    assert meter.get_metrics()["pending_keys"] == 0
+    assert asyncio.run(meter.flush()) == 0
+
+
+def test_checks_in_threads_while_the_loop_records():
+    meter = AIUsageMeter(FakeSupabase(), daily_token_budget=10 ** 9, requests_per_minute=10 ** 6)
+    for i in range(5000):  # longue itération de _pending à chaque check()
+        meter.record("c2", f"/ai/old-{i}", "gpt-4o-mini", 0, 0, 0.0)
+    errors = []
+
+    def checks():
+        try:
+            for _ in range(200):
+                meter.check("c1")
+        except Exception as e:  # RuntimeError: dictionary changed size during iteration
+            errors.append(e)
+
+    async def scenario():
+        worker = asyncio.create_task(asyncio.to_thread(checks))
+        i = 0
+        while not worker.done():
+            meter.record("c1", f"/ai/endpoint-{i}", "gpt-4o-mini", 1, 1, 0.0)
+            i += 1
+            await asyncio.sleep(0)
+        await worker
+        return i
+
+    recorded = asyncio.run(scenario())
+    assert errors == []
+    assert meter.tokens_today("c1") == 2 * recorded
+
+
+def test_concurrent_checks_never_share_the_last_token():
+    limiter = CompanyRateLimiter(requests_per_minute=50)
+    barrier = threading.Barrier(8)
+    accepted = []
+
+    def burst():
+        barrier.wait()
+        accepted.extend(w for w in (limiter.try_acquire("c1") for _ in range(20)) if w == 0.0)
+
+    threads = [threading.Thread(target=burst) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(accepted) == 50
@@ -0,0 +1,141 @@
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+import delta_sync
+import server_supabase
+from delta_sync import DeltaSync
+
+T0 = "2026-10-19T08:00:00+00:00"
+
+
+def _db(fake_supabase):
+    return fake_supabase(
+        searches=[
+            {"id": "a1", "company_id": "c1", "user_id": "t1", "updated_at": T0},
+            {"id": "a2", "company_id": "c1", "user_id": "t2", "updated_at": T0},
+        ],
+        # Planification groupée : une insertion, même updated_at pour tout le lot
+        schedules=[{"id": f"m{i}", "company_id": "c1", "collaborator_id": "t1", "updated_at": T0} for i in range(5)],
+        materials=[{"id": "x1", "company_id": "c1", "updated_at": T0},
+                   {"id": "x9", "company_id": "c2", "updated_at": T0}],
+        clients=[],
+        sync_tombstones=[{"id": 1, "company_id": "c1", "resource": "missions", "record_id": "old", "owner_id": "t1",
+                          "reassigned": False, "deleted_at": "2026-10-01T00:00:00+00:00"}],
+    )
+
+
+def _delete(db, table, resource, record_id, owner_id, at, reassigned=False):
+    """Ce que fait le trigger record_sync_tombstone"""
+    if not reassigned:
+        db.tables[table] = [r for r in db.tables[table] if r["id"] != record_id]
+    db.tables["sync_tombstones"].append({
+        "id": len(db.tables["sync_tombstones"]) + 1, "company_id": "c1", "resource": resource,
+        "record_id": record_id, "owner_id": owner_id, "reassigned": reassigned, "deleted_at": at,
+    })
+
+
+def _pull(sync, tokens, role="TECHNICIEN", limit=2):
+    """Boucle client : pages jusqu'à has_more faux, renvoie lignes, suppressions et curseurs"""
+    changed, deleted = {}, {}
+    while True:
+        body = sync.sync("c1", "t1", role, tokens, limit=limit)
+        for name, res in body["resources"].items():
+            changed.setdefault(name, []).extend(r["id"] for r in res["changed"])
+            deleted.setdefault(name, []).extend(d["id"] for d in res["deleted"])
+            tokens[name] = res["next"]
+        if not body["has_more"]:
+            return changed, deleted, tokens
+
+
+def test_initial_then_delta_sync_with_tombstones(fake_supabase):
+    db = _db(fake_supabase)
+    sync = DeltaSync(lambda: db)
+    changed, deleted, tokens = _pull(sync, {"searches": None, "missions": None, "materials": None})
+    # Pagination par (updated_at, id) : 5 missions de même updated_at, ni doublon ni trou
+    assert changed == {"searches": ["a1"], "missions": ["m0", "m1", "m2", "m3", "m4"], "materials": ["x1"]}
+    assert deleted == {"searches": [], "missions": [], "materials": []}
+
+    db.tables["schedules"][2]["updated_at"] = "2026-10-19T09:00:00+00:00"
+    _delete(db, "schedules", "missions", "m4", "t1", "2026-10-19T09:05:00+00:00")
+    db.tables["schedules"][0].update(collaborator_id="t2", updated_at="2026-10-19T09:10:00+00:00")
+    _delete(db, "schedules", "missions", "m0", "t1", "2026-10-19T09:10:00+00:00", reassigned=True)
+    _delete(db, "searches", "searches", "a2", "t2", "2026-10-19T09:15:00+00:00")
+
+    changed, deleted, tokens = _pull(sync, tokens)
+    assert changed == {"searches": [], "missions": ["m2"], "materials": []}
+    assert deleted == {"searches": [], "missions": ["m4", "m0"], "materials": []}
+
+    # Rien de neuf : rien transmis
+    changed, deleted, _ = _pull(sync, tokens)
+    assert changed == deleted == {"searches": [], "missions": [], "materials": []}
+
+
+def test_office_scope_ignores_reassignments(fake_supabase):
+    db = _db(fake_supabase)
+    sync = DeltaSync(lambda: db)
+    _, _, tokens = _pull(sync, {"missions": None}, role="BUREAU")
+    db.tables["schedules"][0].update(collaborator_id="t2", updated_at="2026-10-19T09:10:00+00:00")
+    _delete(db, "schedules", "missions", "m0", "t1", "2026-10-19T09:10:00+00:00", reassigned=True)
+    changed, deleted, _ = _pull(sync, tokens, role="BUREAU")
+    assert changed == {"missions": ["m0"]} and deleted == {"missions": []}
+
+
+def test_late_commit_inside_safety_lag_is_not_skipped(monkeypatch, fake_supabase):
+    db = _db(fake_supabase)
+    sync = DeltaSync(lambda: db)
+    now = datetime(2026, 10, 20, 12, 0, tzinfo=timezone.utc)
+    monkeypatch.setattr(delta_sync, "_utcnow", lambda: now)
+    _, _, tokens = _pull(sync, {"missions": None})
+
+    # Transaction B ouverte à -10 s, A validée à -2 s : A est lue avant que B soit visible
+    stamp = lambda seconds: (now - timedelta(seconds=seconds)).isoformat()
+    db.tables["schedules"].append({"id": "mA", "company_id": "c1", "collaborator_id": "t1", "updated_at": stamp(2)})
+    changed, _, tokens = _pull(sync, tokens)
+    assert changed == {"missions": []}
+
+    db.tables["schedules"].append({"id": "mB", "company_id": "c1", "collaborator_id": "t1", "updated_at": stamp(10)})
+    _delete(db, "schedules", "missions", "m1", "t1", stamp(15))
+    now += timedelta(minutes=1)
+    changed, deleted, _ = _pull(sync, tokens)
+    assert changed == {"missions": ["mB", "mA"]} and deleted == {"missions": ["m1"]}
+
+
+def test_missing_tombstones_forces_full_resync(fake_supabase):
+    db = _db(fake_supabase)
+    sync = DeltaSync(lambda: db)
+    _, _, tokens = _pull(sync, {"materials": None})
+    db.missing.add("sync_tombstones")
+    body = sync.sync("c1", "t1", "TECHNICIEN", tokens)
+    assert body["resources"]["materials"]["reset"] is True
+    assert [r["id"] for r in body["resources"]["materials"]["changed"]] == ["x1"]
+
+
+def test_sync_endpoint_rejects_bad_cursor_and_unknown_resource(monkeypatch, fake_supabase):
+    async def technician():
+        return {"id": "t1", "role": "TECHNICIEN", "company_id": "c1"}
+
+    async def company(user_data):
+        return "c1"
+    monkeypatch.setattr(server_supabase, "delta_sync", DeltaSync(lambda: _db(fake_supabase)))
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = technician
+    try:
+        http = TestClient(server_supabase.app)
+        res = http.post("/api/sync", json={})
+        assert res.status_code == 200
+        assert set(res.json()["resources"]) == {"searches", "missions", "materials", "clients"}
+        assert http.post("/api/sync", json={"resources": {"missions": "pas-un-curseur"}}).status_code == 400
+        assert http.post("/api/sync", json={"resources": {"quotes": None}}).status_code == 400
+    finally:
+        server_supabase.app.dependency_overrides.clear()
@@ -0,0 +1,194 @@
+import asyncio
+import socketserver
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from email_service import EmailOutbox, OutgoingEmail, SMTPTransport
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Serveur SMTP local minimal : accepte tout et garde les messages"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, reject_first: int = 0):
+        super().__init__(("127.0.0.1", 0), SMTPSinkHandler)
+        self.messages = []
+        self.connections = 0
+        self.reject_first = reject_first
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        sink = self.server
+        sink.connections += 1
+        self.reply("220 sink ESMTP")
+        while True:
+            line = self.rfile.readline().decode(errors="replace").strip()
+            if not line:
+                return
+            verb = line.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 sink")
+            elif verb == "DATA":
+                self.reply("354 go ahead")
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if chunk in (b".\r\n", b".\n", b""):
+                        break
+                    data.append(chunk)
+                if sink.reject_first > 0:
+                    sink.reject_first -= 1
+                    self.reply("451 try again later")
+                else:
+                    sink.messages.append(b"".join(data))
+                    self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_sink():
+    sink = SMTPSink()
+    thread = threading.Thread(target=sink.serve_forever, daemon=True)
+    thread.start()
+    yield sink
+    sink.shutdown()
+    sink.server_close()
+
+
+def _email(i: int) -> OutgoingEmail:
+    return OutgoingEmail(to_email=f"user{i}@example.com", subject=f"Invitation {i}",
+                         html_body="<p>Bonjour</p>", text_body="Bonjour")
+
+
+def _outbox(sink: SMTPSink, **kwargs) -> EmailOutbox:
+    transport = SMTPTransport("127.0.0.1", sink.server_address[1], use_tls=False, timeout=5)
+    return EmailOutbox(transport, **kwargs)
+
+
+def test_outbox_batches_over_single_connection(smtp_sink):
+    outbox = _outbox(smtp_sink, batch_size=10)
+    for i in range(25):
+        assert outbox.enqueue(_email(i))
+    assert outbox.queue_depth == 25
+
+    async def run():
+        while outbox.queue_depth:
+            await outbox.send_pending()
+        await outbox.stop()
+
+    asyncio.run(run())
+    metrics = outbox.get_metrics()
+    assert metrics["sent"] == 25
+    assert metrics["batches"] == 3
+    assert len(smtp_sink.messages) == 25
+    assert smtp_sink.connections == 1
+
+
+def test_outbox_retries_transient_failures_with_backoff(smtp_sink):
+    smtp_sink.reject_first = 1
+    outbox = _outbox(smtp_sink, backoff_base=0.01)
+    outbox.enqueue(_email(1))
+
+    async def run():
+        outbox.start()
+        for _ in range(200):
+            if outbox.get_metrics()["sent"]:
+                break
+            await asyncio.sleep(0.01)
+        await outbox.stop()
+
+    asyncio.run(run())
+    metrics = outbox.get_metrics()
+    assert metrics["sent"] == 1
+    assert metrics["retried"] == 1
+    assert metrics["queue_depth"] == 0
+    assert len(smtp_sink.messages) == 1
+
+
+def test_persisted_outbox_survives_restart(smtp_sink, fake_supabase):
+    db = fake_supabase(email_outbox=[])
+    before_restart = _outbox(smtp_sink)
+    before_restart.attach_store(db)
+    assert before_restart.enqueue(_email(1))
+    assert before_restart.queue_depth == 0
+    assert [row["status"] for row in db.tables["email_outbox"]] == ["pending"]
+
+    # Redéploiement : le processus qui a mis l'email en file n'est plus là
+    after_restart = _outbox(smtp_sink)
+    after_restart.attach_store(db)
+
+    async def run():
+        assert await after_restart.send_pending() == 1
+        assert await after_restart.send_pending() == 0
+        await after_restart.stop()
+
+    asyncio.run(run())
+    row = db.tables["email_outbox"][0]
+    assert row["status"] == "sent" and row["attempts"] == 1 and row["sent_at"]
+    assert len(smtp_sink.messages) == 1
+
+
+def test_persisted_outbox_keeps_abandoned_emails_visible(smtp_sink, fake_supabase):
+    smtp_sink.reject_first = 1
+    db = fake_supabase(email_outbox=[])
+    outbox = _outbox(smtp_sink, max_attempts=1)
+    outbox.attach_store(db)
+    outbox.enqueue(_email(1))
+
+    async def run():
+        await outbox.send_pending()
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert db.tables["email_outbox"][0]["status"] == "failed"
+
+    # Un autre worker voit l'email abandonné et le remet en file
+    other = _outbox(smtp_sink)
+    other.attach_store(db)
+    metrics = other.get_metrics()
+    assert metrics["stored_failed"] == 1
+    assert [d["to_email"] for d in metrics["dead_letters"]] == ["user1@example.com"]
+    assert other.replay([metrics["dead_letters"][0]["id"]]) == 1
+
+    async def resend():
+        await other.send_pending()
+        await other.stop()
+
+    asyncio.run(resend())
+    assert db.tables["email_outbox"][0]["status"] == "sent"
+    assert len(smtp_sink.messages) == 1
+
+
+def test_workers_never_claim_the_same_email(smtp_sink, fake_supabase):
+    db = fake_supabase(email_outbox=[])
+    first, second = _outbox(smtp_sink), _outbox(smtp_sink)
+    for outbox in (first, second):
+        outbox.attach_store(db)
+    for i in range(3):
+        first.enqueue(_email(i))
+
+    def race(query):
+        # Le second worker réserve le lot entre la sélection et l'UPDATE du premier
+        if query.operation == "select" and query.name == "email_outbox":
+            db.hooks.remove(race)
+            race.claimed = second._claim_batch(10)
+    db.hooks.append(race)
+
+    assert first._claim_batch(10) == []
+    assert len(race.claimed) == 3
+    assert {row["claimed_by"] for row in db.tables["email_outbox"]} == {second.worker_id}
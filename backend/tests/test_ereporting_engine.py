@@ -0,0 +1,65 @@
+import sys
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from ereporting_engine import EReportingEngine, aggregate_lines, effective_vat_rate
+
+
+def test_aggregate_lines_exact_cents_and_distinct_invoices():
+    rows = [
+        ("emitted", "b2c", Decimal("20"), "inv-1", 0.1, 0.02, 0.12),
+        ("emitted", "b2c", Decimal("20"), "inv-1", 0.2, 0.04, 0.24),
+        ("emitted", "b2c", Decimal("20"), "inv-2", 1234.56, 246.91, 1481.47),
+        ("emitted", "b2c", Decimal("5.5"), "inv-2", 100, 5.5, 105.5),
+        ("received", "purchase", None, "rec-1", 50, 7, 57),
+    ]
+    groups = {(g["direction"], g["transaction_category"], g["tva_rate"]): g for g in aggregate_lines(rows)}
+
+    b2c_20 = groups[("emitted", "b2c", Decimal("20.00"))]
+    assert b2c_20["total_ht"] == Decimal("1234.86")
+    assert b2c_20["total_tva"] == Decimal("246.97")
+    assert b2c_20["operations_count"] == 2
+    assert b2c_20["lines_count"] == 3
+    assert groups[("emitted", "b2c", Decimal("5.50"))]["operations_count"] == 1
+    assert groups[("received", "purchase", None)]["total_ttc"] == Decimal("57.00")
+
+
+def test_effective_vat_rate_snaps_to_legal_rate():
+    assert effective_vat_rate(100, 20) == Decimal("20")
+    assert effective_vat_rate(100, 5.51) == Decimal("5.5")
+    assert effective_vat_rate(0, 0) is None
+
+
+def test_period_totals_stops_asking_for_a_missing_sql_function(fake_supabase):
+    db = fake_supabase(
+        invoices_electronic=[{"id": "inv-1", "company_id": "c1", "direction": "outgoing", "status_pdp": "sent",
+                              "invoice_date": "2026-10-05", "transaction_category": "b2c"}],
+        invoice_lines=[{"id": 1, "invoice_id": "inv-1", "tva_rate": 20, "total_ht": 100, "tva_amount": 20,
+                        "total_ttc": 120}],
+        invoices_received=[],
+    )
+    engine = EReportingEngine(db)
+    for _ in range(2):
+        totals = engine.period_totals("c1", date(2026, 10, 1), date(2026, 10, 31))
+        assert totals["source"] == "numpy" and totals["totals"]["emitted"]["total_ttc"] == Decimal("120.00")
+    assert db.log.count("ereporting_period_totals") == 1
+
+
+def test_period_totals_falls_back_once_on_a_transient_error(fake_supabase):
+    db = fake_supabase(invoices_electronic=[], invoice_lines=[], invoices_received=[])
+    failures = iter([Exception("{'code': '57014', 'message': 'canceling statement due to statement timeout'}")])
+
+    def totals_rpc(params):
+        error = next(failures, None)
+        if error:
+            raise error
+        return [{"direction": "emitted", "transaction_category": "b2c", "tva_rate": 20, "operations_count": 1,
+                 "lines_count": 1, "total_ht": 100, "total_tva": 20, "total_ttc": 120}]
+    db.rpcs["ereporting_period_totals"] = totals_rpc
+    engine = EReportingEngine(db)
+    assert engine.period_totals("c1", date(2026, 10, 1), date(2026, 10, 31))["source"] == "numpy"
+    assert engine.period_totals("c1", date(2026, 10, 1), date(2026, 10, 31))["source"] == "sql"
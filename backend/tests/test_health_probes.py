@@ -0,0 +1,75 @@
+import sys
+import asyncio
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from health_probes import HealthMonitor
+
+
+def test_snapshot_is_starting_until_first_refresh_and_never_runs_probes():
+    calls = []
+
+    async def database():
+        calls.append("database")
+        return {"mode": "service"}
+
+    monitor = HealthMonitor(interval=60, timeout=1)
+    monitor.register("database", database)
+
+    assert monitor.snapshot()["status"] == "starting"
+    assert monitor.snapshot()["ready"] is False
+    assert calls == []
+
+    asyncio.run(monitor.refresh())
+    for _ in range(100):
+        snapshot = monitor.snapshot()
+    assert calls == ["database"]
+    assert snapshot["ready"] is True and snapshot["status"] == "ok"
+    assert snapshot["checks"]["database"]["mode"] == "service"
+
+
+def test_critical_failure_blocks_readiness_and_optional_failure_degrades():
+    async def ok():
+        return None
+
+    async def broken():
+        raise RuntimeError("connexion refusée")
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    monitor = HealthMonitor(interval=60, timeout=0.05)
+    monitor.register("database", ok)
+    monitor.register("iopole", slow, critical=False)
+    asyncio.run(monitor.refresh())
+    snapshot = monitor.snapshot()
+    assert snapshot["ready"] is True and snapshot["status"] == "degraded"
+    assert "timeout" in snapshot["checks"]["iopole"]["error"]
+
+    monitor.register("database", broken)
+    asyncio.run(monitor.refresh())
+    snapshot = monitor.snapshot()
+    assert snapshot["ready"] is False and snapshot["status"] == "unavailable"
+    assert snapshot["checks"]["database"]["error"] == "connexion refusée"
+
+
+def test_background_task_refreshes_periodically():
+    count = 0
+
+    async def database():
+        nonlocal count
+        count += 1
+
+    async def scenario():
+        monitor = HealthMonitor(interval=0.01, timeout=1)
+        monitor.register("database", database)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert count >= 2
+    assert snapshot["ready"] is True
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+
+from fastapi.testclient import TestClient
+
+import server_supabase
+from iopole_client import IOPOLEClient, IOPOLEError, IOPOLECircuitOpenError
+
+
+def make_fake_iopole(fail_first: int = 0, always_fail: bool = False):
+    """Faux serveur IOPOLE : échoue `fail_first` fois (503) puis accepte"""
+    fake = FastAPI()
+    fake.state.calls = 0
+
+    @fake.post("/v1/invoices/send")
+    async def send(body: dict):
+        fake.state.calls += 1
+        if always_fail or fake.state.calls <= fail_first:
+            return JSONResponse(status_code=503, content={"error": "unavailable"})
+        number = body["invoice"]["number"]
+        return {"status": "transmitted", "pdp_reference": f"IOPOLE-{number}"}
+
+    return fake
+
+
+def make_client(fake: FastAPI, **kwargs) -> IOPOLEClient:
+    return IOPOLEClient(
+        api_base="http://iopole.test/v1",
+        api_key="test-key",
+        environment="production",
+        transport=httpx.ASGITransport(app=fake),
+        backoff_base=0.001,
+        backoff_max=0.01,
+        **kwargs
+    )
+
+
+def test_send_invoice_retries_transient_errors():
+    fake = make_fake_iopole(fail_first=2)
+    client = make_client(fake, max_retries=3)
+
+    async def run():
+        try:
+            return await client.send_invoice({"number": "F20250001"})
+        finally:
+            await client.aclose()
+
+    result = asyncio.run(run())
+    assert result["pdp_reference"] == "IOPOLE-F20250001"
+    assert fake.state.calls == 3
+    assert client.breaker.state == "closed"
+
+
+def test_circuit_opens_after_repeated_failures():
+    fake = make_fake_iopole(always_fail=True)
+    client = make_client(fake, max_retries=0)
+    client.breaker.failure_threshold = 2
+
+    async def run():
+        try:
+            for _ in range(2):
+                with pytest.raises(IOPOLEError):
+                    await client.send_invoice({"number": "F20250002"})
+            with pytest.raises(IOPOLECircuitOpenError):
+                await client.send_invoice({"number": "F20250002"})
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert fake.state.calls == 2
+    assert client.breaker.state == "open"
+
+
+def _bulk_invoices(numbers):
+    invoices = [{"id": f"inv-{n}", "company_id": "c1", "invoice_number": n, "invoice_date": "2026-10-19",
+                 "status_pdp": "draft", "siren_emetteur": "123456789", "company_name": "Skyapp BTP",
+                 "siren_client": "987654321", "customer_name": "SCI Tilleuls",
+                 "total_ht": 100, "total_tva": 20, "total_ttc": 120} for n in numbers]
+    lines = [{"id": f"line-{n}", "invoice_id": f"inv-{n}", "line_number": 1, "designation": "Pose",
+              "quantity": 1, "unit_price_ht": 100, "tva_rate": 20, "total_line_ht": 100} for n in numbers]
+    return invoices, lines
+
+
+def test_transmit_bulk_caps_concurrency_and_rate_and_isolates_failures(monkeypatch, fake_supabase):
+    fake = FastAPI()
+    fake.state.starts, fake.state.in_flight, fake.state.max_in_flight = [], 0, 0
+
+    @fake.post("/v1/invoices/send")
+    async def send(body: dict):
+        fake.state.starts.append(time.monotonic())
+        fake.state.in_flight += 1
+        fake.state.max_in_flight = max(fake.state.max_in_flight, fake.state.in_flight)
+        await asyncio.sleep(0.05)
+        fake.state.in_flight -= 1
+        number = body["invoice"]["number"]
+        if number == "F-REJET":
+            return JSONResponse(status_code=422, content={"error": "SIREN client inconnu"})
+        return {"status": "transmitted", "pdp_reference": f"IOPOLE-{number}"}
+
+    async def company(user_data):
+        return "c1"
+
+    async def user():
+        return {"id": "u1", "role": "ADMIN", "company_id": "c1"}
+
+    numbers = [f"F-{i}" for i in range(7)] + ["F-REJET"]
+    invoices, lines = _bulk_invoices(numbers)
+    db = fake_supabase(invoices_electronic=invoices, invoice_lines=lines, invoices_logs=[])
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    monkeypatch.setattr(server_supabase, "iopole_client", make_client(fake, max_retries=0))
+    monkeypatch.setattr(server_supabase, "IOPOLE_BULK_CONCURRENCY", 2)
+    monkeypatch.setattr(server_supabase, "IOPOLE_BULK_RATE_PER_SECOND", 4.0)
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = user
+    try:
+        res = TestClient(server_supabase.app).post("/api/invoices/electronic/transmit-bulk",
+                                                   json={"invoice_ids": [i["id"] for i in invoices]})
+    finally:
+        server_supabase.app.dependency_overrides.clear()
+
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert (body["total"], body["transmitted"], body["failed"]) == (8, 7, 1)
+    failed = [r for r in body["results"] if not r["success"]]
+    assert [r["invoice_id"] for r in failed] == ["inv-F-REJET"] and "422" in failed[0]["error"]
+    stored = {i["invoice_number"]: i for i in db.tables["invoices_electronic"]}
+    assert stored["F-REJET"]["status_pdp"] == "draft"
+    assert all(stored[n]["status_pdp"] == "transmitted" for n in numbers[:-1])
+
+    # Sémaphore : jamais plus de 2 envois simultanés
+    assert fake.state.max_in_flight == 2
+    # Débit : rafale de 4 jetons, puis un envoi toutes les 250 ms
+    gaps = [b - a for a, b in zip(fake.state.starts, fake.state.starts[1:])]
+    assert all(gap >= 0.25 * 0.9 for gap in gaps[4:]), gaps
+    assert fake.state.starts[-1] - fake.state.starts[0] >= 4 * 0.25 * 0.9
+
@@ -0,0 +1,81 @@
+import io
+import sys
+import json
+import logging
+import threading
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from log_config import RequestIdMiddleware, configure_logging, shutdown_logging
+
+
+def _lines(stream):
+    shutdown_logging()  # vide la file
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class _ThreadRecordingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writer_threads = set()
+
+    def write(self, text):
+        self.writer_threads.add(threading.current_thread().name)
+        return super().write(text)
+
+
+def test_json_records_are_written_off_thread_with_module_levels():
+    stream = _ThreadRecordingStream()
+    configure_logging(level="INFO", fmt="json", module_levels="noisy=ERROR", stream=stream)
+    logging.getLogger("app").info("devis %s créé", "Q-1", extra={"company_id": "c1"})
+    logging.getLogger("noisy").warning("ignoré")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logging.getLogger("app").exception("échec")
+    lines = _lines(stream)
+
+    assert [l["msg"] for l in lines] == ["devis Q-1 créé", "échec"]
+    assert lines[0]["company_id"] == "c1" and lines[0]["logger"] == "app"
+    assert "ValueError: boom" in lines[1]["exc"]
+    # Écriture par le thread du QueueListener, jamais par l'appelant
+    assert stream.writer_threads and threading.current_thread().name not in stream.writer_threads
+
+
+def test_request_id_is_attached_and_returned():
+    stream = io.StringIO()
+    configure_logging(level="INFO", fmt="json", module_levels="", stream=stream)
+    app = FastAPI()
+    app.add_middleware(RequestIdMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        logging.getLogger("app").info("pong")
+        return {}
+
+    client = TestClient(app)
+    res = client.get("/ping", headers={"X-Request-ID": "abc123"})
+    generated = client.get("/ping").headers["x-request-id"]
+    lines = _lines(stream)
+
+    assert res.headers["x-request-id"] == "abc123"
+    assert [l.get("request_id") for l in lines if l["msg"] == "pong"] == ["abc123", generated]
+
+
+def test_debug_lines_are_sampled_per_call_site():
+    stream = io.StringIO()
+    configure_logging(level="DEBUG", fmt="json", module_levels="", debug_sample_rate=0.1, stream=stream)
+    log = logging.getLogger("hot")
+    for i in range(100):
+        log.debug("ligne %d", i)
+    log.info("toujours gardée")
+    lines = _lines(stream)
+
+    debug = [l for l in lines if l["level"] == "DEBUG"]
+    assert len(debug) == 10 and debug[0]["sample_rate"] == 0.1
+    assert lines[-1]["msg"] == "toujours gardée"
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+
+from fastapi.testclient import TestClient
+
+import server_supabase
+from planning_events import (
+    RESYNC, SCHEDULE_CREATED, SCHEDULE_DELETED, SCHEDULE_UPDATED, WORKSITE_UPDATED, PlanningEventBroker,
+    StreamTickets,
+)
+
+
+async def _drain(subscription):
+    events = []
+    while (event := await subscription.get(timeout=0.05)) is not None:
+        events.append(event)
+    return [e["type"] if e["type"] == RESYNC else (e["type"], e.get("schedule_id") or e.get("worksite_id"))
+            for e in events]
+
+
+def test_scoped_subscriptions_and_publish_from_threads():
+    async def scenario():
+        broker = PlanningEventBroker()
+        company = await broker.subscribe("c1")
+        technician = await broker.subscribe("c1", "t1")
+        other = await broker.subscribe("c2")
+
+        broker.publish(SCHEDULE_CREATED, "c1", schedule_id="s1", technician_ids=["t2"])
+        # Endpoints exécutés dans un thread (asyncio.to_thread)
+        await asyncio.to_thread(broker.publish, SCHEDULE_UPDATED, "c1", schedule_id="s2", technician_ids=["t2", "t1"])
+        broker.publish(WORKSITE_UPDATED, "c1", worksite_id="w1")
+        broker.publish(SCHEDULE_DELETED, None, schedule_id="s3")  # sans entreprise : ignoré
+
+        assert await _drain(company) == [(SCHEDULE_CREATED, "s1"), (SCHEDULE_UPDATED, "s2"), (WORKSITE_UPDATED, "w1")]
+        assert await _drain(technician) == [(SCHEDULE_UPDATED, "s2"), (WORKSITE_UPDATED, "w1")]
+        assert await _drain(other) == []
+
+        technician.close()
+        assert broker.subscriber_count == 2
+    asyncio.run(scenario())
+
+
+def test_reconnect_replays_missed_events_or_asks_for_resync():
+    async def scenario():
+        broker = PlanningEventBroker(max_queue=3)
+        first = await broker.subscribe("c1")
+        broker.publish(SCHEDULE_CREATED, "c1", schedule_id="s1")
+        await asyncio.sleep(0)
+        seen = (await first.get(timeout=0.05))["id"]
+        first.close()
+
+        broker.publish(SCHEDULE_UPDATED, "c1", schedule_id="s1")
+        broker.publish(SCHEDULE_DELETED, "c1", schedule_id="s1")
+        await asyncio.sleep(0)
+        replayed = await broker.subscribe("c1", last_event_id=seen)
+        assert await _drain(replayed) == [(SCHEDULE_UPDATED, "s1"), (SCHEDULE_DELETED, "s1")]
+
+        lost = await broker.subscribe("c1", last_event_id="inconnu")
+        assert await _drain(lost) == [RESYNC]
+
+        # Abonné trop lent : file vidée, un seul « resync »
+        for i in range(5):
+            broker.publish(SCHEDULE_CREATED, "c1", schedule_id=f"n{i}")
+        await asyncio.sleep(0)
+        assert await _drain(replayed) == [RESYNC, (SCHEDULE_CREATED, "n4")]
+    asyncio.run(scenario())
+
+
+class FakeRequest:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_stream_tickets_are_signed_scoped_and_short_lived():
+    tickets = StreamTickets("secret-partage", ttl=60)
+    ticket = tickets.issue("t1", "TECHNICIEN", "c1")
+    # Un autre worker (même clé) accepte le ticket
+    claims = StreamTickets("secret-partage").verify(ticket)
+    assert (claims["sub"], claims["role"], claims["company_id"]) == ("t1", "TECHNICIEN", "c1")
+    assert StreamTickets("autre-secret").verify(ticket) is None
+    assert StreamTickets("secret-partage", ttl=-1).verify(StreamTickets("secret-partage", ttl=-1).issue("t1", None, "c1")) is None
+
+
+def test_sse_endpoint_authenticates_once_and_streams_technician_events(monkeypatch):
+    broker = PlanningEventBroker()
+    tokens = []
+
+    async def from_token(credentials):
+        tokens.append(credentials.credentials)
+        return {"id": "t1", "role": "TECHNICIEN", "company_id": "c1"}
+
+    async def company(user_data):
+        return "c1"
+    monkeypatch.setattr(server_supabase, "planning_events", broker)
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    monkeypatch.setattr(server_supabase, "PLANNING_EVENTS_HEARTBEAT", 0.01)
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = (
+        lambda: {"id": "t1", "role": "TECHNICIEN", "company_id": "c1"})
+    try:
+        res = TestClient(server_supabase.app).post("/api/planning/events/ticket")
+    finally:
+        server_supabase.app.dependency_overrides.clear()
+    assert res.status_code == 200 and res.json()["expires_in"] == 60
+    ticket = res.json()["ticket"]
+    monkeypatch.setattr(server_supabase, "get_user_from_token", from_token)
+
+    async def scenario():
+        request = FakeRequest()
+        # Ticket falsifié ou expiré : refusé
+        with pytest.raises(server_supabase.HTTPException) as rejected:
+            await server_supabase.planning_events_stream(request, scope="company", technician_id=None,
+                                                         ticket=ticket + "x", last_event_id=None, credentials=None)
+        assert rejected.value.status_code == 401
+        # EventSource : ticket en paramètre (jamais le JWT), portée « company » demandée par un technicien
+        res = await server_supabase.planning_events_stream(request, scope="company", technician_id=None,
+                                                           ticket=ticket, last_event_id=None, credentials=None)
+        assert res.media_type == "text/event-stream"
+        chunks = res.body_iterator
+        ready = await chunks.__anext__()
+        assert json.loads(ready.split("data: ")[1]) == {"scope": "technician", "technician_id": "t1"}
+
+        broker.publish(SCHEDULE_CREATED, "c1", schedule_id="s1", technician_ids=["t2"])
+        broker.publish(SCHEDULE_UPDATED, "c1", schedule_id="s2", worksite_id="w1", technician_ids=["t1"])
+        chunk = await chunks.__anext__()
+        while chunk.startswith(": ping"):
+            chunk = await chunks.__anext__()
+
+        request.disconnected = True
+        async for _ in chunks:
+            pass
+        assert broker.subscriber_count == 0
+        return chunk
+
+    chunk = asyncio.run(scenario())
+    event_id, event, data = chunk.strip().split("\n")
+    assert event == "event: schedule.updated" and event_id.startswith("id: ")
+    payload = json.loads(data[len("data: "):])
+    assert payload["schedule_id"] == "s2" and payload["worksite_id"] == "w1" and "company_id" not in payload
+    assert tokens == []  # ticket vérifié localement, sans appel à Supabase Auth
+
+
+def test_worksite_creation_publishes_event(monkeypatch):
+    published = []
+
+    class Recorder:
+        def publish(self, event_type, company_id, **ids):
+            published.append((event_type, company_id, ids.get("worksite_id")))
+
+    class Insert:
+        def __init__(self, row):
+            self.row = row
+
+        def execute(self):
+            return type("Res", (), {"data": [{"id": "w1", **self.row}]})
+
+    class Db:
+        def table(self, name):
+            return type("Table", (), {"insert": lambda _, row: Insert(row)})()
+
+    async def bureau():
+        return {"id": "b1", "role": "BUREAU", "company_id": "c1"}
+
+    async def company(user_data):
+        return "c1"
+    monkeypatch.setattr(server_supabase, "planning_events", Recorder())
+    monkeypatch.setattr(server_supabase, "supabase_service", Db())
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = bureau
+    try:
+        res = TestClient(server_supabase.app).post("/api/worksites", json={"title": "Toiture"})
+    finally:
+        server_supabase.app.dependency_overrides.clear()
+
+    assert res.status_code == 200, res.text
+    assert published == [("worksite.created", "c1", "w1")]
@@ -0,0 +1,115 @@
+import os
+import re
+import sys
+import asyncio
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server_supabase
+from query_tracer import trace_client, trace_queries
+
+
+def _company(n):
+    leaders = [{"id": f"tl{i}", "user_id": f"u{i}", "first_name": "Old", "last_name": f"#{i}", "company_id": "c1"}
+               for i in range(n)]
+    return {
+        "planning_team_leaders": leaders,
+        "users": [{"id": f"u{i}", "first_name": "Chef", "last_name": f"#{i}", "email": f"u{i}@x.fr"} for i in range(n)],
+        "clients": [{"id": f"cl{i}", "name": f"Client {i}"} for i in range(n)],
+        "team_leader_collaborators": [
+            {"team_leader_id": f"tl{i}", "is_active": True, "collaborator": {"id": f"t{i}{j}"}}
+            for i in range(n) for j in range(2)
+        ],
+        "schedules": [
+            {"id": f"s{i}", "company_id": "c1", "collaborator_id": "tech", "status": "scheduled",
+             "start_date": "2019-12-30", "end_date": "2020-01-01", "planning_team_leaders": leaders[i],
+             "worksites": {"id": f"w{i}", "title": f"Chantier {i}", "client_id": f"cl{i}"}}
+            for i in range(n)
+        ],
+    }
+
+
+def _query_count(response):
+    match = re.search(r'desc="(\d+) queries"', response.headers.get("server-timing", ""))
+    return int(match.group(1)) if match else 0
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def bureau():
+        return {"id": "tech", "email": "b@x.fr", "role": "BUREAU", "company_id": "c1"}
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = bureau
+    yield TestClient(server_supabase.app), monkeypatch
+    server_supabase.app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("path", ["/api/schedules", "/api/technicians/tech/missions", "/api/team-leaders-stats"])
+def test_planning_endpoints_issue_constant_number_of_queries(client, path, fake_supabase):
+    http, monkeypatch = client
+    counts = []
+    for n in (2, 12):
+        monkeypatch.setattr(server_supabase, "supabase_service", trace_client(fake_supabase(**_company(n))))
+        res = http.get(path)
+        assert res.status_code == 200, res.text
+        assert len(res.json()) == n
+        counts.append(_query_count(res))
+    # Pas de requête par ligne : le nombre de requêtes ne dépend pas du volume
+    assert counts[0] == counts[1] and 0 < counts[0] <= 4
+
+
+def test_missions_are_enriched_from_batched_lookups(client, fake_supabase):
+    http, monkeypatch = client
+    monkeypatch.setattr(server_supabase, "supabase_service", trace_client(fake_supabase(**_company(3))))
+    missions = http.get("/api/technicians/tech/missions").json()
+    assert missions[1]["team_leader_name"] == "Chef #1"
+    assert missions[1]["worksites"]["clients"]["name"] == "Client 1"
+    assert missions[1]["status"] == "completed"
+
+
+def test_trace_flags_repeated_query_shapes(fake_supabase):
+    db = trace_client(fake_supabase(**_company(6)))
+    with trace_queries() as trace:
+        for i in range(6):
+            db.table("users").select("first_name").eq("id", f"u{i}").execute()
+        db.table("users").select("first_name").in_("id", ["u1", "u2"]).execute()
+
+    assert trace.count == 7
+    assert trace.records[0].filters == ["eq(id=u0)"]
+    assert trace.records[-1].rows == 2
+    problems = trace.problems(max_queries=50, repeat_threshold=5)
+    assert problems == ["N+1 probable: users select eq:id x6"]
+
+
+def test_queries_outside_a_request_are_not_recorded(fake_supabase):
+    db = trace_client(fake_supabase(**_company(1)))
+
+    async def background():
+        return await asyncio.to_thread(lambda: db.table("users").select("id").execute())
+
+    assert len(asyncio.run(background()).data) == 1
+    with trace_queries() as trace:
+        asyncio.run(background())
+    assert trace.count == 1
+
+
+def test_schedules_route_is_served_by_a_single_handler(client, fake_supabase):
+    http, monkeypatch = client
+    routes = [r for r in server_supabase.app.routes
+              if getattr(r, "path", None) == "/api/schedules" and "GET" in getattr(r, "methods", ())]
+    assert [r.endpoint for r in routes] == [server_supabase.get_schedules]
+
+    async def technician():
+        return {"id": "tech", "role": "TECHNICIEN", "company_id": "c1"}
+    data = _company(3)
+    data["schedules"][0]["collaborator_id"] = "other"
+    monkeypatch.setattr(server_supabase, "supabase_service", trace_client(fake_supabase(**data)))
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = technician
+    assert [s["id"] for s in http.get("/api/schedules").json()] == ["s1", "s2"]
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from quote_index import CompanyQuoteIndex, tokenize
+
+QUOTES = [
+    {"id": "q1", "title": "Réparation fissure façade", "description": "Mur porteur fissuré",
+     "items": [{"name": "Injection résine", "description": "Traitement des fissures"}]},
+    {"id": "q2", "title": "Traitement humidité cave", "description": "Humidité 30%, remontées capillaires",
+     "items": [{"name": "Injection hydrofuge"}]},
+    {"id": "q3", "title": "Peinture salon", "description": "Deux couches acrylique", "items": []},
+]
+
+
+def test_tokenize_folds_accents_and_plurals():
+    assert tokenize("Réparation des Fissures") == ["reparation", "fissure"]
+
+
+def test_search_ranks_by_bm25_over_titles_descriptions_and_items():
+    index = CompanyQuoteIndex(QUOTES)
+    results = index.search("réparation fissure mur", k=2)
+    assert [r["id"] for r in results] == ["q1"]
+    assert results[0]["similarity_score"] > 0
+    assert {r["id"] for r in index.search("injection", k=5)} == {"q1", "q2"}
+
+
+def test_incremental_updates_match_full_rebuild():
+    index = CompanyQuoteIndex(QUOTES)
+    index.upsert({"id": "q4", "title": "Ravalement façade fissure", "description": "Enduit", "items": []})
+    index.upsert({"id": "q3", "title": "Peinture cave humide", "description": "Peinture anti-humidité", "items": []})
+    index.remove("q2")
+
+    rebuilt = CompanyQuoteIndex([
+        QUOTES[0],
+        {"id": "q4", "title": "Ravalement façade fissure", "description": "Enduit", "items": []},
+        {"id": "q3", "title": "Peinture cave humide", "description": "Peinture anti-humidité", "items": []},
+    ])
+    for query in ("façade fissure", "humidité cave", "peinture"):
+        incremental = [(r["id"], r["similarity_score"]) for r in index.search(query)]
+        assert incremental == [(r["id"], r["similarity_score"]) for r in rebuilt.search(query)]
+
+    index._compact()
+    assert [r["id"] for r in index.search("humidité cave")] == ["q3"]
+    assert len(index) == 3
@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from request_metrics import LatencyHistogram, MetricsMiddleware, RequestMetrics
+
+
+def _app(metrics):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    @app.get("/api/items/{item_id}")
+    async def get_item(item_id: str):
+        if item_id == "missing":
+            raise HTTPException(status_code=404, detail="introuvable")
+        return {"id": item_id}
+
+    @app.post("/api/items")
+    async def create_item(payload: dict):
+        return payload
+
+    @app.get("/api/stream")
+    async def stream():
+        async def chunks():
+            for _ in range(3):
+                yield b"x" * 10
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    return app
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    h = LatencyHistogram()
+    for _ in range(90):
+        h.observe(0.004)
+    for _ in range(10):
+        h.observe(0.4)
+    assert h.count == 100
+    assert 0 < h.quantile(0.5) <= 0.005
+    assert 0.25 < h.quantile(0.95) <= 0.5
+    assert LatencyHistogram().quantile(0.5) is None
+
+
+def test_middleware_groups_by_route_template_and_counts_sizes():
+    metrics = RequestMetrics()
+    client = TestClient(_app(metrics))
+
+    for item_id in ("a", "b", "missing"):
+        client.get(f"/api/items/{item_id}")
+    client.post("/api/items", json={"name": "x" * 20})
+    assert client.get("/api/stream").text == "x" * 30
+    client.get("/nope")
+
+    stats = metrics.routes[("GET", "/api/items/{item_id}")]
+    assert stats.latency.count == 3
+    assert stats.statuses == {200: 2, 404: 1}
+    assert metrics.routes[("POST", "/api/items")].request_bytes > 20
+    assert metrics.routes[("GET", "/api/stream")].response_bytes == 30
+    assert metrics.routes[("GET", "<unmatched>")].statuses == {404: 1}
+    assert metrics.in_flight == 0
+
+    summary = {(r["method"], r["route"]): r for r in metrics.summary()}
+    assert {"p50_ms", "p95_ms", "p99_ms"} <= set(summary[("GET", "/api/items/{item_id}")])
+
+
+def test_prometheus_exposition_format():
+    metrics = RequestMetrics()
+    client = TestClient(_app(metrics))
+    client.get("/api/items/a")
+    text = metrics.render_prometheus()
+
+    labels = 'method="GET",route="/api/items/{item_id}"'
+    assert "# TYPE skyapp_http_request_duration_seconds histogram" in text
+    assert f'skyapp_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"skyapp_http_request_duration_seconds_count{{{labels}}} 1" in text
+    assert f'skyapp_http_request_duration_quantile_seconds{{{labels},quantile="0.95"}}' in text
+    assert f'skyapp_http_responses_total{{{labels},status="200"}} 1' in text
+    assert "skyapp_http_requests_in_flight 0" in text
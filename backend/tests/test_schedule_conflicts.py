@@ -0,0 +1,246 @@
+import os
+import sys
+from datetime import date
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server_supabase
+from schedule_conflicts import ScheduleConflictEngine, ScheduleIndex, Slot
+from worksite_progress import WorksiteProgress
+
+
+def _slot(first, last, time, end_time, **extra):
+    return Slot.from_row({"collaborator_id": "t1", "start_date": first, "end_date": last,
+                          "time": time, "end_time": end_time, **extra})
+
+
+def test_period_overlaps_single_day_only_when_hours_overlap():
+    period = _slot("2026-10-19", "2026-10-30", "08:00:00", "12:00:00")
+    assert period.overlaps(_slot("2026-10-23", "2026-10-23", "11:00", "15:00"))
+    assert not period.overlaps(_slot("2026-10-23", "2026-10-23", "12:00", "17:00"))
+    assert not period.overlaps(_slot("2026-10-31", "2026-10-31", "08:00", "12:00"))
+
+
+def test_night_shift_spills_into_next_day():
+    night = _slot("2026-10-19", "2026-10-19", "22:00", "06:00")
+    assert night.end_min == 30 * 60
+    assert night.overlaps(_slot("2026-10-20", "2026-10-20", "05:00", "09:00"))
+    assert not night.overlaps(_slot("2026-10-20", "2026-10-20", "06:00", "09:00"))
+
+
+def test_index_finds_long_period_started_long_before():
+    index = ScheduleIndex([
+        _slot("2026-01-05", "2026-12-18", "08:00", "17:00", id="long"),
+        *(_slot(f"2026-10-{d:02d}", f"2026-10-{d:02d}", "08:00", "09:00", id=f"s{d}") for d in range(1, 29)),
+    ])
+    hits = index.conflicts(_slot("2026-10-20", "2026-10-21", "08:30", "10:00"))
+    assert sorted(s.schedule_id for s in hits) == ["long", "s20", "s21"]
+    assert index.conflicts(_slot("2026-10-20", "2026-10-20", "08:30", "10:00", id="long"))[0].schedule_id == "s20"
+
+
+def test_check_many_uses_one_query_and_reports_batch_conflicts(fake_supabase):
+    db = fake_supabase(schedules=[
+        {"id": "p1", "company_id": "c1", "collaborator_id": "t1", "start_date": "2026-10-19",
+         "end_date": "2026-10-23", "time": "08:00:00", "end_time": "17:00:00", "status": "scheduled"},
+        {"id": "x1", "company_id": "c1", "collaborator_id": "t2", "date": "2026-10-21",
+         "time": "08:00:00", "end_time": "17:00:00", "status": "cancelled"},
+    ])
+    engine = ScheduleConflictEngine(lambda: db)
+    results = engine.check_many("c1", [
+        {"collaborator_id": "t1", "date": "2026-10-22", "time": "16:00", "end_time": "18:00"},
+        {"collaborator_id": "t2", "period_start": "2026-10-20", "period_end": "2026-10-24", "time": "09:00", "hours": 4},
+        {"collaborator_id": "t2", "date": "2026-10-21", "time": "12:00", "end_time": "14:00"},
+        {"collaborator_id": "t1", "date": "2026-10-24", "time": "08:00", "end_time": "12:00"},
+    ])
+
+    assert [c["schedule_id"] for c in results[0]["conflicts"]] == ["p1"]
+    assert results[1]["conflicts"] == []  # planning annulé ignoré
+    assert results[2]["conflicts"] == [{"source": "batch", "index": 1}]
+    assert results[3]["conflicts"] == []
+    assert db.log == ["schedule_conflict_candidates", "schedules"]
+
+    engine.check("c1", {"collaborator_id": "t1", "date": "2026-10-19", "time": "08:00", "end_time": "09:00"})
+    assert db.log[2:] == ["schedules"]  # fonction absente : plus redemandée
+
+
+def test_candidates_rpc_is_paged_in_a_stable_order(fake_supabase):
+    rows = [{"id": f"s{i:04d}", "company_id": "c1", "collaborator_id": "t1", "date": "2026-10-19",
+             "time": "08:00:00", "end_time": "09:00:00", "status": "scheduled"} for i in range(1500)]
+    db = fake_supabase()
+    calls = []
+
+    def union_all(params):
+        # UNION ALL sans ORDER BY : ordre différent à chaque page demandée
+        calls.append(params)
+        return rows[::-1] if len(calls) % 2 else rows
+    db.rpcs["schedule_conflict_candidates"] = union_all
+    results = ScheduleConflictEngine(lambda: db).check_many("c1", [
+        {"collaborator_id": "t1", "date": "2026-10-19", "time": "08:30", "end_time": "10:00"},
+    ])
+    assert len(calls) == 2
+    assert sorted(c["schedule_id"] for c in results[0]["conflicts"]) == [r["id"] for r in rows]
+
+
+def test_check_many_requires_collaborator_and_date(fake_supabase):
+    with pytest.raises(ValueError):
+        ScheduleConflictEngine(lambda: fake_supabase()).check_many("c1", [{"collaborator_id": "t1", "time": "08:00"}])
+
+
+
+def test_unreadable_existing_schedule_is_skipped_not_fatal(fake_supabase):
+    db = fake_supabase(schedules=[
+        {"id": "bad", "company_id": "c1", "collaborator_id": "t1", "date": "2026-10-19", "time": "8h", "status": "scheduled"},
+        {"id": "ok", "company_id": "c1", "collaborator_id": "t1", "date": "2026-10-19", "time": "08:00:00",
+         "end_time": "12:00:00", "status": "scheduled"},
+    ])
+    conflicts = ScheduleConflictEngine(lambda: db).check(
+        "c1", {"collaborator_id": "t1", "date": "2026-10-19", "time": "09:00", "end_time": "10:00"})
+    assert [c["schedule_id"] for c in conflicts] == ["ok"]
+    with pytest.raises(ValueError):
+        ScheduleConflictEngine(lambda: db).check("c1", {"collaborator_id": "t1", "date": "2026-10-19", "time": "08:xx"})
+
+@pytest.fixture
+def http(monkeypatch):
+    async def bureau():
+        return {"id": "b1", "email": "b@x.fr", "role": "BUREAU", "company_id": "c1"}
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = bureau
+    # Moteur neuf : l'absence de la fonction SQL mémorisée par un test ne fuit pas dans le suivant
+    monkeypatch.setattr(server_supabase, "schedule_conflicts", ScheduleConflictEngine(server_supabase._svc))
+    monkeypatch.setattr(server_supabase, "worksite_progress", WorksiteProgress(server_supabase._svc))
+    yield TestClient(server_supabase.app)
+    server_supabase.app.dependency_overrides.clear()
+
+
+def test_create_period_schedule_conflicting_with_existing_returns_409(http, monkeypatch, fake_supabase):
+    db = fake_supabase(schedules=[{"id": "s1", "company_id": "c1", "collaborator_id": "t1", "date": date(2026, 10, 22).isoformat(),
+                      "time": "08:00:00", "end_time": "12:00:00", "status": "scheduled"}])
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    res = http.post("/api/schedules", json={"collaborator_id": "t1", "period_start": "2026-10-19",
+                                            "period_end": "2026-10-23", "time": "10:00", "end_time": "16:00"})
+    assert res.status_code == 409
+
+    res = http.post("/api/schedules/conflicts", json={"assignments": [
+        {"collaborator_id": "t1", "date": "2026-10-22", "time": "13:00", "end_time": "15:00"},
+        {"id": "s1", "collaborator_id": "t1", "date": "2026-10-22", "time": "09:00", "end_time": "10:00"},
+    ]})
+    assert res.status_code == 200
+    assert res.json()["conflicts"] == 0
+
+
+def test_recurrence_days():
+    weekdays = server_supabase._recurrence_days(date(2026, 10, 19), date(2026, 11, 1), "weekdays", None, 1)
+    assert len(weekdays) == 10 and all(d.weekday() < 5 for d in weekdays)
+    every_other_week = server_supabase._recurrence_days(date(2026, 10, 21), date(2026, 11, 15), "weekly", [0, 3], 2)
+    assert [d.isoformat() for d in every_other_week] == ["2026-10-22", "2026-11-02", "2026-11-05"]
+    assert len(server_supabase._recurrence_days(date(2026, 10, 19), date(2026, 10, 25), "daily", None, 3)) == 3
+
+
+def _team_db(fake_supabase):
+    team = [f"t{i}" for i in range(5)]
+    return fake_supabase(
+        schedules=[{"id": "s1", "company_id": "c1", "collaborator_id": "t2", "start_date": "2026-10-27", "end_date": "2026-10-27",
+          "date": "2026-10-27", "time": "14:00:00", "end_time": "18:00:00", "status": "scheduled"}],
+        planning_team_leaders=[{"id": "tl1", "company_id": "c1"}],
+        team_leader_collaborators=[{"team_leader_id": "tl1", "collaborator_id": t, "is_active": True} for t in team],
+        users=[{"id": u, "company_id": "c1", "first_name": "Tech", "last_name": u} for u in team + ["x9"]],
+        worksites=[{"id": "w1", "company_id": "c1", "start_date": "2026-10-19", "end_date": "2026-10-30", "title": "Toiture", "address": "3 rue Victor Hugo", "clients": {"name": "SCI Tilleuls"}}],
+    )
+
+
+BULK = {"team_leader_id": "tl1", "collaborator_ids": ["x9"], "worksite_id": "w1", "start_date": "2026-10-19",
+        "end_date": "2026-10-30", "recurrence": "weekdays", "time": "08:00", "end_time": "17:00"}
+
+
+def test_bulk_rejects_whole_batch_on_conflict_with_per_slot_report(http, monkeypatch, fake_supabase):
+    db = _team_db(fake_supabase)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    res = http.post("/api/schedules/bulk", json=BULK)
+
+    assert res.status_code == 409
+    detail = res.json()["detail"]
+    assert detail["requested"] == 60 and detail["conflicts"] == 1
+    conflict = next(slot for slot in detail["slots"] if slot["conflicts"])
+    assert (conflict["collaborator_id"], conflict["start_date"]) == ("t2", "2026-10-27")
+    assert conflict["conflicts"][0]["schedule_id"] == "s1"
+    assert len(db.tables["schedules"]) == 1
+
+
+@pytest.mark.parametrize("times", [{"time": "8h"}, {"time": "8h", "end_time": "12:00"}, {"end_time": "midi"}])
+def test_bulk_rejects_malformed_times_with_400(http, monkeypatch, fake_supabase, times):
+    db = _team_db(fake_supabase)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    res = http.post("/api/schedules/bulk", json={**BULK, **times})
+    assert res.status_code == 400, res.text
+    assert db.log == []
+
+
+def test_bulk_skip_inserts_free_slots_in_one_request(http, monkeypatch, fake_supabase):
+    db = _team_db(fake_supabase)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    res = http.post("/api/schedules/bulk", json={**BULK, "on_conflict": "skip"})
+
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert body["created"] == 59 and body["conflicts"] == 1
+    assert all(slot["schedule_id"] for slot in body["slots"] if not slot["conflicts"])
+    created = db.tables["schedules"][1:]
+    assert {r["worksite_title"] for r in created} == {"Toiture"}
+    assert {r["client_name"] for r in created} == {"SCI Tilleuls"}
+    assert all(r["date"] == r["start_date"] == r["end_date"] for r in created)
+    # Chef d'équipe, équipe, noms, conflits (fonction SQL + repli), chantier, insertion,
+    # avancement du chantier (fonction SQL + repli, mise à jour) : pas de requête par créneau
+    assert db.log == ["planning_team_leaders", "team_leader_collaborators", "users",
+                      "schedule_conflict_candidates", "schedules", "worksites", "insert schedules",
+                      "worksite_progress", "worksites", "schedules", "update worksites"]
+
+
+def test_bulk_period_creates_one_row_per_technician(http, monkeypatch, fake_supabase):
+    db = _team_db(fake_supabase)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    res = http.post("/api/schedules/bulk", json={**BULK, "recurrence": "period", "end_time": "12:00", "dry_run": True})
+    body = res.json()
+    assert body["requested"] == 6 and body["conflicts"] == 0 and body["created"] == 0
+    assert body["slots"][0]["end_date"] == "2026-10-30"
+
+
+@pytest.mark.parametrize("changes", [{"time": "8h"}, {"end_time": "08:xx"}, {"time": "25:00"}, {"date": "19/10/2026"}])
+def test_patch_rejects_malformed_date_or_times_with_400(http, monkeypatch, fake_supabase, changes):
+    db = fake_supabase(schedules=[{"id": "s1", "company_id": "c1", "collaborator_id": "t1", "date": "2026-10-19",
+                                   "time": "08:00:00", "end_time": "12:00:00", "status": "scheduled"}])
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    res = http.patch("/api/schedules/s1", json=changes)
+    assert res.status_code == 400, res.text
+    assert db.tables["schedules"][0]["time"] == "08:00:00"
+
+
+def test_put_reassignment_checks_conflicts_and_syncs_dates(http, monkeypatch, fake_supabase):
+    async def company(user_data):
+        return "c1"
+    db = fake_supabase(schedules=[
+        {"id": "s1", "company_id": "c1", "collaborator_id": "t1", "date": "2026-10-19", "start_date": "2026-10-19",
+         "end_date": "2026-10-19", "time": "08:00:00", "end_time": "12:00:00", "status": "scheduled"},
+        {"id": "s2", "company_id": "c1", "collaborator_id": "t2", "date": "2026-10-19", "start_date": "2026-10-19",
+         "end_date": "2026-10-19", "time": "10:00:00", "end_time": "14:00:00", "status": "scheduled"},
+    ])
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+
+    # Écran d'édition du planning : chef d'équipe et technicien seulement
+    res = http.put("/api/schedules/s1", json={"team_leader_id": "", "collaborator_id": "t2"})
+    assert res.status_code == 409, res.text
+    assert db.tables["schedules"][0]["collaborator_id"] == "t1"
+
+    assert http.put("/api/schedules/s1", json={"time": "8h"}).status_code == 400
+
+    res = http.put("/api/schedules/s1", json={"collaborator_id": "t2", "date": "2026-10-20"})
+    assert res.status_code == 200, res.text
+    row = db.tables["schedules"][0]
+    assert (row["collaborator_id"], row["start_date"], row["end_date"]) == ("t2", "2026-10-20", "2026-10-20")
@@ -1,3 +1,6 @@
+import inspect
+import logging
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -57,3 +60,24 @@ def test_list_drafts():
     data = res.json()
     assert isinstance(data, list)
     assert any(item.get('status') == 'DRAFT' for item in data)
+
+
+def test_get_searches_logs_a_single_lazy_line(caplog, monkeypatch, fake_supabase):
+    db = fake_supabase(searches=[
+        {"id": "s1", "company_id": "comp-1", "user_id": "user-1", "status": "DRAFT", "created_at": "2026-10-02"},
+        {"id": "s2", "company_id": "comp-1", "user_id": "user-2", "status": "SHARED", "created_at": "2026-10-01"},
+    ])
+    monkeypatch.setattr(server_supabase, 'supabase_service', db)
+    # mock_auth a remplacé l'attribut du module : surcharger la dépendance réellement déclarée
+    auth = inspect.signature(server_supabase.get_searches).parameters["user_data"].default.dependency
+    app.dependency_overrides[auth] = lambda: {
+        "id": "user-1", "role": "BUREAU", "company_id": "comp-1"}
+    try:
+        with caplog.at_level(logging.INFO):
+            res = client.get('/api/searches')
+    finally:
+        app.dependency_overrides.clear()
+    assert res.json()["count"] == 2
+    lines = [r for r in caplog.records if r.name in ("server_supabase", "root")]
+    assert [r.getMessage() for r in lines] == ["📋 get_searches Admin/Bureau: 1 personnelles + 1 partagées"]
+    assert lines[0].args  # formaté seulement si la ligne est écrite
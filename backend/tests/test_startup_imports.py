@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+HEAVY_MODULES = ("reportlab", "openai", "scipy", "PIL", "qrcode", "ai_service", "pdf_reports")
+
+
+def test_server_import_defers_heavy_dependencies():
+    code = (
+        "import sys, server_supabase; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules)); "
+        "paths = {r.path for r in server_supabase.app.routes}; "
+        "print('/api/ai/query' in paths and '/api/quotes/{quote_id}/pdf' in paths)"
+    )
+    env = {
+        **os.environ,
+        "SUPABASE_URL": "http://localhost:54321",
+        "SUPABASE_ANON_KEY": "test",
+        "SUPABASE_SERVICE_KEY": "test",
+    }
+    proc = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    eager, routes = proc.stdout.splitlines()[-2:]
+    assert eager == ""
+    # Les routes des modules séparés sont bien enregistrées sous /api
+    assert routes == "True"
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server_supabase
+from schedule_conflicts import ScheduleConflictEngine
+from technician_availability import build_availability, filter_technicians
+
+MONDAY = date(2026, 10, 19)
+
+
+def _row(tech, first, last, time=None, end_time=None, **extra):
+    return {"id": f"{tech}-{first}-{time}", "collaborator_id": tech, "start_date": first, "end_date": last,
+            "time": time, "end_time": end_time, **extra}
+
+
+def test_half_day_matrix_with_periods_and_night_shifts():
+    techs = [{"id": "t1"}, {"id": "t2"}]
+    result = build_availability(techs, [
+        _row("t1", "2026-10-19", "2026-10-19", "08:00", "12:00"),
+        _row("t1", "2026-10-20", "2026-10-20", "22:00", "06:00"),  # nuit : mercredi matin occupé
+        _row("t2", "2026-10-15", "2026-10-20", "13:00", "17:00"),  # période commencée avant la plage
+        _row("t2", "2026-10-25", "2026-10-30"),  # sans horaire : journées entières, hors plage
+    ], MONDAY, MONDAY + timedelta(days=2), "half_day")
+
+    assert result["slots"] == ["am", "pm"]
+    assert result["days"] == ["2026-10-19", "2026-10-20", "2026-10-21"]
+    by_id = {t["id"]: t["availability"] for t in result["technicians"]}
+    assert by_id == {"t1": "011001", "t2": "101011"}
+    assert result["free_count"] == [1, 1, 2, 0, 1, 2]
+
+    day = build_availability(techs, [_row("t1", "2026-10-20", "2026-10-20", "22:00", "06:00")],
+                             MONDAY, MONDAY + timedelta(days=2))
+    assert day["technicians"][0]["availability"] == "100"
+
+
+def test_skills_filter_is_accent_insensitive_and_requires_all():
+    users = [
+        {"id": "a", "last_name": "Martin", "skills": "Maçonnerie, Plomberie"},
+        {"id": "b", "last_name": "Durand", "skills": "Électricité; plomberie"},
+        {"id": "c", "last_name": "Bernard", "skills": None},
+    ]
+    assert [u["id"] for u in filter_technicians(users, "plomb")] == ["b", "a"]
+    assert [u["id"] for u in filter_technicians(users, "electricite, PLOMBERIE")] == ["b"]
+    assert [u["id"] for u in filter_technicians(users)] == ["c", "b", "a"]
+
+
+@pytest.fixture
+def http(monkeypatch):
+    async def bureau():
+        return {"id": "b1", "email": "b@x.fr", "role": "BUREAU", "company_id": "c1"}
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = bureau
+    monkeypatch.setattr(server_supabase, "schedule_conflicts", ScheduleConflictEngine(server_supabase._svc))
+    yield TestClient(server_supabase.app)
+    server_supabase.app.dependency_overrides.clear()
+
+
+def _company_db(fake_supabase, technicians=100, days=90):
+    users = [{"id": f"t{i:03d}", "company_id": "c1", "role": "TECHNICIEN", "first_name": "Tech", "last_name": f"{i:03d}",
+              "skills": "Couverture, Zinguerie" if i % 2 else "Plomberie"} for i in range(technicians)]
+    users.append({"id": "b1", "company_id": "c1", "role": "BUREAU", "last_name": "Bureau"})
+    schedules = [
+        {**_row(f"t{i:03d}", (MONDAY + timedelta(days=d)).isoformat(), (MONDAY + timedelta(days=d)).isoformat(),
+                "08:00:00", "12:00:00" if d % 3 else "17:00:00"), "company_id": "c1", "status": "scheduled"}
+        for i in range(technicians) for d in range(0, days, 2)
+    ]
+    db = fake_supabase(
+        users=users, schedules=schedules,
+        planning_team_leaders=[{"id": "tl1", "company_id": "c1"}],
+        team_leader_collaborators=[{"team_leader_id": "tl1", "collaborator_id": t, "is_active": True}
+                                   for t in ("t001", "t002", "b1")],
+    )
+    # Fonction SQL déployée : plannings des techniciens demandés
+    db.rpcs["schedule_conflict_candidates"] = lambda params: [
+        r for r in schedules if r["collaborator_id"] in params["p_collaborator_ids"]]
+    return db
+
+
+def test_availability_endpoint_100_technicians_90_days(http, monkeypatch, fake_supabase):
+    db = _company_db(fake_supabase)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    started = time.perf_counter()
+    res = http.get("/api/schedules/availability", params={
+        "from": MONDAY.isoformat(), "to": (MONDAY + timedelta(days=89)).isoformat(), "granularity": "half_day",
+    })
+    elapsed = time.perf_counter() - started
+
+    assert res.status_code == 200, res.text
+    body = res.json()
+    assert len(body["technicians"]) == 100 and len(body["days"]) == 90
+    # Jour 0 : journée entière ; jour 2 : matin seulement ; jour 1 : libre
+    assert body["technicians"][0]["availability"][:6] == "001101"
+    assert db.log == ["users"] + ["schedule_conflict_candidates"] * 5  # 4 500 plannings, pages de 1000
+    assert elapsed < 2.0
+
+
+def test_availability_endpoint_team_and_skills_filters(http, monkeypatch, fake_supabase):
+    db = _company_db(fake_supabase, technicians=4, days=4)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+    res = http.get("/api/schedules/availability", params={
+        "from": "2026-10-19", "to": "2026-10-22", "team_leader_id": "tl1", "skills": "couverture",
+    })
+    assert [t["id"] for t in res.json()["technicians"]] == ["t001"]
+
+    assert http.get("/api/schedules/availability", params={"from": "2026-10-19", "to": "2026-10-22",
+                                                           "granularity": "hour"}).status_code == 400
@@ -0,0 +1,34 @@
+import asyncio
+import hashlib
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import UploadFile
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from upload_service import save_upload_file, UploadTooLargeError
+
+
+def _upload(content: bytes, filename: str = "facture.pdf") -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+
+def test_save_upload_file_streams_hash_and_size(tmp_path):
+    content = b"%PDF-1.4 " + b"x" * 10_000
+    dest = tmp_path / "sub" / "facture.pdf"
+    stored = asyncio.run(save_upload_file(_upload(content), dest, chunk_size=1024))
+    assert stored.path == dest
+    assert stored.size_bytes == len(content)
+    assert stored.sha256 == hashlib.sha256(content).hexdigest()
+    assert dest.read_bytes() == content
+
+
+def test_save_upload_file_rejects_oversized_and_cleans_up(tmp_path):
+    dest = tmp_path / "big.pdf"
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(save_upload_file(_upload(b"x" * 5000), dest, max_bytes=4096, chunk_size=1024))
+    assert not dest.exists()
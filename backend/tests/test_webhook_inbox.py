@@ -0,0 +1,144 @@
+import asyncio
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from webhook_inbox import CLAIM_FUNCTION, WebhookInbox, coalesce_status_events, compute_dedup_key
+
+
+def _status_event(event_id, ref, status, timestamp):
+    return {
+        "id": event_id,
+        "event_type": "invoice.status_changed",
+        "pdp_reference": ref,
+        "payload": {"event": "invoice.status_changed", "timestamp": timestamp,
+                    "data": {"invoice_reference": ref, "status": status}},
+    }
+
+
+def test_coalesce_keeps_latest_status_per_reference():
+    events = [
+        _status_event("e1", "IOPOLE-1", "transmitted", "2026-01-01T10:00:00Z"),
+        _status_event("e2", "IOPOLE-1", "accepted", "2026-01-01T10:05:00Z"),
+        _status_event("e3", "IOPOLE-2", "rejected", "2026-01-01T10:01:00Z"),
+        _status_event("e4", "IOPOLE-1", "transmitted", "2026-01-01T09:59:00Z"),
+    ]
+    latest = coalesce_status_events(events)
+    assert set(latest) == {"IOPOLE-1", "IOPOLE-2"}
+    assert latest["IOPOLE-1"]["id"] == "e2"
+    assert latest["IOPOLE-2"]["id"] == "e3"
+
+
+def test_coalesce_compares_instants_across_timestamp_formats():
+    events = [
+        _status_event("e1", "IOPOLE-1", "accepted", "2026-01-01T10:05:00.250+00:00"),
+        _status_event("e2", "IOPOLE-1", "transmitted", "2026-01-01T10:05:00Z"),
+        _status_event("e3", "IOPOLE-1", "rejected", "2026-01-01T11:00:00+02:00"),  # 09:00 UTC
+        {**_status_event("e4", "IOPOLE-2", "accepted", None), "received_at": "2026-01-01T10:00:00.123456+00:00"},
+        _status_event("e5", "IOPOLE-2", "transmitted", "2026-01-01T09:00:00Z"),
+    ]
+    latest = coalesce_status_events(events)
+    assert latest["IOPOLE-1"]["id"] == "e1"
+    assert latest["IOPOLE-2"]["id"] == "e4"
+
+def test_dedup_key_prefers_event_id_then_body_hash():
+    body = b'{"event": "invoice.status_changed"}'
+    assert compute_dedup_key({"id": "evt_1"}, body) == "iopole:evt_1"
+    assert compute_dedup_key({}, body, "evt_2") == "iopole:evt_2"
+    assert compute_dedup_key({}, body) == compute_dedup_key({}, body)
+    assert compute_dedup_key({}, body).startswith("sha256:")
+
+
+class FakeIopole:
+    def __init__(self):
+        self.downloads = 0
+
+    async def receive_invoice(self, invoice_id):
+        return {"customer_siren": "123456789", "invoice_number": f"F-{invoice_id}", "supplier_name": "Tuiles SA",
+                "total_ttc": 120, "file_url": f"https://iopole.test/{invoice_id}.pdf"}
+
+    async def download_file(self, url):
+        self.downloads += 1
+        return b"%PDF-1.4 facture"
+
+
+def _received(event_id, invoice_id="INV-1"):
+    return {"id": event_id, "event": "invoice.received", "data": {"invoice_id": invoice_id}}
+
+
+def _inbox(db, tmp_path, iopole=None):
+    return WebhookInbox(db, iopole_client=iopole, uploads_dir=tmp_path, batch_size=10)
+
+
+def test_concurrent_consumers_never_claim_the_same_event(fake_supabase, tmp_path):
+    db = fake_supabase(iopole_webhook_events=[])
+    first, second = _inbox(db, tmp_path), _inbox(db, tmp_path)
+    for i in range(3):
+        asyncio.run(first.enqueue({"id": f"evt_{i}", "event": "invoice.status_changed",
+                                   "data": {"invoice_reference": f"IOPOLE-{i}", "status": "accepted"}}, b"{}"))
+
+    def race(query):
+        # Le second worker réserve le lot entre la sélection et l'UPDATE du premier
+        if query.operation == "select" and query.name == "iopole_webhook_events":
+            db.hooks.remove(race)
+            race.claimed = second._claim_batch()
+    db.hooks.append(race)
+
+    assert first._claim_batch() == []
+    assert sorted(e["id"] for e in race.claimed) == sorted(e["id"] for e in db.tables["iopole_webhook_events"])
+    assert {e["claimed_by"] for e in db.tables["iopole_webhook_events"]} == {second.worker_id}
+    assert db.log.count(CLAIM_FUNCTION) == 2  # fonction absente : chaque worker se replie sur l'UPDATE conditionnel
+
+
+def test_claim_uses_sql_function_when_deployed(fake_supabase, tmp_path):
+    db = fake_supabase(iopole_webhook_events=[{"id": "e1", "status": "pending"}])
+    db.rpcs[CLAIM_FUNCTION] = lambda params: [
+        {**row, "status": "processing", "claimed_by": params["p_worker"]} for row in db.tables["iopole_webhook_events"]
+    ]
+    inbox = _inbox(db, tmp_path)
+    assert [e["claimed_by"] for e in inbox._claim_batch()] == [inbox.worker_id]
+    assert db.log == [CLAIM_FUNCTION]
+
+
+def test_redelivered_or_reprocessed_invoice_is_recorded_once(fake_supabase, tmp_path):
+    db = fake_supabase(iopole_webhook_events=[], invoices_received=[],
+                       company_settings=[{"company_id": "c1", "siren": "123456789"}])
+    iopole = FakeIopole()
+    inbox = _inbox(db, tmp_path, iopole)
+
+    assert asyncio.run(inbox.enqueue(_received("evt_1"), b"{}")) is True
+    assert asyncio.run(inbox.enqueue(_received("evt_1"), b"{}")) is False  # relivraison du même événement
+    assert asyncio.run(inbox.process_batch()) == 1
+
+    # Réservation reprise après un crash avant le marquage, puis nouvel événement pour la même facture
+    db.tables["iopole_webhook_events"][0].update(status="processing", claimed_at="2000-01-01T00:00:00Z")
+    asyncio.run(inbox.enqueue(_received("evt_2"), b"{}"))
+    assert asyncio.run(_inbox(db, tmp_path, iopole).process_batch()) == 2
+
+    assert len(db.tables["invoices_received"]) == 1
+    assert db.tables["invoices_received"][0]["pdp_invoice_id"] == "INV-1"
+    assert iopole.downloads == 1
+    assert len(list(tmp_path.rglob("*.pdf"))) == 1
+    assert {e["status"] for e in db.tables["iopole_webhook_events"]} == {"processed"}
+
+
+def test_late_status_batch_does_not_overwrite_a_newer_status(fake_supabase, tmp_path):
+    db = fake_supabase(iopole_webhook_events=[], invoices_electronic=[
+        {"id": "i1", "pdp_reference": "IOPOLE-1", "status_pdp": "accepted",
+         "pdp_status_updated_at": "2026-01-01T10:05:00+00:00"},
+        {"id": "i2", "pdp_reference": "IOPOLE-2", "status_pdp": "transmitted", "pdp_status_updated_at": None},
+    ])
+    inbox = _inbox(db, tmp_path)
+    for event_id, ref, status, timestamp in [("e1", "IOPOLE-1", "transmitted", "2026-01-01T10:00:00Z"),
+                                              ("e2", "IOPOLE-2", "accepted", "2026-01-01T10:00:00.5Z")]:
+        event = _status_event(event_id, ref, status, timestamp)
+        asyncio.run(inbox.enqueue({**event["payload"], "id": event_id}, b"{}"))
+    assert asyncio.run(inbox.process_batch()) == 2
+
+    invoices = {i["pdp_reference"]: i for i in db.tables["invoices_electronic"]}
+    assert invoices["IOPOLE-1"]["status_pdp"] == "accepted"
+    assert invoices["IOPOLE-2"]["status_pdp"] == "accepted"
+    assert invoices["IOPOLE-2"]["pdp_status_updated_at"] == "2026-01-01T10:00:00.500000+00:00"
+    assert {e["status"] for e in db.tables["iopole_webhook_events"]} == {"processed"}
@@ -0,0 +1,112 @@
+import os
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test")
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server_supabase
+from worksite_progress import WorksiteProgress, completed_days_by_worksite
+
+TODAY = date.today()
+
+
+def _day(offset):
+    return (TODAY + timedelta(days=offset)).isoformat()
+
+
+def _db(fake_supabase):
+    worksites = [
+        {"id": "w1", "company_id": "c1", "title": "Toiture", "status": "IN_PROGRESS", "progress": 0,
+         "start_date": _day(-9), "end_date": _day(10)},
+        {"id": "w2", "company_id": "c1", "title": "Ravalement", "status": "PLANNED", "progress": 0,
+         "start_date": _day(-5), "end_date": _day(-1)},
+        {"id": "w3", "company_id": "c1", "title": "Sans dates", "status": "PLANNED", "progress": 0},
+        {"id": "w9", "company_id": "c2", "title": "Autre entreprise", "status": "PLANNED", "progress": 0,
+         "start_date": _day(-5), "end_date": _day(5)},
+    ]
+    schedules = [
+        {"id": "s1", "company_id": "c1", "worksite_id": "w1", "date": _day(-3), "start_date": _day(-3), "end_date": _day(-3)},
+        {"id": "s2", "company_id": "c1", "worksite_id": "w1", "date": _day(-3), "start_date": _day(-3), "end_date": _day(-3)},
+        {"id": "s3", "company_id": "c1", "worksite_id": "w1", "start_date": _day(-2), "end_date": _day(5)},
+        {"id": "s4", "company_id": "c1", "worksite_id": "w1", "date": _day(-8), "status": "cancelled"},
+        {"id": "s5", "company_id": "c1", "worksite_id": "w2", "start_date": _day(-5), "end_date": _day(-1)},
+        {"id": "s6", "company_id": "c1", "worksite_id": None, "date": _day(-4)},
+        {"id": "s7", "company_id": "c2", "worksite_id": "w9", "date": _day(-4)},
+    ]
+    return fake_supabase(worksites=worksites, schedules=schedules)
+
+
+def test_completed_days_counts_distinct_past_days_of_periods(fake_supabase):
+    completed = completed_days_by_worksite(_db(fake_supabase).tables["schedules"], TODAY)
+    # w1 : J-3 (deux fois) + J-2, J-1 de la période ; annulé et jours futurs exclus
+    assert completed == {"w1": 3, "w2": 5, "w9": 1}
+
+
+def test_company_progress_in_one_pass_then_persisted(fake_supabase):
+    db = _db(fake_supabase)
+    progress = WorksiteProgress(lambda: db)
+
+    def rows():
+        return db.table("worksites").select("*").eq("company_id", "c1").execute().data
+
+    assert progress.current("c1", rows()) == {"w1": 15, "w2": 100, "w3": 0}
+    assert db.log[1:] == ["worksite_progress", "worksites", "schedules"] + ["update worksites"] * 3
+    assert ("schedules", "worksite_id, date, start_date, end_date, status") in db.selects
+    assert {w["progress_computed_on"] for w in db.tables["worksites"][:3]} == {TODAY.isoformat()}
+
+    # Calculé aujourd'hui (par ce worker ou un autre) : valeur persistée, aucun calcul
+    db.tables["schedules"].append({"id": "s8", "company_id": "c1", "worksite_id": "w1", "date": _day(-9)})
+    db.log.clear()
+    assert progress.current("c1", rows())["w1"] == 15
+    assert db.log == ["worksites"]
+
+    assert progress.refresh("c1", ["w1", None]) == {"w1": 20}
+    assert progress.current("c1", rows()) == {"w1": 20, "w2": 100, "w3": 0}
+    # Fonction SQL absente : plus redemandée
+    assert db.log[1:] == ["worksites", "schedules", "update worksites", "worksites"]
+
+    # Le lendemain : recalcul des chantiers du jour précédent
+    assert progress.current("c1", rows(), today=TODAY + timedelta(days=1))["w1"] == 25
+
+
+@pytest.fixture
+def http(monkeypatch):
+    async def bureau():
+        return {"id": "b1", "email": "b@x.fr", "role": "BUREAU", "company_id": "c1"}
+
+    async def company(user_data):
+        return "c1"
+    server_supabase.app.dependency_overrides[server_supabase.get_user_from_token] = bureau
+    monkeypatch.setattr(server_supabase, "get_user_company", company)
+    monkeypatch.setattr(server_supabase, "worksite_progress", WorksiteProgress(server_supabase._svc))
+    yield TestClient(server_supabase.app)
+    server_supabase.app.dependency_overrides.clear()
+
+
+def test_get_worksites_include_progress(http, monkeypatch, fake_supabase):
+    db = _db(fake_supabase)
+    monkeypatch.setattr(server_supabase, "supabase_service", db)
+
+    plain = http.get("/api/worksites")
+    assert {w["id"]: w["progress"] for w in plain.json()} == {"w1": 0, "w2": 0, "w3": 0}
+    assert "worksite_progress" not in db.log
+    assert db.log.count("update worksites") == 1  # w2 terminé hier : une seule mise à jour
+    assert db.tables["worksites"][1]["status"] == "COMPLETED"
+
+    res = http.get("/api/worksites", params={"include_progress": True})
+    assert {w["id"]: w["progress"] for w in res.json()} == {"w1": 15, "w2": 100, "w3": 0}
+
+    # Autre worker (instance neuve) : valeurs persistées du jour, aucun recalcul
+    monkeypatch.setattr(server_supabase, "worksite_progress", WorksiteProgress(server_supabase._svc))
+    db.log.clear()
+    res = http.get("/api/worksites", params={"include_progress": True})
+    assert {w["id"]: w["progress"] for w in res.json()} == {"w1": 15, "w2": 100, "w3": 0}
+    assert db.log == ["worksites"]
@@ -0,0 +1,127 @@
+"""
+Upload Service - Écriture des fichiers uploadés en streaming
+Copie par blocs via aiofiles avec calcul SHA-256 et taille à la volée
+"""
+
+import os
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Taille des blocs lus depuis l'UploadFile (1 Mo par défaut)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Limites de taille par type d'upload (en octets)
+MAX_INVOICE_SIZE = int(os.getenv("MAX_INVOICE_UPLOAD_MB", "25")) * 1024 * 1024
+MAX_PHOTO_SIZE = int(os.getenv("MAX_PHOTO_UPLOAD_MB", "15")) * 1024 * 1024
+MAX_LOGO_SIZE = int(os.getenv("MAX_LOGO_UPLOAD_MB", "5")) * 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Le fichier uploadé dépasse la taille maximale autorisée"""
+
+    def __init__(self, filename: Optional[str], max_bytes: int):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        super().__init__(
+            f"Fichier '{filename}' trop volumineux (max {max_bytes // (1024 * 1024)} Mo)"
+        )
+
+
+@dataclass
+class StoredUpload:
+    """Résultat d'un upload écrit sur disque"""
+    path: Path
+    size_bytes: int
+    sha256: str
+
+
+def _declared_size(upload: UploadFile) -> Optional[int]:
+    """Taille annoncée par le client (multipart) si disponible"""
+    size = getattr(upload, "size", None)
+    if size is not None:
+        return size
+    length = upload.headers.get("content-length") if upload.headers else None
+    return int(length) if length and length.isdigit() else None
+
+
+async def save_upload_file(
+    upload: UploadFile,
+    destination: Path,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> StoredUpload:
+    """
+    Copie un UploadFile vers `destination` par blocs de `chunk_size`
+
+    Le SHA-256 et la taille sont calculés pendant la copie, sans jamais
+    charger le fichier complet en mémoire. La limite `max_bytes` est
+    vérifiée avant la copie (taille annoncée) puis à chaque bloc ; en cas
+    de dépassement, le fichier partiel est supprimé.
+
+    Args:
+        upload: Fichier reçu par FastAPI
+        destination: Chemin du fichier à écrire (dossiers créés si besoin)
+        max_bytes: Taille maximale autorisée (None = illimitée)
+        chunk_size: Taille des blocs de lecture
+
+    Returns:
+        StoredUpload avec chemin, taille et hash SHA-256
+
+    Raises:
+        UploadTooLargeError: si le fichier dépasse max_bytes
+    """
+    if max_bytes is not None:
+        declared = _declared_size(upload)
+        if declared is not None and declared > max_bytes:
+            raise UploadTooLargeError(upload.filename, max_bytes)
+
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(destination, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(upload.filename, max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        try:
+            destination.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+    logger.debug(f"📁 Upload écrit: {destination} ({size} octets)")
+    return StoredUpload(path=destination, size_bytes=size, sha256=digest.hexdigest())
+
+
+async def save_upload_to_tempfile(
+    upload: UploadFile,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> StoredUpload:
+    """
+    Copie un UploadFile dans un fichier temporaire (pour Supabase Storage)
+
+    L'appelant est responsable de supprimer `result.path` après usage.
+    """
+    suffix = Path(upload.filename or "").suffix
+    fd, tmp_name = tempfile.mkstemp(prefix="skyapp_upload_", suffix=suffix)
+    os.close(fd)
+    return await save_upload_file(upload, Path(tmp_name), max_bytes=max_bytes, chunk_size=chunk_size)
@@ -0,0 +1,473 @@
+"""
+Webhook Inbox - File d'attente durable des événements IOPOLE
+Persistance immédiate (dédupliquée), traitement en tâche de fond avec
+regroupement des changements de statut par pdp_reference
+
+Plusieurs workers consomment la même table : un lot est réservé en une
+instruction (fonction SQL claim_iopole_webhook_events, FOR UPDATE SKIP
+LOCKED ; repli : UPDATE conditionné au même prédicat), donc un événement
+n'est réservé que par un worker. Un événement peut malgré tout être traité
+deux fois (réservation reprise après un crash) : les traitements sont
+idempotents (facture reçue identifiée par son id IOPOLE).
+
+Les statuts sont ordonnés par l'horodatage de l'événement (émetteur, sinon
+réception), converti en datetime UTC. Un statut n'est appliqué que s'il est
+au moins aussi récent que celui enregistré (pdp_status_updated_at) : un lot
+en retard ne remplace pas un statut plus récent.
+"""
+
+import os
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+import aiofiles
+from supabase import Client
+
+from supabase_helpers import SqlFunction, is_missing_function
+
+logger = logging.getLogger(__name__)
+
+INBOX_TABLE = "iopole_webhook_events"
+CLAIM_FUNCTION = "claim_iopole_webhook_events"
+STATUS_FUNCTION = "apply_pdp_status_events"
+
+STATUS_EVENT = "invoice.status_changed"
+RECEIVED_EVENT = "invoice.received"
+
+
+def compute_dedup_key(payload: Dict[str, Any], raw_body: bytes, event_id_header: Optional[str] = None) -> str:
+    """
+    Clé d'idempotence d'un événement
+
+    Priorité à l'identifiant fourni par IOPOLE (en-tête ou champ `id` /
+    `event_id`), sinon hash SHA-256 du corps brut.
+    """
+    event_id = event_id_header or payload.get("event_id") or payload.get("id")
+    if event_id:
+        return f"iopole:{event_id}"
+    return f"sha256:{hashlib.sha256(raw_body).hexdigest()}"
+
+
+def _pdp_reference(payload: Dict[str, Any]) -> Optional[str]:
+    data = payload.get("data") or {}
+    return data.get("invoice_reference") or data.get("pdp_reference")
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    """ISO 8601 ('Z', '+00:00', fractions de seconde) -> datetime UTC ; None si illisible"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).astimezone(timezone.utc)
+
+
+def _event_time(event: Dict[str, Any]) -> datetime:
+    """Horodatage d'un événement pour l'ordonnancement (émetteur, sinon réception)"""
+    payload = event.get("payload") or {}
+    for value in (payload.get("timestamp"), payload.get("created_at"), event.get("received_at")):
+        parsed = _parse_time(value)
+        if parsed is not None:
+            return parsed
+    return EPOCH
+
+
+def coalesce_status_events(events: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Garde, pour chaque pdp_reference, le dernier événement de changement de statut
+
+    Returns:
+        {pdp_reference: événement le plus récent}
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        ref = event.get("pdp_reference") or _pdp_reference(event.get("payload") or {})
+        if not ref:
+            continue
+        current = latest.get(ref)
+        if current is None or _event_time(event) >= _event_time(current):
+            latest[ref] = event
+    return latest
+
+
+class WebhookInbox:
+    """Inbox durable : enqueue() à la réception, consommateur en tâche de fond"""
+
+    def __init__(
+        self,
+        supabase_client: Client,
+        iopole_client=None,
+        uploads_dir: Optional[Path] = None,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        stale_after_seconds: int = 300
+    ):
+        self.supabase = supabase_client
+        self.iopole = iopole_client
+        self.uploads_dir = uploads_dir or Path(__file__).parent / "uploads"
+        self.batch_size = batch_size or int(os.getenv("IOPOLE_INBOX_BATCH_SIZE", "100"))
+        self.poll_interval = poll_interval or float(os.getenv("IOPOLE_INBOX_POLL_SECONDS", "2"))
+        self.max_attempts = max_attempts or int(os.getenv("IOPOLE_INBOX_MAX_ATTEMPTS", "5"))
+        self.stale_after = timedelta(seconds=stale_after_seconds)
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._claim_rpc_available = True
+        self._status_rpc = SqlFunction(STATUS_FUNCTION)
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        # Métriques (process courant)
+        self.metrics = {
+            "received": 0,
+            "duplicates": 0,
+            "processed": 0,
+            "coalesced": 0,
+            "status_updates": 0,
+            "failures": 0,
+            "dead_lettered": 0,
+            "last_lag_seconds": 0.0,
+            "max_lag_seconds": 0.0,
+            "last_batch_at": None,
+        }
+
+    # ------------------------------------------------------------------
+    # Réception
+    # ------------------------------------------------------------------
+
+    async def enqueue(self, payload: Dict[str, Any], raw_body: bytes, event_id_header: Optional[str] = None) -> bool:
+        """
+        Persiste l'événement brut (idempotent sur dedup_key)
+
+        Returns:
+            True si nouvel événement, False si doublon déjà reçu
+        """
+        row = {
+            "id": str(uuid.uuid4()),
+            "dedup_key": compute_dedup_key(payload, raw_body, event_id_header),
+            "event_type": payload.get("event"),
+            "pdp_reference": _pdp_reference(payload),
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "received_at": datetime.now(timezone.utc).isoformat(),
+        }
+        result = await asyncio.to_thread(
+            lambda: self.supabase.table(INBOX_TABLE)
+            .upsert(row, on_conflict="dedup_key", ignore_duplicates=True)
+            .execute()
+        )
+        if not result.data:
+            self.metrics["duplicates"] += 1
+            return False
+
+        self.metrics["received"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    # ------------------------------------------------------------------
+    # Consommateur
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Démarre le consommateur en tâche de fond (à appeler dans lifespan)"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="iopole-webhook-inbox")
+            logger.info(f"📥 Inbox webhooks IOPOLE démarrée (worker {self.worker_id})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                handled = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erreur consommateur inbox IOPOLE: {e}")
+                handled = 0
+            if handled >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _claim_batch(self) -> List[Dict[str, Any]]:
+        """Réserve un lot d'événements en attente (ou abandonnés par un worker), exclusivement"""
+        now = datetime.now(timezone.utc)
+        stale_cutoff = (now - self.stale_after).strftime("%Y-%m-%dT%H:%M:%SZ")
+        if self._claim_rpc_available:
+            try:
+                return self.supabase.rpc(CLAIM_FUNCTION, {
+                    "p_worker": self.worker_id,
+                    "p_limit": self.batch_size,
+                    "p_stale_before": stale_cutoff,
+                }).execute().data or []
+            except Exception as e:
+                if not is_missing_function(e):
+                    raise
+                self._claim_rpc_available = False
+                logger.warning(f"⚠️ Fonction {CLAIM_FUNCTION} absente, réservation par UPDATE conditionnel: {e}")
+
+        claimable = f"status.eq.pending,and(status.eq.processing,claimed_at.lt.{stale_cutoff})"
+        candidates = self.supabase.table(INBOX_TABLE)\
+            .select("id")\
+            .or_(claimable)\
+            .order("received_at")\
+            .limit(self.batch_size)\
+            .execute()
+        ids = [row["id"] for row in candidates.data or []]
+        if not ids:
+            return []
+        # Même prédicat que la sélection : une ligne réservée entre-temps par un autre worker
+        # (processing, claimed_at récent) ne correspond plus et n'est pas reprise
+        claimed = self.supabase.table(INBOX_TABLE)\
+            .update({"status": "processing", "claimed_by": self.worker_id, "claimed_at": now.isoformat()})\
+            .in_("id", ids)\
+            .or_(claimable)\
+            .execute()
+        return claimed.data or []
+
+    async def process_batch(self) -> int:
+        """Traite un lot d'événements ; retourne le nombre d'événements réservés"""
+        events = await asyncio.to_thread(self._claim_batch)
+        if not events:
+            return 0
+
+        now = datetime.now(timezone.utc)
+        lags = [
+            (now - datetime.fromisoformat(e["received_at"].replace("Z", "+00:00"))).total_seconds()
+            for e in events if e.get("received_at")
+        ]
+        if lags:
+            self.metrics["last_lag_seconds"] = max(lags)
+            self.metrics["max_lag_seconds"] = max(self.metrics["max_lag_seconds"], max(lags))
+        self.metrics["last_batch_at"] = now.isoformat()
+
+        status_events = [e for e in events if e.get("event_type") == STATUS_EVENT]
+        other_events = [e for e in events if e.get("event_type") != STATUS_EVENT]
+
+        if status_events:
+            await self._apply_status_events(status_events)
+
+        for event in other_events:
+            try:
+                if event.get("event_type") == RECEIVED_EVENT:
+                    await self._handle_invoice_received(event)
+                else:
+                    logger.warning(f"⚠️ Type d'événement inconnu: {event.get('event_type')}")
+                await asyncio.to_thread(self._mark_processed, [event["id"]])
+                self.metrics["processed"] += 1
+            except Exception as e:
+                await asyncio.to_thread(self._mark_failed, [event], str(e))
+
+        return len(events)
+
+    async def _apply_status_events(self, events: List[Dict[str, Any]]):
+        """
+        Un seul appel SQL (apply_pdp_status_events) pour toutes les factures du lot ;
+        repli : un UPDATE par (statut, horodatage), gardé par pdp_status_updated_at
+        """
+        latest = coalesce_status_events(events)
+        updates = []
+        for ref, event in latest.items():
+            new_status = ((event.get("payload") or {}).get("data") or {}).get("status")
+            if new_status:
+                updates.append({"pdp_reference": ref, "status": new_status, "event_at": _event_time(event).isoformat()})
+
+        self.metrics["coalesced"] += len(events) - len(latest)
+        failed_refs = set()
+        if updates:
+            applied = await asyncio.to_thread(self._status_rpc.value, self.supabase, {"p_events": updates})
+            if applied is not None:
+                self.metrics["status_updates"] += 1
+                logger.info(f"✅ Statuts PDP appliqués à {applied}/{len(updates)} facture(s)")
+            else:
+                failed_refs = await asyncio.to_thread(self._apply_status_updates, updates)
+
+        done = [e for e in events if (e.get("pdp_reference") or _pdp_reference(e.get("payload") or {})) not in failed_refs]
+        failed = [e for e in events if e not in done]
+        if done:
+            await asyncio.to_thread(self._mark_processed, [e["id"] for e in done])
+            self.metrics["processed"] += len(done)
+        if failed:
+            await asyncio.to_thread(self._mark_failed, failed, "Mise à jour invoices_electronic échouée")
+
+    def _apply_status_updates(self, updates: List[Dict[str, Any]]) -> set:
+        """Repli PostgREST : même garde que la fonction SQL ; renvoie les références en échec"""
+        groups: Dict[tuple, List[str]] = {}
+        for update in updates:
+            groups.setdefault((update["status"], update["event_at"]), []).append(update["pdp_reference"])
+        updated_at = datetime.utcnow().isoformat()
+        failed_refs = set()
+        for (new_status, event_at), refs in groups.items():
+            try:
+                self.supabase.table("invoices_electronic") \
+                    .update({"status_pdp": new_status, "pdp_status_updated_at": event_at, "updated_at": updated_at}) \
+                    .in_("pdp_reference", refs) \
+                    .or_(f"pdp_status_updated_at.is.null,pdp_status_updated_at.lte.{event_at}") \
+                    .execute()
+                self.metrics["status_updates"] += 1
+                logger.info(f"✅ Statut PDP '{new_status}' appliqué à {len(refs)} facture(s)")
+            except Exception as e:
+                logger.error(f"❌ Erreur mise à jour statut PDP '{new_status}': {e}")
+                failed_refs.update(refs)
+        return failed_refs
+
+    async def _handle_invoice_received(self, event: Dict[str, Any]):
+        """Crée l'entrée invoices_received pour une facture fournisseur reçue via le PDP"""
+        data = (event.get("payload") or {}).get("data") or {}
+        iopole_invoice_id = data.get("invoice_id") or data.get("id")
+        # Identifiant stable : un second traitement réécrit la même facture (et le même PDF)
+        invoice_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"iopole-invoice:{iopole_invoice_id or event['dedup_key']}"))
+        existing = await asyncio.to_thread(
+            lambda: self.supabase.table("invoices_received").select("id").eq("id", invoice_id).limit(1).execute()
+        )
+        if existing.data:
+            logger.info(f"ℹ️ Facture IOPOLE {iopole_invoice_id or invoice_id} déjà enregistrée")
+            return
+
+        details = dict(data)
+        if self.iopole is not None and iopole_invoice_id:
+            details.update(await self.iopole.receive_invoice(iopole_invoice_id))
+
+        customer_siren = details.get("customer_siren") or (details.get("customer") or {}).get("siren")
+        if not customer_siren:
+            raise ValueError("SIREN destinataire absent de l'événement")
+        settings = await asyncio.to_thread(
+            lambda: self.supabase.table("company_settings").select("company_id").eq("siren", customer_siren).limit(1).execute()
+        )
+        if not settings.data:
+            raise ValueError(f"Aucune entreprise pour le SIREN {customer_siren}")
+        company_id = settings.data[0]["company_id"]
+
+        file_path, file_size, pdf_hash = None, None, None
+        if self.iopole is not None and details.get("file_url"):
+            content = await self.iopole.download_file(details["file_url"])
+            target_dir = self.uploads_dir / "invoices_received" / company_id
+            target_dir.mkdir(parents=True, exist_ok=True)
+            file_path = target_dir / f"{invoice_id}.pdf"
+            async with aiofiles.open(file_path, "wb") as f:
+                await f.write(content)
+            file_size = len(content)
+            pdf_hash = hashlib.sha256(content).hexdigest()
+
+        format_type = details.get("format") or "factur-x"
+        invoice_data = {
+            "id": invoice_id,
+            "company_id": company_id,
+            "invoice_number": details.get("invoice_number"),
+            "supplier_name": details.get("supplier_name"),
+            "supplier_siren": details.get("supplier_siren"),
+            "invoice_date": details.get("date") or details.get("invoice_date"),
+            "due_date": details.get("due_date"),
+            "total_ht": float(details.get("total_ht") or 0),
+            "total_tva": float(details.get("total_tva") or 0),
+            "total_ttc": float(details.get("total_ttc") or 0),
+            "format_type": format_type if format_type in ("factur-x", "ubl", "cii", "pdf-simple") else "factur-x",
+            "reception_method": "pdp-webhook",
+            "status": "received",
+            "pdf_file_path": str(file_path) if file_path else None,
+            "file_size_bytes": file_size,
+            "pdf_hash": pdf_hash,
+            "pdp_invoice_id": str(iopole_invoice_id) if iopole_invoice_id else None,
+        }
+        await asyncio.to_thread(
+            lambda: self.supabase.table("invoices_received")
+            .upsert(invoice_data, on_conflict="id", ignore_duplicates=True)
+            .execute()
+        )
+        logger.info(f"✅ Facture reçue via PDP: {invoice_data['invoice_number']}")
+
+    def _mark_processed(self, ids: List[str]):
+        self.supabase.table(INBOX_TABLE)\
+            .update({"status": "processed", "processed_at": datetime.now(timezone.utc).isoformat(), "last_error": None})\
+            .in_("id", ids)\
+            .eq("claimed_by", self.worker_id)\
+            .execute()
+
+    def _mark_failed(self, events: List[Dict[str, Any]], error: str):
+        """Remet en attente (retry) ou passe en 'failed' après max_attempts"""
+        for event in events:
+            attempts = (event.get("attempts") or 0) + 1
+            dead = attempts >= self.max_attempts
+            self.supabase.table(INBOX_TABLE)\
+                .update({
+                    "status": "failed" if dead else "pending",
+                    "attempts": attempts,
+                    "last_error": error[:1000],
+                })\
+                .eq("id", event["id"])\
+                .eq("claimed_by", self.worker_id)\
+                .execute()
+            self.metrics["failures"] += 1
+            if dead:
+                self.metrics["dead_lettered"] += 1
+            logger.error(f"❌ Événement IOPOLE {event['id']} en échec ({attempts}/{self.max_attempts}): {error}")
+
+    # ------------------------------------------------------------------
+    # Supervision
+    # ------------------------------------------------------------------
+
+    def replay(self, event_ids: Optional[List[str]] = None) -> int:
+        """Remet en attente les événements en échec (tous ou ceux listés)"""
+        query = self.supabase.table(INBOX_TABLE)\
+            .update({"status": "pending", "attempts": 0, "last_error": None})\
+            .eq("status", "failed")
+        if event_ids:
+            query = query.in_("id", event_ids)
+        result = query.execute()
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return len(result.data or [])
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métriques du worker + profondeur et retard de la file (depuis la table)"""
+        pending = self.supabase.table(INBOX_TABLE)\
+            .select("received_at", count="exact")\
+            .eq("status", "pending")\
+            .order("received_at")\
+            .limit(1)\
+            .execute()
+        failed = self.supabase.table(INBOX_TABLE)\
+            .select("id", count="exact")\
+            .eq("status", "failed")\
+            .limit(1)\
+            .execute()
+        oldest_lag = 0.0
+        if pending.data:
+            oldest = datetime.fromisoformat(pending.data[0]["received_at"].replace("Z", "+00:00"))
+            oldest_lag = (datetime.now(timezone.utc) - oldest).total_seconds()
+        return {
+            "worker_id": self.worker_id,
+            "running": self.running,
+            "pending": pending.count or 0,
+            "failed": failed.count or 0,
+            "oldest_pending_lag_seconds": round(oldest_lag, 3),
+            **self.metrics,
+        }
@@ -0,0 +1,140 @@
+"""
+Worksite Progress - Avancement des chantiers calculé par entreprise
+
+Avancement d'un chantier = jours distincts déjà planifiés (avant aujourd'hui)
+/ nombre de jours du chantier [start_date, end_date], plafonné à 100 %.
+Une période de planning compte pour chacun de ses jours passés ; les
+plannings annulés ne comptent pas.
+
+Tous les chantiers d'une entreprise sont calculés en une requête groupée :
+1. fonction SQL `worksite_progress` (migration 20261019000006)
+2. repli si la fonction n'est pas déployée : lecture des seules colonnes
+   utiles (chantiers puis plannings de l'entreprise), agrégation en Python
+
+Le résultat est persisté dans worksites.progress avec son jour de calcul
+(progress_computed_on, migration 20261019000008) : tous les workers lisent
+la même valeur, recalculée une fois par jour (l'avancement dépend de la
+date) ou quand des plannings changent (refresh, chantiers concernés
+seulement).
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from schedule_conflicts import INACTIVE_STATUSES, parse_day
+from supabase_helpers import SqlFunction, paged
+
+logger = logging.getLogger(__name__)
+
+
+def progress_percent(completed_days: int, first_day: Optional[date], last_day: Optional[date]) -> int:
+    if first_day is None or last_day is None:
+        return 0
+    total_days = (last_day - first_day).days + 1
+    if total_days <= 0:
+        return 0
+    return min(100, int(completed_days / total_days * 100))
+
+
+def completed_days_by_worksite(schedules: Iterable[Dict[str, Any]], today: date) -> Dict[str, int]:
+    """Jours distincts passés (< today) couverts par les plannings, par chantier"""
+    days: Dict[str, set] = {}
+    for row in schedules:
+        worksite_id = row.get("worksite_id")
+        if not worksite_id or str(row.get("status") or "").lower() in INACTIVE_STATUSES:
+            continue
+        first_day = parse_day(row.get("start_date") or row.get("date"))
+        if first_day is None or first_day >= today:
+            continue
+        last_day = min(parse_day(row.get("end_date")) or first_day, today - timedelta(days=1))
+        seen = days.setdefault(str(worksite_id), set())
+        seen.update(range(first_day.toordinal(), last_day.toordinal() + 1))
+    return {worksite_id: len(seen) for worksite_id, seen in days.items()}
+
+
+class WorksiteProgress:
+    """Avancement des chantiers par entreprise, calculé en lot et persisté (worksites.progress)"""
+
+    def __init__(self, get_client: Callable[[], Any]):
+        self._get_client = get_client
+        self._rpc = SqlFunction("worksite_progress", order="worksite_id")
+
+    def current(self, company_id: str, worksites: List[Dict[str, Any]],
+                today: Optional[date] = None) -> Dict[str, int]:
+        """
+        Avancement des chantiers déjà lus par l'appelant : valeur persistée si elle date
+        d'aujourd'hui, sinon un recalcul groupé des autres (persisté pour les requêtes suivantes)
+        """
+        today = today or date.today()
+        progress, stale = {}, []
+        for worksite in worksites:
+            if str(worksite.get("progress_computed_on") or "")[:10] == today.isoformat():
+                progress[str(worksite["id"])] = int(worksite.get("progress") or 0)
+            else:
+                stale.append(str(worksite["id"]))
+        if stale:
+            # Premier appel du jour : toute l'entreprise d'un coup plutôt qu'un long filtre in.(...)
+            progress.update(self.refresh(company_id, None if len(stale) == len(worksites) else stale, today))
+        return progress
+
+    def refresh(self, company_id: str, worksite_ids: Optional[Iterable[Optional[str]]],
+                today: Optional[date] = None) -> Dict[str, int]:
+        """Recalcule et persiste les chantiers donnés (plannings modifiés), tous si worksite_ids est None"""
+        ids = None if worksite_ids is None else sorted({str(i) for i in worksite_ids if i})
+        if ids == []:
+            return {}
+        today = today or date.today()
+        progress = self.compute(company_id, ids, today=today)
+        self._persist(progress, today)
+        return progress
+
+    def _persist(self, progress: Dict[str, int], today: date):
+        """Une mise à jour par valeur d'avancement (pas une par chantier)"""
+        by_value: Dict[int, List[str]] = {}
+        for worksite_id, value in progress.items():
+            by_value.setdefault(value, []).append(worksite_id)
+        for value, ids in by_value.items():
+            try:
+                self._get_client().table("worksites").update({
+                    "progress": value,
+                    "progress_computed_on": today.isoformat(),
+                }).in_("id", ids).execute()
+            except Exception as e:
+                logger.warning(f"⚠️ Avancement {value}% non enregistré pour {len(ids)} chantier(s): {e}")
+
+    def compute(self, company_id: str, worksite_ids: Optional[List[str]] = None,
+                today: Optional[date] = None) -> Dict[str, int]:
+        """{worksite_id: progress} sans cache ; tous les chantiers de l'entreprise si worksite_ids est None"""
+        today = today or date.today()
+        rows = self._rpc.rows(self._get_client(), {
+            "p_company_id": company_id,
+            "p_worksite_ids": worksite_ids,
+            "p_today": today.isoformat(),
+        })
+        if rows is not None:
+            return {str(row["worksite_id"]): int(row.get("progress") or 0) for row in rows}
+        return self._compute_fallback(company_id, worksite_ids, today)
+
+    def _compute_fallback(self, company_id: str, worksite_ids: Optional[List[str]], today: date) -> Dict[str, int]:
+        def worksites_query():
+            query = self._get_client().table("worksites").select("id, start_date, end_date").eq("company_id", company_id)
+            return query.in_("id", worksite_ids) if worksite_ids is not None else query
+
+        def schedules_query():
+            query = (self._get_client().table("schedules")
+                     .select("worksite_id, date, start_date, end_date, status")
+                     .eq("company_id", company_id))
+            if worksite_ids is not None:
+                query = query.in_("worksite_id", worksite_ids)
+            return query.order("id")
+
+        worksites = list(paged(lambda: worksites_query().order("id")))
+        if not worksites:
+            return {}
+        completed = completed_days_by_worksite(paged(schedules_query), today)
+        return {
+            str(ws["id"]): progress_percent(completed.get(str(ws["id"]), 0),
+                                            parse_day(ws.get("start_date")), parse_day(ws.get("end_date")))
+            for ws in worksites
+        }
@@ -0,0 +1,146 @@
+"""
+Benchmark taille des données des outils IA get_statistics / predict_delays
+Compare l'ancienne lecture (select("*") des devis, recherches et projets,
+calculs en Python) aux agrégats compacts : volume transféré depuis la base
+et taille du contenu envoyé au modèle (prompt / message d'outil).
+
+Tokens comptés avec tiktoken si installé, sinon estimés (~4 caractères / token).
+
+Usage: python scripts/benchmarks/bench_ai_prompts.py [nb_devis] [nb_projets]
+"""
+
+import json
+import random
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend"))
+
+from ai_aggregates import format_projects_prompt, summarize_projects, summarize_quotes  # noqa: E402
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_ENCODING.encode(text))
+    TOKENIZER = "tiktoken o200k_base"
+except ImportError:
+    def count_tokens(text: str) -> int:
+        return (len(text) + 3) // 4
+    TOKENIZER = "estimation 4 car./token"
+
+TODAY = date(2026, 10, 19)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def synthetic_rows(n_quotes: int, n_projects: int, seed: int = 42):
+    rng = random.Random(seed)
+    company_id = _uuid(rng)
+    now = datetime(2026, 10, 19, 12, 0)
+    quotes = [{
+        "id": _uuid(rng), "company_id": company_id, "client_id": _uuid(rng),
+        "quote_number": f"DEV-2026-{i:05d}", "title": f"Rénovation lot {i}",
+        "description": "Reprise de maçonnerie, enduit de façade et remplacement des menuiseries extérieures. " * 3,
+        "amount": round(rng.uniform(500, 80000), 2),
+        "status": rng.choice(("DRAFT", "SENT", "ACCEPTED", "REJECTED")),
+        "items": [{"name": "Main d'oeuvre", "quantity": 3, "unit_price": 45.0}] * rng.randint(1, 6),
+        "created_at": (now - timedelta(days=rng.randint(0, 29))).isoformat(),
+        "updated_at": now.isoformat(),
+    } for i in range(n_quotes)]
+    searches = [{
+        "id": _uuid(rng), "company_id": company_id, "user_id": _uuid(rng),
+        "location": f"{rng.randint(1, 200)} rue de la République, Lyon",
+        "description": "Recherche de réseaux enterrés avant terrassement. " * 4,
+        "observations": "Canalisation fonte détectée à 1,20 m. " * 3,
+        "status": rng.choice(("ACTIVE", "PROCESSED", "SHARED")),
+        "photos": [{"url": f"https://cdn.example/{i}.jpg"}] * rng.randint(0, 5),
+        "created_at": now.isoformat(),
+    } for i in range(n_quotes // 2)]
+    projects = [{
+        "id": _uuid(rng), "company_id": company_id, "client_id": _uuid(rng), "search_id": _uuid(rng),
+        "name": f"Chantier {i}", "status": rng.choice(("ACTIVE", "IN_PROGRESS")),
+        "priority": rng.choice(("LOW", "NORMAL", "HIGH")), "category": "TERRAIN",
+        "estimated_value": round(rng.uniform(1000, 200000), 2), "tags": ["réseaux", "voirie"],
+        "start_date": (TODAY - timedelta(days=rng.randint(10, 200))).isoformat(),
+        "end_date": (TODAY + timedelta(days=rng.randint(-30, 120))).isoformat() if rng.random() > 0.1 else None,
+        "created_at": now.isoformat(),
+    } for i in range(n_projects)]
+    return quotes, searches, projects
+
+
+def size(obj) -> int:
+    return len(json.dumps(obj, ensure_ascii=False, default=str).encode())
+
+
+def legacy(quotes, searches, projects):
+    """Ancien calcul : lignes complètes, sommes en Python, 10 premiers projets dans le prompt"""
+    transfer = size(quotes) + size(searches) + size(projects)
+    stats = {
+        "period": "month",
+        "quotes": {
+            "total": len(quotes),
+            "amount": sum(q.get("amount", 0) for q in quotes),
+            "accepted": len([q for q in quotes if q.get("status") == "ACCEPTED"]),
+            "pending": len([q for q in quotes if q.get("status") == "SENT"]),
+        },
+        "clients": {"total": 120},
+        "searches": {
+            "total": len(searches),
+            "processed": len([s for s in searches if s.get("status") == "PROCESSED"]),
+        },
+    }
+    projects_summary = "\n".join([
+        f"- {p.get('title')}: statut {p.get('status')}, deadline {p.get('deadline_date', 'N/A')}"
+        for p in projects[:10]
+    ])
+    return transfer, json.dumps(stats, ensure_ascii=False, default=str), projects_summary
+
+
+def aggregated(quotes, searches, projects):
+    """Agrégats : seul l'objet JSON final transite depuis la base"""
+    stats = {
+        "period": "month",
+        "quotes": summarize_quotes(quotes),
+        "clients": {"total": 120},
+        "searches": {
+            "total": len(searches),
+            "processed": sum(s.get("status") == "PROCESSED" for s in searches),
+        },
+    }
+    risk = summarize_projects(projects, TODAY)
+    transfer = size(stats) + size(risk)
+    return (
+        transfer,
+        json.dumps(stats, ensure_ascii=False, default=str, separators=(",", ":")),
+        format_projects_prompt(risk),
+    )
+
+
+def main():
+    n_quotes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_projects = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    quotes, searches, projects = synthetic_rows(n_quotes, n_projects)
+
+    before = legacy(quotes, searches, projects)
+    after = aggregated(quotes, searches, projects)
+
+    print(f"{len(quotes)} devis, {len(searches)} recherches, {len(projects)} projets ({TOKENIZER})")
+    print(f"  transfert base       : {before[0] / 1024:10.1f} Ko -> {after[0] / 1024:8.1f} Ko "
+          f"(/{before[0] / max(1, after[0]):.0f})")
+    for label, old, new in (
+        ("get_statistics (outil)", before[1], after[1]),
+        ("predict_delays (prompt)", before[2], after[2]),
+    ):
+        print(f"  {label:<23}: {count_tokens(old):6d} -> {count_tokens(new):6d} tokens")
+    print("  note : l'ancien prompt predict_delays lisait title / deadline_date (absents de projects) : "
+          "10 lignes sans nom ni échéance ; il transmet désormais compteurs + 10 échéances les plus proches")
+
+
+if __name__ == "__main__":
+    main()
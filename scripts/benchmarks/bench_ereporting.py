@@ -0,0 +1,70 @@
+"""
+Benchmark agrégation e-reporting
+Compare une boucle Decimal ligne par ligne à aggregate_lines (NumPy, centimes int64)
+sur des lignes synthétiques, et vérifie que les totaux sont identiques.
+
+Usage: python scripts/benchmarks/bench_ereporting.py [nb_lignes]
+"""
+
+import random
+import sys
+import time
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend"))
+
+from ereporting_engine import aggregate_lines, VAT_RATES, TRANSACTION_CATEGORIES  # noqa: E402
+
+
+def synthetic_rows(n: int, seed: int = 42):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rate = rng.choice(VAT_RATES)
+        ht = Decimal(rng.randint(100, 5_000_000)) / 100
+        tva = (ht * rate / 100).quantize(Decimal("0.01"))
+        rows.append((
+            rng.choice(("emitted", "received")), rng.choice(TRANSACTION_CATEGORIES), rate,
+            f"inv-{i // 3}", float(ht), float(tva), float(ht + tva),
+        ))
+    return rows
+
+
+def decimal_loop(rows):
+    groups = defaultdict(lambda: [0, Decimal("0"), Decimal("0"), Decimal("0")])
+    for direction, category, rate, _, ht, tva, ttc in rows:
+        g = groups[(direction, category, rate)]
+        g[0] += 1
+        g[1] += Decimal(str(ht))
+        g[2] += Decimal(str(tva))
+        g[3] += Decimal(str(ttc))
+    return groups
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rows = synthetic_rows(n)
+
+    t0 = time.perf_counter()
+    reference = decimal_loop(rows)
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    groups = aggregate_lines(rows)
+    t_numpy = time.perf_counter() - t0
+
+    for g in groups:
+        ref = reference[(g["direction"], g["transaction_category"], g["tva_rate"])]
+        assert g["lines_count"] == ref[0]
+        assert (g["total_ht"], g["total_tva"], g["total_ttc"]) == tuple(ref[1:]), g
+
+    print(f"{n} lignes, {len(groups)} groupes")
+    print(f"  boucle Decimal : {t_loop * 1000:8.1f} ms")
+    print(f"  NumPy (cents)  : {t_numpy * 1000:8.1f} ms  (x{t_loop / t_numpy:.1f})")
+    print("  ✅ totaux identiques")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Benchmark génération PDF (rapports de recherche et devis)
+
+Appelle directement generate_search_pdf et generate_quote_pdf sur des
+recherches (0 à 100 photos, sections personnalisées) et des devis (1 à 500
+lignes, photos d'articles) synthétiques. Supabase est remplacé par un client
+en mémoire (tables + storage) servant des photos JPEG générées avec Pillow :
+aucun réseau, seul le code PDF est mesuré.
+
+Chaque cas tourne dans un processus neuf (pic de RSS propre au cas) :
+- temps : médiane et minimum sur --repeat générations
+- mémoire : pic de RSS et hausse par rapport au RSS avant génération
+- sortie : taille du PDF et nombre de pages
+
+Seuils de régression (code de sortie 1) avec --baseline fichier.json :
+temps > référence x (1 + --tolerance) (et écart > --noise-ms), hausse de RSS
+> référence x (1 + --tolerance) (et écart > --noise-mb), taille du PDF >
+référence x (1 + --tolerance).
+
+Référence versionnée : baselines/bench_pdf.json (--save-baseline sur main).
+Temps et RSS dépendent de la machine : mesurée sur une autre machine
+(système, architecture, Python, nombre de CPU), la référence ne sert qu'aux
+tailles de PDF ; pour comparer les temps, enregistrer d'abord une référence
+locale sur main. Aucune CI ne lance ce script : à exécuter avant un
+déploiement touchant pdf_reports / pdf_routes.
+
+Usage:
+  python scripts/benchmarks/bench_pdf.py [--cases search,quote-l500] [--repeat 3]
+      [--photo-px 1600x1200] [--json out.json] [--baseline ref.json] [--save-baseline ref.json]
+  python scripts/benchmarks/bench_pdf.py --baseline scripts/benchmarks/baselines/bench_pdf.json
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    resource = None
+    RESOURCE_AVAILABLE = False
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parents[1] / "backend"
+sys.path.insert(0, str(BENCH_DIR))
+
+from synthetic_data import CITIES, FIRST_NAMES, LAST_NAMES, STREETS, WORKS  # noqa: E402
+
+# (photos, sections personnalisées) et (lignes, lignes avec photo)
+SEARCH_CASES = [(0, 0), (10, 2), (25, 4), (50, 6), (100, 10)]
+QUOTE_CASES = [(1, 0), (50, 0), (200, 0), (500, 0), (50, 10), (500, 100)]
+
+STANDARD_SECTIONS = ["general_info", "description", "observations", "localisation", "equipements", "resultats"]
+PHOTO_VARIANTS = 4
+
+COMPANY_ID = "00000000-0000-4000-8000-0000000000c0"
+USER = {"id": "00000000-0000-4000-8000-0000000000a1", "email": "bench@skyapp.fr", "role": "ADMIN"}
+
+
+def case_names() -> List[str]:
+    return ([f"search-p{p}-s{s}" for p, s in SEARCH_CASES]
+            + [f"quote-l{n}-p{p}" for n, p in QUOTE_CASES])
+
+
+# ==================== FIXTURES ====================
+
+def jpeg_fixture(width: int, height: int, seed: int) -> bytes:
+    """Photo de chantier simulée : dégradé + bruit (taux de compression proche d'une vraie photo)"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([
+        128 + 90 * np.sin(x / (width / 3) + seed),
+        128 + 90 * np.cos(y / (height / 4) - seed),
+        128 + 60 * np.sin((x + y) / (width / 5)),
+    ], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 18, base.shape), 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def search_record(photos: int, sections: int, rng: random.Random) -> dict:
+    search_id = f"5ea4c000-0000-4000-8000-{photos:06d}{sections:06d}"
+    custom = [{"id": f"custom_{k}", "title": f"{rng.choice(WORKS)} - zone {k + 1}",
+               "value": "Relevé détaillé.\n" * rng.randint(1, 6)} for k in range(sections)]
+    section_ids = STANDARD_SECTIONS + [c["id"] for c in custom]
+    photo_rows = [{"filename": "profile.jpg", "is_profile": True, "section_id": "profile"}] if photos else []
+    for p in range(photos):
+        photo_rows.append({
+            "filename": f"photo_{p}.jpg", "section_id": section_ids[p % len(section_ids)],
+            "notes": rng.choice(["", "Fissure en pied de mur", "Trace d'humidité sous l'évier", "Regard ouvert"]),
+        })
+    return {
+        "id": search_id, "company_id": COMPANY_ID, "user_id": USER["id"],
+        "nom": rng.choice(LAST_NAMES), "prenom": rng.choice(FIRST_NAMES), "search_type": "FUITE",
+        "location": f"{rng.randint(1, 180)} {rng.choice(STREETS)}, {rng.choice(CITIES)}",
+        "description": "Recherche de fuite sur réseau d'eau chaude.\nAccès par le sous-sol.",
+        "observations": json.dumps({"text": "Compteur relevé avant et après essai.", "customSections": custom}),
+        "status": "ACTIVE", "created_at": "2026-10-19T08:00:00+00:00", "photos": photo_rows,
+    }
+
+
+def quote_record(lines: int, photo_lines: int, photo_data_url: str, rng: random.Random) -> dict:
+    items = []
+    for k in range(lines):
+        item = {
+            "name": f"{rng.choice(WORKS)} - poste {k + 1}", "description": "Fourniture et pose, évacuation des gravats",
+            "quantity": rng.randint(1, 40), "price": round(rng.lognormvariate(4.5, 1.0), 2),
+            "tva_rate": rng.choice([5.5, 10, 20]), "unit": rng.choice(["u", "m²", "ml", "h", "forfait"]),
+        }
+        if k < photo_lines:
+            item["photo"] = {"data": photo_data_url}
+        items.append(item)
+    return {
+        "id": f"9e07e000-0000-4000-8000-{lines:06d}{photo_lines:06d}", "company_id": COMPANY_ID,
+        "client_id": "00000000-0000-4000-8000-0000000000b1", "quote_number": "202610-00001",
+        "title": "Rénovation salle de bain", "description": "Travaux selon visite du 12/10",
+        "status": "DRAFT", "items": items, "created_at": "2026-10-19T08:00:00+00:00",
+    }
+
+
+class StubQuery:
+    def __init__(self, rows: List[dict]):
+        self.rows = rows
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        return StubQuery([r for r in self.rows if r.get(column) == value])
+
+    def execute(self):
+        return SimpleNamespace(data=self.rows, count=len(self.rows))
+
+
+class StubBucket:
+    def __init__(self, files: Dict[str, bytes]):
+        self.files = files
+
+    def download(self, path: str) -> bytes:
+        return self.files[path.rsplit("/", 1)[-1]]
+
+
+class StubSupabase:
+    """Remplace supabase_service : tables en mémoire et storage.from_(bucket).download(path)"""
+
+    def __init__(self, tables: Dict[str, List[dict]], files: Dict[str, bytes]):
+        self.tables = tables
+        self.storage = SimpleNamespace(from_=lambda bucket: StubBucket(files))
+
+    def table(self, name: str) -> StubQuery:
+        return StubQuery(self.tables.get(name, []))
+
+
+# ==================== MESURE (processus enfant) ====================
+
+def _peak_rss_mb() -> Optional[float]:
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _current_rss_mb() -> Optional[float]:
+    # RSS courant (Linux) ; ailleurs le pic atteint jusque-là
+    try:
+        resident_pages = int(Path("/proc/self/statm").read_text().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return _peak_rss_mb()
+
+
+async def _read_body(response) -> bytes:
+    chunks = [chunk async for chunk in response.body_iterator]
+    return b"".join(c if isinstance(c, bytes) else c.encode() for c in chunks)
+
+
+def run_case(name: str, repeat: int, photo_px: str) -> dict:
+    os.environ.update({
+        "SUPABASE_URL": os.environ.get("SUPABASE_URL", "http://localhost:54321"),
+        "SUPABASE_ANON_KEY": os.environ.get("SUPABASE_ANON_KEY", "bench"),
+        "SUPABASE_SERVICE_KEY": os.environ.get("SUPABASE_SERVICE_KEY", "bench"),
+    })
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    sys.path.insert(0, str(BACKEND_DIR))
+    import pdf_reports
+
+    kind, *params = name.split("-")
+    a, b = (int(p[1:]) for p in params)
+    width, height = (int(v) for v in photo_px.lower().split("x"))
+    rng = random.Random(name)
+    photos = [jpeg_fixture(width, height, seed) for seed in range(PHOTO_VARIANTS)]
+
+    workdir = tempfile.TemporaryDirectory(prefix="bench_pdf_")
+    root = Path(workdir.name)
+    (root / "uploads").mkdir()
+    (root / "uploads" / "logo.jpg").write_bytes(jpeg_fixture(400, 400, 99))
+
+    tables = {
+        "companies": [{"id": COMPANY_ID, "name": "Entreprise Bench", "address": "12 rue Victor Hugo",
+                       "postal_code": "69002", "city": "Lyon", "siret": "12345678900012"}],
+        "company_settings": [{"company_id": COMPANY_ID, "company_name": "Entreprise Bench", "logo_url": "/uploads/logo.jpg",
+                              "address": "12 rue Victor Hugo", "postal_code": "69002", "city": "Lyon",
+                              "siret": "12345678900012", "tva_number": "FR00123456789", "phone": "0472000000"}],
+        "clients": [{"id": "00000000-0000-4000-8000-0000000000b1", "company_id": COMPANY_ID, "societe": "SCI Les Tilleuls",
+                     "nom": "Durand", "prenom": "Léa", "adresse": "3 chemin des Vignes, Annecy"}],
+        "searches": [], "quotes": [],
+    }
+    if kind == "search":
+        record = search_record(a, b, rng)
+        tables["searches"].append(record)
+        files = {p["filename"]: photos[i % PHOTO_VARIANTS] for i, p in enumerate(record["photos"])}
+        generate = lambda: pdf_reports.generate_search_pdf(record["id"], USER)  # noqa: E731
+    else:
+        data_url = "data:image/jpeg;base64," + base64.b64encode(photos[0]).decode()
+        record = quote_record(a, b, data_url, rng)
+        tables["quotes"].append(record)
+        files = {}
+        generate = lambda: pdf_reports.generate_quote_pdf(record["id"], USER)  # noqa: E731
+
+    async def get_user_company(user_data):
+        return COMPANY_ID
+
+    pdf_reports.supabase_service = StubSupabase(tables, files)
+    pdf_reports.get_user_company = get_user_company
+    pdf_reports.ROOT_DIR = root
+
+    async def measure():
+        timings, body = [], b""
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await generate()
+            timings.append((time.perf_counter() - started) * 1000)
+            body = await _read_body(response)
+        return timings, body
+
+    rss_before = _current_rss_mb()
+    timings, body = asyncio.run(measure())
+    rss_peak = _peak_rss_mb()
+    workdir.cleanup()
+
+    return {
+        "case": name,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "peak_rss_mb": round(rss_peak, 1) if rss_peak is not None else None,
+        "rss_growth_mb": round(rss_peak - rss_before, 1) if rss_peak is not None and rss_before is not None else None,
+        "size_kb": round(len(body) / 1024, 1),
+        "pages": len(re.findall(rb"/Type /Page\b", body)),
+    }
+
+
+def run_isolated(name: str, repeat: int, photo_px: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, __file__, "--worker", name, "--repeat", str(repeat), "--photo-px", photo_px],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"Cas {name} en échec:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# ==================== RAPPORT ====================
+
+def machine() -> dict:
+    """Empreinte de la machine : les temps et le RSS ne se comparent qu'à l'identique"""
+    return {"system": platform.system(), "arch": platform.machine(),
+            "python": ".".join(platform.python_version_tuple()[:2]), "cpus": os.cpu_count()}
+
+
+def check_thresholds(results: dict, baseline: dict, tolerance: float, noise_ms: float, noise_mb: float,
+                     sizes_only: bool = False) -> List[str]:
+    failures = []
+    for name, case in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        if case["size_kb"] > base["size_kb"] * (1 + tolerance):
+            failures.append(f"{name}: PDF de {case['size_kb']} Ko > référence {base['size_kb']} Ko")
+        if sizes_only:
+            continue
+        if case["median_ms"] > base["median_ms"] * (1 + tolerance) and case["median_ms"] - base["median_ms"] > noise_ms:
+            failures.append(f"{name}: {case['median_ms']} ms > référence {base['median_ms']} ms")
+        growth, base_growth = case.get("rss_growth_mb"), base.get("rss_growth_mb")
+        if growth is not None and base_growth is not None \
+                and growth > base_growth * (1 + tolerance) and growth - base_growth > noise_mb:
+            failures.append(f"{name}: +{growth} Mo de RSS > référence +{base_growth} Mo")
+    return failures
+
+
+def print_report(results: dict):
+    print(f"Génération PDF - photos {results['photo_px']}, {results['repeat']} run(s) par cas")
+    print(f"  {'cas':<20} {'médiane ms':>11} {'min ms':>8} {'pic RSS Mo':>11} {'+RSS Mo':>8} {'PDF Ko':>9} {'pages':>6}")
+    for name, c in results["cases"].items():
+        peak = f"{c['peak_rss_mb']:.1f}" if c["peak_rss_mb"] is not None else "-"
+        growth = f"{c['rss_growth_mb']:.1f}" if c["rss_growth_mb"] is not None else "-"
+        print(f"  {name:<20} {c['median_ms']:>11.1f} {c['min_ms']:>8.1f} {peak:>11} {growth:>8} "
+              f"{c['size_kb']:>9.1f} {c['pages']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", help="Filtre (préfixes séparés par des virgules) : search, quote-l500...")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--photo-px", default="1600x1200", help="Taille des photos simulées")
+    parser.add_argument("--json", help="Écrit les résultats")
+    parser.add_argument("--baseline", help="Résultats de référence (JSON) à ne pas dégrader")
+    parser.add_argument("--save-baseline", help="Enregistre ces résultats comme référence")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--noise-ms", type=float, default=20.0)
+    parser.add_argument("--noise-mb", type=float, default=10.0)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_case(args.worker, args.repeat, args.photo_px)))
+        return
+
+    prefixes = [p.strip() for p in args.cases.split(",")] if args.cases else [""]
+    names = [n for n in case_names() if any(n.startswith(p) for p in prefixes)]
+    if not names:
+        parser.error(f"Aucun cas ne correspond ; cas disponibles : {', '.join(case_names())}")
+
+    results = {"photo_px": args.photo_px, "repeat": args.repeat, "machine": machine(), "cases": {}}
+    for name in names:
+        print(f"  ⏱️ {name}...", file=sys.stderr)
+        results["cases"][name] = run_isolated(name, args.repeat, args.photo_px)
+    print_report(results)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    failures = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        sizes_only = baseline.get("machine") != results["machine"]
+        if sizes_only:
+            print(f"⚠️ Référence mesurée sur une autre machine ({baseline.get('machine')}) : tailles de PDF seules")
+        failures = check_thresholds(results, baseline, args.tolerance, args.noise_ms, args.noise_mb, sizes_only)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if args.baseline and not failures:
+        print("\n✅ Aucun seuil dépassé")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Supabase local de substitution pour les benchmarks (PostgREST / Auth / Storage)
+
+Serveur HTTP réel (uvicorn, thread dédié) sur 127.0.0.1 : le backend
+l'utilise via SUPABASE_URL comme le vrai Supabase, client supabase-py et
+sérialisation JSON compris. Les tables sont en mémoire.
+
+Sous-ensemble PostgREST couvert :
+- GET/HEAD/POST/PATCH/DELETE /rest/v1/<table>
+- select avec colonnes, *, ressources embarquées (alias:fk(...), table(...))
+- filtres eq, neq, gt, gte, lt, lte, like, ilike, in, is, not.<op>, or=(...)
+  (and(...) / or(...) imbriqués)
+- order, limit, offset, Prefer: count=exact (Content-Range), objet unique
+- upsert (resolution=merge-duplicates, on_conflict)
+- /rest/v1/rpc/<fn> : 404 PGRST202 (le backend bascule sur ses replis)
+Auth : GET /auth/v1/user avec un jeton "bench-<user_id>".
+Storage : objets en mémoire (upload, download, URL signée, liste vide).
+
+latency_ms simule l'aller-retour réseau vers Supabase pour chaque appel.
+"""
+
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# Colonne de clé étrangère -> table référencée (quand l'alias n'est pas un nom de table)
+FK_TABLES = {
+    "user_id": "users", "collaborator_id": "users", "created_by": "users", "created_by_user_id": "users",
+    "client_id": "clients", "company_id": "companies", "worksite_id": "worksites", "quote_id": "quotes",
+    "team_leader_id": "planning_team_leaders", "search_id": "searches", "project_id": "projects",
+}
+SINGULAR = {"companies": "company", "searches": "search"}
+
+AUTH_TOKEN_PREFIX = "bench-"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        parts.append("".join(current).strip())
+    return [p for p in parts if p]
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _compare(value: Any, op: str, arg: str) -> bool:
+    if op == "is":
+        return _as_text(value) == arg.lower()
+    if op == "in":
+        options = [o.strip().strip('"') for o in _split_top_level(arg.strip()[1:-1])]
+        return _as_text(value) in options
+    if op in ("like", "ilike"):
+        pattern = "^" + re.escape(arg).replace("\\*", ".*").replace("%", ".*") + "$"
+        return value is not None and re.match(pattern, str(value), re.IGNORECASE if op == "ilike" else 0) is not None
+    if op == "eq":
+        return _as_text(value) == arg
+    if op == "neq":
+        return _as_text(value) != arg
+    if value is None:
+        return False
+    try:
+        left, right = float(value), float(arg)
+    except (TypeError, ValueError):
+        left, right = str(value), arg
+    return {"gt": left > right, "gte": left >= right, "lt": left < right, "lte": left <= right}.get(op, False)
+
+
+def _condition(column: str, expression: str):
+    """'eq.x' / 'not.is.null' -> prédicat sur une ligne"""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, arg = expression.partition(".")
+    return lambda row: _compare(row.get(column), op, arg) != negate
+
+
+def _or_condition(expression: str, combine=any):
+    """or=(a.eq.1,b.ilike.*x*), avec and(...) / or(...) imbriqués"""
+    predicates = []
+    for item in _split_top_level(expression.strip()[1:-1]):
+        if item.startswith(("and(", "or(")):
+            name, _, rest = item.partition("(")
+            predicates.append(_or_condition("(" + rest, all if name == "and" else any))
+            continue
+        column, _, rest = item.partition(".")
+        predicates.append(_condition(column, rest))
+    return lambda row: combine(p(row) for p in predicates)
+
+
+class FakeSupabase:
+    """Tables en mémoire servies comme Supabase (voir docstring du module)"""
+
+    def __init__(self, tables: Dict[str, List[dict]], latency_ms: float = 2.0):
+        self.tables: Dict[str, List[dict]] = {name: list(rows) for name, rows in tables.items()}
+        self.latency = latency_ms / 1000
+        self.objects: Dict[str, bytes] = {}
+        self.requests = 0
+        self._by_id: Dict[str, Dict[str, dict]] = {}
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.url = ""
+        self.app = Starlette(routes=[
+            Route("/rest/v1/rpc/{fn}", self._rpc, methods=["POST", "GET"]),
+            Route("/rest/v1/{table}", self._rest, methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+            Route("/auth/v1/user", self._auth_user, methods=["GET"]),
+            Route("/storage/v1/object/list/{bucket}", self._storage_list, methods=["POST"]),
+            Route("/storage/v1/object/sign/{bucket}/{path:path}", self._storage_sign, methods=["POST"]),
+            Route("/storage/v1/object/public/{bucket}/{path:path}", self._storage_object, methods=["GET"]),
+            Route("/storage/v1/object/{bucket}/{path:path}", self._storage_object, methods=["GET", "POST", "PUT", "DELETE"]),
+        ])
+
+    # -- cycle de vie ------------------------------------------------------
+
+    def start(self) -> str:
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=0, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-supabase", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Le faux Supabase n'a pas démarré")
+            time.sleep(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- données -----------------------------------------------------------
+
+    def _rows(self, table: str) -> List[dict]:
+        if table == "quotes_with_client_name":
+            clients = self._index("clients")
+            return [{**q, "client_name": (clients.get(q.get("client_id")) or {}).get("name")}
+                    for q in self.tables.get("quotes", [])]
+        return self.tables.setdefault(table, [])
+
+    def _index(self, table: str) -> Dict[str, dict]:
+        rows = self.tables.get(table, [])
+        index = self._by_id.get(table)
+        if index is None or len(index) != len(rows):
+            index = self._by_id[table] = {r.get("id"): r for r in rows}
+        return index
+
+    def _project(self, row: dict, table: str, fields: List[str]) -> dict:
+        out: Dict[str, Any] = {}
+        for field in fields:
+            if field == "*":
+                out.update(row)
+                continue
+            if "(" not in field:
+                alias, _, column = field.rpartition(":")
+                column = column.split("::")[0]
+                out[alias or column] = row.get(column)
+                continue
+            head, inner = field.split("(", 1)
+            inner_fields = _split_top_level(inner[:-1]) or ["*"]
+            alias, _, target = head.partition(":") if ":" in head else ("", "", head)
+            target = target.split("!")[0].strip()
+            alias = alias.strip() or target
+            if target in self.tables:
+                fk = f"{SINGULAR.get(target, target.rstrip('s'))}_id"
+                if fk in row:
+                    ref = self._index(target).get(row.get(fk))
+                    out[alias] = self._project(ref, target, inner_fields) if ref else None
+                else:
+                    parent_fk = f"{SINGULAR.get(table, table.rstrip('s'))}_id"
+                    out[alias] = [self._project(child, target, inner_fields)
+                                  for child in self.tables[target] if child.get(parent_fk) == row.get("id")]
+            else:
+                ref_table = alias if alias in self.tables else FK_TABLES.get(target, "")
+                ref = self._index(ref_table).get(row.get(target)) if ref_table else None
+                out[alias] = self._project(ref, ref_table, inner_fields) if ref else None
+        return out
+
+    def _filtered(self, table: str, params: List[Tuple[str, str]]) -> List[dict]:
+        predicates = []
+        for key, value in params:
+            if key in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+                continue
+            predicates.append(_or_condition(value) if key == "or" else _condition(key, value))
+        return [r for r in self._rows(table) if all(p(r) for p in predicates)]
+
+    # -- handlers ----------------------------------------------------------
+
+    async def _rest(self, request: Request) -> Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        table = request.path_params["table"]
+        params = list(request.query_params.multi_items())
+        query = dict(params)
+        prefer = request.headers.get("prefer", "")
+        method = request.method
+
+        if method == "POST":
+            payload = json.loads(await request.body() or b"[]")
+            rows = payload if isinstance(payload, list) else [payload]
+            result = [self._upsert(table, row, "merge-duplicates" in prefer, query.get("on_conflict")) for row in rows]
+            return self._respond(request, table, result, len(result), query, status=201)
+
+        matched = self._filtered(table, params)
+        if method == "PATCH":
+            changes = json.loads(await request.body() or b"{}")
+            for row in matched:
+                row.update(changes)
+                row.setdefault("updated_at", _now())
+            return self._respond(request, table, matched, len(matched), query)
+        if method == "DELETE":
+            ids = {id(r) for r in matched}
+            self.tables[table] = [r for r in self._rows(table) if id(r) not in ids]
+            self._by_id.pop(table, None)
+            return self._respond(request, table, matched, len(matched), query)
+
+        for column, desc in reversed(self._order(query.get("order"))):
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column) if r.get(column) is not None else ""),
+                         reverse=desc)
+            if desc:
+                # NULLS LAST même en ordre décroissant
+                matched.sort(key=lambda r: r.get(column) is None)
+        total = len(matched)
+        offset = int(query.get("offset", 0))
+        limit = int(query["limit"]) if "limit" in query else None
+        page = matched[offset: offset + limit if limit is not None else None]
+        return self._respond(request, table, page, total, query, offset=offset)
+
+    @staticmethod
+    def _order(spec: Optional[str]) -> List[Tuple[str, bool]]:
+        orders = []
+        for part in (spec or "").split(","):
+            if part:
+                pieces = part.split(".")
+                orders.append((pieces[0], "desc" in pieces[1:]))
+        return orders
+
+    def _upsert(self, table: str, row: dict, merge: bool, on_conflict: Optional[str]) -> dict:
+        rows = self._rows(table)
+        keys = (on_conflict or "id").split(",")
+        if merge and all(k in row for k in keys):
+            for existing in rows:
+                if all(existing.get(k) == row[k] for k in keys):
+                    existing.update(row)
+                    existing["updated_at"] = _now()
+                    return existing
+        stored = {"id": str(uuid.uuid4()), "created_at": _now(), "updated_at": _now(), **row}
+        rows.append(stored)
+        return stored
+
+    def _respond(self, request: Request, table: str, rows: List[dict], total: int, query: dict,
+                 status: int = 200, offset: int = 0) -> Response:
+        fields = _split_top_level(query.get("select", "*")) or ["*"]
+        body: Any = [self._project(r, table, fields) for r in rows]
+        headers = {}
+        if "count=" in request.headers.get("prefer", ""):
+            headers["content-range"] = f"{offset}-{offset + len(rows) - 1}/{total}" if rows else f"*/{total}"
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(body) != 1:
+                return JSONResponse({"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned",
+                                     "details": f"Results contain {len(body)} rows", "hint": None}, status_code=406)
+            body = body[0]
+        if request.method == "HEAD":
+            return Response(status_code=status, headers=headers)
+        return JSONResponse(body, status_code=status, headers=headers)
+
+    async def _rpc(self, request: Request) -> Response:
+        self.requests += 1
+        fn = request.path_params["fn"]
+        return JSONResponse({"code": "PGRST202", "message": f"Could not find the function public.{fn}",
+                             "details": None, "hint": None}, status_code=404)
+
+    async def _auth_user(self, request: Request) -> Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        user = self._index("users").get(token.removeprefix(AUTH_TOKEN_PREFIX)) if token.startswith(AUTH_TOKEN_PREFIX) else None
+        if user is None:
+            return JSONResponse({"code": 401, "msg": "invalid JWT"}, status_code=401)
+        return JSONResponse({
+            "id": user["id"], "aud": "authenticated", "role": "authenticated", "email": user.get("email"),
+            "app_metadata": {"provider": "email"}, "user_metadata": {}, "created_at": user.get("created_at") or _now(),
+        })
+
+    async def _storage_object(self, request: Request) -> Response:
+        self.requests += 1
+        key = f"{request.path_params['bucket']}/{request.path_params['path']}"
+        if request.method in ("POST", "PUT"):
+            self.objects[key] = await request.body()
+            return JSONResponse({"Key": key})
+        if request.method == "DELETE":
+            self.objects.pop(key, None)
+            return JSONResponse({"message": "deleted"})
+        if key not in self.objects:
+            return JSONResponse({"statusCode": "404", "error": "not_found", "message": "Object not found"}, status_code=404)
+        return Response(self.objects[key], media_type="application/octet-stream")
+
+    async def _storage_sign(self, request: Request) -> Response:
+        self.requests += 1
+        key = f"{request.path_params['bucket']}/{request.path_params['path']}"
+        return JSONResponse({"signedURL": f"/object/sign/{key}?token=bench"})
+
+    async def _storage_list(self, request: Request) -> Response:
+        self.requests += 1
+        return JSONResponse([])
+
+
+def auth_token(user_id: str) -> str:
+    """Jeton Bearer accepté par /auth/v1/user pour cet utilisateur"""
+    return f"{AUTH_TOKEN_PREFIX}{user_id}"
@@ -0,0 +1,246 @@
+"""
+Test de charge local et reproductible de l'API (sans Supabase distant)
+
+Démarre le faux Supabase (fake_supabase.py) rempli par synthetic_data.py,
+importe server_supabase pointé dessus et rejoue, dans le même processus
+(httpx + ASGITransport), des parcours technicien et bureau pour chaque
+niveau de concurrence. Même graine = mêmes données et mêmes séquences de
+requêtes : les résultats sont comparables d'un commit à l'autre.
+
+Rapport par niveau et par endpoint : nombre, erreurs, p50, p95, débit.
+
+Seuils de régression (code de sortie 1) :
+- --baseline fichier.json : p95 > référence x (1 + --tolerance) (et écart
+  > --noise-ms) ou débit < référence x (1 - --tolerance)
+- --p95-budget-ms : p95 maximal absolu par endpoint
+- --max-error-rate : taux d'erreurs (5xx, exceptions) maximal
+
+Usage:
+  python scripts/benchmarks/loadtest.py [--concurrency 1,10,30] [--requests 20]
+      [--companies 2] [--seed 42] [--latency-ms 2] [--json out.json]
+      [--baseline ref.json] [--save-baseline ref.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parents[1] / "backend"))
+
+from fake_supabase import FakeSupabase, auth_token  # noqa: E402
+from synthetic_data import TODAY, TenantSpec, generate_tenants  # noqa: E402
+
+
+@dataclass
+class Step:
+    label: str
+    weight: int
+    request: Callable[["VirtualUser"], Tuple[str, str, Optional[dict]]]
+
+
+@dataclass
+class VirtualUser:
+    user: dict
+    token: str
+    own_searches: List[str]
+
+
+def _window() -> str:
+    return f"from={(TODAY - timedelta(days=7)).isoformat()}&to={(TODAY + timedelta(days=21)).isoformat()}"
+
+
+TECHNICIAN_STEPS = [
+    Step("GET /api/searches", 4, lambda u: ("GET", "/api/searches", None)),
+    Step("GET /api/searches?page", 2, lambda u: ("GET", "/api/searches?page=1&page_size=10", None)),
+    Step("GET /api/searches/{id}", 2, lambda u: ("GET", f"/api/searches/{u.own_searches[0]}", None)),
+    Step("GET /api/technicians/{id}/missions", 3,
+         lambda u: ("GET", f"/api/technicians/{u.user['id']}/missions?{_window()}", None)),
+    Step("GET /api/clients", 1, lambda u: ("GET", "/api/clients", None)),
+    Step("POST /api/searches/draft", 1, lambda u: ("POST", "/api/searches/draft", None)),
+]
+
+BUREAU_STEPS = [
+    Step("GET /api/searches", 3, lambda u: ("GET", "/api/searches", None)),
+    Step("GET /api/schedules", 3, lambda u: ("GET", f"/api/schedules?{_window()}", None)),
+    Step("GET /api/team-leaders-stats", 1, lambda u: ("GET", "/api/team-leaders-stats", None)),
+    Step("GET /api/quotes", 2, lambda u: ("GET", "/api/quotes", None)),
+    Step("GET /api/worksites", 2, lambda u: ("GET", "/api/worksites", None)),
+    Step("GET /api/clients", 1, lambda u: ("GET", "/api/clients", None)),
+]
+
+
+def _virtual_users(tables) -> Tuple[List[VirtualUser], List[VirtualUser]]:
+    searches_by_user = defaultdict(list)
+    for search in tables["searches"]:
+        searches_by_user[search["user_id"]].append(search["id"])
+    technicians, bureau = [], []
+    for user in tables["users"]:
+        if not searches_by_user[user["id"]]:
+            continue
+        vu = VirtualUser(user, auth_token(user["id"]), searches_by_user[user["id"]])
+        (technicians if user["role"] == "TECHNICIEN" else bureau).append(vu)
+    return technicians, bureau
+
+
+async def _run_user(client, vu: VirtualUser, steps: List[Step], n_requests: int, rng: random.Random, samples):
+    weights = [s.weight for s in steps]
+    headers = {"Authorization": f"Bearer {vu.token}"}
+    for step in rng.choices(steps, weights=weights, k=n_requests):
+        method, path, body = step.request(vu)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, headers=headers, json=body)
+            status = response.status_code
+        except Exception:
+            status = 599
+        samples[step.label].append((time.perf_counter() - started, status))
+
+
+async def run_level(client, technicians, bureau, concurrency: int, n_requests: int, seed: int):
+    """`concurrency` utilisateurs simultanés (1 bureau pour 3 techniciens), n_requests chacun"""
+    rng = random.Random(seed * 1000 + concurrency)
+    samples: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+    tasks = []
+    for i in range(concurrency):
+        if i % 4 == 3 and bureau:
+            vu, steps = bureau[(i // 4) % len(bureau)], BUREAU_STEPS
+        else:
+            vu, steps = technicians[i % len(technicians)], TECHNICIAN_STEPS
+        tasks.append(_run_user(client, vu, steps, n_requests, random.Random(rng.getrandbits(32)), samples))
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    return _summarize(samples, wall)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _summarize(samples, wall: float) -> dict:
+    endpoints = {}
+    total = errors = 0
+    for label, rows in sorted(samples.items()):
+        latencies = [d * 1000 for d, _ in rows]
+        failed = sum(1 for _, status in rows if status >= 500)
+        total += len(rows)
+        errors += failed
+        endpoints[label] = {
+            "count": len(rows),
+            "errors": failed,
+            "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "rps": round(len(rows) / wall, 1),
+        }
+    return {"requests": total, "errors": errors, "wall_s": round(wall, 3), "rps": round(total / wall, 1), "endpoints": endpoints}
+
+
+def check_thresholds(results: dict, baseline: Optional[dict], tolerance: float, noise_ms: float,
+                     p95_budget_ms: Optional[float], max_error_rate: float) -> List[str]:
+    failures = []
+    for level, result in results["levels"].items():
+        if result["requests"] and result["errors"] / result["requests"] > max_error_rate:
+            failures.append(f"c={level}: taux d'erreurs {result['errors']}/{result['requests']}")
+        base_level = (baseline or {}).get("levels", {}).get(level)
+        if base_level and result["rps"] < base_level["rps"] * (1 - tolerance):
+            failures.append(f"c={level}: débit {result['rps']} req/s < référence {base_level['rps']} req/s")
+        for label, stats in result["endpoints"].items():
+            if p95_budget_ms is not None and stats["p95_ms"] > p95_budget_ms:
+                failures.append(f"c={level} {label}: p95 {stats['p95_ms']} ms > budget {p95_budget_ms} ms")
+            base = (base_level or {}).get("endpoints", {}).get(label)
+            if base and stats["p95_ms"] > base["p95_ms"] * (1 + tolerance) and stats["p95_ms"] - base["p95_ms"] > noise_ms:
+                failures.append(f"c={level} {label}: p95 {stats['p95_ms']} ms > référence {base['p95_ms']} ms")
+    return failures
+
+
+async def run(args) -> dict:
+    spec = TenantSpec(searches=args.searches, schedules=args.schedules)
+    tables = generate_tenants(companies=args.companies, seed=args.seed, spec=spec)
+    technicians, bureau = _virtual_users(tables)
+
+    with FakeSupabase(tables, latency_ms=args.latency_ms) as fake:
+        os.environ.update({
+            "SUPABASE_URL": fake.url,
+            "SUPABASE_ANON_KEY": "bench-anon",
+            "SUPABASE_SERVICE_KEY": "bench-service",
+        })
+        os.environ.setdefault("LOG_LEVEL", "ERROR")
+        import httpx
+        import server_supabase
+
+        transport = httpx.ASGITransport(app=server_supabase.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            # Échauffement (imports paresseux, connexions)
+            await run_level(client, technicians, bureau, 2, 3, args.seed)
+            levels = {}
+            for concurrency in args.concurrency:
+                levels[str(concurrency)] = await run_level(client, technicians, bureau, concurrency, args.requests, args.seed)
+        return {
+            "seed": args.seed,
+            "dataset": {name: len(rows) for name, rows in tables.items()},
+            "latency_ms": args.latency_ms,
+            "requests_per_user": args.requests,
+            "backend_calls": fake.requests,
+            "levels": levels,
+        }
+
+
+def print_report(results: dict):
+    print(f"Jeu de données (graine {results['seed']}) : "
+          + ", ".join(f"{n} {t}" for t, n in results["dataset"].items() if n))
+    for level, result in results["levels"].items():
+        print(f"\nConcurrence {level} : {result['requests']} requêtes en {result['wall_s']} s "
+              f"- {result['rps']} req/s - {result['errors']} erreur(s)")
+        print(f"  {'endpoint':<38} {'n':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>7}")
+        for label, s in result["endpoints"].items():
+            print(f"  {label:<38} {s['count']:>5} {s['errors']:>4} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['rps']:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 10, 30])
+    parser.add_argument("--requests", type=int, default=20, help="Requêtes par utilisateur virtuel")
+    parser.add_argument("--companies", type=int, default=2)
+    parser.add_argument("--searches", type=int, default=300, help="Recherches par entreprise")
+    parser.add_argument("--schedules", type=int, default=400, help="Plannings par entreprise")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Aller-retour simulé vers Supabase")
+    parser.add_argument("--json", help="Écrit les résultats")
+    parser.add_argument("--baseline", help="Résultats de référence (JSON) à ne pas dégrader")
+    parser.add_argument("--save-baseline", help="Enregistre ces résultats comme référence")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--noise-ms", type=float, default=5.0)
+    parser.add_argument("--p95-budget-ms", type=float)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    failures = check_thresholds(results, baseline, args.tolerance, args.noise_ms, args.p95_budget_ms, args.max_error_rate)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("\n✅ Aucun seuil dépassé")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
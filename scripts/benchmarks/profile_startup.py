@@ -0,0 +1,95 @@
+"""
+Profil du temps d'import du serveur (python -X importtime)
+
+Importe server_supabase dans un sous-processus (variables Supabase factices,
+aucune connexion n'est ouverte à l'import), affiche les modules les plus
+coûteux en temps cumulé et vérifie :
+- le budget de démarrage (médiane sur plusieurs imports, STARTUP_BUDGET_MS)
+- qu'aucune dépendance lourde (ReportLab, OpenAI, SciPy, Pillow, qrcode)
+  n'est chargée au démarrage : elles doivent l'être au premier usage
+
+Code de sortie 1 si le budget est dépassé ou si un module lourd est importé.
+
+Usage: python scripts/benchmarks/profile_startup.py [--runs 3] [--top 15] [--budget-ms 1500] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[2] / "backend"
+
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+# Modules qui ne doivent pas être importés au démarrage
+LAZY_MODULES = ("reportlab", "openai", "scipy", "PIL", "qrcode", "ai_service", "quote_index", "pdf_reports")
+
+
+def profile_import(module: str = "server_supabase"):
+    """Un import dans un processus neuf : {module: (self_us, cumulative_us)} dans l'ordre d'import"""
+    env = {
+        **os.environ,
+        "SUPABASE_URL": os.environ.get("SUPABASE_URL", "http://localhost:54321"),
+        "SUPABASE_ANON_KEY": os.environ.get("SUPABASE_ANON_KEY", "profile"),
+        "SUPABASE_SERVICE_KEY": os.environ.get("SUPABASE_SERVICE_KEY", "profile"),
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"Import de {module} impossible:\n{proc.stderr[-2000:]}")
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--json", help="Écrit le résultat (suivi dans le temps)")
+    args = parser.parse_args()
+
+    runs = [profile_import() for _ in range(args.runs)]
+    totals_ms = [run["server_supabase"][1] / 1000 for run in runs]
+    median_ms = statistics.median(totals_ms)
+    last = runs[-1]
+
+    print(f"Import server_supabase : médiane {median_ms:.0f} ms sur {args.runs} run(s) "
+          f"({', '.join(f'{t:.0f}' for t in totals_ms)} ms) - budget {args.budget_ms:.0f} ms")
+    print(f"\n  {'cumulé (ms)':>12} {'propre (ms)':>12}  module")
+    top_level = {name: t for name, t in last.items() if "." not in name}
+    for name, (self_us, cum_us) in sorted(top_level.items(), key=lambda kv: -kv[1][1])[:args.top]:
+        print(f"  {cum_us / 1000:12.1f} {self_us / 1000:12.1f}  {name}")
+
+    eager = [m for m in LAZY_MODULES if m in last]
+    ok = median_ms <= args.budget_ms and not eager
+    if eager:
+        print(f"\n❌ Modules lourds importés au démarrage : {', '.join(eager)}")
+    print(f"\n{'✅' if median_ms <= args.budget_ms else '❌'} {median_ms:.0f} ms / budget {args.budget_ms:.0f} ms")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "median_ms": round(median_ms, 1),
+            "runs_ms": [round(t, 1) for t in totals_ms],
+            "budget_ms": args.budget_ms,
+            "eager_heavy_modules": eager,
+            "top": {name: round(t[1] / 1000, 1) for name, t in
+                    sorted(top_level.items(), key=lambda kv: -kv[1][1])[:args.top]},
+        }, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Données synthétiques déterministes pour les benchmarks
+
+Entreprises générées avec un jeu de lignes cohérent avec le schéma Supabase
+(users, clients, searches avec métadonnées photos, worksites, chefs
+d'équipe et équipes, schedules, quotes avec lignes) : mêmes identifiants et
+mêmes valeurs pour une même graine.
+
+- generate_tenants(companies, seed, spec) : volumes identiques par entreprise
+  (petits jeux en mémoire : loadtest, faux Supabase)
+- iter_tenants(companies, seed, searches=..., schedules=..., quotes=...) :
+  volumes totaux répartis entre entreprises de tailles inégales
+  (log-normale : quelques grosses entreprises, beaucoup de petites), une
+  entreprise à la fois pour les gros volumes (load_synthetic_tenants.py)
+
+Distributions : statuts pondérés comme en production, photos par recherche
+géométriques (moyenne ~3, beaucoup de recherches sans photo), plannings
+en jours ouvrés sur des créneaux matin / après-midi / journée, devis de 1 à
+12 lignes à prix log-normaux.
+"""
+
+import math
+import random
+import uuid
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+TODAY = date(2026, 10, 19)
+
+CITIES = ["Lyon", "Villeurbanne", "Grenoble", "Annecy", "Valence", "Saint-Étienne", "Bourg-en-Bresse", "Chambéry"]
+STREETS = ["rue de la République", "avenue Jean Jaurès", "boulevard Gambetta", "rue Victor Hugo", "chemin des Vignes"]
+WORKS = ["Toiture", "Façade", "Isolation", "Plomberie", "Électricité", "Menuiseries", "Maçonnerie", "Carrelage"]
+FIRST_NAMES = ["Camille", "Lucas", "Léa", "Hugo", "Chloé", "Louis", "Manon", "Jules", "Inès", "Arthur"]
+LAST_NAMES = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand", "Leroy", "Moreau"]
+
+# Ordre d'insertion compatible avec les clés étrangères
+TABLES = (
+    "companies", "users", "clients", "quotes", "worksites", "searches",
+    "planning_team_leaders", "team_leader_collaborators", "schedules",
+)
+
+SEARCH_STATUSES = (("ACTIVE", 45), ("SHARED", 25), ("PROCESSED", 12), ("ARCHIVED", 10), ("DRAFT", 5), ("SHARED_TO_BUREAU", 3))
+QUOTE_STATUSES = (("DRAFT", 20), ("SENT", 35), ("ACCEPTED", 25), ("REJECTED", 12), ("EXPIRED", 8))
+WORKSITE_STATUSES = (("PLANNED", 30), ("IN_PROGRESS", 35), ("COMPLETED", 30), ("CANCELLED", 5))
+SLOTS = (("08:00", "12:00"), ("13:30", "17:30"), ("08:00", "17:00"), ("07:30", "16:30"))
+
+
+@dataclass
+class TenantSpec:
+    """Volumes par entreprise"""
+    technicians: int = 12
+    bureau: int = 3
+    team_leaders: int = 3
+    clients: int = 40
+    searches: int = 300
+    worksites: int = 30
+    schedules: int = 400
+    quotes: int = 120
+    photos_per_search: int = 3
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _timestamp(rng: random.Random, days_back: int) -> str:
+    moment = datetime(2026, 10, 19, 18, tzinfo=timezone.utc) - timedelta(minutes=rng.randrange(days_back * 24 * 60))
+    return moment.isoformat()
+
+
+def _weighted(rng: random.Random, choices) -> str:
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+
+def _geometric(rng: random.Random, mean: float) -> int:
+    """Loi géométrique sur {0, 1, ...} de moyenne `mean`"""
+    p = 1 / (mean + 1)
+    return int(math.log(1 - rng.random()) / math.log(1 - p))
+
+
+def _workday(rng: random.Random, days_before: int, days_after: int) -> date:
+    day = TODAY + timedelta(days=rng.randint(-days_before, days_after))
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def _person(rng: random.Random) -> Dict[str, str]:
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {"first_name": first, "last_name": last, "prenom": first, "nom": last}
+
+
+def generate_company(rng: random.Random, index: int, spec: TenantSpec) -> Dict[str, List[dict]]:
+    company_id = _uuid(rng)
+    tables: Dict[str, List[dict]] = {name: [] for name in TABLES}
+    tables["companies"].append({"id": company_id, "name": f"Entreprise {index + 1:03d}", "created_at": _timestamp(rng, 900)})
+
+    def user(role: str, n: int) -> dict:
+        row = {
+            "id": _uuid(rng), "company_id": company_id, "role": role, **_person(rng), "actif": True,
+            "email": f"{role.lower()}{n}.c{index + 1}@bench.skyapp.fr", "created_at": _timestamp(rng, 700),
+        }
+        tables["users"].append(row)
+        return row
+
+    admin = user("ADMIN", 0)
+    bureau = [user("BUREAU", n) for n in range(spec.bureau)]
+    technicians = [user("TECHNICIEN", n) for n in range(spec.technicians)]
+
+    for n in range(spec.clients):
+        person = _person(rng)
+        tables["clients"].append({
+            "id": _uuid(rng), "company_id": company_id, "nom": person["nom"], "prenom": person["prenom"],
+            "name": f"{person['prenom']} {person['nom']}", "email": f"client{n}.c{index + 1}@exemple.fr",
+            "phone": (phone := f"06{rng.randrange(10**8):08d}"), "telephone": phone,
+            "adresse": f"{rng.randint(1, 180)} {rng.choice(STREETS)}, {rng.choice(CITIES)}",
+            "created_at": _timestamp(rng, 700),
+        })
+    clients = tables["clients"]
+
+    for n in range(spec.quotes):
+        items = [
+            {"description": f"{rng.choice(WORKS)} - poste {k + 1}", "quantity": rng.randint(1, 40),
+             "unit_price": round(rng.lognormvariate(4.5, 1.0), 2), "unit": rng.choice(["u", "m²", "ml", "h", "forfait"])}
+            for k in range(rng.randint(1, 12))
+        ]
+        amount = round(sum(i["quantity"] * i["unit_price"] for i in items), 2)
+        created = _timestamp(rng, 365)
+        tables["quotes"].append({
+            "id": _uuid(rng), "company_id": company_id, "client_id": rng.choice(clients)["id"],
+            "user_id": rng.choice(bureau + [admin])["id"], "quote_number": f"{created[:4]}{created[5:7]}-{index + 1:03d}{n + 1:05d}",
+            "title": f"Devis {rng.choice(WORKS).lower()}", "description": "", "amount": amount,
+            "total_ht": amount, "status": _weighted(rng, QUOTE_STATUSES), "items": items, "created_at": created,
+        })
+
+    accepted = [q for q in tables["quotes"] if q["status"] == "ACCEPTED"]
+    for n in range(spec.worksites):
+        start = TODAY + timedelta(days=rng.randint(-120, 90))
+        client = rng.choice(clients)
+        quote = rng.choice(accepted) if accepted and rng.random() < 0.6 else None
+        tables["worksites"].append({
+            "id": _uuid(rng), "company_id": company_id, "user_id": admin["id"], "client_id": client["id"],
+            "client_name": client["name"], "quote_id": quote["id"] if quote else None,
+            "source": "QUOTE" if quote else "MANUAL", "amount": quote["amount"] if quote else 0,
+            "title": f"{rng.choice(WORKS)} - {client['nom']}", "address": client["adresse"], "description": "",
+            "status": _weighted(rng, WORKSITE_STATUSES),
+            "start_date": start.isoformat(), "end_date": (start + timedelta(days=rng.randint(2, 45))).isoformat(),
+            "created_at": _timestamp(rng, 200),
+        })
+
+    for _ in range(spec.searches):
+        author = rng.choice(technicians + bureau)
+        created = _timestamp(rng, 365)
+        search_id = _uuid(rng)
+        tables["searches"].append({
+            "id": search_id, "company_id": company_id, "user_id": author["id"],
+            "location": f"{rng.randint(1, 180)} {rng.choice(STREETS)}, {rng.choice(CITIES)}",
+            "description": f"Recherche {rng.choice(WORKS).lower()} - relevé des réseaux et contraintes d'accès",
+            "observations": rng.choice([None, "Accès par la cour", "Présence d'amiante à confirmer", "RAS"]),
+            "latitude": round(45.75 + rng.uniform(-0.3, 0.3), 6), "longitude": round(4.85 + rng.uniform(-0.3, 0.3), 6),
+            "status": _weighted(rng, SEARCH_STATUSES), "timestamp": created, "created_at": created, "updated_at": created,
+            "photos": [
+                {"filename": f"{search_id}_{p}.jpg", "number": p + 1, "section": rng.choice(["general", "reseaux", "acces"]),
+                 "size": int(rng.lognormvariate(13.5, 0.6)), "content_type": "image/jpeg", "uploaded_at": created}
+                for p in range(_geometric(rng, spec.photos_per_search))
+            ],
+        })
+
+    leaders = []
+    for n in range(spec.team_leaders):
+        lead_user = technicians[n % len(technicians)]
+        leader = {"id": _uuid(rng), "company_id": company_id, "user_id": lead_user["id"],
+                  "name": f"{lead_user['first_name']} {lead_user['last_name']}",
+                  "first_name": lead_user["first_name"], "last_name": lead_user["last_name"], "email": lead_user["email"]}
+        leaders.append(leader)
+        tables["planning_team_leaders"].append(leader)
+    for i, tech in enumerate(technicians[spec.team_leaders:]):
+        tables["team_leader_collaborators"].append({
+            "id": _uuid(rng), "team_leader_id": leaders[i % len(leaders)]["id"], "collaborator_id": tech["id"],
+            "is_active": True, "assigned_at": _timestamp(rng, 200),
+        })
+
+    for _ in range(spec.schedules):
+        worksite = rng.choice(tables["worksites"])
+        tech = rng.choice(technicians)
+        day = _workday(rng, 90, 60)
+        start_time, end_time = rng.choice(SLOTS)
+        tables["schedules"].append({
+            "id": _uuid(rng), "company_id": company_id, "worksite_id": worksite["id"],
+            "collaborator_id": tech["id"], "team_leader_id": rng.choice(leaders)["id"],
+            "collaborator_first_name": tech["first_name"], "collaborator_last_name": tech["last_name"],
+            "title": worksite["title"], "location": worksite["address"],
+            "date": day.isoformat(), "start_date": day.isoformat(), "end_date": day.isoformat(),
+            "time": start_time, "end_time": end_time,
+            "start_datetime": f"{day.isoformat()}T{start_time}:00+00:00", "end_datetime": f"{day.isoformat()}T{end_time}:00+00:00",
+            "status": "completed" if day < TODAY else "scheduled", "shift": "day",
+            "hours": int(end_time[:2]) - int(start_time[:2]), "created_at": _timestamp(rng, 120),
+        })
+    return tables
+
+
+def scaled_specs(rng: random.Random, companies: int, searches: int, schedules: int, quotes: int) -> List[TenantSpec]:
+    """Répartit des volumes totaux entre entreprises de tailles log-normales (sigma 0.8)"""
+    weights = [rng.lognormvariate(0, 0.8) for _ in range(companies)]
+    total = sum(weights)
+    specs = []
+    for weight in weights:
+        share = weight / total
+        n_searches = max(1, round(searches * share))
+        n_schedules = max(1, round(schedules * share))
+        n_quotes = max(1, round(quotes * share))
+        technicians = max(3, round(n_schedules / 150))
+        specs.append(TenantSpec(
+            technicians=technicians,
+            bureau=max(1, technicians // 6),
+            team_leaders=max(1, technicians // 5),
+            clients=max(5, round(n_quotes * 0.4)),
+            searches=n_searches,
+            worksites=max(1, round(n_quotes * 0.25)),
+            schedules=n_schedules,
+            quotes=n_quotes,
+        ))
+    return specs
+
+
+def iter_tenants(companies: int = 2, seed: int = 42, spec: Optional[TenantSpec] = None,
+                 searches: Optional[int] = None, schedules: Optional[int] = None,
+                 quotes: Optional[int] = None) -> Iterator[Dict[str, List[dict]]]:
+    """Une entreprise à la fois ; volumes totaux répartis si searches/schedules/quotes sont fournis"""
+    rng = random.Random(seed)
+    base = spec or TenantSpec()
+    if searches is None and schedules is None and quotes is None:
+        specs = [base] * companies
+    else:
+        specs = scaled_specs(
+            random.Random(seed ^ 0x5EED), companies,
+            searches if searches is not None else base.searches * companies,
+            schedules if schedules is not None else base.schedules * companies,
+            quotes if quotes is not None else base.quotes * companies,
+        )
+        specs = [replace(s, photos_per_search=base.photos_per_search) for s in specs]
+    for index, company_spec in enumerate(specs):
+        yield generate_company(rng, index, company_spec)
+
+
+def generate_tenants(companies: int = 2, seed: int = 42, spec: Optional[TenantSpec] = None, **totals) -> Dict[str, List[dict]]:
+    """Toutes les entreprises fusionnées par table (déterministe pour une graine donnée)"""
+    merged: Dict[str, List[dict]] = {}
+    for tables in iter_tenants(companies, seed, spec, **totals):
+        for table, rows in tables.items():
+            merged.setdefault(table, []).extend(rows)
+    return merged
@@ -0,0 +1,49 @@
+-- =====================================================
+-- MIGRATION: Inbox durable des webhooks IOPOLE
+-- Événements bruts persistés à la réception, traités en tâche de fond
+-- Date: 2026-10-19
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.iopole_webhook_events (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    
+    -- Idempotence : identifiant IOPOLE ou SHA256 du corps brut
+    dedup_key TEXT NOT NULL,
+    
+    -- Événement
+    event_type VARCHAR(100),
+    pdp_reference TEXT,
+    payload JSONB NOT NULL,
+    
+    -- Traitement
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    claimed_by TEXT,
+    claimed_at TIMESTAMP WITH TIME ZONE,
+    
+    -- Audit
+    received_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    processed_at TIMESTAMP WITH TIME ZONE,
+    
+    CONSTRAINT iopole_webhook_events_dedup_key_key UNIQUE (dedup_key),
+    CONSTRAINT valid_inbox_status CHECK (status IN ('pending', 'processing', 'processed', 'failed'))
+);
+
+-- Index pour le consommateur (file d'attente) et les métriques
+CREATE INDEX IF NOT EXISTS idx_iopole_webhook_events_queue
+    ON public.iopole_webhook_events(status, received_at);
+CREATE INDEX IF NOT EXISTS idx_iopole_webhook_events_pdp_reference
+    ON public.iopole_webhook_events(pdp_reference);
+
+-- Index pour les mises à jour groupées de statut PDP (colonne écrite par l'API)
+ALTER TABLE public.invoices_electronic ADD COLUMN IF NOT EXISTS pdp_reference TEXT;
+CREATE INDEX IF NOT EXISTS idx_invoices_electronic_pdp_reference
+    ON public.invoices_electronic(pdp_reference);
+
+-- Table technique : accès uniquement via la clé service
+ALTER TABLE public.iopole_webhook_events ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.iopole_webhook_events IS 'Inbox durable des webhooks IOPOLE (événements bruts, dédupliqués)';
+COMMENT ON COLUMN public.iopole_webhook_events.dedup_key IS 'Clé d''idempotence (id événement IOPOLE ou sha256 du corps)';
+COMMENT ON COLUMN public.iopole_webhook_events.status IS 'pending, processing, processed, failed';
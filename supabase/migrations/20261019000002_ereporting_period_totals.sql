@@ -0,0 +1,91 @@
+-- =====================================================
+-- MIGRATION: Agrégation e-reporting côté serveur
+-- Totaux d'une période par sens, catégorie de transaction et taux de TVA
+-- Date: 2026-10-19
+-- =====================================================
+
+-- Catégorie de transaction des factures émises (détermine la déclaration)
+ALTER TABLE public.invoices_electronic
+    ADD COLUMN IF NOT EXISTS transaction_category TEXT NOT NULL DEFAULT 'b2b-fr';
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'valid_transaction_category'
+    ) THEN
+        ALTER TABLE public.invoices_electronic
+            ADD CONSTRAINT valid_transaction_category
+            CHECK (transaction_category IN ('b2b-fr', 'b2c', 'export', 'intra-ue'));
+    END IF;
+END $$;
+
+-- Index pour le filtrage par entreprise + période
+CREATE INDEX IF NOT EXISTS idx_invoices_electronic_company_date
+    ON public.invoices_electronic(company_id, invoice_date);
+CREATE INDEX IF NOT EXISTS idx_invoices_received_company_date
+    ON public.invoices_received(company_id, invoice_date);
+
+-- Une seule requête groupée : lignes des factures émises + factures reçues
+CREATE OR REPLACE FUNCTION public.ereporting_period_totals(
+    p_company_id UUID,
+    p_period_start DATE,
+    p_period_end DATE
+)
+RETURNS TABLE (
+    direction TEXT,
+    transaction_category TEXT,
+    tva_rate NUMERIC,
+    operations_count BIGINT,
+    lines_count BIGINT,
+    total_ht NUMERIC,
+    total_tva NUMERIC,
+    total_ttc NUMERIC
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        'emitted'::TEXT,
+        ie.transaction_category,
+        il.tva_rate,
+        COUNT(DISTINCT ie.id),
+        COUNT(*),
+        SUM(il.total_ht),
+        SUM(il.tva_amount),
+        SUM(il.total_ttc)
+    FROM public.invoices_electronic ie
+    JOIN public.invoice_lines il ON il.invoice_id = ie.id
+    WHERE ie.company_id = p_company_id
+      AND ie.direction = 'outgoing'
+      AND ie.status_pdp <> 'draft'
+      AND ie.invoice_date BETWEEN p_period_start AND p_period_end
+    GROUP BY ie.transaction_category, il.tva_rate
+
+    UNION ALL
+
+    SELECT
+        'received'::TEXT,
+        'purchase'::TEXT,
+        rates.tva_rate,
+        COUNT(*),
+        COUNT(*),
+        SUM(ir.total_ht),
+        SUM(ir.total_tva),
+        SUM(ir.total_ttc)
+    FROM public.invoices_received ir
+    LEFT JOIN LATERAL (
+        -- Taux effectif ramené au taux légal le plus proche (factures sans lignes)
+        SELECT r AS tva_rate
+        FROM unnest(ARRAY[0, 5.5, 10, 20]::NUMERIC[]) AS r
+        WHERE ir.total_ht <> 0
+          AND abs(ir.total_tva * 100 / ir.total_ht - r) < 0.05
+        LIMIT 1
+    ) rates ON TRUE
+    WHERE ir.company_id = p_company_id
+      AND ir.status <> 'rejected'
+      AND ir.invoice_date BETWEEN p_period_start AND p_period_end
+    GROUP BY rates.tva_rate;
+$$;
+
+COMMENT ON FUNCTION public.ereporting_period_totals IS 'Totaux e-reporting d''une période (émises par catégorie/taux, reçues par taux)';
+COMMENT ON COLUMN public.invoices_electronic.transaction_category IS 'b2b-fr (e-invoicing), b2c, export, intra-ue (e-reporting)';
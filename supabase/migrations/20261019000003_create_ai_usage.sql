@@ -0,0 +1,74 @@
+-- =====================================================
+-- MIGRATION: Consommation IA par entreprise
+-- Compteurs journaliers (entreprise x endpoint x modèle) alimentés par lots,
+-- limites optionnelles par entreprise (budget tokens / jour, requêtes / minute)
+-- Date: 2026-10-19
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.ai_usage_daily (
+    company_id UUID NOT NULL REFERENCES public.companies(id) ON DELETE CASCADE,
+    usage_date DATE NOT NULL,
+    endpoint VARCHAR(50) NOT NULL,
+    model VARCHAR(50) NOT NULL,
+    
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    total_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_estimate NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    
+    PRIMARY KEY (company_id, usage_date, endpoint, model)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ai_usage_daily_date
+    ON public.ai_usage_daily(usage_date);
+
+CREATE TABLE IF NOT EXISTS public.ai_company_limits (
+    company_id UUID PRIMARY KEY REFERENCES public.companies(id) ON DELETE CASCADE,
+    daily_token_budget BIGINT,      -- NULL => valeur par défaut (AI_DAILY_TOKEN_BUDGET)
+    requests_per_minute INTEGER,    -- NULL => valeur par défaut (AI_REQUESTS_PER_MINUTE)
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Écriture groupée : un appel par lot, compteurs incrémentés côté serveur
+CREATE OR REPLACE FUNCTION public.record_ai_usage(p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH rows AS (
+        INSERT INTO public.ai_usage_daily AS u (
+            company_id, usage_date, endpoint, model,
+            requests, prompt_tokens, completion_tokens, total_tokens, cost_estimate
+        )
+        SELECT
+            (r->>'company_id')::UUID,
+            (r->>'usage_date')::DATE,
+            r->>'endpoint',
+            r->>'model',
+            (r->>'requests')::INTEGER,
+            (r->>'prompt_tokens')::BIGINT,
+            (r->>'completion_tokens')::BIGINT,
+            (r->>'total_tokens')::BIGINT,
+            (r->>'cost_estimate')::NUMERIC
+        FROM jsonb_array_elements(p_rows) AS r
+        ON CONFLICT (company_id, usage_date, endpoint, model) DO UPDATE SET
+            requests = u.requests + EXCLUDED.requests,
+            prompt_tokens = u.prompt_tokens + EXCLUDED.prompt_tokens,
+            completion_tokens = u.completion_tokens + EXCLUDED.completion_tokens,
+            total_tokens = u.total_tokens + EXCLUDED.total_tokens,
+            cost_estimate = u.cost_estimate + EXCLUDED.cost_estimate,
+            updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM rows;
+$$;
+
+-- Tables techniques : accès uniquement via la clé service
+ALTER TABLE public.ai_usage_daily ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.ai_company_limits ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.ai_usage_daily IS 'Consommation IA journalière par entreprise, endpoint et modèle';
+COMMENT ON TABLE public.ai_company_limits IS 'Limites IA spécifiques à une entreprise (budget tokens, débit)';
+COMMENT ON FUNCTION public.record_ai_usage(JSONB) IS 'Incrémente ai_usage_daily à partir d''un lot de compteurs';
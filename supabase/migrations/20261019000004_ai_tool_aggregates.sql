@@ -0,0 +1,91 @@
+-- =====================================================
+-- MIGRATION: Agrégats côté serveur pour les outils IA
+-- get_statistics / predict_delays : compteurs, sommes et projets top-N
+-- renvoyés en un seul objet JSON au lieu des lignes complètes
+-- Date: 2026-10-19
+-- =====================================================
+
+-- Index pour le filtrage par entreprise + période / statut
+CREATE INDEX IF NOT EXISTS idx_quotes_company_created
+    ON public.quotes(company_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_searches_company_created
+    ON public.searches(company_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_projects_company_status
+    ON public.projects(company_id, status);
+
+-- Statistiques de l'entreprise depuis une date
+CREATE OR REPLACE FUNCTION public.ai_company_statistics(
+    p_company_id UUID,
+    p_date_from TIMESTAMPTZ
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'quotes', (
+            SELECT jsonb_build_object(
+                'total', COUNT(*),
+                'amount', COALESCE(SUM(q.amount), 0),
+                'accepted', COUNT(*) FILTER (WHERE q.status = 'ACCEPTED'),
+                'accepted_amount', COALESCE(SUM(q.amount) FILTER (WHERE q.status = 'ACCEPTED'), 0),
+                'pending', COUNT(*) FILTER (WHERE q.status = 'SENT')
+            )
+            FROM public.quotes q
+            WHERE q.company_id = p_company_id AND q.created_at >= p_date_from
+        ),
+        'clients', jsonb_build_object(
+            'total', (SELECT COUNT(*) FROM public.clients c WHERE c.company_id = p_company_id)
+        ),
+        'searches', (
+            SELECT jsonb_build_object(
+                'total', COUNT(*),
+                'processed', COUNT(*) FILTER (WHERE s.status = 'PROCESSED')
+            )
+            FROM public.searches s
+            WHERE s.company_id = p_company_id AND s.created_at >= p_date_from
+        )
+    );
+$$;
+
+-- Échéances des projets en cours : compteurs + projets les plus urgents
+CREATE OR REPLACE FUNCTION public.ai_projects_at_risk(
+    p_company_id UUID,
+    p_statuses TEXT[],
+    p_today DATE DEFAULT CURRENT_DATE,
+    p_due_soon_days INTEGER DEFAULT 14,
+    p_top INTEGER DEFAULT 10
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    WITH active AS (
+        SELECT id, name, status::TEXT AS status, priority::TEXT AS priority,
+               end_date::DATE AS end_date,
+               (end_date::DATE - p_today) AS days_left
+        FROM public.projects
+        WHERE company_id = p_company_id
+          AND status::TEXT = ANY(p_statuses)
+    )
+    SELECT jsonb_build_object(
+        'active', (SELECT COUNT(*) FROM active),
+        'overdue', (SELECT COUNT(*) FROM active WHERE days_left < 0),
+        'due_soon', (SELECT COUNT(*) FROM active WHERE days_left BETWEEN 0 AND p_due_soon_days),
+        'no_end_date', (SELECT COUNT(*) FROM active WHERE end_date IS NULL),
+        'projects', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', t.id, 'name', t.name, 'status', t.status, 'priority', t.priority,
+                'end_date', t.end_date, 'days_left', t.days_left
+            ) ORDER BY t.end_date NULLS LAST, t.id)
+            FROM (
+                SELECT * FROM active
+                ORDER BY end_date NULLS LAST, id
+                LIMIT p_top
+            ) t
+        ), '[]'::jsonb)
+    );
+$$;
+
+COMMENT ON FUNCTION public.ai_company_statistics IS 'Statistiques compactes (devis, clients, recherches) pour l''outil IA get_statistics';
+COMMENT ON FUNCTION public.ai_projects_at_risk IS 'Échéances des projets en cours (compteurs + top-N) pour l''outil IA predict_delays';
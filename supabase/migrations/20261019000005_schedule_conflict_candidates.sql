@@ -0,0 +1,48 @@
+-- =====================================================
+-- MIGRATION: Détection des conflits de planning par plage de jours
+-- Index GiST sur la plage de jours occupée par chaque planning (date unique
+-- ou période) et fonction de lecture des candidats en une requête
+-- Date: 2026-10-19
+-- =====================================================
+
+-- Égalité sur company_id / collaborator_id dans un index GiST
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Anciennes lignes à date unique : start_date / end_date renseignées comme à la création
+UPDATE public.schedules
+SET start_date = COALESCE(start_date, date),
+    end_date = COALESCE(end_date, start_date, date)
+WHERE date IS NOT NULL
+  AND (start_date IS NULL OR end_date IS NULL);
+
+CREATE INDEX IF NOT EXISTS idx_schedules_collaborator_days
+    ON public.schedules
+    USING gist (company_id, collaborator_id, daterange(start_date, COALESCE(end_date, start_date), '[]'));
+
+-- Plannings des techniciens dont la plage de jours touche [p_from, p_to].
+-- Le chevauchement horaire (plages de nuit comprises) est vérifié côté API
+-- (schedule_conflicts.py) : une contrainte d'exclusion ne peut pas exprimer
+-- « chaque jour de la période, de time à end_time ».
+CREATE OR REPLACE FUNCTION public.schedule_conflict_candidates(
+    p_company_id UUID,
+    p_collaborator_ids UUID[],
+    p_from DATE,
+    p_to DATE
+)
+RETURNS SETOF public.schedules
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT s.*
+    FROM public.schedules s
+    WHERE s.company_id = p_company_id
+      AND s.collaborator_id = ANY(p_collaborator_ids)
+      AND daterange(s.start_date, COALESCE(s.end_date, s.start_date), '[]') && daterange(p_from, p_to, '[]')
+    UNION ALL
+    SELECT s.*
+    FROM public.schedules s
+    WHERE s.company_id = p_company_id
+      AND s.collaborator_id = ANY(p_collaborator_ids)
+      AND s.start_date IS NULL
+      AND s.date BETWEEN p_from AND p_to
+$$;
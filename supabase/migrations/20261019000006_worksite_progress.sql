@@ -0,0 +1,59 @@
+-- =====================================================
+-- MIGRATION: Avancement des chantiers en une requête groupée
+-- Jours distincts déjà planifiés (avant aujourd'hui) par chantier, rapportés
+-- à la durée du chantier, pour tous les chantiers d'une entreprise
+-- Date: 2026-10-19
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_schedules_company_worksite
+    ON public.schedules (company_id, worksite_id)
+    WHERE worksite_id IS NOT NULL;
+
+-- Une période [start_date, end_date] compte pour chacun de ses jours passés ;
+-- les plannings annulés ne comptent pas. Même calcul que le repli Python
+-- (backend/worksite_progress.py).
+CREATE OR REPLACE FUNCTION public.worksite_progress(
+    p_company_id UUID,
+    p_worksite_ids UUID[] DEFAULT NULL,
+    p_today DATE DEFAULT CURRENT_DATE
+)
+RETURNS TABLE (
+    worksite_id UUID,
+    total_days INTEGER,
+    completed_days INTEGER,
+    progress INTEGER
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH w AS (
+        SELECT ws.id, ws.start_date::date AS first_day, ws.end_date::date AS last_day
+        FROM public.worksites ws
+        WHERE ws.company_id = p_company_id
+          AND (p_worksite_ids IS NULL OR ws.id = ANY(p_worksite_ids))
+    ),
+    done AS (
+        SELECT s.worksite_id, count(DISTINCT d.day)::int AS completed_days
+        FROM public.schedules s
+        CROSS JOIN LATERAL generate_series(
+            COALESCE(s.start_date, s.date),
+            LEAST(COALESCE(s.end_date, s.start_date, s.date), p_today - 1),
+            interval '1 day'
+        ) AS d(day)
+        WHERE s.company_id = p_company_id
+          AND s.worksite_id IN (SELECT id FROM w)
+          AND COALESCE(s.start_date, s.date) < p_today
+          AND lower(COALESCE(s.status, '')) NOT IN ('cancelled', 'canceled')
+        GROUP BY s.worksite_id
+    )
+    SELECT
+        w.id,
+        GREATEST(w.last_day - w.first_day + 1, 0),
+        COALESCE(done.completed_days, 0),
+        CASE
+            WHEN w.first_day IS NULL OR w.last_day IS NULL OR w.last_day < w.first_day THEN 0
+            ELSE LEAST(100, floor(100.0 * COALESCE(done.completed_days, 0) / (w.last_day - w.first_day + 1)))::int
+        END
+    FROM w
+    LEFT JOIN done ON done.worksite_id = w.id
+$$;
@@ -0,0 +1,95 @@
+-- =====================================================
+-- MIGRATION: Synchronisation différentielle (clients hors ligne)
+-- updated_at maintenu sur les tables synchronisées, index (updated_at, id)
+-- pour la pagination par curseur, et pierres tombales des suppressions
+-- Date: 2026-10-19
+-- =====================================================
+
+-- schedules n'avait pas de trigger updated_at (mis à jour à la main par l'API)
+ALTER TABLE public.schedules ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE OR REPLACE TRIGGER update_schedules_updated_at
+    BEFORE UPDATE ON public.schedules
+    FOR EACH ROW EXECUTE FUNCTION public.update_updated_at_column();
+
+-- Lignes anciennes sans updated_at : jamais vues par un curseur sinon
+UPDATE public.searches SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+UPDATE public.schedules SET updated_at = NOW() WHERE updated_at IS NULL;
+UPDATE public.materials SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+UPDATE public.clients SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_searches_sync ON public.searches (company_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_searches_user_sync ON public.searches (company_id, user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_schedules_sync ON public.schedules (company_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_schedules_collaborator_sync ON public.schedules (company_id, collaborator_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_materials_sync ON public.materials (company_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_clients_sync ON public.clients (company_id, updated_at, id);
+
+-- Une ligne par suppression : tous les chemins de suppression (API, cascades,
+-- console) sont couverts par le trigger ci-dessous
+CREATE TABLE IF NOT EXISTS public.sync_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    company_id UUID NOT NULL,
+    resource VARCHAR(30) NOT NULL,
+    record_id UUID NOT NULL,
+    owner_id UUID,                  -- searches.user_id / schedules.collaborator_id
+    reassigned BOOLEAN NOT NULL DEFAULT FALSE,  -- ligne toujours présente, passée à un autre propriétaire
+    deleted_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_cursor
+    ON public.sync_tombstones (company_id, resource, deleted_at, id);
+
+-- TG_ARGV[0] : ressource exposée par /api/sync ; TG_ARGV[1] : colonne propriétaire (optionnelle).
+-- Sur UPDATE (changement de propriétaire) : disparition pour l'ancien propriétaire seulement.
+CREATE OR REPLACE FUNCTION public.record_sync_tombstone()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    old_owner UUID;
+BEGIN
+    IF TG_NARGS > 1 THEN
+        old_owner := (to_jsonb(OLD) ->> TG_ARGV[1])::UUID;
+    END IF;
+    IF TG_OP = 'DELETE' AND OLD.company_id IS NOT NULL THEN
+        INSERT INTO public.sync_tombstones (company_id, resource, record_id, owner_id)
+        VALUES (OLD.company_id, TG_ARGV[0], OLD.id, old_owner);
+    ELSIF TG_OP = 'UPDATE' AND old_owner IS NOT NULL
+          AND old_owner IS DISTINCT FROM (to_jsonb(NEW) ->> TG_ARGV[1])::UUID THEN
+        INSERT INTO public.sync_tombstones (company_id, resource, record_id, owner_id, reassigned)
+        VALUES (OLD.company_id, TG_ARGV[0], OLD.id, old_owner, TRUE);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER sync_tombstone_searches
+    AFTER DELETE OR UPDATE OF user_id ON public.searches
+    FOR EACH ROW EXECUTE FUNCTION public.record_sync_tombstone('searches', 'user_id');
+CREATE OR REPLACE TRIGGER sync_tombstone_schedules
+    AFTER DELETE OR UPDATE OF collaborator_id ON public.schedules
+    FOR EACH ROW EXECUTE FUNCTION public.record_sync_tombstone('missions', 'collaborator_id');
+CREATE OR REPLACE TRIGGER sync_tombstone_materials
+    AFTER DELETE ON public.materials
+    FOR EACH ROW EXECUTE FUNCTION public.record_sync_tombstone('materials');
+CREATE OR REPLACE TRIGGER sync_tombstone_clients
+    AFTER DELETE ON public.clients
+    FOR EACH ROW EXECUTE FUNCTION public.record_sync_tombstone('clients');
+
+-- Rétention : un curseur plus ancien est réinitialisé par l'API (SYNC_TOMBSTONE_RETENTION_DAYS)
+CREATE OR REPLACE FUNCTION public.purge_sync_tombstones(p_keep INTERVAL DEFAULT INTERVAL '90 days')
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH purged AS (
+        DELETE FROM public.sync_tombstones WHERE deleted_at < NOW() - p_keep RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM purged;
+$$;
+
+-- Table technique : accès uniquement via la clé service
+ALTER TABLE public.sync_tombstones ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.sync_tombstones IS 'Suppressions à transmettre aux clients synchronisés (/api/sync)';
+COMMENT ON FUNCTION public.purge_sync_tombstones(INTERVAL) IS 'Supprime les pierres tombales plus anciennes que p_keep';
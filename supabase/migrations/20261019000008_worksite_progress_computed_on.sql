@@ -0,0 +1,10 @@
+-- =====================================================
+-- MIGRATION: Jour de calcul de l'avancement des chantiers
+-- worksites.progress est recalculé une fois par jour ou quand ses plannings
+-- changent ; la valeur persistée est partagée par tous les workers
+-- Date: 2026-10-19
+-- =====================================================
+
+ALTER TABLE public.worksites ADD COLUMN IF NOT EXISTS progress_computed_on DATE;
+
+COMMENT ON COLUMN public.worksites.progress_computed_on IS 'Jour du dernier calcul de progress (backend/worksite_progress.py)';
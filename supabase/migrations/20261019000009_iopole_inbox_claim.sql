@@ -0,0 +1,38 @@
+-- =====================================================
+-- MIGRATION: Réservation exclusive des événements de l'inbox IOPOLE
+-- et facture reçue unique par identifiant IOPOLE
+-- Date: 2026-10-19
+-- =====================================================
+
+-- Plusieurs workers consomment l'inbox : chaque événement n'est réservé que
+-- par un seul (les lignes verrouillées par un autre worker sont sautées).
+-- Même prédicat que le repli PostgREST de webhook_inbox.py.
+CREATE OR REPLACE FUNCTION public.claim_iopole_webhook_events(
+    p_worker TEXT,
+    p_limit INTEGER,
+    p_stale_before TIMESTAMP WITH TIME ZONE
+)
+RETURNS SETOF public.iopole_webhook_events
+LANGUAGE sql
+AS $$
+    UPDATE public.iopole_webhook_events e
+    SET status = 'processing', claimed_by = p_worker, claimed_at = NOW()
+    WHERE e.id IN (
+        SELECT id FROM public.iopole_webhook_events
+        WHERE status = 'pending' OR (status = 'processing' AND claimed_at < p_stale_before)
+        ORDER BY received_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING e.*;
+$$;
+
+-- Un événement retraité (relivraison, réservation reprise après un crash)
+-- ne crée pas de seconde facture fournisseur
+ALTER TABLE public.invoices_received ADD COLUMN IF NOT EXISTS pdp_invoice_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_received_pdp_invoice_id
+    ON public.invoices_received(pdp_invoice_id);
+
+COMMENT ON FUNCTION public.claim_iopole_webhook_events(TEXT, INTEGER, TIMESTAMP WITH TIME ZONE)
+    IS 'Réserve un lot d''événements IOPOLE pour un worker (FOR UPDATE SKIP LOCKED)';
+COMMENT ON COLUMN public.invoices_received.pdp_invoice_id IS 'Identifiant de la facture chez IOPOLE (réception via webhook)';
@@ -0,0 +1,66 @@
+-- =====================================================
+-- MIGRATION: Outbox email persistée
+-- Emails en file écrits en base : ils survivent à un redémarrage et les
+-- emails abandonnés restent consultables et rejouables
+-- Date: 2026-10-19
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.email_outbox (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    
+    -- Message
+    to_email TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    html_body TEXT NOT NULL,
+    text_body TEXT,
+    
+    -- Envoi
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    claimed_by TEXT,
+    claimed_at TIMESTAMP WITH TIME ZONE,
+    
+    -- Audit
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMP WITH TIME ZONE,
+    
+    CONSTRAINT valid_email_outbox_status CHECK (status IN ('pending', 'sending', 'sent', 'failed'))
+);
+
+-- Index pour l'expéditeur (file d'attente) et les métriques
+CREATE INDEX IF NOT EXISTS idx_email_outbox_queue
+    ON public.email_outbox(status, next_attempt_at);
+
+-- Plusieurs workers vident la file : chaque email n'est réservé que par un
+-- seul. Même prédicat que le repli PostgREST d'email_service.py.
+CREATE OR REPLACE FUNCTION public.claim_email_outbox(
+    p_worker TEXT,
+    p_limit INTEGER,
+    p_now TIMESTAMP WITH TIME ZONE,
+    p_stale_before TIMESTAMP WITH TIME ZONE
+)
+RETURNS SETOF public.email_outbox
+LANGUAGE sql
+AS $$
+    UPDATE public.email_outbox o
+    SET status = 'sending', claimed_by = p_worker, claimed_at = NOW()
+    WHERE o.id IN (
+        SELECT id FROM public.email_outbox
+        WHERE (status = 'pending' AND next_attempt_at <= p_now)
+           OR (status = 'sending' AND claimed_at < p_stale_before)
+        ORDER BY created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING o.*;
+$$;
+
+-- Table technique : accès uniquement via la clé service
+ALTER TABLE public.email_outbox ENABLE ROW LEVEL SECURITY;
+
+COMMENT ON TABLE public.email_outbox IS 'Outbox des emails applicatifs (envoi en tâche de fond)';
+COMMENT ON COLUMN public.email_outbox.status IS 'pending, sending, sent, failed';
+COMMENT ON FUNCTION public.claim_email_outbox(TEXT, INTEGER, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE)
+    IS 'Réserve un lot d''emails pour un worker (FOR UPDATE SKIP LOCKED)';
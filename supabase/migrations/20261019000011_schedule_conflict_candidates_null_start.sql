@@ -0,0 +1,33 @@
+-- =====================================================
+-- MIGRATION: Candidats de conflit de planning sans start_date
+-- daterange(NULL, NULL) est une plage infinie : un planning sans
+-- start_date était renvoyé par la première branche pour toute période
+-- (et une seconde fois par la branche dédiée). Seule la seconde branche,
+-- sur la colonne date, couvre désormais ces lignes.
+-- Date: 2026-10-19
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION public.schedule_conflict_candidates(
+    p_company_id UUID,
+    p_collaborator_ids UUID[],
+    p_from DATE,
+    p_to DATE
+)
+RETURNS SETOF public.schedules
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT s.*
+    FROM public.schedules s
+    WHERE s.company_id = p_company_id
+      AND s.collaborator_id = ANY(p_collaborator_ids)
+      AND s.start_date IS NOT NULL
+      AND daterange(s.start_date, COALESCE(s.end_date, s.start_date), '[]') && daterange(p_from, p_to, '[]')
+    UNION ALL
+    SELECT s.*
+    FROM public.schedules s
+    WHERE s.company_id = p_company_id
+      AND s.collaborator_id = ANY(p_collaborator_ids)
+      AND s.start_date IS NULL
+      AND s.date BETWEEN p_from AND p_to
+$$;
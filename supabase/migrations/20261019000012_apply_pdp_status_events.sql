@@ -0,0 +1,32 @@
+-- =====================================================
+-- MIGRATION: Statuts PDP appliqués dans l'ordre des événements
+-- Un lot d'événements traité après un autre plus récent (worker en retard,
+-- événement en échec puis rejoué) ne remplace plus le statut déjà
+-- enregistré : pdp_status_updated_at garde l'horodatage de l'événement
+-- appliqué (émetteur, sinon réception)
+-- Date: 2026-10-19
+-- =====================================================
+
+-- p_events : [{"pdp_reference": ..., "status": ..., "event_at": ...}], une entrée par facture.
+-- Même garde que le repli PostgREST de webhook_inbox.py.
+CREATE OR REPLACE FUNCTION public.apply_pdp_status_events(p_events JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH applied AS (
+        UPDATE public.invoices_electronic i
+        SET status_pdp = e.status, pdp_status_updated_at = e.event_at, updated_at = NOW()
+        FROM jsonb_to_recordset(p_events) AS e(pdp_reference TEXT, status TEXT, event_at TIMESTAMP WITH TIME ZONE)
+        WHERE i.pdp_reference = e.pdp_reference
+          AND (i.pdp_status_updated_at IS NULL OR i.pdp_status_updated_at <= e.event_at)
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM applied;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_invoices_electronic_pdp_reference
+    ON public.invoices_electronic(pdp_reference);
+
+COMMENT ON FUNCTION public.apply_pdp_status_events(JSONB)
+    IS 'Applique les derniers statuts PDP d''un lot de webhooks, sauf si un événement plus récent est déjà enregistré';
+COMMENT ON COLUMN public.invoices_electronic.pdp_status_updated_at IS 'Horodatage de l''événement PDP ayant fixé status_pdp';